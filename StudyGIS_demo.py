@@ -11,42 +11,194 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QSplitter, QTextEdit, QTreeWidget, 
                              QTreeWidgetItem, QTabWidget, QLabel, QMenuBar, 
                              QToolBar, QAction, QMessageBox, QFileDialog,
-                             QPushButton, QTableWidget, QTableWidgetItem,
+                             QPushButton, QTableView, QHeaderView,
                              QComboBox, QCheckBox, QSlider, QSpinBox, QDialog,
-                             QLineEdit)
-from PyQt5.QtWebEngineWidgets import QWebEngineView
+                             QLineEdit, QInputDialog, QDoubleSpinBox, QFormLayout,
+                             QDialogButtonBox, QAbstractItemView)
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage
 from PyQt5.QtCore import Qt, pyqtSignal, QUrl, QTimer
 from PyQt5.QtGui import QIcon
 import pandas as pd
 import numpy as np
 import folium
 from folium import plugins
+from branca.element import MacroElement
+from jinja2 import Template
 import json
 from datetime import datetime
-import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+from src.table_models import DataFrameTableModel, PagedTableModel
+from src.layer_stats import stats_service
+from src.chart_engine import ChartEngine, configure_fonts
+
 # 尝试导入Plotly (可选)
 try:
     import plotly.graph_objects as go
     import plotly.express as px
-    from plotly.offline import plot
+    from src.plotly_host import PlotlyHost
     PLOTLY_AVAILABLE = True
 except ImportError:
     PLOTLY_AVAILABLE = False
 
 # 尝试导入数据库模块 (可选)
 try:
-    from src.database_config import DatabaseManager, initialize_database
+    from src.database_config import KNN_PAGE_SIZE, DatabaseManager, initialize_database
     DATABASE_AVAILABLE = True
 except ImportError:
     DATABASE_AVAILABLE = False
 
+# 尝试导入矢量数据读取模块 (可选; layer_to_geometries 只需要shapely, 缓冲区、插值等分析共用)
+try:
+    from src.vector_io import (VECTOR_BACKEND, SUPPORTED_VECTOR_EXTENSIONS, layer_to_geometries,
+                               read_vector_files, source_info)
+    VECTOR_IO_AVAILABLE = VECTOR_BACKEND is not None
+except ImportError:
+    VECTOR_IO_AVAILABLE = False
+    SUPPORTED_VECTOR_EXTENSIONS = ('.shp', '.gpkg')
+
+# 尝试导入GeoParquet模块 (可选)
+try:
+    from src.geoparquet_io import read_geoparquet, write_layer_geoparquet
+    GEOPARQUET_AVAILABLE = True
+except ImportError:
+    GEOPARQUET_AVAILABLE = False
+
+# 尝试导入图层缓存模块 (可选)
+try:
+    from src.layer_cache import LayerCache
+    LAYER_CACHE_AVAILABLE = True
+except ImportError:
+    LAYER_CACHE_AVAILABLE = False
+
+# 尝试导入坐标转换模块 (可选)
+try:
+    from src.reprojection import (DISPLAY_CRS, COMMON_CRS, crs_equal, epsg_code, guess_crs,
+                                  reproject_result)
+    REPROJECTION_AVAILABLE = True
+except ImportError:
+    REPROJECTION_AVAILABLE = False
+    DISPLAY_CRS = 'EPSG:4326'
+
+# 尝试导入项目存储模块 (可选)
+try:
+    from src import project_store
+    PROJECT_STORE_AVAILABLE = True
+except ImportError:
+    PROJECT_STORE_AVAILABLE = False
+
+# 尝试导入TIN模块 (可选, 需要scipy)
+try:
+    from src.tin import find_elevation_column, tin_from_layer
+    TIN_AVAILABLE = True
+except ImportError:
+    TIN_AVAILABLE = False
+
+# 尝试导入等高线模块 (可选)
+try:
+    from src.contour import contour_levels, contour_tin, contour_grid
+    CONTOUR_AVAILABLE = True
+except ImportError:
+    CONTOUR_AVAILABLE = False
+
+# 尝试导入栅格图层模块 (可选, 需要rasterio)
+try:
+    from src.raster_layer import (RASTER_EXTENSIONS, RasterSource, register_source, unregister_source,
+                                  tile_url, install_tile_handler, register_tile_scheme)
+    RASTER_AVAILABLE = True
+except ImportError:
+    RASTER_AVAILABLE = False
+    RASTER_EXTENSIONS = ()
+
+# 尝试导入地形分析模块 (可选, 需要rasterio)
+try:
+    from src.terrain import (PRODUCTS, PRODUCT_NAMES, PRODUCT_CMAPS, PRODUCT_RANGES,
+                             terrain_analysis, cached_output_path)
+    TERRAIN_AVAILABLE = True
+except ImportError:
+    TERRAIN_AVAILABLE = False
+
+# 尝试导入分区统计模块 (可选, 需要rasterio)
+try:
+    from src.zonal import choose_overview_level, zonal_layer
+    ZONAL_AVAILABLE = True
+except ImportError:
+    ZONAL_AVAILABLE = False
+
+# 尝试导入空间连接模块 (可选)
+try:
+    from src.spatial_join import PREDICATES, PREDICATE_NAMES, spatial_join
+    SPATIAL_JOIN_AVAILABLE = True
+except ImportError:
+    SPATIAL_JOIN_AVAILABLE = False
+
+# 尝试导入缓冲区模块 (可选)
+try:
+    from src.buffer import buffer_layer, highlight_data, query_within_distance
+    BUFFER_AVAILABLE = True
+except ImportError:
+    BUFFER_AVAILABLE = False
+
+# 尝试导入测量模块 (可选, 需要pyproj)
+try:
+    from src.measure import distance_matrix, layer_points, measure_layer, nearest_table
+    MEASURE_AVAILABLE = True
+except ImportError:
+    MEASURE_AVAILABLE = False
+
+# 尝试导入泰森多边形模块 (可选, 需要scipy)
+try:
+    from src.voronoi import voronoi_layer
+    VORONOI_AVAILABLE = True
+except ImportError:
+    VORONOI_AVAILABLE = False
+
+# 尝试导入插值模块 (可选, 需要scipy; 写栅格需要rasterio)
+try:
+    from src.interpolation import (DEFAULT_K, SURFACE_MAX_CELLS, cached_grid_path, interpolate_layer,
+                                   prune_grid_cache, surface_trace, write_grid_raster)
+    INTERPOLATION_AVAILABLE = True
+except ImportError:
+    INTERPOLATION_AVAILABLE = False
+
+# 尝试导入点密度聚合模块 (可选, 需要scipy; 核密度栅格需要rasterio)
+try:
+    from src.density import DENSITY_CMAP, density_layer, hexbin_layer
+    from src.interpolation import cached_grid_path, grid_value_range, prune_grid_cache, write_grid_raster
+    DENSITY_AVAILABLE = True
+except ImportError:
+    DENSITY_AVAILABLE = False
+
+# 尝试导入计数金字塔模块
+try:
+    from src.point_pyramid import PYRAMID_FILE, PointPyramid, pyramid_service
+    PYRAMID_AVAILABLE = True
+except ImportError:
+    PYRAMID_AVAILABLE = False
+
+# 尝试导入面融合模块
+try:
+    from src.dissolve import dissolve_layer
+    DISSOLVE_AVAILABLE = True
+except ImportError:
+    DISSOLVE_AVAILABLE = False
+
 # 配置
 APP_NAME = "StudyGIS_demo"
 APP_VERSION = "1.0.0"
 BASE_DIR = Path(__file__).parent
+LAYER_CACHE_DIR = BASE_DIR / "cache" / "layers"
+LAYER_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 图层缓存上限 2GB
+OVERVIEW_CACHE_DIR = BASE_DIR / "cache" / "overviews"  # 栅格概视 (外部.ovr)
+TERRAIN_CACHE_DIR = BASE_DIR / "cache" / "terrain"  # 山体阴影/坡度/坡向结果
+INTERPOLATION_CACHE_DIR = BASE_DIR / "cache" / "interpolation"  # IDW插值栅格
+DENSITY_CACHE_DIR = BASE_DIR / "cache" / "density"  # 核密度栅格
+PYRAMID_RENDER_THRESHOLD = 5000  # 点数超过该值时地图按计数金字塔的瓦片聚合显示
+ZONAL_MAX_PIXELS = 200000000  # 分区统计超过该像元数时改用概视
+IDENTIFY_URL = "studygis://identify/"  # 地图点选时页面跳转到 IDENTIFY_URL/<经度>/<纬度>, 由MapPage拦截
+VIEW_URL = "studygis://view/"  # 地图范围变化时页面跳转到 VIEW_URL/<西>/<南>/<东>/<北>, 由MapPage拦截
+IDENTIFY_TABLES = ["point_features", "line_features", "polygon_features"]
 
 def setup_logging():
     """设置日志"""
@@ -62,6 +214,25 @@ def setup_logging():
         ]
     )
 
+def ask_source_crs(parent, x, y):
+    """询问投影坐标数据的坐标系 (默认选中按坐标范围猜测的坐标系), 取消时返回None"""
+    if not REPROJECTION_AVAILABLE:
+        QMessageBox.warning(parent, "警告", "坐标不是经纬度, 未安装pyproj无法进行坐标转换")
+        return None
+    
+    names = list(COMMON_CRS)
+    guessed = guess_crs(x, y)
+    current = next((i for i, name in enumerate(names) if COMMON_CRS[name] == guessed), 0)
+    
+    name, ok = QInputDialog.getItem(
+        parent, "选择坐标系", "坐标超出经纬度范围, 请选择数据的坐标系 (也可输入如 EPSG:4547):",
+        names, current, True
+    )
+    if not ok or not name:
+        return None
+    return COMMON_CRS.get(name, name.strip())
+
+
 class DatabaseDialog(QDialog):
     """数据库操作对话框"""
     
@@ -71,6 +242,7 @@ class DatabaseDialog(QDialog):
         self.setWindowTitle("数据库操作")
         self.setGeometry(200, 200, 800, 600)
         self.current_data = None
+        self.query_table = None
         self.init_ui()
         
     def init_ui(self):
@@ -119,8 +291,11 @@ class DatabaseDialog(QDialog):
         
         layout.addLayout(query_control)
         
-        # 数据表格
-        self.data_table = QTableWidget()
+        # 数据表格 (滚动到底部时按页从数据库加载)
+        self.data_model = DataFrameTableModel()
+        self.paged_model = None
+        self.data_table = QTableView()
+        self.data_table.setModel(self.data_model)
         layout.addWidget(self.data_table)
         
         # 状态信息
@@ -183,6 +358,10 @@ class DatabaseDialog(QDialog):
         self.export_btn.clicked.connect(self.export_data)
         export_control.addWidget(self.export_btn)
         
+        self.export_parquet_btn = QPushButton("导出为GeoParquet")
+        self.export_parquet_btn.clicked.connect(self.export_data_geoparquet)
+        export_control.addWidget(self.export_parquet_btn)
+        
         layout.addLayout(export_control)
         
         # 导出选项
@@ -209,21 +388,24 @@ class DatabaseDialog(QDialog):
             table_name = self.table_combo.currentText()
             self.status_label.setText(f"正在查询 {table_name}...")
             
-            df = self.db_manager.query_spatial_data(table_name, limit=100)
+            # 按主键分页查询, 首页同步加载, 后续页在滚动时增量加载
+            db_manager = self.db_manager
+            model = PagedTableModel(lambda after_id: db_manager.query_page(table_name, after_id))
+            model.fetchMore()
+            if model.error is not None:
+                model.close()
+                raise model.error
             
-            if not df.empty:
+            self.current_data = None
+            if model.rowCount() > 0:
                 # 显示数据
-                self.data_table.setRowCount(len(df))
-                self.data_table.setColumnCount(len(df.columns))
-                self.data_table.setHorizontalHeaderLabels(df.columns.tolist())
-                
-                for i, row in df.iterrows():
-                    for j, value in enumerate(row):
-                        self.data_table.setItem(i, j, QTableWidgetItem(str(value)))
-                
-                self.status_label.setText(f"查询到 {len(df)} 条记录")
-                self.current_data = df
+                self.set_paged_model(model)
+                self.update_loaded_count()
+                self.query_table = table_name
             else:
+                model.close()
+                self.set_paged_model(None)
+                self.data_model.set_data(pd.DataFrame())
                 self.status_label.setText("没有查询到数据")
                 self.current_data = None
                 
@@ -250,28 +432,69 @@ class DatabaseDialog(QDialog):
                 self.status_label.setText(f"查询失败: {error_msg}")
             
             # 在数据表中显示错误信息
-            self.data_table.setRowCount(1)
-            self.data_table.setColumnCount(1)
-            self.data_table.setHorizontalHeaderLabels(["错误信息"])
-            self.data_table.setItem(0, 0, QTableWidgetItem(f"查询失败: {error_msg}"))
+            self.set_paged_model(None)
+            self.data_model.set_data(pd.DataFrame({"错误信息": [f"查询失败: {error_msg}"]}))
+    
+    def set_paged_model(self, model):
+        """切换结果表格的分页模型, model为None时显示普通表格"""
+        if self.paged_model is not None:
+            self.paged_model.close()
+        self.paged_model = model
+        if model is None:
+            self.data_table.setModel(self.data_model)
+        else:
+            model.rowsInserted.connect(self.update_loaded_count)
+            self.data_table.setModel(model)
     
-    def load_to_map(self):
-        """加载数据到地图"""
-        if hasattr(self, 'current_data') and self.current_data is not None:
-            # 发送信号给主窗口加载数据
-            self.accept()  # 关闭对话框
-            # 这里需要主窗口处理数据加载
+    def update_loaded_count(self, *args):
+        """显示已加载的记录数"""
+        if self.paged_model is None:
+            return
+        count = self.paged_model.rowCount()
+        if self.paged_model.canFetchMore():
+            self.status_label.setText(f"已加载 {count} 条记录 (滚动加载更多)")
         else:
+            self.status_label.setText(f"查询到 {count} 条记录")
+    
+    def load_to_map(self):
+        """加载数据到地图: 按主键逐页取回完整的查询结果, 而不只是表格中已加载的页"""
+        if self.paged_model is None:
             self.status_label.setText("没有数据可加载")
+            return
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            self.current_data = self.db_manager.query_all(self.query_table)
+        except Exception as e:
+            self.status_label.setText(f"加载失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        # 关闭对话框, 由主窗口把 current_data 加载为图层
+        self.accept()
     
     def browse_file(self):
         """浏览文件"""
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "选择文件", "", "CSV文件 (*.csv);;GeoJSON文件 (*.geojson)"
+            self, "选择文件", "", "CSV文件 (*.csv);;GeoJSON文件 (*.geojson);;GeoParquet文件 (*.parquet)"
         )
         if file_path:
             self.file_path_edit.setText(file_path)
     
+    def csv_source_srid(self, file_path):
+        """CSV坐标的SRID: 坐标都在经纬度范围内时为4326, 否则与导入地图时一样询问坐标系; 取消时返回None"""
+        coords = pd.read_csv(file_path, encoding='utf-8', usecols=lambda col: col in ('longitude', 'latitude'))
+        if len(coords.columns) < 2:
+            return 4326  # 缺少坐标列, 由导入时报错
+        x = pd.to_numeric(coords['longitude'], errors='coerce')
+        y = pd.to_numeric(coords['latitude'], errors='coerce')
+        valid = x.notna() & y.notna()
+        x, y = x[valid], y[valid]
+        if x.abs().le(180).all() and y.abs().le(90).all():
+            return 4326
+        crs = ask_source_crs(self, x, y)
+        return None if crs is None else epsg_code(crs)
+    
     def import_data(self):
         """导入数据"""
         if not self.db_manager:
@@ -287,11 +510,19 @@ class DatabaseDialog(QDialog):
             self.import_log.append(f"开始导入文件: {file_path}")
             
             if file_path.endswith('.csv'):
-                self.import_log.append("检测到CSV文件，导入到point_features表")
-                success = self.db_manager.import_csv_to_postgis(file_path, 'point_features')
+                source_srid = self.csv_source_srid(file_path)
+                if source_srid is None:
+                    self.import_log.append("已取消: 未选择坐标系")
+                    return
+                self.import_log.append(f"检测到CSV文件，导入到point_features表 (SRID {source_srid})")
+                success = self.db_manager.import_csv_to_postgis(file_path, 'point_features',
+                                                                source_srid=source_srid)
             elif file_path.endswith('.geojson'):
                 self.import_log.append("检测到GeoJSON文件，自动选择目标表")
                 success = self.db_manager.import_geojson_to_postgis(file_path, 'auto')
+            elif file_path.endswith('.parquet'):
+                self.import_log.append("检测到GeoParquet文件，按几何类型批量导入")
+                success = self.db_manager.import_geoparquet_to_postgis(file_path, 'auto')
             else:
                 self.import_log.append("错误: 不支持的文件格式")
                 return
@@ -300,7 +531,7 @@ class DatabaseDialog(QDialog):
                 self.import_log.append(f"✅ 成功: 文件 {file_path} 导入完成")
                 
                 # 检查导入结果
-                if file_path.endswith('.geojson'):
+                if file_path.endswith('.geojson') or file_path.endswith('.parquet'):
                     # 检查各表的数据量
                     tables = ['point_features', 'line_features', 'polygon_features']
                     for table in tables:
@@ -341,18 +572,45 @@ class DatabaseDialog(QDialog):
             except Exception as e:
                 self.export_log.append(f"错误: {str(e)}")
 
+    def export_data_geoparquet(self):
+        """导出数据为GeoParquet"""
+        if not self.db_manager:
+            self.export_log.append("错误: 数据库未连接")
+            return
+        
+        table_name = self.export_table_combo.currentText()
+        
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "保存文件", f"{table_name}.parquet", "GeoParquet文件 (*.parquet)"
+        )
+        
+        if file_path:
+            try:
+                success = self.db_manager.export_table_to_geoparquet(table_name, file_path)
+                if success:
+                    self.export_log.append(f"成功: 数据已导出到 {file_path}")
+                else:
+                    self.export_log.append(f"失败: 导出失败")
+            except Exception as e:
+                self.export_log.append(f"错误: {str(e)}")
+
 class StatisticsDialog(QDialog):
     """统计图表对话框"""
     
-    def __init__(self, data_layers, parent=None):
+    DATABASE_TABLES = ["point_features", "line_features", "polygon_features"]
+    
+    def __init__(self, data_layers, parent=None, db_manager=None):
         super().__init__(parent)
         self.data_layers = data_layers
+        self.db_manager = db_manager  # 提供时可在数据库中计算统计量
+        self.db_stats = {}  # 表名 -> 数据库聚合结果
+        self.tin_cache = {}  # id(图层) -> (缓存键, TIN)
+        self.idw_cache = {}  # id(图层) -> (缓存键, 属性列, 网格, 范围)
         self.setWindowTitle("数据统计分析")
         self.setGeometry(200, 200, 800, 600)
         
-        # 为3D图表准备文件路径
+        # 3D图表宿主页面所在的临时目录
         self.temp_dir = tempfile.mkdtemp()
-        self.plotly_file = os.path.join(self.temp_dir, "stats_3d.html")
         
         self.init_ui()
         
@@ -361,10 +619,19 @@ class StatisticsDialog(QDialog):
         
         # 图层选择
         layer_layout = QHBoxLayout()
+        if self.db_manager:
+            # 数据源: 内存图层 或 数据库表 (统计量在数据库中聚合)
+            layer_layout.addWidget(QLabel("数据源:"))
+            self.source_combo = QComboBox()
+            self.source_combo.addItems(["内存图层", "数据库 (SQL聚合)"])
+            if not self.data_layers:
+                self.source_combo.setCurrentIndex(1)
+            self.source_combo.currentIndexChanged.connect(self.change_source)
+            layer_layout.addWidget(self.source_combo)
+        
         layer_layout.addWidget(QLabel("选择图层:"))
         self.layer_combo = QComboBox()
-        for layer in self.data_layers:
-            self.layer_combo.addItem(layer['name'])
+        self.fill_layer_combo()
         self.layer_combo.currentTextChanged.connect(self.update_statistics)
         layer_layout.addWidget(self.layer_combo)
         
@@ -375,6 +642,10 @@ class StatisticsDialog(QDialog):
         chart_types = ["柱状图", "饼图", "散点图", "直方图"]
         if PLOTLY_AVAILABLE:
             chart_types.extend(["3D散点图"])  # 只保留3D散点图
+            if TIN_AVAILABLE:
+                chart_types.append("3D表面图(TIN)")
+            if INTERPOLATION_AVAILABLE:
+                chart_types.append("3D插值表面(IDW)")
         self.chart_combo.addItems(chart_types)
         self.chart_combo.currentTextChanged.connect(self.update_statistics)
         chart_layout.addWidget(self.chart_combo)
@@ -390,6 +661,7 @@ class StatisticsDialog(QDialog):
         chart_2d_layout = QVBoxLayout()
         self.figure = Figure(figsize=(10, 6))
         self.canvas = FigureCanvas(self.figure)
+        self.chart = ChartEngine(self.figure)
         chart_2d_layout.addWidget(self.canvas)
         self.chart_2d_widget.setLayout(chart_2d_layout)
         self.chart_stack.addTab(self.chart_2d_widget, "2D图表")
@@ -402,6 +674,8 @@ class StatisticsDialog(QDialog):
             chart_3d_layout.addWidget(self.web_view)
             self.chart_3d_widget.setLayout(chart_3d_layout)
             self.chart_stack.addTab(self.chart_3d_widget, "3D图表")
+            # 宿主页面只加载一次, 之后通过 Plotly.react 更新图表
+            self.plotly_host = PlotlyHost(self.web_view, self.temp_dir)
         
         layout.addWidget(self.chart_stack)
         
@@ -413,11 +687,35 @@ class StatisticsDialog(QDialog):
         self.setLayout(layout)
         
         # 初始化显示
-        if self.data_layers:
+        if self.data_layers or self.is_database_mode():
             self.update_statistics()
     
+    def is_database_mode(self):
+        """是否在数据库中计算统计量"""
+        return self.db_manager is not None and self.source_combo.currentIndex() == 1
+    
+    def fill_layer_combo(self):
+        """根据数据源填充图层列表"""
+        self.layer_combo.blockSignals(True)
+        self.layer_combo.clear()
+        if self.is_database_mode():
+            self.layer_combo.addItems(self.DATABASE_TABLES)
+        else:
+            for layer in self.data_layers:
+                self.layer_combo.addItem(layer['name'])
+        self.layer_combo.blockSignals(False)
+    
+    def change_source(self):
+        """切换数据源"""
+        self.fill_layer_combo()
+        self.update_statistics()
+    
     def update_statistics(self):
         """更新统计信息"""
+        if self.is_database_mode():
+            self.update_database_statistics()
+            return
+        
         if not self.data_layers:
             return
             
@@ -433,99 +731,127 @@ class StatisticsDialog(QDialog):
         
         if not current_layer:
             return
+        
+        if chart_type == "3D表面图(TIN)":
+            self.draw_3d_surface(current_layer)
+            return
+        if chart_type == "3D插值表面(IDW)":
+            self.draw_idw_surface(current_layer)
+            return
+        if current_layer['type'] == 'tin':
+            self.chart.message("TIN图层请选择\"3D表面图(TIN)\"查看")
+            self.canvas.draw_idle()
+            return
+        if current_layer['type'] == 'raster':
+            self.chart.message("栅格图层暂不支持统计图表")
+            self.canvas.draw_idle()
+            return
             
         data = current_layer['data']
+        # 统计结果按图层版本缓存, 切换图表类型不会重新计算
+        self.current_stats = stats_service.get(current_layer)
         
-        # 清除之前的图表
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        
-        # 根据图表类型绘制
+        # 根据图表类型绘制 (复用已有图表元素, 只更新数据)
         try:
             if chart_type == "柱状图":
-                self.draw_bar_chart(ax, data)
+                self.draw_bar_chart(data)
             elif chart_type == "饼图":
-                self.draw_pie_chart(ax, data)
+                self.draw_pie_chart(data)
             elif chart_type == "散点图":
-                self.draw_scatter_chart(ax, data)
+                self.draw_scatter_chart(data)
             elif chart_type == "直方图":
-                self.draw_histogram(ax, data)
+                self.draw_histogram()
             elif chart_type == "3D散点图" and PLOTLY_AVAILABLE:
                 self.draw_3d_scatter(data)
                 return  # 3D图表不使用matplotlib
         except Exception as e:
-            ax.text(0.5, 0.5, f"绘图错误: {str(e)}", 
-                   horizontalalignment='center', verticalalignment='center',
-                   transform=ax.transAxes)
+            self.chart.message(f"绘图错误: {str(e)}")
         
-        self.canvas.draw()
+        self.canvas.draw_idle()
         
         # 更新统计文本
-        self.update_stats_text(data)
+        self.update_stats_text(self.current_stats)
     
-    def draw_bar_chart(self, ax, data):
-        """绘制柱状图"""
-        # 设置中文字体
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+    def update_database_statistics(self):
+        """数据库模式: 统计量和图表数据均由数据库聚合, 只传输聚合结果"""
+        table_name = self.layer_combo.currentText()
+        chart_type = self.chart_combo.currentText()
         
-        numeric_cols = data.select_dtypes(include=[np.number]).columns
-        if len(numeric_cols) > 0:
-            col = numeric_cols[0]
-            if 'name' in data.columns:
-                ax.bar(data['name'][:10], data[col][:10])  # 只显示前10个
-                ax.set_xlabel('名称')
-                ax.set_ylabel(col)
-                ax.set_title(f'{col} 柱状图')
-                plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+        try:
+            if table_name not in self.db_stats:
+                self.db_stats[table_name] = self.db_manager.get_table_statistics(table_name)
+            self.current_stats = self.db_stats[table_name]
+            groups = self.current_stats['groups']
+            
+            if chart_type in ("柱状图", "饼图") and groups:
+                # 优先按类型分组, 其次按省份
+                col = 'type' if 'type' in groups else next(iter(groups))
+                counts = groups[col]
+                if chart_type == "柱状图":
+                    self.chart.bar(counts.index, counts.values, col, '数量', f'{table_name} 按{col}分组计数')
+                else:
+                    self.chart.pie(counts.values, counts.index, f'{table_name} {col}分布饼图')
+            elif chart_type == "直方图":
+                self.draw_histogram()
             else:
-                ax.bar(range(len(data[:10])), data[col][:10])
-                ax.set_xlabel('索引')
-                ax.set_ylabel(col)
-                ax.set_title(f'{col} 柱状图')
+                self.chart.message("数据库模式仅支持柱状图、饼图和直方图")
+            
+            self.update_stats_text(self.current_stats)
+        except Exception as e:
+            self.chart.message(f"数据库统计失败: {str(e)}")
+        
+        self.canvas.draw_idle()
     
-    def draw_pie_chart(self, ax, data):
-        """绘制饼图"""
-        # 设置中文字体
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+    def numeric_data_columns(self):
+        """当前图层的数值列 (来自统计服务缓存)"""
+        return list(self.current_stats['columns'])
+    
+    def draw_bar_chart(self, data):
+        """绘制柱状图"""
+        numeric_cols = self.numeric_data_columns()
+        if not numeric_cols:
+            self.chart.message("没有可用的数值列")
+            return
         
+        col = numeric_cols[0]
+        head = data.head(10)  # 只显示前10个
+        if 'name' in data.columns:
+            self.chart.bar(head['name'], head[col], '名称', col, f'{col} 柱状图')
+        else:
+            self.chart.bar(range(len(head)), head[col], '索引', col, f'{col} 柱状图')
+    
+    def draw_pie_chart(self, data):
+        """绘制饼图"""
         if 'type' in data.columns:
             type_counts = data['type'].value_counts()
-            ax.pie(type_counts.values, labels=type_counts.index, autopct='%1.1f%%')
-            ax.set_title('类型分布饼图')
-        elif len(data) <= 10:  # 数据量小时按名称分组
-            if 'name' in data.columns:
-                ax.pie([1]*len(data), labels=data['name'], autopct='%1.1f%%')
-                ax.set_title('数据分布饼图')
-    
-    def draw_scatter_chart(self, ax, data):
-        """绘制散点图"""
-        # 设置中文字体
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+            self.chart.pie(type_counts.values, type_counts.index, '类型分布饼图')
+        elif len(data) <= 10 and 'name' in data.columns:  # 数据量小时按名称分组
+            self.chart.pie([1] * len(data), data['name'], '数据分布饼图')
+        else:
+            self.chart.message("没有可用于饼图的分类列")
+    
+    def draw_scatter_chart(self, data):
+        """绘制散点图 (大数据量时自动聚合为密度图)"""
+        numeric_cols = self.numeric_data_columns()
+        if len(numeric_cols) < 2:
+            self.chart.message("散点图需要至少两个数值列")
+            return
         
-        numeric_cols = data.select_dtypes(include=[np.number]).columns
-        if len(numeric_cols) >= 2:
-            x_col, y_col = numeric_cols[0], numeric_cols[1]
-            ax.scatter(data[x_col], data[y_col])
-            ax.set_xlabel(x_col)
-            ax.set_ylabel(y_col)
-            ax.set_title(f'{x_col} vs {y_col} 散点图')
-    
-    def draw_histogram(self, ax, data):
-        """绘制直方图"""
-        # 设置中文字体
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+        x_col, y_col = numeric_cols[0], numeric_cols[1]
+        self.chart.scatter(data[x_col].to_numpy(dtype=float, na_value=np.nan),
+                           data[y_col].to_numpy(dtype=float, na_value=np.nan),
+                           x_col, y_col, f'{x_col} vs {y_col} 散点图')
+    
+    def draw_histogram(self):
+        """绘制直方图 (使用统计服务缓存的分箱)"""
+        columns = self.current_stats['columns']
+        col = next((c for c in columns if columns[c]['histogram'] is not None), None)
+        if col is None:
+            self.chart.message("没有可用的数值列")
+            return
         
-        numeric_cols = data.select_dtypes(include=[np.number]).columns
-        if len(numeric_cols) > 0:
-            col = numeric_cols[0]
-            ax.hist(data[col].dropna(), bins=20, alpha=0.7)
-            ax.set_xlabel(col)
-            ax.set_ylabel('频次')
-            ax.set_title(f'{col} 直方图')
+        counts, edges = columns[col]['histogram']
+        self.chart.histogram(counts, edges, col, '频次', f'{col} 直方图')
     
     def draw_3d_scatter(self, data):
         """绘制3D散点图"""
@@ -577,10 +903,7 @@ class StatisticsDialog(QDialog):
             font=dict(family="Microsoft YaHei, Arial", size=12)
         )
         
-        plot(fig, filename=self.plotly_file, auto_open=False, 
-             config={'displayModeBar': True, 'responsive': True})
-        
-        self.web_view.setUrl(QUrl.fromLocalFile(self.plotly_file))
+        self.plotly_host.show(fig)
         self.chart_stack.setCurrentIndex(1)  # 切换到3D标签页
     
     def draw_3d_bar(self, data):
@@ -616,86 +939,296 @@ class StatisticsDialog(QDialog):
             font=dict(family="Microsoft YaHei, Arial", size=12)
         )
         
-        plot(fig, filename=self.plotly_file, auto_open=False, 
-             config={'displayModeBar': True, 'responsive': True})
-        
-        self.web_view.setUrl(QUrl.fromLocalFile(self.plotly_file))
+        self.plotly_host.show(fig)
         self.chart_stack.setCurrentIndex(1)  # 切换到3D标签页
     
-    def draw_3d_surface(self, data):
-        """绘制3D表面图"""
-        if not PLOTLY_AVAILABLE:
-            QMessageBox.warning(self, "警告", "Plotly未安装，无法显示3D表面图")
+    def layer_tin(self, layer):
+        """图层对应的TIN: TIN图层直接使用, 点图层按版本缓存剖分结果"""
+        if layer['type'] == 'tin':
+            return layer['data']
+        key = (layer.get('version', 0), id(layer['data']))
+        cached = self.tin_cache.get(id(layer))
+        if cached is None or cached[0] != key:
+            cached = (key, tin_from_layer(layer))
+            self.tin_cache[id(layer)] = cached
+        return cached[1]
+    
+    def draw_3d_surface(self, layer):
+        """绘制3D表面图 (由点图层的高程列构建TIN, 以Mesh3d显示)"""
+        if not PLOTLY_AVAILABLE or not TIN_AVAILABLE:
+            QMessageBox.warning(self, "警告", "Plotly或scipy未安装，无法显示3D表面图")
             return
         
-        # 检查必要的列
-        if 'longitude' not in data.columns or 'latitude' not in data.columns:
-            QMessageBox.warning(self, "警告", "数据中缺少经纬度列")
+        if layer['type'] not in ('points', 'tin'):
+            QMessageBox.warning(self, "警告", "3D表面图需要带高程列的点图层或TIN图层")
             return
         
-        numeric_cols = data.select_dtypes(include=[np.number]).columns
-        numeric_cols = [col for col in numeric_cols if col not in ['longitude', 'latitude']]
-        
-        if not numeric_cols:
-            QMessageBox.warning(self, "警告", "没有可用的数值列进行3D可视化")
+        try:
+            tin = self.layer_tin(layer)
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", f"无法构建TIN: {str(e)}")
             return
         
-        z_col = numeric_cols[0]
-        z_data = pd.to_numeric(data[z_col], errors='coerce').fillna(0)
-        
-        # 创建网格数据
-        import numpy as np
-        x = np.array(data['longitude'])
-        y = np.array(data['latitude'])
-        z = np.array(z_data)
+        fig = go.Figure(data=tin.to_mesh3d())
+        fig.update_layout(
+            title=f"3D表面图 (TIN: {tin.vertex_count} 个顶点, {len(tin)} 个三角形)",
+            scene=dict(
+                xaxis_title="经度",
+                yaxis_title="纬度",
+                zaxis_title="高程",
+                aspectmode='manual',
+                aspectratio=dict(x=1, y=1, z=0.4),
+                camera=dict(eye=dict(x=1.5, y=1.5, z=1.5))
+            ),
+            height=500,
+            font=dict(family="Microsoft YaHei, Arial", size=12)
+        )
         
-        fig = go.Figure(data=go.Scatter3d(
-            x=x, y=y, z=z,
-            mode='markers',
-            marker=dict(
-                size=5,
-                color=z,
-                colorscale='Viridis',
-                opacity=0.8,
-                colorbar=dict(title=z_col)
-            )
-        ))
+        self.plotly_host.show(fig)
+        self.chart_stack.setCurrentIndex(1)  # 切换到3D标签页
+    
+    def draw_idw_surface(self, layer):
+        """绘制IDW插值表面 (点图层的高程列, 没有时取第一个数值列; 分辨率按Surface像元上限自动选择)"""
+        if layer['type'] != 'points':
+            QMessageBox.warning(self, "警告", "插值表面需要点图层")
+            return
+        key = (layer.get('version', 0), id(layer['data']))
+        cached = self.idw_cache.get(id(layer))
+        if cached is None or cached[0] != key:
+            _, attrs = layer_to_geometries(layer)
+            column = find_elevation_column(attrs) if TIN_AVAILABLE else None
+            if column is None:
+                numeric_cols = attrs.select_dtypes(include=[np.number]).columns
+                if len(numeric_cols) == 0:
+                    QMessageBox.warning(self, "警告", "没有可用的数值列进行插值")
+                    return
+                column = numeric_cols[0]
+            try:
+                grid, bounds = interpolate_layer(layer, column, max_cells=SURFACE_MAX_CELLS)
+            except ValueError as e:
+                QMessageBox.warning(self, "警告", f"插值失败: {str(e)}")
+                return
+            cached = (key, column, grid, bounds)
+            self.idw_cache[id(layer)] = cached
+        _, column, grid, bounds = cached
         
+        fig = go.Figure(data=surface_trace(grid, bounds, column))
         fig.update_layout(
-            title=f"3D表面图 (经度-纬度-{z_col})",
+            title=f"3D插值表面 (IDW: {column}, {grid.shape[1]}x{grid.shape[0]} 网格)",
             scene=dict(
                 xaxis_title="经度",
                 yaxis_title="纬度",
-                zaxis_title=z_col,
+                zaxis_title=column,
+                aspectmode='manual',
+                aspectratio=dict(x=1, y=1, z=0.4),
                 camera=dict(eye=dict(x=1.5, y=1.5, z=1.5))
             ),
             height=500,
             font=dict(family="Microsoft YaHei, Arial", size=12)
         )
         
-        plot(fig, filename=self.plotly_file, auto_open=False, 
-             config={'displayModeBar': True, 'responsive': True})
-        
-        self.web_view.setUrl(QUrl.fromLocalFile(self.plotly_file))
+        self.plotly_host.show(fig)
         self.chart_stack.setCurrentIndex(1)  # 切换到3D标签页
     
-    def update_stats_text(self, data):
-        """更新统计文本信息"""
+    def update_stats_text(self, stats):
+        """更新统计文本信息 (stats为统计服务返回的结果)"""
         stats_text = f"数据统计信息:\n\n"
-        stats_text += f"总记录数: {len(data)}\n"
-        stats_text += f"列数: {len(data.columns)}\n\n"
+        stats_text += f"总记录数: {stats['row_count']}\n"
+        stats_text += f"列数: {len(stats['column_names'])}\n\n"
         
         # 数值列统计
-        numeric_cols = data.select_dtypes(include=[np.number]).columns
-        for col in numeric_cols:
+        for col, col_stats in stats['columns'].items():
+            quantiles = col_stats['quantiles']
             stats_text += f"{col}:\n"
-            stats_text += f"  最小值: {data[col].min():.2f}\n"
-            stats_text += f"  最大值: {data[col].max():.2f}\n"
-            stats_text += f"  平均值: {data[col].mean():.2f}\n"
-            stats_text += f"  标准差: {data[col].std():.2f}\n\n"
+            stats_text += f"  最小值: {col_stats['min']:.2f}\n"
+            stats_text += f"  最大值: {col_stats['max']:.2f}\n"
+            stats_text += f"  平均值: {col_stats['mean']:.2f}\n"
+            stats_text += f"  标准差: {col_stats['std']:.2f}\n"
+            stats_text += f"  四分位数: {quantiles[0.25]:.2f} / {quantiles[0.5]:.2f} / {quantiles[0.75]:.2f}\n\n"
+        
+        # 分组计数 (数据库模式)
+        for col, counts in stats.get('groups', {}).items():
+            stats_text += f"按{col}分组:\n"
+            for value, count in counts.items():
+                stats_text += f"  {value}: {count}\n"
+            stats_text += "\n"
         
         self.stats_text.setText(stats_text)
 
+class ContourDialog(QDialog):
+    """等高线参数对话框"""
+    
+    def __init__(self, source_layers, parent=None):
+        super().__init__(parent)
+        self.source_layers = source_layers
+        self.setWindowTitle("生成等高线")
+        self.init_ui()
+    
+    def init_ui(self):
+        layout = QFormLayout()
+        
+        self.layer_combo = QComboBox()
+        self.layer_combo.addItems([layer['name'] for layer in self.source_layers])
+        self.layer_combo.currentIndexChanged.connect(self.update_default_interval)
+        layout.addRow("输入数据:", self.layer_combo)
+        
+        self.interval_spin = QDoubleSpinBox()
+        self.interval_spin.setDecimals(3)
+        self.interval_spin.setRange(0.001, 1e6)
+        layout.addRow("等高距:", self.interval_spin)
+        
+        # 平滑: Chaikin迭代次数; 抽稀: Douglas-Peucker容差 (坐标单位)
+        self.smooth_spin = QSpinBox()
+        self.smooth_spin.setRange(0, 5)
+        layout.addRow("平滑次数:", self.smooth_spin)
+        
+        self.simplify_spin = QDoubleSpinBox()
+        self.simplify_spin.setDecimals(6)
+        self.simplify_spin.setRange(0, 1)
+        self.simplify_spin.setSingleStep(0.0001)
+        layout.addRow("抽稀容差:", self.simplify_spin)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+        
+        self.setLayout(layout)
+        self.update_default_interval()
+    
+    def selected_layer(self):
+        return self.source_layers[self.layer_combo.currentIndex()]
+    
+    def update_default_interval(self):
+        """默认等高距: 高程范围约分为10级"""
+        layer = self.selected_layer()
+        if layer['type'] == 'raster':
+            zmin, zmax = layer['data'].value_range[0]
+        else:
+            zmin, zmax = float(layer['data'].z.min()), float(layer['data'].z.max())
+        self.z_range = (zmin, zmax)
+        levels = contour_levels(zmin, zmax)
+        if len(levels) > 1:
+            step = levels[1] - levels[0]
+            self.interval_spin.setValue(float(f"{step:.1g}"))
+    
+    def accept(self):
+        """等高距过小 (级别数超过上限) 时提示用户, 不关闭对话框"""
+        try:
+            contour_levels(*self.z_range, self.interval_spin.value())
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", str(e))
+            return
+        super().accept()
+    
+    def parameters(self):
+        return {
+            'interval': self.interval_spin.value(),
+            'smooth': self.smooth_spin.value(),
+            'simplify': self.simplify_spin.value()
+        }
+
+class MapPage(QWebEnginePage):
+    """地图页面: 拦截点选查询和地图范围的跳转, 转换为 identify_requested(经度, 纬度)
+    和 view_changed(西, 南, 东, 北) 信号"""
+    
+    identify_requested = pyqtSignal(float, float)
+    view_changed = pyqtSignal(float, float, float, float)
+    
+    def acceptNavigationRequest(self, url, nav_type, is_main_frame):
+        text = url.toString()
+        if text.startswith(VIEW_URL):
+            try:
+                west, south, east, north = (float(v) for v in text[len(VIEW_URL):].strip('/').split('/'))
+            except ValueError:
+                logging.warning(f"无效的地图范围地址: {text}")
+            else:
+                self.view_changed.emit(west, south, east, north)
+            return False
+        if text.startswith(IDENTIFY_URL):
+            try:
+                lon, lat = (float(v) for v in text[len(IDENTIFY_URL):].strip('/').split('/'))
+            except ValueError:
+                logging.warning(f"无效的点选地址: {text}")
+            else:
+                self.identify_requested.emit(lon, lat)
+            return False
+        return super().acceptNavigationRequest(url, nav_type, is_main_frame)
+
+
+class IdentifyClickHandler(MacroElement):
+    """地图单击时跳转到 IDENTIFY_URL/<经度>/<纬度> (作为地图的子元素, 在地图对象创建之后执行)"""
+    
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this._parent.get_name() }}.getContainer().style.cursor = 'crosshair';
+        {{ this._parent.get_name() }}.on('click', function(e) {
+            var p = e.latlng.wrap();
+            window.location.href = '{{ this.url }}' + p.lng + '/' + p.lat;
+        });
+        {% endmacro %}
+    """)
+    
+    def __init__(self, url=IDENTIFY_URL):
+        super().__init__()
+        self._name = 'IdentifyClickHandler'
+        self.url = url
+
+
+class ViewBoundsReporter(MacroElement):
+    """地图加载完成和每次平移/缩放后跳转到 VIEW_URL/<西>/<南>/<东>/<北>, 把当前范围交给MapPage"""
+    
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function(map) {
+            function report() {
+                var b = map.getBounds();
+                window.location.href = '{{ this.url }}' + b.getWest() + '/' + b.getSouth() + '/'
+                    + b.getEast() + '/' + b.getNorth();
+            }
+            map.whenReady(report);
+            map.on('moveend', report);
+        })({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+    
+    def __init__(self, url=VIEW_URL):
+        super().__init__()
+        self._name = 'ViewBoundsReporter'
+        self.url = url
+
+
+class IdentifyResultDialog(QDialog):
+    """点选查询结果 (非模态, 结果通过分页模型增量加载)"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("点选查询结果")
+        self.resize(700, 400)
+        self.model = None
+        layout = QVBoxLayout()
+        self.info_label = QLabel()
+        layout.addWidget(self.info_label)
+        self.result_table = QTableView()
+        self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        layout.addWidget(self.result_table)
+        self.setLayout(layout)
+    
+    def set_model(self, model, info):
+        """显示新的查询结果, 关闭上一次的分页模型"""
+        if self.model is not None:
+            self.model.close()
+        self.model = model
+        self.result_table.setModel(model)
+        self.info_label.setText(info)
+    
+    def closeEvent(self, event):
+        if self.model is not None:
+            self.model.close()
+            self.model = None
+        super().closeEvent(event)
+
+
 class Enhanced3DMapWidget(QWidget):
     """增强的地图组件 - 集成Folium和Plotly 3D"""
     
@@ -707,6 +1240,18 @@ class Enhanced3DMapWidget(QWidget):
         self.map_file = os.path.join(self.temp_dir, "map.html")
         self.plotly_file = os.path.join(self.temp_dir, "plotly_3d.html")
         
+        # 栅格瓦片通过自定义URL scheme提供给地图页面
+        if RASTER_AVAILABLE:
+            install_tile_handler()
+        
+        # 导入缓存 - 重复导入同一文件时直接内存映射读取
+        self.layer_cache = None
+        if LAYER_CACHE_AVAILABLE:
+            try:
+                self.layer_cache = LayerCache(LAYER_CACHE_DIR, max_bytes=LAYER_CACHE_MAX_BYTES)
+            except OSError as e:
+                logging.warning(f"图层缓存不可用: {e}")
+        
         # 地图配置
         self.map_configs = {
             "OpenStreetMap": {
@@ -729,6 +1274,8 @@ class Enhanced3DMapWidget(QWidget):
         
         # 当前显示模式
         self.current_mode = "2D"  # "2D" 或 "3D"
+        self.identify_enabled = False  # 点选查询模式: 单击地图查询数据库中最近的要素
+        self.view_bounds = None  # 当前地图范围 (西, 南, 东, 北), 由页面加载后上报
         
         self.init_ui()
         self.create_initial_map()
@@ -742,6 +1289,9 @@ class Enhanced3DMapWidget(QWidget):
         
         # Web视图
         self.web_view = QWebEngineView()
+        self.map_page = MapPage(self.web_view)
+        self.map_page.view_changed.connect(self.set_view_bounds)
+        self.web_view.setPage(self.map_page)
         layout.addWidget(self.web_view)
         
         self.setLayout(layout)
@@ -837,6 +1387,13 @@ class Enhanced3DMapWidget(QWidget):
             # 小地图插件
             minimap = plugins.MiniMap()
             self.current_map.add_child(minimap)
+            
+            # 地图范围: 用于按当前范围导入矢量数据
+            self.current_map.add_child(ViewBoundsReporter())
+            
+            # 点选查询: 单击位置通过页面跳转交给MapPage
+            if self.identify_enabled:
+                self.current_map.add_child(IdentifyClickHandler())
         except Exception as e:
             logging.warning(f"添加地图插件时出错: {e}")
     
@@ -855,8 +1412,8 @@ class Enhanced3DMapWidget(QWidget):
         df = pd.DataFrame(cities_data)
         self.add_points_layer(df, '中国主要城市')
     
-    def add_points_layer(self, data, layer_name):
-        """添加点图层"""
+    def add_points_layer(self, data, layer_name, pyramid=None):
+        """添加点图层 (pyramid为从缓存读取的计数金字塔)"""
         if 'longitude' not in data.columns or 'latitude' not in data.columns:
             QMessageBox.warning(self, "警告", "数据中缺少经纬度列")
             return
@@ -868,6 +1425,8 @@ class Enhanced3DMapWidget(QWidget):
             'type': 'points',
             'visible': True  # 新增可见性属性
         })
+        if pyramid is not None:
+            pyramid_service.attach(self.data_layers[-1], pyramid)
         
         # 根据当前模式更新显示
         self.update_display()
@@ -909,11 +1468,13 @@ class Enhanced3DMapWidget(QWidget):
             for layer in self.data_layers:
                 if layer.get('visible', True):  # 只显示可见图层
                     if layer['type'] == 'points':
-                        self.add_points_to_folium_map(layer['data'], layer['name'])
+                        self.add_points_to_folium_map(layer['data'], layer['name'], layer)
                     elif layer['type'] == 'lines':
                         self.add_line_features_to_map(layer['data'], layer['name'])
                     elif layer['type'] == 'polygons':
                         self.add_polygon_features_to_map(layer['data'], layer['name'])
+                    elif layer['type'] == 'raster':
+                        self.add_raster_to_map(layer['data'], layer['name'])
             
             # 保存并加载地图
             self.save_and_load_map()
@@ -922,8 +1483,12 @@ class Enhanced3DMapWidget(QWidget):
             logging.error(f"更新2D地图时出错: {e}")
             QMessageBox.critical(self, "错误", f"更新2D地图失败: {str(e)}")
     
-    def add_points_to_folium_map(self, data, layer_name):
-        """向Folium地图添加点数据"""
+    def add_points_to_folium_map(self, data, layer_name, layer=None):
+        """向Folium地图添加点数据 (点很多时按计数金字塔的瓦片聚合显示)"""
+        if (PYRAMID_AVAILABLE and layer is not None and len(data) > PYRAMID_RENDER_THRESHOLD
+                and 'color' not in data.columns):
+            self.add_pyramid_to_folium_map(layer)
+            return
         try:
             # 创建标记聚类
             marker_cluster = plugins.MarkerCluster(name=layer_name).add_to(self.current_map)
@@ -933,8 +1498,10 @@ class Enhanced3DMapWidget(QWidget):
                 if pd.isna(row['longitude']) or pd.isna(row['latitude']):
                     continue
                     
-                # 根据人口大小设置图标颜色（简化版本）
-                if 'population' in data.columns and not pd.isna(row.get('population')):
+                # 根据人口大小设置图标颜色（简化版本）, 数据带color列时按其着色 (如查询结果高亮)
+                if 'color' in data.columns and not pd.isna(row['color']):
+                    color = row['color']
+                elif 'population' in data.columns and not pd.isna(row.get('population')):
                     pop = row['population']
                     if pop > 20000000:
                         color = 'red'
@@ -967,6 +1534,33 @@ class Enhanced3DMapWidget(QWidget):
             logging.error(f"添加点到地图时出错: {e}")
             QMessageBox.warning(self, "警告", f"添加数据点失败: {str(e)}")
     
+    def add_pyramid_to_folium_map(self, layer):
+        """按计数金字塔中非空瓦片数不超过上限的一级显示点图层, 每个瓦片一个按点数缩放的圆"""
+        try:
+            pyramid = pyramid_service.get(layer)
+            zoom = pyramid.choose_zoom()
+            tiles = pyramid.tiles(zoom)
+            group = folium.FeatureGroup(name=f"{layer['name']} (聚合)").add_to(self.current_map)
+            max_count = max(int(tiles['count'].max()), 1) if len(tiles) else 1
+            for tile in tiles.to_dict('records'):
+                popup_text = f"<b>{tile['count']} 个点</b><br>"
+                for col in pyramid.columns:
+                    total = tile[f"{col}_sum"]
+                    popup_text += f"{col}: 合计 {total:.4g}, 平均 {total / tile['count']:.4g}<br>"
+                folium.CircleMarker(
+                    location=[tile['latitude'], tile['longitude']],
+                    radius=4 + 16 * np.sqrt(tile['count'] / max_count),
+                    popup=folium.Popup(popup_text, max_width=300),
+                    tooltip=f"{tile['count']} 个点",
+                    color='blue',
+                    weight=1,
+                    fill=True,
+                    fillOpacity=0.5
+                ).add_to(group)
+            logging.info(f"点图层 {layer['name']} 按第 {zoom} 级金字塔显示: {len(tiles)} 个瓦片")
+        except Exception as e:
+            logging.error(f"添加聚合点图层时出错: {e}")
+    
     def add_line_features_to_map(self, line_features, layer_name):
         """向地图添加线要素（不保存到图层列表）"""
         try:
@@ -985,18 +1579,34 @@ class Enhanced3DMapWidget(QWidget):
                         if key != 'name':
                             popup_text += f"{key}: {value}<br>"
                     
-                    # 添加线要素
+                    # 添加线要素 (要素带color属性时按其着色, 如等高线)
                     folium.PolyLine(
                         locations=folium_coords,
                         popup=folium.Popup(popup_text, max_width=300),
                         tooltip=properties.get('name', '线要素'),
-                        color='blue',
+                        color=properties.get('color', 'blue'),
                         weight=3,
                         opacity=0.8
                     ).add_to(self.current_map)
         except Exception as e:
             logging.error(f"添加线要素到地图失败: {e}")
     
+    def add_raster_to_map(self, source, layer_name):
+        """向地图添加栅格瓦片图层 (瓦片按视口请求, 不加载整个栅格)"""
+        try:
+            west, south, east, north = source.wgs84_bounds()
+            folium.raster_layers.TileLayer(
+                tiles=tile_url(source),
+                attr=layer_name,
+                name=layer_name,
+                overlay=True,
+                control=False,
+                opacity=0.8,
+                bounds=[[south, west], [north, east]]
+            ).add_to(self.current_map)
+        except Exception as e:
+            logging.error(f"添加栅格图层到地图失败: {e}")
+    
     def add_polygon_features_to_map(self, polygon_features, layer_name):
         """向地图添加面要素（不保存到图层列表）"""
         try:
@@ -1016,15 +1626,16 @@ class Enhanced3DMapWidget(QWidget):
                         if key != 'name':
                             popup_text += f"{key}: {value}<br>"
                     
-                    # 添加面要素
+                    # 添加面要素 (要素带color属性时按其着色, 如查询结果高亮)
+                    color = properties.get('color', 'red')
                     folium.Polygon(
                         locations=folium_coords,
                         popup=folium.Popup(popup_text, max_width=300),
                         tooltip=properties.get('name', '面要素'),
-                        color='red',
+                        color=color,
                         weight=2,
                         fill=True,
-                        fillColor='red',
+                        fillColor=color,
                         fillOpacity=0.3
                     ).add_to(self.current_map)
         except Exception as e:
@@ -1186,6 +1797,10 @@ class Enhanced3DMapWidget(QWidget):
             except Exception as e:
                 logging.error(f"切换地图类型时出错: {e}")
     
+    def set_view_bounds(self, west, south, east, north):
+        """记录页面上报的地图范围, 限制在经纬度的有效范围内"""
+        self.view_bounds = (max(west, -180.0), max(south, -90.0), min(east, 180.0), min(north, 90.0))
+    
     def fit_bounds(self):
         """适应数据边界"""
         try:
@@ -1306,59 +1921,43 @@ class Enhanced3DMapWidget(QWidget):
     def import_data(self, file_path):
         """导入数据"""
         try:
-            if file_path.endswith('.csv'):
-                data = pd.read_csv(file_path, encoding='utf-8')
-                # 检查坐标列
-                coord_cols = ['longitude', 'lon', 'lng', 'x', 'X', '经度']
-                lat_cols = ['latitude', 'lat', 'y', 'Y', '纬度']
-                
-                lon_col = None
-                lat_col = None
-                
-                for col in coord_cols:
-                    if col in data.columns:
-                        lon_col = col
-                        break
-                
-                for col in lat_cols:
-                    if col in data.columns:
-                        lat_col = col
-                        break
-                
-                if lon_col and lat_col:
-                    # 标准化列名
-                    data = data.rename(columns={lon_col: 'longitude', lat_col: 'latitude'})
-                    
-                    # 确保坐标为数值类型
-                    data['longitude'] = pd.to_numeric(data['longitude'], errors='coerce')
-                    data['latitude'] = pd.to_numeric(data['latitude'], errors='coerce')
-                    
-                    # 移除无效坐标
-                    data = data.dropna(subset=['longitude', 'latitude'])
-                    
-                    if len(data) == 0:
-                        QMessageBox.warning(self, "警告", "没有有效的坐标数据")
+            suffix = Path(file_path).suffix.lower()
+            if suffix in ('.csv', '.json', '.geojson'):
+                # 先查磁盘缓存, 命中时跳过文本解析
+                result = self.layer_cache.get(file_path) if self.layer_cache else None
+                if result is None:
+                    if suffix == '.csv':
+                        result = self.parse_csv(file_path)
+                    else:
+                        result = self.parse_geojson(file_path)
+                    if result is None:
                         return False
-                    
-                    layer_name = Path(file_path).stem
-                    self.add_points_layer(data, layer_name)
-                    return True
-                else:
-                    QMessageBox.warning(self, "警告", "文件中未找到坐标列")
-                    return False
-                    
-            elif file_path.endswith('.json') or file_path.endswith('.geojson'):
-                # 处理GeoJSON数据
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    geojson_data = json.load(f)
+                    self.cache_import_result(file_path, result)
                 
-                if geojson_data.get('type') == 'FeatureCollection':
-                    layer_name = Path(file_path).stem
-                    self.add_geojson_layer(geojson_data, layer_name)
+                layer_name = Path(file_path).stem
+                if suffix == '.csv':
+                    result = self.with_csv_crs(result)
+                    if result is None:
+                        return False
+                    # 计数金字塔按显示坐标建立, 只有经纬度数据的金字塔与所选坐标系无关, 可以随文件缓存
+                    geographic = result['crs'] == DISPLAY_CRS
+                    result = self.to_display_crs(result)
+                    if result is None:
+                        return False
+                    layer_count = len(self.data_layers)
+                    pyramid = self.load_point_pyramid(file_path) if geographic else None
+                    self.add_points_layer(result['points'], layer_name, pyramid)
+                    self.tag_layer_crs(layer_count, result)
+                    if geographic and len(self.data_layers) > layer_count:
+                        self.save_point_pyramid(file_path, self.data_layers[layer_count])
                     return True
-                else:
-                    QMessageBox.warning(self, "警告", "不支持的GeoJSON格式")
-                    return False
+                return self.add_vector_result(result, layer_name)
+            elif suffix in SUPPORTED_VECTOR_EXTENSIONS:
+                return self.import_vector_files([file_path])
+            elif suffix == '.parquet':
+                return self.import_geoparquet(file_path)
+            elif suffix in RASTER_EXTENSIONS:
+                return self.import_raster(file_path)
             else:
                 QMessageBox.warning(self, "警告", "不支持的文件格式")
                 return False
@@ -1368,62 +1967,287 @@ class Enhanced3DMapWidget(QWidget):
             QMessageBox.critical(self, "错误", f"导入数据失败: {str(e)}")
             return False
     
-    def add_geojson_layer(self, geojson_data, layer_name):
-        """添加GeoJSON图层"""
-        try:
-            features = geojson_data.get('features', [])
-            if not features:
-                QMessageBox.warning(self, "警告", "GeoJSON文件中没有要素")
-                return
-            
-            # 分析要素类型
-            point_features = []
-            line_features = []
-            polygon_features = []
+    def import_raster(self, file_path):
+        """导入栅格 (GeoTIFF/DEM): 只读取元数据, 瓦片在显示时按窗口读取"""
+        source = RasterSource(file_path, cache_dir=OVERVIEW_CACHE_DIR)
+        self.add_raster_layer(source, Path(file_path).stem)
+        if source.overview_future is not None:
+            QMessageBox.information(self, "提示", "栅格较大, 正在后台生成概视, 缩小显示的瓦片稍后可见")
+        return True
+    
+    def add_raster_layer(self, source, name, generated=False):
+        """注册栅格的瓦片源并添加为栅格图层, 返回图层
+
+        generated 表示栅格是分析结果 (文件在缓存目录中), 保存项目时会复制到项目里。
+        """
+        register_source(source)
+        layer = {
+            'name': name,
+            'data': source,
+            'type': 'raster',
+            'visible': True,
+            'crs': source.crs.to_string(),
+            'generated': generated
+        }
+        self.data_layers.append(layer)
+        return layer
+    
+    def parse_csv(self, file_path):
+        """解析CSV点数据, 失败时返回None
+
+        结果只包含解析出的列 (crs为None), 会写入按文件内容寻址的图层缓存;
+        坐标系由 with_csv_crs 在每次导入时确定。
+        """
+        data = pd.read_csv(file_path, encoding='utf-8')
+        # 检查坐标列
+        coord_cols = ['longitude', 'lon', 'lng', 'x', 'X', '经度']
+        lat_cols = ['latitude', 'lat', 'y', 'Y', '纬度']
+        
+        lon_col = None
+        lat_col = None
+        
+        for col in coord_cols:
+            if col in data.columns:
+                lon_col = col
+                break
+        
+        for col in lat_cols:
+            if col in data.columns:
+                lat_col = col
+                break
+        
+        if not (lon_col and lat_col):
+            QMessageBox.warning(self, "警告", "文件中未找到坐标列")
+            return None
+        
+        # 标准化列名
+        data = data.rename(columns={lon_col: 'longitude', lat_col: 'latitude'})
+        
+        # 确保坐标为数值类型
+        data['longitude'] = pd.to_numeric(data['longitude'], errors='coerce')
+        data['latitude'] = pd.to_numeric(data['latitude'], errors='coerce')
+        
+        # 移除无效坐标
+        data = data.dropna(subset=['longitude', 'latitude'])
+        
+        if len(data) == 0:
+            QMessageBox.warning(self, "警告", "没有有效的坐标数据")
+            return None
+        
+        return {'crs': None, 'points': data, 'lines': [], 'polygons': []}
+    
+    def with_csv_crs(self, result):
+        """确定CSV点数据的坐标系: 坐标都在经纬度范围内时为经纬度, 否则询问 (每次导入都询问, 不来自缓存);
+        取消时返回None"""
+        data = result['points']
+        crs = DISPLAY_CRS
+        if not (data['longitude'].abs().le(180).all() and data['latitude'].abs().le(90).all()):
+            crs = ask_source_crs(self, data['longitude'], data['latitude'])
+            if crs is None:
+                return None
+        return dict(result, crs=crs)
+    
+    def to_display_crs(self, result):
+        """将读取结果转换到显示坐标系 (EPSG:4326), 无法转换时返回None"""
+        crs = result.get('crs') or DISPLAY_CRS
+        if crs == DISPLAY_CRS or (REPROJECTION_AVAILABLE and crs_equal(crs, DISPLAY_CRS)):
+            return dict(result, crs=DISPLAY_CRS, source_crs=crs)
+        
+        if not REPROJECTION_AVAILABLE:
+            QMessageBox.warning(self, "警告", f"数据坐标系为 {crs}, 未安装pyproj无法进行坐标转换")
+            return None
+        
+        return reproject_result(result, DISPLAY_CRS)
+    
+    def tag_layer_crs(self, layer_start, result):
+        """为新添加的图层记录坐标系和原始坐标系"""
+        for layer in self.data_layers[layer_start:]:
+            layer['crs'] = result.get('crs', DISPLAY_CRS)
+            layer['source_crs'] = result.get('source_crs', layer['crs'])
+    
+    def parse_geojson(self, file_path):
+        """解析GeoJSON文件, 失败时返回None"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            geojson_data = json.load(f)
+        
+        if geojson_data.get('type') != 'FeatureCollection':
+            QMessageBox.warning(self, "警告", "不支持的GeoJSON格式")
+            return None
+        
+        features = geojson_data.get('features', [])
+        if not features:
+            QMessageBox.warning(self, "警告", "GeoJSON文件中没有要素")
+            return None
+        
+        return self.split_geojson_features(features)
+    
+    def cache_import_result(self, file_path, result):
+        """将解析结果写入磁盘缓存, 失败不影响导入"""
+        if not self.layer_cache:
+            return
+        try:
+            self.layer_cache.put(file_path, result)
+        except Exception as e:
+            logging.warning(f"写入图层缓存失败: {e}")
+    
+    def load_point_pyramid(self, file_path):
+        """读取与图层缓存一起保存的计数金字塔, 没有时返回None"""
+        if not PYRAMID_AVAILABLE or not self.layer_cache:
+            return None
+        path = self.layer_cache.get_sidecar(file_path, PYRAMID_FILE)
+        if path is None:
+            return None
+        try:
+            return PointPyramid.load(path)
+        except Exception as e:
+            logging.warning(f"读取计数金字塔失败: {e}")
+            return None
+    
+    def save_point_pyramid(self, file_path, layer):
+        """建立点图层的计数金字塔并保存到图层缓存, 失败不影响导入"""
+        if not PYRAMID_AVAILABLE or not self.layer_cache:
+            return
+        try:
+            pyramid = pyramid_service.get(layer)
+            if self.layer_cache.get_sidecar(file_path, PYRAMID_FILE) is None:
+                self.layer_cache.put_sidecar(file_path, PYRAMID_FILE, pyramid.save)
+        except Exception as e:
+            logging.warning(f"保存计数金字塔失败: {e}")
+    
+    def import_vector_files(self, file_paths, bbox=None, columns=None):
+        """导入Shapefile/GeoPackage文件 (多文件并行读取)
+        
+        bbox为显示坐标系下的范围 (如当前地图范围), 按各文件的坐标系转换后下推到OGR;
+        columns为需要读取的属性列, None表示全部读取。
+        """
+        if not VECTOR_IO_AVAILABLE:
+            QMessageBox.warning(self, "警告", "未安装pyogrio或fiona, 无法导入Shapefile/GeoPackage")
+            return False
+        
+        try:
+            results = read_vector_files(file_paths, bbox=bbox, columns=columns, bbox_crs=DISPLAY_CRS)
             
-            for feature in features:
-                geometry = feature.get('geometry', {})
-                properties = feature.get('properties', {})
-                geom_type = geometry.get('type', '')
-                
-                if geom_type == 'Point':
-                    coords = geometry.get('coordinates', [])
-                    if len(coords) >= 2:
-                        point_data = {
-                            'longitude': coords[0],
-                            'latitude': coords[1],
-                            'name': properties.get('name', '未知点'),
-                            'type': properties.get('type', 'point')
-                        }
-                        # 添加其他属性
-                        for key, value in properties.items():
-                            if key not in ['name', 'type']:
-                                point_data[key] = value
-                        point_features.append(point_data)
-                
-                elif geom_type == 'LineString':
-                    line_features.append(feature)
-                
-                elif geom_type == 'Polygon':
-                    polygon_features.append(feature)
+            imported = False
+            for file_path, result in results.items():
+                if isinstance(result, Exception):
+                    QMessageBox.warning(self, "警告", f"读取 {file_path} 失败: {result}")
+                    continue
+                imported = self.add_vector_result(result, Path(file_path).stem) or imported
             
-            # 添加点要素
-            if point_features:
-                df = pd.DataFrame(point_features)
-                self.add_points_layer(df, f"{layer_name}_点要素")
+            if not imported:
+                QMessageBox.warning(self, "警告", "没有读取到有效要素")
+            return imported
             
-            # 添加线要素
-            if line_features:
-                self.add_line_features(line_features, f"{layer_name}_线要素")
+        except Exception as e:
+            logging.error(f"导入矢量数据失败: {e}")
+            QMessageBox.critical(self, "错误", f"导入矢量数据失败: {str(e)}")
+            return False
+    
+    def import_geoparquet(self, file_path, bbox=None, columns=None):
+        """导入GeoParquet文件"""
+        if not GEOPARQUET_AVAILABLE:
+            QMessageBox.warning(self, "警告", "未安装pyarrow/shapely, 无法导入GeoParquet")
+            return False
+        
+        result = read_geoparquet(file_path, bbox=bbox, columns=columns)
+        if not self.add_vector_result(result, Path(file_path).stem):
+            QMessageBox.warning(self, "警告", "没有读取到有效要素")
+            return False
+        return True
+    
+    def add_vector_result(self, result, layer_name):
+        """将矢量读取结果 {'crs', 'points', 'lines', 'polygons'} 添加为图层"""
+        result = self.to_display_crs(result)
+        if result is None:
+            return False
+        
+        layer_count = len(self.data_layers)
+        added = False
+        
+        # 添加点要素
+        if result['points'] is not None and len(result['points']) > 0:
+            self.add_points_layer(result['points'], f"{layer_name}_点要素")
+            added = True
+        
+        # 添加线要素
+        if result['lines']:
+            self.add_line_features(result['lines'], f"{layer_name}_线要素")
+            added = True
+        
+        # 添加面要素
+        if result['polygons']:
+            self.add_polygon_features(result['polygons'], f"{layer_name}_面要素")
+            added = True
+        
+        self.tag_layer_crs(layer_count, result)
+        return added
+    
+    def export_layer_geoparquet(self, layer_name, file_path):
+        """导出图层为GeoParquet文件"""
+        if not GEOPARQUET_AVAILABLE:
+            QMessageBox.warning(self, "警告", "未安装pyarrow/shapely, 无法导出GeoParquet")
+            return False
+        
+        for layer in self.data_layers:
+            if layer['name'] == layer_name:
+                write_layer_geoparquet(layer, file_path)
+                return True
+        return False
+    
+    def add_geojson_layer(self, geojson_data, layer_name):
+        """添加GeoJSON图层"""
+        try:
+            features = geojson_data.get('features', [])
+            if not features:
+                QMessageBox.warning(self, "警告", "GeoJSON文件中没有要素")
+                return
             
-            # 添加面要素
-            if polygon_features:
-                self.add_polygon_features(polygon_features, f"{layer_name}_面要素")
+            self.add_vector_result(self.split_geojson_features(features), layer_name)
                 
         except Exception as e:
             logging.error(f"添加GeoJSON图层失败: {e}")
             QMessageBox.critical(self, "错误", f"添加GeoJSON图层失败: {str(e)}")
     
+    def split_geojson_features(self, features):
+        """按几何类型拆分GeoJSON要素, 返回 {'crs', 'points', 'lines', 'polygons'}"""
+        # 分析要素类型
+        point_features = []
+        line_features = []
+        polygon_features = []
+        
+        for feature in features:
+            geometry = feature.get('geometry', {})
+            properties = feature.get('properties', {})
+            geom_type = geometry.get('type', '')
+            
+            if geom_type == 'Point':
+                coords = geometry.get('coordinates', [])
+                if len(coords) >= 2:
+                    point_data = {
+                        'longitude': coords[0],
+                        'latitude': coords[1],
+                        'name': properties.get('name', '未知点'),
+                        'type': properties.get('type', 'point')
+                    }
+                    # 添加其他属性
+                    for key, value in properties.items():
+                        if key not in ['name', 'type']:
+                            point_data[key] = value
+                    point_features.append(point_data)
+            
+            elif geom_type == 'LineString':
+                line_features.append(feature)
+            
+            elif geom_type == 'Polygon':
+                polygon_features.append(feature)
+        
+        return {
+            'crs': 'EPSG:4326',
+            'points': pd.DataFrame(point_features) if point_features else None,
+            'lines': line_features,
+            'polygons': polygon_features
+        }
+    
     def add_line_features(self, line_features, layer_name):
         """添加线要素到地图"""
         try:
@@ -1451,12 +2275,12 @@ class Enhanced3DMapWidget(QWidget):
                         if key != 'name':
                             popup_text += f"{key}: {value}<br>"
                     
-                    # 添加线要素
+                    # 添加线要素 (要素带color属性时按其着色, 如等高线)
                     folium.PolyLine(
                         locations=folium_coords,
                         popup=folium.Popup(popup_text, max_width=300),
                         tooltip=properties.get('name', '线要素'),
-                        color='blue',
+                        color=properties.get('color', 'blue'),
                         weight=3,
                         opacity=0.8
                     ).add_to(self.current_map)
@@ -1571,7 +2395,7 @@ class Enhanced3DLayerPanel(QWidget):
         """添加图层到面板"""
         item = QTreeWidgetItem([layer_info['name']])
         item.setData(0, Qt.UserRole, layer_info)
-        item.setCheckState(0, Qt.Checked)
+        item.setCheckState(0, Qt.Checked if layer_info.get('visible', True) else Qt.Unchecked)
         item.setFlags(item.flags() | Qt.ItemIsUserCheckable)  # 启用复选框
         self.layer_tree.addTopLevelItem(item)
     
@@ -1594,6 +2418,7 @@ class Enhanced3DAttributePanel(QWidget):
     
     def __init__(self):
         super().__init__()
+        self.current_layer = None
         self.init_ui()
         
     def init_ui(self):
@@ -1607,9 +2432,26 @@ class Enhanced3DAttributePanel(QWidget):
         self.layer_info_tab.setReadOnly(True)
         self.tab_widget.addTab(self.layer_info_tab, "图层信息")
         
-        # 属性表标签
-        self.attribute_table = QTableWidget()
-        self.tab_widget.addTab(self.attribute_table, "属性表")
+        # 属性表标签 (模型直接读取图层列数据, 只格式化可见单元格)
+        attribute_widget = QWidget()
+        attribute_layout = QVBoxLayout()
+        attribute_layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.attribute_filter = QLineEdit()
+        self.attribute_filter.setPlaceholderText("过滤属性 (匹配任意列)")
+        self.attribute_filter.textChanged.connect(self.filter_attributes)
+        attribute_layout.addWidget(self.attribute_filter)
+        
+        self.attribute_model = DataFrameTableModel()
+        self.attribute_table = QTableView()
+        self.attribute_table.setModel(self.attribute_model)
+        self.attribute_table.setSortingEnabled(True)
+        self.attribute_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.attribute_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        attribute_layout.addWidget(self.attribute_table)
+        
+        attribute_widget.setLayout(attribute_layout)
+        self.tab_widget.addTab(attribute_widget, "属性表")
         
         # 统计信息标签
         self.stats_tab = QTextEdit()
@@ -1619,8 +2461,15 @@ class Enhanced3DAttributePanel(QWidget):
         layout.addWidget(self.tab_widget)
         self.setLayout(layout)
     
+    def selected_positions(self):
+        """属性表中选中的行在当前图层数据中的位置"""
+        rows = {index.row() for index in self.attribute_table.selectionModel().selectedIndexes()}
+        positions = self.attribute_model.row_positions()
+        return sorted(int(positions[row]) for row in rows if row < len(positions))
+    
     def show_layer_info(self, layer_info):
         """显示图层信息"""
+        self.current_layer = layer_info
         mode_info = "2D/3D切换" if PLOTLY_AVAILABLE else "2D地图"
         info_text = f"""
 图层名称: {layer_info['name']}
@@ -1635,60 +2484,37 @@ class Enhanced3DAttributePanel(QWidget):
         # 显示属性表 - 处理不同数据类型
         data = layer_info['data']
         
-        if isinstance(data, pd.DataFrame):
-            # 处理DataFrame数据
-            self.attribute_table.setRowCount(len(data))
-            self.attribute_table.setColumnCount(len(data.columns))
-            self.attribute_table.setHorizontalHeaderLabels(data.columns.tolist())
-            
-            for i, row in data.iterrows():
-                for j, value in enumerate(row):
-                    self.attribute_table.setItem(i, j, QTableWidgetItem(str(value)))
-            
-            # 显示统计信息
-            stats_text = "数据统计:\n\n"
-            for col in data.columns:
-                if data[col].dtype in ['int64', 'float64']:
-                    stats_text += f"{col}:\n"
-                    stats_text += f"  最小值: {data[col].min()}\n"
-                    stats_text += f"  最大值: {data[col].max()}\n"
-                    stats_text += f"  平均值: {data[col].mean():.2f}\n"
-                    stats_text += f"  标准差: {data[col].std():.2f}\n\n"
-            
-        elif isinstance(data, list):
-            # 处理GeoJSON要素列表
-            if data and isinstance(data[0], dict):
-                # 提取属性信息
-                properties_list = []
-                for feature in data:
-                    props = feature.get('properties', {})
-                    properties_list.append(props)
-                
-                if properties_list:
-                    # 获取所有属性键
-                    all_keys = set()
-                    for props in properties_list:
-                        all_keys.update(props.keys())
-                    all_keys = list(all_keys)
-                    
-                    self.attribute_table.setRowCount(len(properties_list))
-                    self.attribute_table.setColumnCount(len(all_keys))
-                    self.attribute_table.setHorizontalHeaderLabels(all_keys)
-                    
-                    for i, props in enumerate(properties_list):
-                        for j, key in enumerate(all_keys):
-                            value = props.get(key, '')
-                            self.attribute_table.setItem(i, j, QTableWidgetItem(str(value)))
-            
-            stats_text = f"GeoJSON要素统计:\n\n要素数量: {len(data)}\n"
+        self.attribute_filter.blockSignals(True)
+        self.attribute_filter.clear()
+        self.attribute_filter.blockSignals(False)
+        self.attribute_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.attribute_model.set_data(data)
+        
+        if isinstance(data, (pd.DataFrame, list)):
+            # 显示统计信息 (与统计对话框共用缓存)
+            stats = stats_service.get(layer_info)
+            if isinstance(data, pd.DataFrame):
+                stats_text = "数据统计:\n\n"
+            else:
+                stats_text = f"GeoJSON要素统计:\n\n要素数量: {len(data)}\n\n"
+            for col, col_stats in stats['columns'].items():
+                stats_text += f"{col}:\n"
+                stats_text += f"  最小值: {col_stats['min']:g}\n"
+                stats_text += f"  最大值: {col_stats['max']:g}\n"
+                stats_text += f"  平均值: {col_stats['mean']:.2f}\n"
+                stats_text += f"  标准差: {col_stats['std']:.2f}\n\n"
             
+        elif layer_info['type'] == 'raster':
+            stats_text = data.describe()
         else:
             # 其他数据类型
-            self.attribute_table.setRowCount(0)
-            self.attribute_table.setColumnCount(0)
             stats_text = "无法显示此类型的数据统计信息"
         
         self.stats_tab.setText(stats_text)
+    
+    def filter_attributes(self, text):
+        """按输入文本过滤属性表"""
+        self.attribute_model.set_filter(text)
 
 class Enhanced3DMainWindow(QMainWindow):
     """增强的主窗口 - 集成3D功能"""
@@ -1697,6 +2523,8 @@ class Enhanced3DMainWindow(QMainWindow):
         super().__init__()
         self.current_project = None
         self.db_manager = None  # 数据库管理器
+        self.identify_options = None  # 点选查询的表、要素数和距离
+        self.identify_dialog = None
         self.init_ui()
         self.setup_connections()
         self.init_database()  # 初始化数据库连接
@@ -1769,6 +2597,11 @@ class Enhanced3DMainWindow(QMainWindow):
         save_action.triggered.connect(self.save_project)
         file_menu.addAction(save_action)
         
+        save_as_action = QAction('项目另存为', self)
+        save_as_action.setShortcut('Ctrl+Shift+S')
+        save_as_action.triggered.connect(self.save_project_as)
+        file_menu.addAction(save_as_action)
+        
         file_menu.addSeparator()
         
         import_action = QAction('导入数据', self)
@@ -1779,6 +2612,10 @@ class Enhanced3DMainWindow(QMainWindow):
         export_action.triggered.connect(self.export_map)
         file_menu.addAction(export_action)
         
+        export_layer_action = QAction('导出图层 (GeoParquet)', self)
+        export_layer_action.triggered.connect(self.export_layer)
+        file_menu.addAction(export_layer_action)
+        
         # 视图菜单
         view_menu = menubar.addMenu('视图')
         
@@ -1797,6 +2634,87 @@ class Enhanced3DMainWindow(QMainWindow):
             toggle_3d_action.triggered.connect(self.toggle_3d_mode)
             view_menu.addAction(toggle_3d_action)
         
+        # 功能菜单
+        tools_menu = menubar.addMenu('功能')
+        
+        if TIN_AVAILABLE:
+            create_tin_action = QAction('创建TIN', self)
+            create_tin_action.triggered.connect(self.create_tin)
+            tools_menu.addAction(create_tin_action)
+            
+            add_tin_points_action = QAction('向TIN添加点', self)
+            add_tin_points_action.triggered.connect(self.add_points_to_tin)
+            tools_menu.addAction(add_tin_points_action)
+            tools_menu.addSeparator()
+        
+        if CONTOUR_AVAILABLE:
+            contour_action = QAction('生成等高线', self)
+            contour_action.triggered.connect(self.generate_contours)
+            tools_menu.addAction(contour_action)
+        
+        if TERRAIN_AVAILABLE:
+            terrain_action = QAction('地形分析', self)
+            terrain_action.triggered.connect(self.analyze_terrain)
+            tools_menu.addAction(terrain_action)
+        
+        if ZONAL_AVAILABLE:
+            zonal_action = QAction('分区统计', self)
+            zonal_action.triggered.connect(self.zonal_statistics)
+            tools_menu.addAction(zonal_action)
+        
+        if SPATIAL_JOIN_AVAILABLE:
+            join_action = QAction('空间连接', self)
+            join_action.triggered.connect(self.join_layers)
+            tools_menu.addAction(join_action)
+        
+        if BUFFER_AVAILABLE:
+            buffer_action = QAction('缓冲区', self)
+            buffer_action.triggered.connect(self.buffer_features)
+            tools_menu.addAction(buffer_action)
+            
+            buffer_query_action = QAction('缓冲区查询', self)
+            buffer_query_action.triggered.connect(self.query_buffer)
+            tools_menu.addAction(buffer_query_action)
+        
+        if MEASURE_AVAILABLE:
+            measure_action = QAction('测量长度和面积', self)
+            measure_action.triggered.connect(self.measure_features)
+            tools_menu.addAction(measure_action)
+            
+            distance_action = QAction('距离矩阵', self)
+            distance_action.triggered.connect(self.export_distances)
+            tools_menu.addAction(distance_action)
+        
+        if VORONOI_AVAILABLE:
+            voronoi_action = QAction('泰森多边形', self)
+            voronoi_action.triggered.connect(self.generate_voronoi)
+            tools_menu.addAction(voronoi_action)
+        
+        if INTERPOLATION_AVAILABLE and RASTER_AVAILABLE:
+            interpolate_action = QAction('插值 (IDW)', self)
+            interpolate_action.triggered.connect(self.interpolate_points)
+            tools_menu.addAction(interpolate_action)
+        
+        if DENSITY_AVAILABLE:
+            if RASTER_AVAILABLE:
+                density_action = QAction('核密度', self)
+                density_action.triggered.connect(self.kernel_density)
+                tools_menu.addAction(density_action)
+            
+            hexbin_action = QAction('六边形分箱', self)
+            hexbin_action.triggered.connect(self.hexbin_points)
+            tools_menu.addAction(hexbin_action)
+        
+        if PYRAMID_AVAILABLE:
+            bbox_stats_action = QAction('范围统计', self)
+            bbox_stats_action.triggered.connect(self.bbox_statistics)
+            tools_menu.addAction(bbox_stats_action)
+        
+        if DISSOLVE_AVAILABLE:
+            dissolve_action = QAction('按属性融合', self)
+            dissolve_action.triggered.connect(self.dissolve_polygons)
+            tools_menu.addAction(dissolve_action)
+        
         # 帮助菜单
         help_menu = menubar.addMenu('帮助')
         
@@ -1811,6 +2729,11 @@ class Enhanced3DMainWindow(QMainWindow):
             db_operations_action = QAction('数据库操作', self)
             db_operations_action.triggered.connect(self.open_database_operations)
             db_menu.addAction(db_operations_action)
+            
+            self.identify_action = QAction('点选查询', self)
+            self.identify_action.setCheckable(True)
+            self.identify_action.toggled.connect(self.toggle_identify)
+            db_menu.addAction(self.identify_action)
     
     def create_toolbar(self):
         """创建工具栏"""
@@ -1854,89 +2777,183 @@ class Enhanced3DMainWindow(QMainWindow):
         self.layer_panel.layer_visibility_changed.connect(self.map_widget.toggle_layer_visibility)  # 新增
         self.layer_panel.add_btn.clicked.connect(self.import_data)
         self.layer_panel.remove_btn.clicked.connect(self.remove_layer)
+        self.map_widget.map_page.identify_requested.connect(self.identify_at)
     
     def new_project(self):
         """新建项目"""
         self.map_widget.data_layers.clear()
         self.layer_panel.layer_tree.clear()
         self.map_widget.create_initial_map()
+        self.current_project = None
         self.statusBar().showMessage("新项目创建完成")
     
     def open_project(self):
         """打开项目"""
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "打开项目", "", "JSON文件 (*.json)"
+            self, "打开项目", "", "StudyGIS项目 (project.json);;旧版JSON项目 (*.json)"
         )
         if file_path:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    project_data = json.load(f)
-                
                 # 清空当前数据
                 self.map_widget.data_layers.clear()
                 self.layer_panel.layer_tree.clear()
                 
-                # 加载项目数据
-                for layer_data in project_data.get('layers', []):
-                    df = pd.DataFrame(layer_data['data'])
-                    self.map_widget.add_points_layer(df, layer_data['name'])
-                    self.layer_panel.add_layer(self.map_widget.data_layers[-1])
+                if PROJECT_STORE_AVAILABLE and project_store.is_project_manifest(file_path):
+                    # 只读取清单, 图层数据在首次显示时加载
+                    manifest, layers = project_store.open_project(file_path,
+                                                                  raster_cache_dir=OVERVIEW_CACHE_DIR)
+                    self.map_widget.data_layers.extend(layers)
+                    for layer in layers:
+                        self.layer_panel.add_layer(layer)
+                    self.map_widget.update_display()
+                    self.current_project = str(Path(file_path).parent)
+                else:
+                    self.open_legacy_project(file_path)
+                    self.current_project = None
                 
                 self.statusBar().showMessage(f"项目已打开: {file_path}")
                 
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"打开项目失败: {str(e)}")
     
+    def open_legacy_project(self, file_path):
+        """打开旧版JSON项目文件"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            project_data = json.load(f)
+        
+        # 加载项目数据
+        for layer_data in project_data.get('layers', []):
+            if layer_data.get('type') == 'lines':
+                self.map_widget.add_line_features(layer_data['data'], layer_data['name'])
+            elif layer_data.get('type') == 'polygons':
+                self.map_widget.add_polygon_features(layer_data['data'], layer_data['name'])
+            else:
+                df = pd.DataFrame(layer_data['data'])
+                self.map_widget.add_points_layer(df, layer_data['name'])
+            self.layer_panel.add_layer(self.map_widget.data_layers[-1])
+        self.map_widget.update_display()
+    
     def save_project(self):
-        """保存项目"""
+        """保存项目 (已打开的项目增量保存)"""
+        if self.current_project:
+            self.write_project(self.current_project)
+        else:
+            self.save_project_as()
+    
+    def save_project_as(self):
+        """项目另存为"""
         if not self.map_widget.data_layers:
             QMessageBox.warning(self, "警告", "没有数据可保存")
             return
         
         file_path, _ = QFileDialog.getSaveFileName(
-            self, "保存项目", "", "JSON文件 (*.json)"
+            self, "保存项目", "", "StudyGIS项目 (*.sgproj)"
         )
         if file_path:
+            if not file_path.endswith('.sgproj'):
+                file_path += '.sgproj'
+            self.write_project(file_path)
+    
+    def write_project(self, project_dir):
+        """写入项目目录"""
+        if not PROJECT_STORE_AVAILABLE:
+            QMessageBox.warning(self, "警告", "未安装pyarrow/shapely, 无法保存项目")
+            return
+        
+        try:
+            if Path(project_dir).is_file():
+                raise ValueError(f"{project_dir} 是一个文件, 项目需要保存为目录")
+            
+            stats = project_store.save_project(
+                project_dir, self.map_widget.data_layers, app_version=APP_VERSION
+            )
+            self.current_project = str(project_dir)
+            self.statusBar().showMessage(
+                f"项目已保存: {project_dir} (更新 {stats['written']} 个图层, 未变化 {stats['reused']} 个)"
+            )
+            if stats['skipped']:
+                QMessageBox.warning(self, "警告", "以下图层的类型暂不支持保存, 未写入项目:\n"
+                                    + "\n".join(stats['skipped']))
+            
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"保存项目失败: {str(e)}")
+    
+    def vector_import_options(self, file_paths):
+        """Shapefile/GeoPackage的读取选项: 范围 (全部或当前地图范围) 和属性列, 返回 (bbox, columns), 取消时返回None"""
+        if not VECTOR_IO_AVAILABLE:
+            return None, None
+        bbox = None
+        if self.map_widget.view_bounds is not None:
+            extents = ["全部要素", "当前地图范围内的要素"]
+            extent, ok = QInputDialog.getItem(self, "导入矢量数据", "读取范围:", extents, 0, False)
+            if not ok:
+                return None
+            if extent == extents[1]:
+                bbox = self.map_widget.view_bounds
+        
+        fields = []
+        for file_path in file_paths:
             try:
-                project_data = {
-                    'name': f"GIS项目_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                    'created_time': datetime.now().isoformat(),
-                    'version': APP_VERSION,
-                    'layers': []
-                }
-                
-                for layer in self.map_widget.data_layers:
-                    layer_data = {
-                        'name': layer['name'],
-                        'type': layer['type'],
-                        'data': layer['data'].to_dict('records')
-                    }
-                    project_data['layers'].append(layer_data)
-                
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(project_data, f, ensure_ascii=False, indent=2)
-                
-                self.statusBar().showMessage(f"项目已保存: {file_path}")
-                
+                fields.extend(name for name in source_info(file_path)[1] if name not in fields)
             except Exception as e:
-                QMessageBox.critical(self, "错误", f"保存项目失败: {str(e)}")
+                logging.warning(f"读取属性列失败 {file_path}: {e}")
+        if not fields:
+            return bbox, None
+        text, ok = QInputDialog.getText(
+            self, "导入矢量数据",
+            f"读取的属性列 (逗号分隔, 留空读取全部):\n可选: {', '.join(fields)}"
+        )
+        if not ok:
+            return None
+        columns = [name.strip() for name in text.replace('，', ',').split(',') if name.strip()]
+        unknown = [name for name in columns if name not in fields]
+        if unknown:
+            QMessageBox.warning(self, "警告", f"没有属性列: {', '.join(unknown)}")
+            return None
+        return bbox, columns or None
     
     def import_data(self):
         """导入数据"""
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "导入数据", "", "CSV文件 (*.csv);;GeoJSON文件 (*.geojson);;JSON文件 (*.json)"
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "导入数据", "",
+            "所有支持格式 (*.csv *.geojson *.json *.shp *.gpkg *.parquet *.tif *.tiff *.img *.jp2 *.vrt);;"
+            "CSV文件 (*.csv);;GeoJSON文件 (*.geojson);;JSON文件 (*.json);;Shapefile (*.shp);;"
+            "GeoPackage (*.gpkg);;GeoParquet文件 (*.parquet);;栅格数据 (*.tif *.tiff *.img *.jp2 *.vrt)"
         )
-        if file_path:
-            if self.map_widget.import_data(file_path):
-                # 添加到图层面板 - 修复：确保添加最新的图层
-                if self.map_widget.data_layers:
-                    latest_layer = self.map_widget.data_layers[-1]
-                    self.layer_panel.add_layer(latest_layer)
-                    # 立即更新显示
-                    self.map_widget.update_display()
-                self.statusBar().showMessage(f"数据导入成功: {file_path}")
+        if not file_paths:
+            return
+        
+        layer_count = len(self.map_widget.data_layers)
+        
+        # Shapefile/GeoPackage 一次性提交, 多文件并行读取
+        vector_paths = [p for p in file_paths if Path(p).suffix.lower() in SUPPORTED_VECTOR_EXTENSIONS]
+        other_paths = [p for p in file_paths if p not in vector_paths]
+        
+        success = True
+        if vector_paths:
+            options = self.vector_import_options(vector_paths)
+            if options is None:
+                if not other_paths:
+                    return
+                file_paths = other_paths
             else:
-                self.statusBar().showMessage(f"数据导入失败: {file_path}")
+                success = self.map_widget.import_vector_files(vector_paths, *options) and success
+        for file_path in other_paths:
+            success = self.map_widget.import_data(file_path) and success
+        
+        # 添加到图层面板 - 一个文件可能生成多个图层
+        new_layers = self.map_widget.data_layers[layer_count:]
+        for layer in new_layers:
+            self.layer_panel.add_layer(layer)
+        if new_layers:
+            # 立即更新显示
+            self.map_widget.update_display()
+        
+        file_names = ', '.join(Path(p).name for p in file_paths)
+        if success:
+            self.statusBar().showMessage(f"数据导入成功: {file_names}")
+        else:
+            self.statusBar().showMessage(f"数据导入失败: {file_names}")
     
     def export_map(self):
         """导出地图"""
@@ -1958,17 +2975,41 @@ class Enhanced3DMainWindow(QMainWindow):
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"导出地图失败: {str(e)}")
     
+    def export_layer(self):
+        """导出当前选中图层为GeoParquet"""
+        current_item = self.layer_panel.layer_tree.currentItem()
+        if not current_item:
+            QMessageBox.warning(self, "警告", "请先在图层面板中选择图层")
+            return
+        
+        layer_info = current_item.data(0, Qt.UserRole)
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出图层", f"{layer_info['name']}.parquet", "GeoParquet文件 (*.parquet)"
+        )
+        if file_path:
+            try:
+                if self.map_widget.export_layer_geoparquet(layer_info['name'], file_path):
+                    self.statusBar().showMessage(f"图层已导出: {file_path}")
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"导出图层失败: {str(e)}")
+    
     def remove_layer(self):
         """移除图层"""
         current_item = self.layer_panel.layer_tree.currentItem()
         if current_item:
             layer_info = current_item.data(0, Qt.UserRole)
             if layer_info:
-                # 从图层列表中移除
+                # 从图层列表中移除 (面板中保存的是图层的副本, 按名称找到图层本身)
+                removed = [layer for layer in self.map_widget.data_layers if layer['name'] == layer_info['name']]
                 self.map_widget.data_layers = [
                     layer for layer in self.map_widget.data_layers 
                     if layer['name'] != layer_info['name']
                 ]
+                for layer in removed:
+                    # 项目中尚未加载的栅格没有注册瓦片源
+                    if RASTER_AVAILABLE and layer['type'] == 'raster' and dict.__contains__(layer, 'data'):
+                        unregister_source(layer['data'])
+                        self.discard_cached_raster(layer)
                 
                 # 从树中移除
                 self.layer_panel.layer_tree.takeTopLevelItem(
@@ -1980,6 +3021,21 @@ class Enhanced3DMainWindow(QMainWindow):
                 
                 self.statusBar().showMessage("图层已移除")
     
+    def discard_cached_raster(self, layer):
+        """删除分析结果写在缓存目录中的栅格文件 (仍有其他图层使用时保留)"""
+        path = Path(layer['data'].path)
+        if path.parent not in (INTERPOLATION_CACHE_DIR.resolve(), DENSITY_CACHE_DIR.resolve()):
+            return
+        # 项目中尚未加载的栅格不会引用缓存目录中的文件 (生成的栅格保存时已复制到项目中)
+        if any(other['type'] == 'raster' and dict.__contains__(other, 'data') and Path(other['data'].path) == path
+               for other in self.map_widget.data_layers):
+            return
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as e:
+            # Windows上仍有瓦片线程打开该文件时删除失败, 留待下次
+            logging.warning(f"删除缓存栅格失败: {e}")
+    
     def toggle_3d_mode(self):
         """切换3D模式"""
         if PLOTLY_AVAILABLE:
@@ -1991,13 +3047,679 @@ class Enhanced3DMainWindow(QMainWindow):
     
     def show_statistics(self):
         """显示统计分析对话框"""
-        if not self.map_widget.data_layers:
+        if not self.map_widget.data_layers and not self.db_manager:
             QMessageBox.information(self, "提示", "没有数据可以统计")
             return
         
-        dialog = StatisticsDialog(self.map_widget.data_layers, self)
+        # 数据库已连接时可选择在数据库中聚合统计
+        dialog = StatisticsDialog(self.map_widget.data_layers, self, db_manager=self.db_manager)
         dialog.exec_()
     
+    def choose_layer(self, layer_type, title, label, missing_message=None):
+        """让用户选择指定类型的图层, 取消或没有图层时返回None
+
+        没有该类型的图层时显示 missing_message (给出时), 用户取消选择时不提示。
+        """
+        layers = [layer for layer in self.map_widget.data_layers if layer['type'] == layer_type]
+        if not layers:
+            if missing_message:
+                QMessageBox.information(self, "提示", missing_message)
+            return None
+        names = [layer['name'] for layer in layers]
+        name, ok = QInputDialog.getItem(self, title, label, names, 0, False)
+        return layers[names.index(name)] if ok else None
+    
+    def elevation_column(self, layer):
+        """点图层的高程列: 自动识别, 识别不到时让用户从数值列中选择"""
+        data = layer['data']
+        z_column = find_elevation_column(data)
+        if z_column is not None:
+            return z_column
+        numeric_cols = [str(col) for col in data.select_dtypes(include=[np.number]).columns
+                        if col not in ('longitude', 'latitude')]
+        if not numeric_cols:
+            return None
+        z_column, ok = QInputDialog.getItem(self, "选择高程列", f"图层 {layer['name']} 的高程列:",
+                                            numeric_cols, 0, False)
+        return z_column if ok else None
+    
+    def create_tin(self):
+        """由点图层构建TIN图层并显示3D表面"""
+        layer = self.choose_layer('points', "创建TIN", "选择带高程的点图层:", "请先加载点图层")
+        if layer is None:
+            return
+        z_column = self.elevation_column(layer)
+        if z_column is None:
+            QMessageBox.warning(self, "警告", "图层中没有可用作高程的数值列")
+            return
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            tin = tin_from_layer(layer, z_column)
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", f"无法构建TIN: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        tin_layer = {
+            'name': f"{layer['name']}_TIN",
+            'data': tin,
+            'type': 'tin',
+            'visible': True,
+            'crs': layer.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(tin_layer)
+        self.layer_panel.add_layer(tin_layer)
+        self.statusBar().showMessage(
+            f"TIN已创建: {tin.vertex_count} 个顶点, {len(tin)} 个三角形"
+        )
+        
+        if PLOTLY_AVAILABLE:
+            dialog = StatisticsDialog(self.map_widget.data_layers, self, db_manager=self.db_manager)
+            dialog.layer_combo.setCurrentText(tin_layer['name'])
+            dialog.chart_combo.setCurrentText("3D表面图(TIN)")
+            dialog.exec_()
+    
+    def add_points_to_tin(self):
+        """把点图层中的点插入已有TIN (只局部更新受影响的三角形)"""
+        tin_layer = self.choose_layer('tin', "向TIN添加点", "选择TIN图层:", "请先创建TIN图层")
+        if tin_layer is None:
+            return
+        layer = self.choose_layer('points', "向TIN添加点", "选择要插入的点图层:", "请先加载点图层")
+        if layer is None:
+            return
+        z_column = self.elevation_column(layer)
+        if z_column is None:
+            QMessageBox.warning(self, "警告", "图层中没有可用作高程的数值列")
+            return
+        
+        data = layer['data']
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            added = tin_layer['data'].add_points(
+                pd.to_numeric(data['longitude'], errors='coerce').to_numpy(dtype=np.float64),
+                pd.to_numeric(data['latitude'], errors='coerce').to_numpy(dtype=np.float64),
+                pd.to_numeric(data[z_column], errors='coerce').to_numpy(dtype=np.float64)
+            )
+        finally:
+            QApplication.restoreOverrideCursor()
+        tin_layer['version'] = tin_layer.get('version', 0) + 1
+        self.statusBar().showMessage(
+            f"已向 {tin_layer['name']} 插入 {added} 个点, 现有 {len(tin_layer['data'])} 个三角形"
+        )
+    
+    def generate_contours(self):
+        """由TIN图层或DEM栅格生成等高线线图层"""
+        sources = [layer for layer in self.map_widget.data_layers if layer['type'] in ('tin', 'raster')]
+        if not sources:
+            QMessageBox.information(self, "提示", "请先导入DEM或通过\"功能\"→\"创建TIN\"生成TIN图层")
+            return
+        
+        dialog = ContourDialog(sources, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        source = dialog.selected_layer()
+        params = dialog.parameters()
+        
+        if source['type'] == 'raster' and source['data'].overview_future is not None \
+                and not source['data'].overview_future.done():
+            QMessageBox.information(self, "提示", "栅格概视正在生成, 请稍后再试")
+            return
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if source['type'] == 'raster':
+                # DEM按概视读取适当分辨率的网格, 大网格分块多进程追踪
+                features = contour_grid(*source['data'].read_grid(), **params)
+                result = self.map_widget.to_display_crs(
+                    {'crs': source['crs'], 'points': None, 'lines': features, 'polygons': []}
+                )
+                features = result['lines'] if result else []
+            else:
+                features = contour_tin(source['data'], **params)
+        except ValueError as e:
+            # 栅格实际读取的高程范围可能比统计值大, 级别数仍可能超过上限
+            QMessageBox.warning(self, "警告", str(e))
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        if not features:
+            QMessageBox.information(self, "提示", "该等高距下没有生成等高线")
+            return
+        
+        contour_layer = {
+            'name': f"{source['name']}_等高线_{params['interval']:g}",
+            'data': features,
+            'type': 'lines',
+            'visible': True,
+            'crs': DISPLAY_CRS if source['type'] == 'raster' else source.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(contour_layer)
+        self.layer_panel.add_layer(contour_layer)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"等高线已生成: {len(features)} 条")
+    
+    def analyze_terrain(self):
+        """由DEM栅格计算山体阴影/坡度/坡向, 结果作为栅格图层叠加显示"""
+        layer = self.choose_layer('raster', "地形分析", "选择DEM图层:", "请先导入DEM栅格")
+        if layer is None:
+            return
+        names = [PRODUCT_NAMES[product] for product in PRODUCTS]
+        name, ok = QInputDialog.getItem(self, "地形分析", "选择分析结果:", names, 0, False)
+        if not ok:
+            return
+        product = PRODUCTS[names.index(name)]
+        
+        dem_path = layer['data'].path
+        out_path = cached_output_path(TERRAIN_CACHE_DIR, dem_path, product)
+        if not out_path.exists():
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = out_path.with_suffix('.part.tif')
+            
+            def progress(done, total):
+                self.statusBar().showMessage(f"{name}计算中: {done}/{total} 块")
+                QApplication.processEvents()
+            
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                # 先写临时文件, 中断时不会留下不完整的缓存
+                terrain_analysis(dem_path, tmp_path, product, progress=progress)
+                os.replace(tmp_path, out_path)
+            except Exception as e:
+                QMessageBox.warning(self, "警告", f"地形分析失败: {str(e)}")
+                return
+            finally:
+                QApplication.restoreOverrideCursor()
+        
+        source = RasterSource(out_path, cmap=PRODUCT_CMAPS[product], value_range=PRODUCT_RANGES.get(product))
+        result_layer = self.map_widget.add_raster_layer(source, f"{layer['name']}_{name}", generated=True)
+        self.layer_panel.add_layer(result_layer)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"{name}已生成: {out_path.name}")
+    
+    def zonal_statistics(self):
+        """按面图层 (或数据库中的面表) 统计栅格值, 结果写为属性列"""
+        raster = self.choose_layer('raster', "分区统计", "选择栅格图层:", "请先导入栅格")
+        if raster is None:
+            return
+        layers = [layer for layer in self.map_widget.data_layers if layer['type'] == 'polygons']
+        targets = [layer['name'] for layer in layers]
+        if self.db_manager:
+            targets.append("数据库表: polygon_features")
+        if not targets:
+            QMessageBox.information(self, "提示", "没有可用的面图层")
+            return
+        target, ok = QInputDialog.getItem(self, "分区统计", "选择面图层:", targets, 0, False)
+        if not ok:
+            return
+        by = None
+        if target in targets[:len(layers)]:
+            # 默认每个要素单独统计; 多部件的面在导入时被拆成多个要素, 可以选择按属性列合并
+            per_feature = "不合并 (每个要素单独统计)"
+            _, attrs = layer_to_geometries(layers[targets.index(target)])
+            choice, ok = QInputDialog.getItem(self, "分区统计", "合并同值要素的属性列:",
+                                              [per_feature] + [str(col) for col in attrs.columns], 0, False)
+            if not ok:
+                return
+            by = None if choice == per_feature else choice
+        prefix, ok = QInputDialog.getText(self, "分区统计", "结果列名前缀:", text="高程")
+        if not ok or not prefix.strip():
+            return
+        prefix = prefix.strip()
+        
+        # 栅格很大时在概视上统计 (概视仍在后台生成时使用原始分辨率)
+        source = raster['data']
+        path = source.path
+        if source.overview_future is None or source.overview_future.done():
+            path = source.overview_path or source.path
+        level = choose_overview_level(path, ZONAL_MAX_PIXELS)
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if target in targets[:len(layers)]:
+                layer = layers[targets.index(target)]
+                table = zonal_layer(layer, path, prefix, by=by, overview_level=level)
+                count = len(table)
+            else:
+                count = self.db_manager.write_zonal_statistics('polygon_features', path, prefix, overview_level=level)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"分区统计失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        if target in targets[:len(layers)]:
+            self.attribute_panel.show_layer_info(layer)
+        self.statusBar().showMessage(f"分区统计完成: {target}, {count} 个分区, 结果列前缀 {prefix}")
+    
+    def join_layers(self):
+        """空间连接两个矢量图层 (例如为城市标注所在省份), 结果作为新图层"""
+        layers = [layer for layer in self.map_widget.data_layers if layer['type'] in ('points', 'lines', 'polygons')]
+        if len(layers) < 2:
+            QMessageBox.information(self, "提示", "空间连接需要至少两个矢量图层")
+            return
+        names = [layer['name'] for layer in layers]
+        left_name, ok = QInputDialog.getItem(self, "空间连接", "选择要标注的图层:", names, 0, False)
+        if not ok:
+            return
+        others = [name for name in names if name != left_name]
+        right_name, ok = QInputDialog.getItem(self, "空间连接", "选择提供属性的图层:", others, 0, False)
+        if not ok:
+            return
+        predicate_names = [PREDICATE_NAMES[p] for p in PREDICATES]
+        predicate_name, ok = QInputDialog.getItem(self, "空间连接", "空间关系:", predicate_names, 0, False)
+        if not ok:
+            return
+        predicate = PREDICATES[predicate_names.index(predicate_name)]
+        distance = None
+        if predicate == 'within_distance':
+            km, ok = QInputDialog.getDouble(self, "空间连接", "距离 (公里):", 10.0, 0.001, 20000.0, 3)
+            if not ok:
+                return
+            distance = km * 1000
+        left = layers[names.index(left_name)]
+        right = layers[names.index(right_name)]
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            data = spatial_join(left, right, predicate, distance)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"空间连接失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        join_layer = {
+            'name': f"{left_name}_{right_name}_连接",
+            'data': data,
+            'type': left['type'],
+            'visible': True,
+            'crs': left.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(join_layer)
+        self.layer_panel.add_layer(join_layer)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"空间连接完成: {len(data)} 条结果 ({predicate_name})")
+    
+    def buffer_features(self):
+        """为矢量图层的要素生成缓冲区 (距离按米计算), 结果作为新的面图层"""
+        layers = [layer for layer in self.map_widget.data_layers if layer['type'] in ('points', 'lines', 'polygons')]
+        if not layers:
+            QMessageBox.information(self, "提示", "请先加载点、线或面图层")
+            return
+        names = [layer['name'] for layer in layers]
+        name, ok = QInputDialog.getItem(self, "缓冲区", "选择图层:", names, 0, False)
+        if not ok:
+            return
+        km, ok = QInputDialog.getDouble(self, "缓冲区", "缓冲距离 (公里):", 10.0, 0.001, 20000.0, 3)
+        if not ok:
+            return
+        layer = layers[names.index(name)]
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            features = buffer_layer(layer, km * 1000)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"生成缓冲区失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        result_layer = {
+            'name': f"{name}_缓冲区_{km:g}km",
+            'data': features,
+            'type': 'polygons',
+            'visible': True,
+            'crs': layer.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(result_layer)
+        self.layer_panel.add_layer(result_layer)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"缓冲区生成完成: {len(features)} 个面, 距离 {km:g} 公里")
+    
+    def query_buffer(self):
+        """查询距属性表中选中要素N公里以内的要素, 结果作为高亮图层"""
+        selected_layer = self.attribute_panel.current_layer
+        positions = self.attribute_panel.selected_positions() if selected_layer else []
+        if not positions:
+            QMessageBox.information(self, "提示", "请先在属性表中选择要素")
+            return
+        layers = [layer for layer in self.map_widget.data_layers if layer['type'] in ('points', 'lines', 'polygons')]
+        names = [layer['name'] for layer in layers]
+        name, ok = QInputDialog.getItem(self, "缓冲区查询", "查询图层:", names, 0, False)
+        if not ok:
+            return
+        km, ok = QInputDialog.getDouble(self, "缓冲区查询", "距离 (公里):", 10.0, 0.001, 20000.0, 3)
+        if not ok:
+            return
+        target = layers[names.index(name)]
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            geoms, _ = layer_to_geometries(selected_layer)
+            found, distances = query_within_distance(target, geoms[positions], km * 1000,
+                                                     selection_crs=selected_layer.get('crs', DISPLAY_CRS))
+            data = highlight_data(target, found, distances)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"缓冲区查询失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        highlight_layer = {
+            'name': f"{name}_{km:g}km内",
+            'data': data,
+            'type': target['type'],
+            'visible': True,
+            'crs': target.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(highlight_layer)
+        self.layer_panel.add_layer(highlight_layer)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"缓冲区查询完成: {selected_layer['name']} 选中 {len(positions)} 个要素, "
+                                     f"{km:g} 公里以内有 {len(found)} 个要素")
+    
+    def measure_features(self):
+        """计算线/面图层每个要素的椭球面长度、周长和面积, 写为属性列"""
+        layers = [layer for layer in self.map_widget.data_layers if layer['type'] in ('lines', 'polygons')]
+        if not layers:
+            QMessageBox.information(self, "提示", "请先加载线图层或面图层")
+            return
+        names = [layer['name'] for layer in layers]
+        name, ok = QInputDialog.getItem(self, "测量", "选择图层:", names, 0, False)
+        if not ok:
+            return
+        layer = layers[names.index(name)]
+        
+        try:
+            table = measure_layer(layer)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"测量失败: {str(e)}")
+            return
+        
+        self.attribute_panel.show_layer_info(layer)
+        totals = ', '.join(f"{column} 合计 {table[column].sum():,.1f}" for column in table.columns)
+        self.statusBar().showMessage(f"测量完成: {name}, {totals}")
+    
+    def export_distances(self):
+        """导出两个图层要素之间的距离: 每个要素最近的k个 (CSV) 或完整距离矩阵 (.npy)"""
+        layers = [layer for layer in self.map_widget.data_layers if layer['type'] in ('points', 'lines', 'polygons')]
+        if not layers:
+            QMessageBox.information(self, "提示", "请先加载矢量图层")
+            return
+        names = [layer['name'] for layer in layers]
+        left_name, ok = QInputDialog.getItem(self, "距离矩阵", "起点图层 (行):", names, 0, False)
+        if not ok:
+            return
+        right_name, ok = QInputDialog.getItem(self, "距离矩阵", "终点图层 (列):", names, 0, False)
+        if not ok:
+            return
+        left = layers[names.index(left_name)]
+        right = layers[names.index(right_name)]
+        
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出距离", f"{left_name}_{right_name}_距离.csv",
+            "最近k个要素 (*.csv);;完整距离矩阵 (*.npy)"
+        )
+        if not file_path:
+            return
+        full_matrix = file_path.lower().endswith('.npy')
+        if not full_matrix:
+            k, ok = QInputDialog.getInt(self, "距离矩阵", "每个要素保留最近的要素个数:", 1, 1, 1000)
+            if not ok:
+                return
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if full_matrix:
+                matrix = distance_matrix(layer_points(left), layer_points(right), path=file_path)
+                message = f"距离矩阵已导出: {file_path} ({matrix.shape[0]}×{matrix.shape[1]}, 单位米)"
+            else:
+                table = nearest_table(left, right, k)
+                table.to_csv(file_path, index=False, encoding='utf-8-sig')
+                message = f"最近距离已导出: {file_path} ({len(table)} 行)"
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"导出距离失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.statusBar().showMessage(message)
+    
+    def generate_voronoi(self):
+        """为点图层生成泰森多边形 (服务区), 可裁剪到面图层的边界, 结果作为新的面图层"""
+        layer = self.choose_layer('points', "泰森多边形", "选择点图层:", "请先加载点图层")
+        if layer is None:
+            return
+        no_clip = "不裁剪 (点的外包范围)"
+        boundaries = [item for item in self.map_widget.data_layers if item['type'] == 'polygons']
+        names = [no_clip] + [item['name'] for item in boundaries]
+        name, ok = QInputDialog.getItem(self, "泰森多边形", "裁剪边界:", names, 0, False)
+        if not ok:
+            return
+        boundary = None if name == no_clip else boundaries[names.index(name) - 1]
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            features = voronoi_layer(layer, boundary)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"生成泰森多边形失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        voronoi_info = {
+            'name': f"{layer['name']}_泰森多边形",
+            'data': features,
+            'type': 'polygons',
+            'visible': True,
+            'crs': layer.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(voronoi_info)
+        self.layer_panel.add_layer(voronoi_info)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"泰森多边形生成完成: {len(features)} 个面")
+    
+    def interpolate_points(self):
+        """由点图层的数值属性做反距离加权插值, 结果作为栅格图层叠加显示"""
+        layer = self.choose_layer('points', "插值 (IDW)", "选择点图层:", "请先加载点图层")
+        if layer is None:
+            return
+        _, attrs = layer_to_geometries(layer)
+        columns = [str(col) for col in attrs.select_dtypes(include=[np.number]).columns]
+        if not columns:
+            QMessageBox.information(self, "提示", "图层没有数值属性列")
+            return
+        column, ok = QInputDialog.getItem(self, "插值 (IDW)", "插值属性列:", columns, 0, False)
+        if not ok:
+            return
+        k, ok = QInputDialog.getInt(self, "插值 (IDW)", "参与加权的最近点个数:", DEFAULT_K, 1, 1000)
+        if not ok:
+            return
+        
+        # 同一图层版本和参数的结果已在缓存中时直接使用
+        out_path = cached_grid_path(INTERPOLATION_CACHE_DIR, layer, 'idw', column=column, k=k)
+        if not out_path.exists():
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = out_path.with_suffix('.part.tif')
+            
+            def progress(done, total):
+                self.statusBar().showMessage(f"插值计算中: {done}/{total} 块")
+                QApplication.processEvents()
+            
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                grid, bounds = interpolate_layer(layer, column, k=k, progress=progress)
+                write_grid_raster(tmp_path, grid, bounds, layer.get('crs', DISPLAY_CRS))
+                os.replace(tmp_path, out_path)
+            except Exception as e:
+                QMessageBox.warning(self, "警告", f"插值失败: {str(e)}")
+                return
+            finally:
+                QApplication.restoreOverrideCursor()
+        self.touch_cached_grid(out_path)
+        
+        source = RasterSource(out_path, cmap='viridis')
+        result_layer = self.map_widget.add_raster_layer(source, f"{layer['name']}_{column}_IDW", generated=True)
+        self.layer_panel.add_layer(result_layer)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"插值完成: {source.width}x{source.height} 网格, {out_path.name}")
+    
+    def touch_cached_grid(self, out_path):
+        """记录缓存栅格的使用时间, 缓存目录超过容量上限时删除最久未用的文件 (已加载的栅格保留)"""
+        os.utime(out_path)
+        in_use = [layer['data'].path for layer in self.map_widget.data_layers
+                  if layer['type'] == 'raster' and dict.__contains__(layer, 'data')]
+        prune_grid_cache(out_path.parent, keep=in_use + [out_path])
+    
+    def choose_weight_column(self, layer, title):
+        """选择权重列, 返回 (列名或None, 是否确定); 不加权时按点数聚合"""
+        no_weight = "不加权 (点数)"
+        data = layer['data']
+        attrs = data if isinstance(data, pd.DataFrame) else layer_to_geometries(layer)[1]
+        columns = [str(col) for col in attrs.select_dtypes(include=[np.number]).columns
+                   if col not in ('longitude', 'latitude')]
+        name, ok = QInputDialog.getItem(self, title, "权重列:", [no_weight] + columns, 0, False)
+        return (None if name == no_weight else name), ok
+    
+    def kernel_density(self):
+        """点图层的核密度 (可按属性加权), 结果作为栅格图层叠加显示"""
+        layer = self.choose_layer('points', "核密度", "选择点图层:", "请先加载点图层")
+        if layer is None:
+            return
+        column, ok = self.choose_weight_column(layer, "核密度")
+        if not ok:
+            return
+        km, ok = QInputDialog.getDouble(self, "核密度", "带宽 (公里, 0为自动):", 0.0, 0.0, 20000.0, 3)
+        if not ok:
+            return
+        
+        # 同一图层版本和参数的结果已在缓存中时直接使用
+        out_path = cached_grid_path(DENSITY_CACHE_DIR, layer, 'kde', column=column, bandwidth_km=km)
+        value_range = grid_value_range(out_path) if out_path.exists() else None
+        if value_range is None:
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = out_path.with_suffix('.part.tif')
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                grid, bounds, bandwidth = density_layer(layer, column, km * 1000 if km > 0 else None)
+                write_grid_raster(tmp_path, grid, bounds, layer.get('crs', DISPLAY_CRS))
+                os.replace(tmp_path, out_path)
+            except Exception as e:
+                QMessageBox.warning(self, "警告", f"核密度计算失败: {str(e)}")
+                return
+            finally:
+                QApplication.restoreOverrideCursor()
+            value_range = (0.0, float(np.nanmax(grid)))
+            message = f"核密度完成: 带宽 {bandwidth / 1000:.3g} 公里"
+        else:
+            message = "核密度完成 (使用缓存结果)"
+        self.touch_cached_grid(out_path)
+        
+        source = RasterSource(out_path, cmap=DENSITY_CMAP, value_range=(0.0, value_range[1]))
+        result_layer = self.map_widget.add_raster_layer(source, f"{layer['name']}_核密度", generated=True)
+        self.layer_panel.add_layer(result_layer)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"{message}, {source.width}x{source.height} 网格")
+    
+    def hexbin_points(self):
+        """把点图层按六边形分箱汇总 (可按属性加权), 结果作为新的面图层"""
+        layer = self.choose_layer('points', "六边形分箱", "选择点图层:", "请先加载点图层")
+        if layer is None:
+            return
+        column, ok = self.choose_weight_column(layer, "六边形分箱")
+        if not ok:
+            return
+        km, ok = QInputDialog.getDouble(self, "六边形分箱", "六边形半径 (公里):", 50.0, 0.001, 5000.0, 3)
+        if not ok:
+            return
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            features = hexbin_layer(layer, km * 1000, column)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"六边形分箱失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        hexbin_info = {
+            'name': f"{layer['name']}_六边形{km:g}km",
+            'data': features,
+            'type': 'polygons',
+            'visible': True,
+            'crs': layer.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(hexbin_info)
+        self.layer_panel.add_layer(hexbin_info)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"六边形分箱完成: {len(features)} 个六边形")
+    
+    def bbox_statistics(self):
+        """统计点图层在经纬度范围内的点数和数值列合计 (由计数金字塔按瓦片汇总)"""
+        layer = self.choose_layer('points', "范围统计", "选择点图层:", "请先加载点图层")
+        if layer is None:
+            return
+        data = layer['data']
+        default = ", ".join(f"{value:.4f}" for value in (data['longitude'].min(), data['latitude'].min(),
+                                                          data['longitude'].max(), data['latitude'].max()))
+        text, ok = QInputDialog.getText(self, "范围统计", "范围 (西, 南, 东, 北):", text=default)
+        if not ok:
+            return
+        try:
+            bbox = [float(value) for value in text.replace('，', ',').split(',')]
+            if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "警告", "范围格式应为: 西, 南, 东, 北")
+            return
+        
+        summary = pyramid_service.get(layer).bbox_summary(bbox)
+        lines = [f"点数: {summary['count']}"]
+        for col, total in summary['sums'].items():
+            mean = total / summary['count'] if summary['count'] else float('nan')
+            lines.append(f"{col}: 合计 {total:.6g}, 平均 {mean:.6g}")
+        QMessageBox.information(self, f"范围统计 - {layer['name']}", "\n".join(lines))
+    
+    def dissolve_polygons(self):
+        """按属性列融合面图层 (如省界合成区域), 可对数值列求和, 结果作为新的面图层"""
+        layer = self.choose_layer('polygons', "按属性融合", "选择面图层:", "请先加载面图层")
+        if layer is None:
+            return
+        _, attrs = layer_to_geometries(layer)
+        columns = [str(col) for col in attrs.columns if col != 'color']
+        if not columns:
+            QMessageBox.information(self, "提示", "图层没有属性列")
+            return
+        column, ok = QInputDialog.getItem(self, "按属性融合", "分组列:", columns, 0, False)
+        if not ok:
+            return
+        options = ["对数值列求和", "只保留分组值和个数"]
+        option, ok = QInputDialog.getItem(self, "按属性融合", "属性汇总:", options, 0, False)
+        if not ok:
+            return
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            features = dissolve_layer(layer, column, option == options[0])
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"融合失败: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        
+        dissolve_info = {
+            'name': f"{layer['name']}_按{column}融合",
+            'data': features,
+            'type': 'polygons',
+            'visible': True,
+            'crs': layer.get('crs', DISPLAY_CRS)
+        }
+        self.map_widget.data_layers.append(dissolve_info)
+        self.layer_panel.add_layer(dissolve_info)
+        self.map_widget.update_display()
+        self.statusBar().showMessage(f"融合完成: {len(features)} 个面")
+    
     def fit_to_data(self):
         """适应数据范围"""
         if hasattr(self, 'map_widget'):
@@ -2044,6 +3766,71 @@ GitHub: https://github.com/Tqy43
                 logging.warning(f"数据库初始化失败: {e}")
                 self.statusBar().showMessage("数据库不可用 - 使用文件模式")
     
+    def toggle_identify(self, checked):
+        """开关点选查询: 开启时选择数据库表和查询数量, 之后单击地图查询最近的要素"""
+        if checked:
+            self.identify_options = self.ask_identify_options()
+            if self.identify_options is None:
+                self.identify_action.blockSignals(True)
+                self.identify_action.setChecked(False)
+                self.identify_action.blockSignals(False)
+                return
+            self.statusBar().showMessage(f"点选查询: 单击地图查询 {self.identify_options['table']} 中最近的要素")
+        else:
+            self.identify_options = None
+            self.statusBar().showMessage("点选查询已关闭")
+        self.map_widget.identify_enabled = self.identify_options is not None
+        if self.map_widget.current_mode == "2D":
+            self.map_widget.update_display()
+    
+    def ask_identify_options(self):
+        """连接数据库并询问点选查询的参数, 取消时返回None"""
+        if not self.db_manager:
+            try:
+                self.db_manager = initialize_database()
+            except Exception as e:
+                logging.warning(f"数据库初始化失败: {e}")
+            if not self.db_manager:
+                QMessageBox.warning(self, "警告", "数据库连接失败，请检查配置")
+                return None
+        table, ok = QInputDialog.getItem(self, "点选查询", "查询的数据库表:", IDENTIFY_TABLES, 0, False)
+        if not ok:
+            return None
+        k, ok = QInputDialog.getInt(self, "点选查询", "返回最近的要素个数:", 10, 1, 10000)
+        if not ok:
+            return None
+        km, ok = QInputDialog.getDouble(self, "点选查询", "最大距离 (公里, 0为不限):", 0.0, 0.0, 20000.0, 3)
+        if not ok:
+            return None
+        return {'table': table, 'k': k, 'max_distance': km * 1000 if km > 0 else None}
+    
+    def identify_at(self, lon, lat):
+        """查询数据库表中距单击位置最近的要素, 结果按页从数据库加载, 不读入整个表"""
+        options = self.identify_options
+        if options is None or not self.db_manager:
+            return
+        db_manager = self.db_manager
+        model = PagedTableModel(
+            lambda after_rank: db_manager.query_nearest(options['table'], lon, lat, options['k'],
+                                                        options['max_distance'], after_rank),
+            key_column='knn_rank', page_size=KNN_PAGE_SIZE
+        )
+        model.fetchMore()
+        if model.error is not None:
+            model.close()
+            QMessageBox.warning(self, "警告", f"点选查询失败: {str(model.error)}")
+            return
+        
+        if self.identify_dialog is None:
+            self.identify_dialog = IdentifyResultDialog(self)
+        info = f"({lon:.5f}, {lat:.5f}) 附近 {options['table']} 中最近的 {options['k']} 个要素"
+        if options['max_distance'] is not None:
+            info += f" (距离 {options['max_distance'] / 1000:g} 公里以内)"
+        self.identify_dialog.set_model(model, info)
+        self.identify_dialog.show()
+        self.identify_dialog.raise_()
+        self.statusBar().showMessage(f"点选查询: {info}")
+    
     def open_database_operations(self):
         """打开数据库操作窗口"""
         if not DATABASE_AVAILABLE:
@@ -2085,6 +3872,13 @@ def main():
     
     logger.info(f"启动 {APP_NAME} v{APP_VERSION}")
     
+    # 图表中文字体只在启动时设置一次
+    configure_fonts()
+    
+    # 栅格瓦片的URL scheme必须在创建QApplication之前注册
+    if RASTER_AVAILABLE:
+        register_tile_scheme()
+    
     # 创建QApplication
     app = QApplication(sys.argv)
     app.setApplicationName(APP_NAME)
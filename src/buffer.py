@@ -0,0 +1,183 @@
+"""
+缓冲区和缓冲区查询
+经纬度图层按区域分组, 每组在以区域为中心的等距投影 (米) 中一次性向量化生成缓冲区;
+"距离选中要素N公里以内" 的查询不生成缓冲区多边形: 先用图层的 STRtree 按扩展范围取候选,
+再用代表点之间的球面距离 (haversine) 和要素半径排除远处的候选, 点与点之间的球面距离直接作为结果,
+只有线/面附近的候选在局部投影中精确计算距离
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.geodesy import METERS_PER_DEGREE, haversine
+from src.layer_stats import VersionedLayerCache
+from src.reprojection import DISPLAY_CRS, crs_equal, is_geographic, local_metric_crs, transform_geometries
+from src.vector_io import layer_to_geometries, split_geometries
+
+REGION_SIZE = 6.0  # 生成缓冲区时按该大小 (度) 的区域分组投影
+QUAD_SEGS = 16  # 缓冲区每四分之一圆的线段数
+SEGMENT_DEGREES = 0.05  # 投影前加密顶点, 使经纬度中的直线边在投影后仍沿原来的位置
+HIGHLIGHT_COLOR = 'orange'
+DISTANCE_COLUMN = 'distance'
+
+logger = logging.getLogger(__name__)
+
+
+def representative_points(geoms):
+    """每个几何上的一个点及几何上所有顶点到该点的最大球面距离 (米), 返回 (经度, 纬度, 半径)"""
+    points = shapely.point_on_surface(geoms)
+    lon, lat = shapely.get_x(points), shapely.get_y(points)
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    radius = np.zeros(len(geoms))
+    if len(coords):
+        distances = haversine(lon[index], lat[index], coords[:, 0], coords[:, 1])
+        np.maximum.at(radius, index, distances)
+    return lon, lat, radius
+
+
+class LayerIndexCache(VersionedLayerCache):
+    """按图层版本缓存图层的几何数组、STRtree和代表点"""
+
+    def get(self, layer):
+        """返回 {'geoms', 'tree', 'points' (经度, 纬度, 半径) 或None}, 版本未变化时直接返回缓存"""
+        index = self._cached(layer)
+        if index is not None:
+            return index
+
+        geoms, _ = layer_to_geometries(layer)
+        geoms = np.where(shapely.is_missing(geoms), shapely.from_wkt('GEOMETRYCOLLECTION EMPTY'), geoms)
+        index = {'geoms': geoms, 'tree': shapely.STRtree(geoms), 'points': None}
+        if is_geographic(layer.get('crs', DISPLAY_CRS)):
+            index['points'] = representative_points(geoms)
+        self._store(layer, index)
+        logger.debug(f"建立图层空间索引: {layer.get('name')}")
+        return index
+
+
+index_cache = LayerIndexCache()
+
+
+def _region_groups(geoms):
+    """按质心所在的 REGION_SIZE 度区域分组, 返回 [(成员序号, 投影坐标系)]"""
+    centers = shapely.centroid(geoms)
+    keys = pd.DataFrame({'x': np.floor(shapely.get_x(centers) / REGION_SIZE),
+                         'y': np.floor(shapely.get_y(centers) / REGION_SIZE)})
+    groups = []
+    for _, members in keys.groupby(['x', 'y']).indices.items():
+        xmin, ymin, xmax, ymax = shapely.total_bounds(geoms[members])
+        groups.append((members, local_metric_crs([xmin, xmax], [ymin, ymax])))
+    return groups
+
+
+def buffer_geometries(geoms, distance, crs=DISPLAY_CRS, quad_segs=QUAD_SEGS):
+    """生成缓冲区 (距离单位为米), 返回与输入坐标系相同的几何数组
+
+    经纬度几何按区域分组, 每组在以该区域为中心的等距投影中生成, 区域内的长度误差可以忽略;
+    投影坐标系的几何直接按坐标单位生成。
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    if not is_geographic(crs):
+        return shapely.buffer(geoms, distance, quad_segs=quad_segs)
+    result = np.empty(len(geoms), dtype=object)
+    valid = np.flatnonzero(~(shapely.is_missing(geoms) | shapely.is_empty(geoms)))
+    for members, metric in _region_groups(geoms[valid]):
+        projected = transform_geometries(shapely.segmentize(geoms[valid[members]], SEGMENT_DEGREES), crs, metric)
+        buffered = shapely.buffer(projected, distance, quad_segs=quad_segs)
+        result[valid[members]] = transform_geometries(buffered, metric, crs)
+    return result
+
+
+def buffer_layer(layer, distance, quad_segs=QUAD_SEGS):
+    """为图层所有要素生成缓冲区, 返回面要素列表 (保留原属性)"""
+    geoms, attrs = layer_to_geometries(layer)
+    buffered = buffer_geometries(geoms, distance, layer.get('crs', DISPLAY_CRS), quad_segs)
+    return split_geometries(buffered, attrs)['polygons']
+
+
+def query_within_distance(layer, selection, distance, selection_crs=DISPLAY_CRS):
+    """查询图层中与选中几何的距离不超过distance (米) 的要素
+
+    返回 (要素位置, 到最近选中几何的距离), 按位置排序。经纬度图层的候选先按代表点的球面距离判断:
+    减去两者半径后仍超过distance的直接排除; 点与点的球面距离即为精确距离,
+    其余候选在以选区为中心的等距投影中精确计算。
+    """
+    crs = layer.get('crs', DISPLAY_CRS)
+    selection = np.asarray(selection, dtype=object)
+    selection = selection[~(shapely.is_missing(selection) | shapely.is_empty(selection))]
+    if not crs_equal(selection_crs, crs):
+        selection = transform_geometries(selection, selection_crs, crs)
+    index = index_cache.get(layer)
+    empty = (np.array([], dtype=np.int64), np.array([]))
+    if len(selection) == 0 or len(index['geoms']) == 0:
+        return empty
+
+    if index['points'] is None:
+        # 投影坐标系: 坐标单位即为米, 直接用索引的距离查询
+        sel, cand = index['tree'].query(selection, predicate='dwithin', distance=distance)
+        distances = shapely.distance(selection[sel], index['geoms'][cand])
+        return _nearest_per_candidate(cand, distances)
+
+    # 按距离扩展选区范围 (经度方向按最高纬度放大), 用索引取候选
+    bounds = shapely.bounds(selection)
+    pad_lat = distance / METERS_PER_DEGREE
+    max_lat = np.minimum(np.maximum(np.abs(bounds[:, 1]), np.abs(bounds[:, 3])) + pad_lat, 89.9)
+    pad_lon = np.minimum(pad_lat / np.cos(np.radians(max_lat)), 360.0)
+    boxes = shapely.box(bounds[:, 0] - pad_lon, bounds[:, 1] - pad_lat,
+                        bounds[:, 2] + pad_lon, bounds[:, 3] + pad_lat)
+    sel, cand = index['tree'].query(boxes)
+    if len(sel) == 0:
+        return empty
+
+    sel_lon, sel_lat, sel_radius = representative_points(selection)
+    cand_lon, cand_lat, cand_radius = index['points']
+    rep_distance = haversine(sel_lon[sel], sel_lat[sel], cand_lon[cand], cand_lat[cand])
+    # 顶点间的直线与大圆弧略有差别, 排除时留出余量
+    lower = rep_distance - sel_radius[sel] - cand_radius[cand]
+    keep = lower <= distance * 1.001 + 1.0
+    sel, cand, rep_distance = sel[keep], cand[keep], rep_distance[keep]
+
+    # 两个都是点时代表点距离就是精确距离, 否则在以选区为中心的等距投影中计算
+    extended = (sel_radius[sel] > 0) | (cand_radius[cand] > 0)
+    distances = rep_distance.copy()
+    if extended.any():
+        xmin, ymin, xmax, ymax = shapely.total_bounds(selection)
+        metric = local_metric_crs([xmin, xmax], [ymin, ymax])
+        used = np.unique(cand[extended])
+        projected = np.empty(len(index['geoms']), dtype=object)
+        projected[used] = transform_geometries(shapely.segmentize(index['geoms'][used], SEGMENT_DEGREES),
+                                               crs, metric)
+        projected_selection = transform_geometries(shapely.segmentize(selection, SEGMENT_DEGREES), crs, metric)
+        distances[extended] = shapely.distance(projected_selection[sel[extended]], projected[cand[extended]])
+    within = distances <= distance
+    logger.debug(f"缓冲区查询: {len(keep)} 个候选, 排除 {int((~keep).sum())} 个, "
+                 f"{int(extended.sum())} 个精确计算")
+    return _nearest_per_candidate(cand[within], distances[within])
+
+
+def _nearest_per_candidate(cand, distances):
+    """每个候选要素只保留到最近选中几何的距离"""
+    if len(cand) == 0:
+        return np.array([], dtype=np.int64), np.array([])
+    nearest = pd.Series(distances).groupby(cand).min()
+    return nearest.index.to_numpy(dtype=np.int64), nearest.to_numpy()
+
+
+def highlight_data(layer, positions, distances=None):
+    """取图层的部分要素作为高亮图层数据 (附带距离和高亮颜色)"""
+    data = layer['data']
+    if isinstance(data, pd.DataFrame):
+        subset = data.iloc[positions].reset_index(drop=True)
+        if distances is not None:
+            subset[DISTANCE_COLUMN] = distances
+        subset['color'] = HIGHLIGHT_COLOR
+        return subset
+    features = []
+    for k, position in enumerate(positions):
+        feature = data[position]
+        properties = dict(feature.get('properties') or {}, color=HIGHLIGHT_COLOR)
+        if distances is not None:
+            properties[DISTANCE_COLUMN] = float(distances[k])
+        features.append(dict(feature, properties=properties))
+    return features
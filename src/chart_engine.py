@@ -0,0 +1,237 @@
+"""
+统计图表绘制引擎
+大数据量散点图先用NumPy分箱聚合为二维密度图像再显示 (类似datashader);
+图表元素在切换图层/图表类型时复用, 只更新数据, 不重建整个Figure
+"""
+import logging
+
+import numpy as np
+import matplotlib
+from matplotlib import ticker
+
+CHINESE_FONTS = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
+DENSITY_THRESHOLD = 50000  # 超过该点数时散点图改为密度图
+DENSITY_SHAPE = (400, 300)  # 密度图像的分箱数 (宽, 高)
+
+logger = logging.getLogger(__name__)
+
+_fonts_configured = False
+
+
+def configure_fonts():
+    """设置Matplotlib中文字体 (程序启动时调用一次)"""
+    global _fonts_configured
+    if _fonts_configured:
+        return
+    matplotlib.rcParams['font.sans-serif'] = CHINESE_FONTS
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    _fonts_configured = True
+
+
+def density_grid(x, y, shape=DENSITY_SHAPE, extent=None):
+    """把散点分箱为二维计数网格
+
+    返回 (counts, extent): counts形状为 (高, 宽), 行对应y;
+    extent为 (xmin, xmax, ymin, ymax)。NaN/无穷值被忽略。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+
+    width, height = shape
+    if extent is None:
+        if len(x) == 0:
+            return np.zeros((height, width), dtype=np.int64), (0.0, 1.0, 0.0, 1.0)
+        extent = (x.min(), x.max(), y.min(), y.max())
+    xmin, xmax, ymin, ymax = extent
+    if xmax <= xmin:
+        xmin, xmax = xmin - 0.5, xmax + 0.5
+    if ymax <= ymin:
+        ymin, ymax = ymin - 0.5, ymax + 0.5
+
+    # 直接计算分箱编号再bincount, 比histogram2d快且只分配一份索引数组
+    col = ((x - xmin) * (width / (xmax - xmin))).astype(np.int64)
+    row = ((y - ymin) * (height / (ymax - ymin))).astype(np.int64)
+    np.clip(col, 0, width - 1, out=col)
+    np.clip(row, 0, height - 1, out=row)
+    inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    flat = row[inside] * width + col[inside]
+    counts = np.bincount(flat, minlength=width * height).reshape(height, width)
+    return counts, (xmin, xmax, ymin, ymax)
+
+
+class ChartEngine:
+    """在单个Axes上绘制并复用图表元素
+
+    每种图表保留一组artist, 切换时隐藏其他图表的artist, 数据变化时只调用set_data等方法更新。
+    """
+
+    def __init__(self, figure):
+        configure_fonts()
+        self.figure = figure
+        self.ax = figure.add_subplot(111)
+        self._scatter = None
+        self._image = None
+        self._colorbar = None
+        self._bars = None
+        self._pie = []
+        self._message = None
+
+    # ---- 内部 ----
+
+    def _show_only(self, *artists):
+        """隐藏除指定artist外的所有图表元素"""
+        keep = set(id(a) for a in artists if a is not None)
+        for artist in self._all_artists():
+            artist.set_visible(id(artist) in keep)
+        if self._colorbar is not None and not (self._image is not None and id(self._image) in keep):
+            # 移除色带, 把空间还给主Axes
+            self._colorbar.remove()
+            self._colorbar = None
+        # 饼图元素不可复用 (扇区数随数据变化), 切换走时直接移除
+        if self._pie and not any(id(w) in keep for w in self._pie):
+            for wedge in self._pie:
+                wedge.remove()
+            self._pie = []
+            # ax.pie 会关闭边框并清空刻度, 切换回其他图表时恢复
+            self.ax.set_aspect('auto')
+            self.ax.set_frame_on(True)
+            self.ax.yaxis.set_major_locator(ticker.AutoLocator())
+            self.ax.yaxis.set_major_formatter(ticker.ScalarFormatter())
+            self._reset_ticks()
+        self.ax.set_axis_on()
+
+    def _all_artists(self):
+        artists = [self._scatter, self._image, self._message]
+        if self._bars is not None:
+            artists.extend(self._bars)
+        artists.extend(self._pie)
+        return [a for a in artists if a is not None]
+
+    def _set_labels(self, xlabel='', ylabel='', title=''):
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        self.ax.set_title(title)
+
+    def _set_bars(self, left, heights, widths, align='edge'):
+        """更新柱子; 数量不变时复用已有矩形"""
+        left = np.asarray(left, dtype=np.float64)
+        heights = np.asarray(heights, dtype=np.float64)
+        widths = np.broadcast_to(np.asarray(widths, dtype=np.float64), left.shape)
+        if align == 'center':
+            left = left - widths / 2
+
+        if self._bars is None or len(self._bars) != len(left):
+            if self._bars is not None:
+                for rect in self._bars:
+                    rect.remove()
+            self._bars = list(self.ax.bar(left, heights, width=widths, align='edge',
+                                          color='C0', alpha=0.7))
+        else:
+            for rect, x, w, h in zip(self._bars, left, widths, heights):
+                rect.set_x(x)
+                rect.set_width(w)
+                rect.set_height(h)
+        return self._bars
+
+    def _reset_ticks(self):
+        """恢复数值坐标轴刻度 (柱状图会设置分类刻度)"""
+        self.ax.xaxis.set_major_locator(ticker.AutoLocator())
+        self.ax.xaxis.set_major_formatter(ticker.ScalarFormatter())
+        for label in self.ax.get_xticklabels():
+            label.set_rotation(0)
+            label.set_horizontalalignment('center')
+
+    def _autoscale(self):
+        self.ax.set_autoscale_on(True)
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+
+    def _fit_points(self, x, y):
+        """按散点范围设置坐标轴 (relim不统计散点集合)"""
+        finite = np.isfinite(x) & np.isfinite(y)
+        if not finite.any():
+            return
+        limits = []
+        for values in (x[finite], y[finite]):
+            low, high = float(values.min()), float(values.max())
+            margin = (high - low) * 0.05 or 0.5
+            limits.append((low - margin, high + margin))
+        self.ax.set_xlim(*limits[0])
+        self.ax.set_ylim(*limits[1])
+
+    # ---- 图表 ----
+
+    def scatter(self, x, y, xlabel='', ylabel='', title=''):
+        """散点图; 点数超过 DENSITY_THRESHOLD 时显示为密度图像"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) > DENSITY_THRESHOLD:
+            counts, extent = density_grid(x, y)
+            # 对数拉伸, 避免少数高密度像元压暗整个图像
+            image = np.log1p(counts).astype(np.float32)
+            image = np.ma.masked_equal(image, 0)
+            if self._image is None:
+                self._image = self.ax.imshow(image, origin='lower', extent=extent,
+                                             aspect='auto', cmap='viridis', interpolation='nearest')
+            else:
+                self._image.set_data(image)
+                self._image.set_extent(extent)
+            self._image.set_clim(0, max(float(image.max()), 1.0))
+            self._show_only(self._image)
+            if self._colorbar is None:
+                self._colorbar = self.figure.colorbar(self._image, ax=self.ax, label='log(1+点数)')
+            self.ax.set_xlim(extent[0], extent[1])
+            self.ax.set_ylim(extent[2], extent[3])
+            title = f"{title} (密度图, {len(x)} 个点)"
+        else:
+            offsets = np.column_stack([x, y])
+            if self._scatter is None:
+                self._scatter = self.ax.scatter(x, y, color='C0')
+            else:
+                self._scatter.set_offsets(offsets)
+            self._show_only(self._scatter)
+            self._fit_points(x, y)
+        self._reset_ticks()
+        self._set_labels(xlabel, ylabel, title)
+
+    def histogram(self, counts, edges, xlabel='', ylabel='频次', title=''):
+        """由预先计算的分箱绘制直方图"""
+        edges = np.asarray(edges, dtype=np.float64)
+        bars = self._set_bars(edges[:-1], counts, np.diff(edges))
+        self._show_only(*bars)
+        self._reset_ticks()
+        self._autoscale()
+        self._set_labels(xlabel, ylabel, title)
+
+    def bar(self, labels, values, xlabel='', ylabel='', title=''):
+        """分类柱状图"""
+        labels = [str(label) for label in labels]
+        positions = np.arange(len(labels))
+        bars = self._set_bars(positions, values, 0.8, align='center')
+        self._show_only(*bars)
+        self.ax.set_xticks(positions)
+        self.ax.set_xticklabels(labels, rotation=45, ha='right')
+        self._autoscale()
+        self._set_labels(xlabel, ylabel, title)
+
+    def pie(self, values, labels, title=''):
+        """饼图"""
+        self._show_only()
+        wedges, texts, autotexts = self.ax.pie(values, labels=[str(l) for l in labels], autopct='%1.1f%%')
+        self._pie = list(wedges) + list(texts) + list(autotexts)
+        self.ax.set_axis_off()
+        self._set_labels(title=title)
+
+    def message(self, text):
+        """在图表区域显示提示文字"""
+        if self._message is None:
+            self._message = self.ax.text(0.5, 0.5, text, horizontalalignment='center',
+                                         verticalalignment='center', transform=self.ax.transAxes)
+        else:
+            self._message.set_text(text)
+        self._show_only(self._message)
+        self.ax.set_axis_off()
+        self._set_labels()
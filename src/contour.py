@@ -0,0 +1,266 @@
+"""
+等高线生成
+规则格网 (DEM) 使用向量化的 Marching Squares, 大格网按行分块并可选多进程;
+TIN 对所有高程级别一次性切割三角形。线段按级别用 shapely.line_merge 连接成等高线,
+可选平滑和抽稀, 输出与线图层一致的GeoJSON要素
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib import colormaps
+from matplotlib.colors import Normalize, to_hex
+
+from src.vector_io import split_geometries
+
+DEFAULT_LEVEL_COUNT = 10
+MAX_LEVELS = 500  # 级别数上限, 等高距过小时拒绝生成
+TILE_ROWS = 512  # 分块处理时每块的行数
+PARALLEL_THRESHOLD = 4000000  # 超过该像元数时默认启用多进程
+CONTOUR_CMAP = 'terrain'
+
+logger = logging.getLogger(__name__)
+
+# Marching Squares 查找表: 角点编码 左下=1, 右下=2, 右上=4, 左上=8;
+# 边编号 下=0, 右=1, 上=2, 左=3; 每种情况最多两条线段, -1表示无
+_SEGMENTS = np.full((16, 2, 2), -1, dtype=np.int8)
+for _case, _segs in {
+    1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)],
+    5: [(3, 0), (1, 2)], 6: [(0, 2)], 7: [(3, 2)], 8: [(2, 3)],
+    9: [(0, 2)], 10: [(0, 1), (2, 3)], 11: [(1, 2)], 12: [(3, 1)],
+    13: [(0, 1)], 14: [(3, 0)],
+}.items():
+    for _k, _seg in enumerate(_segs):
+        _SEGMENTS[_case, _k] = _seg
+# 鞍点: 单元中心高于级别时, 两个高角点相连, 切开两个低角点
+_SADDLE_CONNECTED = {5: [(0, 1), (2, 3)], 10: [(3, 0), (1, 2)]}
+
+
+def contour_levels(zmin, zmax, interval=None, count=DEFAULT_LEVEL_COUNT):
+    """等高线高程级别: 指定间隔时取间隔的整数倍, 否则在范围内均匀取count个
+
+    级别数超过 MAX_LEVELS 时抛出ValueError (提示可用的最小等高距), 而不是生成海量级别。
+    """
+    if not np.isfinite(zmin) or not np.isfinite(zmax) or zmax <= zmin:
+        return np.array([])
+    if interval:
+        start = np.ceil(zmin / interval) * interval
+        n_levels = int(np.floor((zmax - start) / interval + 1e-9)) + 1
+        if n_levels > MAX_LEVELS:
+            raise ValueError(f"等高距 {interval:g} 会生成 {n_levels} 个级别, 超过上限 {MAX_LEVELS}; "
+                             f"高程范围 {zmin:g} ~ {zmax:g} 的等高距应不小于 {(zmax - zmin) / MAX_LEVELS:.3g}")
+        return np.arange(start, zmax + interval * 1e-9, interval)
+    return np.linspace(zmin, zmax, count + 2)[1:-1]
+
+
+# ---- 规则格网 ----
+
+def _edge_points(z, x, y, rows, cols, edges, level):
+    """单元 (rows, cols) 的指定边与级别的交点
+
+    同一条边无论从哪个单元计算, 都由相同的两个端点按相同顺序插值, 结果完全一致,
+    保证相邻单元的线段端点可以精确连接。
+    """
+    # 边的两个端点 (行, 列): 下/上为水平边, 左/右为竖直边
+    r0 = rows + (edges == 2)
+    c0 = cols + (edges == 1)
+    r1 = r0 + ((edges == 1) | (edges == 3))
+    c1 = c0 + ((edges == 0) | (edges == 2))
+    z0 = z[r0, c0]
+    z1 = z[r1, c1]
+    t = (level - z0) / (z1 - z0)
+    px = x[c0] + t * (x[c1] - x[c0])
+    py = y[r0] + t * (y[r1] - y[r0])
+    return np.column_stack([px, py])
+
+
+def grid_segments(z, x, y, levels):
+    """Marching Squares: 返回每个级别的线段数组列表, 每个数组形状为 (k, 2, 2)"""
+    z = np.asarray(z, dtype=np.float64)
+    bl, br = z[:-1, :-1], z[:-1, 1:]
+    tl, tr = z[1:, :-1], z[1:, 1:]
+    valid = np.isfinite(bl) & np.isfinite(br) & np.isfinite(tl) & np.isfinite(tr)
+
+    result = []
+    for level in levels:
+        case = ((bl >= level) * 1 + (br >= level) * 2 + (tr >= level) * 4 + (tl >= level) * 8).astype(np.int8)
+        case[~valid] = 0
+        rows, cols = np.nonzero((case != 0) & (case != 15))
+        case = case[rows, cols]
+        segments = _SEGMENTS[case].copy()
+
+        saddle = np.flatnonzero((case == 5) | (case == 10))
+        if len(saddle):
+            center = (bl[rows[saddle], cols[saddle]] + br[rows[saddle], cols[saddle]] +
+                      tl[rows[saddle], cols[saddle]] + tr[rows[saddle], cols[saddle]]) / 4
+            for saddle_case, connected in _SADDLE_CONNECTED.items():
+                hit = saddle[(case[saddle] == saddle_case) & (center >= level)]
+                segments[hit] = connected
+
+        parts = []
+        for k in range(2):
+            has = segments[:, k, 0] >= 0
+            r, c = rows[has], cols[has]
+            start = _edge_points(z, x, y, r, c, segments[has, k, 0], level)
+            end = _edge_points(z, x, y, r, c, segments[has, k, 1], level)
+            parts.append(np.stack([start, end], axis=1))
+        result.append(np.concatenate(parts))
+    return result
+
+
+def _tile_segments(args):
+    """在子进程中处理一个行块"""
+    z, x, y, levels = args
+    return grid_segments(z, x, y, levels)
+
+
+def grid_contours(z, x, y, levels, tile_rows=TILE_ROWS, max_workers=None):
+    """规则格网等高线, 返回每个级别的几何 (MultiLineString)
+
+    z形状为 (行, 列), x/y为列/行坐标。按行分块, 相邻块共享边界行,
+    边界上的交点完全一致; max_workers为None时像元数超过 PARALLEL_THRESHOLD 才使用多进程。
+    """
+    z = np.asarray(z, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    levels = np.asarray(levels, dtype=np.float64)
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if z.size >= PARALLEL_THRESHOLD else 1
+
+    starts = range(0, max(len(y) - 1, 1), tile_rows)
+    tasks = [(z[s:s + tile_rows + 1], x, y[s:s + tile_rows + 1], levels) for s in starts]
+    if max_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            tiles = list(executor.map(_tile_segments, tasks))
+    else:
+        tiles = [_tile_segments(task) for task in tasks]
+
+    segments = [np.concatenate([tile[i] for tile in tiles]) for i in range(len(levels))]
+    return merge_segments(segments)
+
+
+# ---- TIN ----
+
+def tin_segments(tin, levels):
+    """对所有级别一次性切割TIN三角形, 返回每个级别的线段数组列表"""
+    levels = np.sort(np.asarray(levels, dtype=np.float64))
+    if len(levels) == 0:
+        return []
+    triangles = tin.triangles
+    tz = tin.z[triangles]
+    # 与级别L相交的三角形满足 zmin < L <= zmax (高程等于L的顶点视为在上方)
+    lo = np.searchsorted(levels, tz.min(axis=1), side='right')
+    hi = np.searchsorted(levels, tz.max(axis=1), side='right')
+    counts = hi - lo
+    tri = np.repeat(np.arange(len(triangles)), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    level_index = lo[tri] + np.arange(len(tri)) - offsets
+    level = levels[level_index]
+
+    # 与另外两个顶点不在同一侧的顶点, 线段连接它的两条邻边上的交点
+    above = tin.z[triangles[tri]] >= level[:, None]
+    lone = np.where(above.sum(axis=1) == 1, above.argmax(axis=1), (~above).argmax(axis=1))
+    vertices = triangles[tri]
+    rows = np.arange(len(tri))
+    apex = vertices[rows, lone]
+    ends = [_tin_edge_points(tin, apex, vertices[rows, (lone + k) % 3], level) for k in (1, 2)]
+    segments = np.stack(ends, axis=1)
+
+    order = np.argsort(level_index, kind='stable')
+    split = np.searchsorted(level_index[order], np.arange(1, len(levels)))
+    return np.split(segments[order], split)
+
+
+def _tin_edge_points(tin, a, b, level):
+    """边 (a, b) 与级别的交点, 按顶点编号排序后插值以保证相邻三角形结果一致"""
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    za, zb = tin.z[a], tin.z[b]
+    t = ((level - za) / (zb - za))[:, None]
+    return tin.points[a] + t * (tin.points[b] - tin.points[a])
+
+
+def tin_contours(tin, levels):
+    """TIN等高线, 返回每个级别的几何 (按级别升序)"""
+    return merge_segments(tin_segments(tin, levels))
+
+
+# ---- 连接和后处理 ----
+
+def merge_segments(segments_by_level):
+    """把每个级别的线段连接为尽量长的折线"""
+    merged = []
+    for segments in segments_by_level:
+        # 去掉退化的零长度线段 (顶点恰好落在级别上时产生)
+        segments = segments[(segments[:, 0] != segments[:, 1]).any(axis=1)]
+        if len(segments) == 0:
+            merged.append(None)
+            continue
+        lines = shapely.linestrings(segments)
+        merged.append(shapely.line_merge(shapely.multilinestrings(lines)))
+    return merged
+
+
+def chaikin(coords, iterations=2):
+    """Chaikin角切割平滑, 开放折线保留端点, 闭合环保持闭合"""
+    closed = len(coords) > 3 and np.array_equal(coords[0], coords[-1])
+    for _ in range(iterations):
+        if len(coords) < 3:
+            break
+        p, q = coords[:-1], coords[1:]
+        cut = np.empty((2 * len(p), 2))
+        cut[0::2] = 0.75 * p + 0.25 * q
+        cut[1::2] = 0.25 * p + 0.75 * q
+        coords = np.vstack([cut, cut[:1]]) if closed else np.vstack([coords[:1], cut, coords[-1:]])
+    return coords
+
+
+def postprocess(geometry, smooth=0, simplify=0.0):
+    """平滑 (Chaikin迭代次数) 和抽稀 (Douglas-Peucker容差)"""
+    if geometry is None:
+        return None
+    if smooth:
+        parts = shapely.get_parts(geometry)
+        parts = [shapely.linestrings(chaikin(shapely.get_coordinates(part), smooth)) for part in parts]
+        geometry = shapely.multilinestrings(parts)
+    if simplify:
+        geometry = shapely.simplify(geometry, simplify, preserve_topology=False)
+    return geometry
+
+
+def contour_features(geometries, levels, smooth=0, simplify=0.0, cmap=CONTOUR_CMAP):
+    """把每个级别的等高线转为线图层的GeoJSON要素, 按高程着色"""
+    levels = np.asarray(levels, dtype=np.float64)
+    geometries = np.array([postprocess(g, smooth, simplify) for g in geometries], dtype=object)
+    if len(levels) == 0:
+        return []
+    norm = Normalize(levels.min(), levels.max() if levels.max() > levels.min() else levels.min() + 1)
+    colormap = colormaps[cmap]
+    attrs = pd.DataFrame({
+        'name': [f"等高线 {level:g}" for level in levels],
+        'elevation': levels,
+        'color': [to_hex(colormap(norm(level))) for level in levels]
+    })
+    return split_geometries(geometries, attrs)['lines']
+
+
+def contour_tin(tin, interval=None, count=DEFAULT_LEVEL_COUNT, smooth=0, simplify=0.0):
+    """由TIN生成等高线要素"""
+    levels = contour_levels(tin.z.min(), tin.z.max(), interval, count)
+    features = contour_features(tin_contours(tin, levels), levels, smooth, simplify)
+    logger.info(f"TIN等高线: {len(levels)} 个级别, {len(features)} 条线")
+    return features
+
+
+def contour_grid(z, x, y, interval=None, count=DEFAULT_LEVEL_COUNT, smooth=0, simplify=0.0, max_workers=None):
+    """由规则格网 (DEM) 生成等高线要素"""
+    z = np.asarray(z, dtype=np.float64)
+    levels = contour_levels(np.nanmin(z), np.nanmax(z), interval, count)
+    features = contour_features(grid_contours(z, x, y, levels, max_workers=max_workers),
+                                levels, smooth, simplify)
+    logger.info(f"格网等高线: {len(levels)} 个级别, {len(features)} 条线")
+    return features
@@ -2,16 +2,43 @@
 PostgreSQL + PostGIS 数据库配置和连接管理
 """
 import os
+import re
 import logging
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from geoalchemy2 import Geometry
 from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import json
 
+# 尝试导入GeoParquet模块 (可选)
+try:
+    import shapely
+    from src.geoparquet_io import write_geoparquet_batches, iter_geoparquet_batches
+    GEOPARQUET_AVAILABLE = True
+except ImportError:
+    GEOPARQUET_AVAILABLE = False
+
+# 尝试导入坐标转换模块 (可选, 需要pyproj)
+try:
+    from src.reprojection import epsg_code
+    REPROJECTION_AVAILABLE = True
+except ImportError:
+    REPROJECTION_AVAILABLE = False
+
+# 尝试导入分区统计模块 (可选, 需要rasterio)
+try:
+    from src.zonal import ZONAL_STATS, zonal_statistics
+    ZONAL_AVAILABLE = True
+except ImportError:
+    ZONAL_AVAILABLE = False
+
+# 分区统计结果列名前缀只允许字母、数字、下划线和汉字 (前缀会拼进SQL的列名)
+COLUMN_PREFIX_PATTERN = re.compile(r'[\w\u4e00-\u9fff]+')
+
 # 数据库配置
 DATABASE_CONFIG = {
     'host': 'localhost',
@@ -24,6 +51,27 @@ DATABASE_CONFIG = {
 # SQLAlchemy基类
 Base = declarative_base()
 
+KNN_PAGE_SIZE = 50
+# 距离换算为度时每度取偏小的长度, 预筛选范围只会偏大, 不会漏掉要素
+MIN_METERS_PER_DEGREE = 110000.0
+
+
+def _to_float(value):
+    """数据库返回值 -> float (NULL为NaN)"""
+    return float(value) if value is not None else float('nan')
+
+
+def _srid(crs):
+    """坐标系 -> PostGIS的SRID, 没有对应的EPSG代码时抛出ValueError (不静默按4326写入)"""
+    if crs is None:
+        return 4326
+    if REPROJECTION_AVAILABLE:
+        return epsg_code(crs)
+    if crs.upper().startswith('EPSG:'):
+        return int(crs.split(':')[1])
+    raise ValueError(f"坐标系 {crs} 需要pyproj解析EPSG代码")
+
+
 class DatabaseManager:
     """数据库管理器"""
     
@@ -75,6 +123,12 @@ class DatabaseManager:
             
             # 创建所有表
             Base.metadata.create_all(self.engine)
+            # geography表达式索引: 最近邻按球面距离排序 (geom::geography <-> 点) 时走索引
+            with self.engine.connect() as conn:
+                for table in Base.metadata.sorted_tables:
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table.name}_geog "
+                                      f"ON {table.name} USING GIST ((geom::geography))"))
+                conn.commit()
             self.logger.info("数据表创建成功")
             return True
             
@@ -112,8 +166,8 @@ class DatabaseManager:
             self.logger.error(f"查询执行失败: {e}")
             return None
     
-    def import_csv_to_postgis(self, csv_file, table_name, lon_col='longitude', lat_col='latitude'):
-        """将CSV数据导入PostGIS"""
+    def import_csv_to_postgis(self, csv_file, table_name, lon_col='longitude', lat_col='latitude', source_srid=4326):
+        """将CSV数据导入PostGIS (source_srid不是4326时由PostGIS转换坐标)"""
         try:
             # 读取CSV
             df = pd.read_csv(csv_file)
@@ -130,9 +184,12 @@ class DatabaseManager:
             placeholders = ', '.join([f':{col}' for col in columns])
             
             # 添加几何列
+            geom_sql = f"ST_SetSRID(ST_MakePoint(:{lon_col}, :{lat_col}), {int(source_srid)})"
+            if int(source_srid) != 4326:
+                geom_sql = f"ST_Transform({geom_sql}, 4326)"
             insert_sql = f"""
             INSERT INTO {table_name} ({', '.join(columns)}, geom)
-            VALUES ({placeholders}, ST_SetSRID(ST_MakePoint(:{lon_col}, :{lat_col}), 4326))
+            VALUES ({placeholders}, {geom_sql})
             """
             
             # 批量插入
@@ -198,6 +255,93 @@ class DatabaseManager:
             
             return pd.DataFrame()
     
+    def query_page(self, table_name, after_id=None, page_size=500, bbox=None):
+        """按主键分页查询 (keyset分页), 返回id大于after_id的下一页数据
+
+        与OFFSET分页不同, 每页的查询代价不随翻页深度增长, 也不需要在服务端保持游标。
+        出错时抛出异常, 由调用方处理。
+        """
+        query = f"""
+        SELECT *,
+               ST_X(ST_Centroid(geom)) as longitude,
+               ST_Y(ST_Centroid(geom)) as latitude,
+               ST_AsText(geom) as geometry_wkt
+        FROM {table_name}
+        WHERE geom IS NOT NULL
+        """
+        params = {'limit': int(page_size)}
+        if after_id is not None:
+            query += " AND id > :after_id"
+            params['after_id'] = after_id
+        if bbox:
+            # bbox格式: [min_lon, min_lat, max_lon, max_lat]
+            query += """
+            AND ST_Intersects(geom, ST_MakeEnvelope(:min_lon, :min_lat, :max_lon, :max_lat, 4326))
+            """
+            params.update(zip(['min_lon', 'min_lat', 'max_lon', 'max_lat'], map(float, bbox)))
+        query += " ORDER BY id LIMIT :limit"
+        
+        with self.engine.connect() as conn:
+            return pd.read_sql_query(text(query), conn, params=params)
+    
+    def query_all(self, table_name, page_size=5000, bbox=None):
+        """按主键逐页 (keyset) 读取整个查询结果, 返回DataFrame; 出错时抛出异常"""
+        frames = []
+        after_id = None
+        while True:
+            frame = self.query_page(table_name, after_id, page_size, bbox)
+            if len(frame) > 0:
+                frames.append(frame)
+            if len(frame) < page_size:
+                break
+            after_id = frame['id'].iloc[-1]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    
+    def query_nearest(self, table_name, lon, lat, k=10, max_distance=None, after_rank=None,
+                      page_size=KNN_PAGE_SIZE):
+        """查询距 (lon, lat) 最近的k个要素, 按名次分页, 返回名次大于after_rank的下一页
+
+        排序使用 ORDER BY geom::geography <-> 点, id: 由geography表达式索引 (create_tables创建) 按球面距离顺序返回,
+        不需要扫描整个表, 名次与 distance_m 一致, 距离相同时按id排序, 分页之间不会重复或遗漏;
+        max_distance (米) 给出时先用 ST_DWithin 在几何坐标 (度) 上按偏大的范围走索引预筛选,
+        再按球面距离精确过滤。结果带 knn_rank (名次, 从1开始) 和 distance_m (球面距离, 米) 列,
+        可以作为 PagedTableModel 的 fetch_page (key_column='knn_rank')。出错时抛出异常。
+        """
+        offset = int(after_rank or 0)
+        limit = min(int(page_size), int(k) - offset)
+        if limit <= 0:
+            return pd.DataFrame(columns=['knn_rank', 'distance_m'])
+
+        query = f"""
+        SELECT *,
+               ST_X(ST_Centroid(geom)) as longitude,
+               ST_Y(ST_Centroid(geom)) as latitude,
+               ST_AsText(geom) as geometry_wkt,
+               ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography) as distance_m
+        FROM {table_name}
+        WHERE geom IS NOT NULL
+        """
+        params = {'lon': float(lon), 'lat': float(lat), 'limit': limit, 'offset': offset}
+        if max_distance is not None:
+            # 经度方向按范围内的最高纬度放大
+            pad_lat = float(max_distance) / MIN_METERS_PER_DEGREE
+            max_lat = min(abs(float(lat)) + pad_lat, 89.0)
+            query += """
+            AND ST_DWithin(geom, ST_SetSRID(ST_MakePoint(:lon, :lat), 4326), :max_degrees)
+            AND ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography, :max_distance)
+            """
+            params['max_degrees'] = min(pad_lat / np.cos(np.radians(max_lat)), 360.0)
+            params['max_distance'] = float(max_distance)
+        query += """
+        ORDER BY geom::geography <-> ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography, id
+        LIMIT :limit OFFSET :offset
+        """
+        
+        with self.engine.connect() as conn:
+            frame = pd.read_sql_query(text(query), conn, params=params)
+        frame.insert(0, 'knn_rank', np.arange(offset + 1, offset + len(frame) + 1))
+        return frame
+    
     def import_geojson_to_postgis(self, geojson_file, table_name):
         """将GeoJSON数据导入PostGIS"""
         try:
@@ -395,6 +539,270 @@ class DatabaseManager:
             self.logger.error(f"导出图层失败: {e}")
             return False
 
+    def get_table_columns(self, table_name):
+        """获取表的列名列表"""
+        result = self.execute_query(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = :table_name",
+            {'table_name': table_name}
+        )
+        return [row['column_name'] for row in result] if result else []
+    
+    def get_numeric_columns(self, table_name):
+        """获取表中数值类型的列名 (不含主键id)"""
+        result = self.execute_query(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = :table_name
+              AND data_type IN ('smallint', 'integer', 'bigint', 'real', 'double precision', 'numeric')
+              AND column_name <> 'id'
+            ORDER BY ordinal_position
+            """,
+            {'table_name': table_name}
+        )
+        return [row['column_name'] for row in result] if result else []
+    
+    def get_table_statistics(self, table_name, bins=20, group_columns=('type', 'province'), top_n=20):
+        """在数据库中计算表的统计量, 只传输聚合结果
+
+        数值列的 count/min/max/avg/stddev 和四分位数 (percentile_cont) 在一条查询中完成,
+        直方图使用 width_bucket 分组计数, 分类列返回出现次数最多的 top_n 个取值。
+        返回结构与 layer_stats.summarize_frame 一致, 另含 'groups': {列名: pandas.Series}。
+        """
+        all_columns = self.get_table_columns(table_name)
+        if not all_columns:
+            raise ValueError(f"表 {table_name} 不存在或没有列")
+        numeric = self.get_numeric_columns(table_name)
+        
+        selects = ['COUNT(*) AS row_count']
+        for i, col in enumerate(numeric):
+            selects += [
+                f'COUNT("{col}") AS c{i}_count',
+                f'MIN("{col}")::float8 AS c{i}_min',
+                f'MAX("{col}")::float8 AS c{i}_max',
+                f'AVG("{col}")::float8 AS c{i}_avg',
+                f'STDDEV_SAMP("{col}")::float8 AS c{i}_std',
+                f'VAR_SAMP("{col}")::float8 AS c{i}_var',
+                f'percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY "{col}") AS c{i}_q'
+            ]
+        row = self.execute_query(f'SELECT {", ".join(selects)} FROM {table_name}')
+        if not row:
+            raise RuntimeError(f"统计查询 {table_name} 失败")
+        row = row[0]
+        
+        stats = {'row_count': int(row['row_count']), 'column_names': all_columns, 'columns': {}, 'groups': {}}
+        for i, col in enumerate(numeric):
+            count = int(row[f'c{i}_count'])
+            quantiles = row[f'c{i}_q'] or [None] * 3
+            col_stats = {
+                'count': count,
+                'mean': _to_float(row[f'c{i}_avg']),
+                'std': _to_float(row[f'c{i}_std']),
+                'm2': _to_float(row[f'c{i}_var']) * (count - 1) if count > 1 else 0.0,
+                'min': _to_float(row[f'c{i}_min']),
+                'max': _to_float(row[f'c{i}_max']),
+                'quantiles': {q: _to_float(v) for q, v in zip((0.25, 0.5, 0.75), quantiles)},
+                'histogram': None
+            }
+            if count > 0:
+                col_stats['histogram'] = self._table_histogram(table_name, col, col_stats['min'], col_stats['max'], bins)
+            stats['columns'][col] = col_stats
+        
+        for col in group_columns:
+            if col not in all_columns:
+                continue
+            result = self.execute_query(
+                f'SELECT "{col}" AS value, COUNT(*) AS count FROM {table_name} '
+                f'GROUP BY "{col}" ORDER BY count DESC LIMIT :top_n',
+                {'top_n': int(top_n)}
+            ) or []
+            stats['groups'][col] = pd.Series(
+                [int(r['count']) for r in result],
+                index=[r['value'] if r['value'] is not None else '(空)' for r in result],
+                name=col
+            )
+        
+        self.logger.info(f"数据库统计完成: {table_name}, {stats['row_count']} 条记录")
+        return stats
+    
+    def _table_histogram(self, table_name, column, min_value, max_value, bins):
+        """使用width_bucket计算直方图, 返回 (counts, edges), 与numpy.histogram一致"""
+        if min_value == max_value:
+            min_value, max_value = min_value - 0.5, max_value + 0.5
+        edges = np.linspace(min_value, max_value, bins + 1)
+        result = self.execute_query(
+            f'SELECT width_bucket("{column}"::float8, :lo, :hi, :bins) AS bucket, COUNT(*) AS count '
+            f'FROM {table_name} WHERE "{column}" IS NOT NULL GROUP BY bucket',
+            {'lo': float(min_value), 'hi': float(max_value), 'bins': int(bins)}
+        ) or []
+        counts = np.zeros(bins, dtype=np.int64)
+        for r in result:
+            # width_bucket 把等于上界的值放在 bins+1 号桶, numpy 把它算入最后一个桶
+            counts[min(max(int(r['bucket']), 1), bins) - 1] += int(r['count'])
+        return counts, edges
+    
+    def export_table_to_geoparquet(self, table_name, output_file, bbox=None, chunk_size=50000):
+        """导出表为GeoParquet格式 (服务端游标分块读取, 流式写入)"""
+        if not GEOPARQUET_AVAILABLE:
+            self.logger.error("未安装pyarrow/shapely, 无法导出GeoParquet")
+            return False
+        
+        try:
+            query = f"""
+            SELECT *, ST_AsBinary(geom) as geom_wkb
+            FROM {table_name}
+            WHERE geom IS NOT NULL
+            """
+            if bbox:
+                # bbox格式: [min_lon, min_lat, max_lon, max_lat]
+                query += f"""
+                AND ST_Intersects(geom, ST_MakeEnvelope({bbox[0]}, {bbox[1]}, {bbox[2]}, {bbox[3]}, 4326))
+                """
+            
+            geometry_types = {
+                'point_features': ['Point'],
+                'line_features': ['LineString'],
+                'polygon_features': ['Polygon']
+            }.get(table_name, [])
+            
+            def batches(conn):
+                for chunk in pd.read_sql_query(text(query), conn, chunksize=chunk_size):
+                    geoms = shapely.from_wkb([bytes(wkb) for wkb in chunk['geom_wkb']])
+                    # 移除不需要的列
+                    attrs = chunk.drop(columns=[c for c in ['id', 'geom', 'created_at', 'geom_wkb']
+                                                if c in chunk.columns])
+                    yield geoms, attrs
+            
+            with self.engine.connect().execution_options(stream_results=True) as conn:
+                count = write_geoparquet_batches(output_file, batches(conn), 'EPSG:4326', geometry_types)
+            
+            if count == 0:
+                return False
+            
+            self.logger.info(f"成功导出 {count} 条记录到 {output_file}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"导出GeoParquet失败: {e}")
+            return False
+    
+    def import_geoparquet_to_postgis(self, parquet_file, table_name='auto', bbox=None):
+        """将GeoParquet数据批量导入PostGIS, 坐标系没有EPSG代码时抛出ValueError"""
+        if not GEOPARQUET_AVAILABLE:
+            self.logger.error("未安装pyarrow/shapely, 无法导入GeoParquet")
+            return False
+        
+        # 几何类型编号 -> 目标表
+        type_tables = {0: 'point_features', 1: 'line_features', 3: 'polygon_features'}
+        
+        try:
+            session = self.get_session()
+            table_columns = {}
+            imported_count = 0
+            
+            for crs, geoms, attrs in iter_geoparquet_batches(parquet_file, bbox=bbox):
+                # 非4326坐标由PostGIS转换
+                srid = _srid(crs)
+                geom_sql = f"ST_GeomFromWKB(:geom_wkb, {srid})"
+                if srid != 4326:
+                    geom_sql = f"ST_Transform({geom_sql}, 4326)"
+                
+                # 多部件几何拆分为单部件, 与表的几何类型一致
+                parts, index = shapely.get_parts(geoms, return_index=True)
+                type_ids = shapely.get_type_id(parts)
+                wkbs = shapely.to_wkb(parts)
+                
+                for type_id, default_table in type_tables.items():
+                    mask = type_ids == type_id
+                    if not mask.any():
+                        continue
+                    
+                    target_table = default_table if table_name == 'auto' else table_name
+                    if target_table not in table_columns:
+                        table_columns[target_table] = set(self.get_table_columns(target_table))
+                    
+                    # 只插入目标表中存在的列
+                    columns = [c for c in attrs.columns
+                               if c in table_columns[target_table] and c not in ['id', 'geom', 'created_at']]
+                    rows = attrs.iloc[index[mask]][columns].astype(object)
+                    rows = rows.where(pd.notna(rows), None).to_dict('records')
+                    for row, wkb in zip(rows, wkbs[mask]):
+                        row['geom_wkb'] = wkb
+                    
+                    placeholders = ', '.join([f':{col}' for col in columns] + [geom_sql])
+                    insert_sql = f"""
+                    INSERT INTO {target_table} ({', '.join(columns + ['geom'])})
+                    VALUES ({placeholders})
+                    """
+                    
+                    # 批量插入 (executemany)
+                    session.execute(text(insert_sql), rows)
+                    imported_count += len(rows)
+            
+            session.commit()
+            session.close()
+            
+            self.logger.info(f"GeoParquet导入完成，成功导入 {imported_count} 个要素")
+            return imported_count > 0
+            
+        except ValueError:
+            # 坐标系无法确定SRID: 交给调用方提示用户, 而不是按4326写入错误位置
+            if 'session' in locals():
+                session.rollback()
+                session.close()
+            raise
+        except Exception as e:
+            self.logger.error(f"GeoParquet导入失败: {e}")
+            if 'session' in locals():
+                session.rollback()
+                session.close()
+            return False
+
+    def write_zonal_statistics(self, table_name, raster_path, prefix, stats=None, **kwargs):
+        """对表中的面做分区统计, 结果写入 '{prefix}_{统计量}' 列 (不存在时自动添加)
+
+        只从数据库读取id和几何 (WKB), 统计在本地分块并行完成, 再按id批量更新。
+        kwargs传给 zonal_statistics。返回更新的行数, 出错时抛出异常;
+        prefix含字母、数字、下划线和汉字以外的字符时抛出 ValueError。
+        """
+        if not ZONAL_AVAILABLE:
+            raise RuntimeError("未安装rasterio, 无法进行分区统计")
+        if not COLUMN_PREFIX_PATTERN.fullmatch(prefix):
+            raise ValueError(f"列名前缀只能包含字母、数字、下划线和汉字: {prefix!r}")
+        stats = list(stats or ZONAL_STATS)
+        
+        with self.engine.connect() as conn:
+            rows = pd.read_sql_query(
+                text(f"SELECT id, ST_AsBinary(geom) AS geom_wkb FROM {table_name} WHERE geom IS NOT NULL ORDER BY id"),
+                conn
+            )
+        if rows.empty:
+            return 0
+        geoms = shapely.from_wkb([bytes(wkb) for wkb in rows['geom_wkb']])
+        table = zonal_statistics(raster_path, geoms, crs='EPSG:4326', **kwargs)[stats]
+        
+        columns = {stat: f"{prefix}_{stat}" for stat in stats}
+        table.columns = [f'v{i}' for i in range(len(stats))]
+        table['id'] = rows['id'].to_numpy()
+        table = table.astype(object)
+        records = table.where(pd.notna(table), None).to_dict('records')
+        session = self.get_session()
+        try:
+            for stat, column in columns.items():
+                column_type = 'bigint' if stat == 'count' else 'double precision'
+                session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS "{column}" {column_type}'))
+            assignments = ', '.join(f'"{column}" = :v{i}' for i, column in enumerate(columns.values()))
+            # 批量更新 (executemany)
+            session.execute(text(f"UPDATE {table_name} SET {assignments} WHERE id = :id"), records)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        
+        self.logger.info(f"分区统计已写入 {table_name}: {len(records)} 行, 列 {list(columns.values())}")
+        return len(records)
+
 # 数据模型定义
 class PointFeature(Base):
     """点要素表"""
@@ -0,0 +1,204 @@
+"""
+点密度聚合: 核密度栅格和六边形分箱
+核密度先把点 (可带权重, 如人口) 用 bincount 计入规则网格, 再用 FFT 与高斯核卷积, 耗时只与网格大小有关;
+六边形分箱在以数据为中心的平面坐标中向量化计算每个点所在六边形的轴向坐标 (立方坐标取整),
+按六边形汇总个数和权重后生成面要素。两者都不逐点处理, 数百万个点也能在数秒内完成
+"""
+import math
+import logging
+
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib import colormaps
+from matplotlib.colors import Normalize, to_hex
+from scipy.signal import fftconvolve
+
+from src.geodesy import METERS_PER_DEGREE
+from src.interpolation import MAX_RASTER_CELLS, grid_shape
+from src.reprojection import DISPLAY_CRS, is_geographic
+from src.vector_io import layer_to_geometries, split_geometries
+
+KERNEL_TRUNCATE = 4.0  # 高斯核截断到该倍数的带宽
+DENSITY_FLOOR = 0.001  # 低于最大密度该比例的像元写为nodata (显示为透明)
+DENSITY_CMAP = 'inferno'
+HEX_CMAP = 'YlOrRd'
+COUNT_COLUMN = 'count'
+DENSITY_COLUMN = 'density_km2'
+
+logger = logging.getLogger(__name__)
+
+
+def layer_coordinates(layer, weight_column=None):
+    """点图层的坐标和权重, 返回 (x, y, 权重或None); 坐标或权重无效的点被去掉
+
+    DataFrame点表直接取经纬度列, 不构造几何, 数百万个点也很快。
+    """
+    if layer['type'] != 'points':
+        raise ValueError("密度聚合需要点图层")
+    data = layer['data']
+    if isinstance(data, pd.DataFrame):
+        x = pd.to_numeric(data['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+        y = pd.to_numeric(data['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+        attrs = data
+    else:
+        geoms, attrs = layer_to_geometries(layer)
+        x, y = shapely.get_x(geoms), shapely.get_y(geoms)
+    valid = np.isfinite(x) & np.isfinite(y)
+    weights = None
+    if weight_column is not None:
+        if weight_column not in attrs.columns:
+            raise ValueError(f"图层没有属性列: {weight_column}")
+        weights = pd.to_numeric(attrs[weight_column], errors='coerce').to_numpy(dtype=np.float64)
+        valid &= np.isfinite(weights)
+        weights = weights[valid]
+    return x[valid], y[valid], weights
+
+
+def ground_scale(ymin, ymax, geographic):
+    """每个坐标单位在地面上的米数 (x方向, y方向), 经纬度按中间纬度计算"""
+    if not geographic:
+        return 1.0, 1.0
+    return METERS_PER_DEGREE * max(math.cos(math.radians((ymin + ymax) / 2)), 0.01), METERS_PER_DEGREE
+
+
+def default_bandwidth(x, y, weights=None, geographic=True):
+    """Scott规则的带宽 (米): 两个方向地面标准差的平均乘以有效点数的 -1/6 次方"""
+    sx, sy = ground_scale(np.min(y), np.max(y), geographic)
+    if weights is None:
+        n, std_x, std_y = len(x), np.std(x), np.std(y)
+    else:
+        total = weights.sum()
+        n = total ** 2 / max((weights ** 2).sum(), 1e-300)
+        std_x = math.sqrt(np.average((x - np.average(x, weights=weights)) ** 2, weights=weights))
+        std_y = math.sqrt(np.average((y - np.average(y, weights=weights)) ** 2, weights=weights))
+    spread = (std_x * sx + std_y * sy) / 2
+    return max(spread * max(n, 1) ** (-1 / 6), 1.0)
+
+
+def bin_counts(x, y, bounds, shape, weights=None):
+    """把点计入网格 (第一行在北), 返回每个像元的点数或权重和"""
+    xmin, ymin, xmax, ymax = bounds
+    rows, cols = shape
+    col = np.floor((x - xmin) / (xmax - xmin) * cols).astype(np.int64)
+    row = np.floor((ymax - y) / (ymax - ymin) * rows).astype(np.int64)
+    inside = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+    cells = row[inside] * cols + col[inside]
+    counts = np.bincount(cells, weights=None if weights is None else weights[inside], minlength=rows * cols)
+    return counts.astype(np.float64).reshape(shape)
+
+
+def gaussian_kernel(sigma_cols, sigma_rows, truncate=KERNEL_TRUNCATE):
+    """归一化的二维高斯核 (两个方向的标准差以像元计)"""
+    half_x, half_y = max(int(math.ceil(truncate * sigma_cols)), 1), max(int(math.ceil(truncate * sigma_rows)), 1)
+    kx = np.exp(-0.5 * (np.arange(-half_x, half_x + 1) / max(sigma_cols, 1e-9)) ** 2)
+    ky = np.exp(-0.5 * (np.arange(-half_y, half_y + 1) / max(sigma_rows, 1e-9)) ** 2)
+    kernel = np.outer(ky, kx)
+    return kernel / kernel.sum()
+
+
+def kernel_density(x, y, weights=None, bandwidth=None, bounds=None, shape=None, max_cells=MAX_RASTER_CELLS,
+                   geographic=True):
+    """高斯核密度, 返回 (每平方公里的点数或权重和的网格, 范围, 带宽)
+
+    bandwidth为米, 默认按Scott规则; bounds默认为点的范围四周外扩3倍带宽。
+    经纬度数据的核按中间纬度换算为度, 像元面积按每行的纬度计算。
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if len(x) == 0:
+        raise ValueError("没有有效的点")
+    if bandwidth is None:
+        bandwidth = default_bandwidth(x, y, weights, geographic)
+    sx, sy = ground_scale(np.min(y), np.max(y), geographic)
+    if bounds is None:
+        pad_x, pad_y = 3 * bandwidth / sx, 3 * bandwidth / sy
+        bounds = (np.min(x) - pad_x, max(np.min(y) - pad_y, -90.0 if geographic else -np.inf),
+                  np.max(x) + pad_x, min(np.max(y) + pad_y, 90.0 if geographic else np.inf))
+    if shape is None:
+        shape = grid_shape(bounds, max_cells, geographic=geographic)
+    xmin, ymin, xmax, ymax = bounds
+    dx, dy = (xmax - xmin) / shape[1], (ymax - ymin) / shape[0]
+
+    counts = bin_counts(x, y, bounds, shape, weights)
+    kernel = gaussian_kernel(bandwidth / sx / dx, bandwidth / sy / dy)
+    smoothed = np.maximum(fftconvolve(counts, kernel, mode='same'), 0.0)
+
+    if geographic:
+        row_y = ymax - (np.arange(shape[0]) + 0.5) * dy
+        cell_km2 = dx * dy * METERS_PER_DEGREE ** 2 * np.maximum(np.cos(np.radians(row_y)), 1e-6) / 1e6
+    else:
+        cell_km2 = np.full(shape[0], dx * dy / 1e6)
+    logger.info(f"核密度: {len(x)} 个点, 网格 {shape[0]}x{shape[1]}, 带宽 {bandwidth:.0f} 米, "
+                f"核 {kernel.shape[0]}x{kernel.shape[1]}")
+    return smoothed / cell_km2[:, None], bounds, bandwidth
+
+
+def density_layer(layer, weight_column=None, bandwidth=None, max_cells=MAX_RASTER_CELLS):
+    """点图层的核密度, 返回 (网格, 范围, 带宽); 低密度像元为NaN, 写为栅格后显示为透明"""
+    geographic = is_geographic(layer.get('crs', DISPLAY_CRS))
+    x, y, weights = layer_coordinates(layer, weight_column)
+    grid, bounds, bandwidth = kernel_density(x, y, weights, bandwidth, max_cells=max_cells, geographic=geographic)
+    peak = np.max(grid) if grid.size else 0.0
+    grid[grid <= peak * DENSITY_FLOOR] = np.nan
+    return grid, bounds, bandwidth
+
+
+def hex_bin(x, y, size, weights=None, geographic=True):
+    """六边形分箱 (尖顶六边形, size为中心到顶点的距离, 米)
+
+    返回 (六边形几何数组, 每个六边形的点数, 权重和或None), 只包含有点的六边形。
+    经纬度数据在以数据为中心的等距圆柱平面中分箱, 六边形在该纬度附近近似为正六边形。
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    empty = np.array([], dtype=object)
+    if len(x) == 0:
+        return empty, np.array([], dtype=np.int64), None if weights is None else np.array([])
+    x0, y0 = (np.min(x) + np.max(x)) / 2, (np.min(y) + np.max(y)) / 2
+    sx, sy = ground_scale(np.min(y), np.max(y), geographic)
+    px, py = (x - x0) * sx, (y - y0) * sy
+
+    # 平面坐标 -> 分数轴向坐标 -> 立方坐标取整 (修正误差最大的分量)
+    q = (math.sqrt(3) / 3 * px - py / 3) / size
+    r = (2 / 3 * py) / size
+    s = -q - r
+    rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+
+    keys = rq.astype(np.int64) * (1 << 32) + rr.astype(np.int64)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique))
+    sums = None if weights is None else np.bincount(inverse, weights=weights, minlength=len(unique))
+    hq = np.floor_divide(unique + (1 << 31), 1 << 32).astype(np.float64)
+    hr = (unique - hq.astype(np.int64) * (1 << 32)).astype(np.float64)
+
+    cx = size * math.sqrt(3) * (hq + hr / 2)
+    cy = size * 1.5 * hr
+    angles = np.radians(30 + 60 * np.arange(7))
+    vx = (cx[:, None] + size * np.cos(angles)) / sx + x0
+    vy = (cy[:, None] + size * np.sin(angles)) / sy + y0
+    hexagons = shapely.polygons(np.stack([vx, vy], axis=-1))
+    logger.info(f"六边形分箱: {len(x)} 个点, {len(unique)} 个六边形")
+    return hexagons, counts, sums
+
+
+def hexbin_layer(layer, size, weight_column=None, cmap=HEX_CMAP):
+    """点图层的六边形分箱面要素, 属性为点数、权重和与每平方公里的密度, 按密度的对数着色"""
+    geographic = is_geographic(layer.get('crs', DISPLAY_CRS))
+    x, y, weights = layer_coordinates(layer, weight_column)
+    hexagons, counts, sums = hex_bin(x, y, size, weights, geographic)
+    values = counts if sums is None else sums
+    area_km2 = 1.5 * math.sqrt(3) * size ** 2 / 1e6
+    attrs = pd.DataFrame({'name': [f"六边形 {int(count)} 个点" for count in counts], COUNT_COLUMN: counts})
+    if sums is not None:
+        attrs[f"{weight_column}_sum"] = sums
+    attrs[DENSITY_COLUMN] = values / area_km2
+    if len(values):
+        scaled = np.log1p(np.maximum(values, 0))
+        norm = Normalize(scaled.min(), scaled.max() if scaled.max() > scaled.min() else scaled.min() + 1)
+        colormap = colormaps[cmap]
+        attrs['color'] = [to_hex(colormap(norm(value))) for value in scaled]
+    return split_geometries(hexagons, attrs)['polygons']
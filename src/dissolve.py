@@ -0,0 +1,138 @@
+"""
+按属性融合面图层 (dissolve)
+按属性列分组, 每组的面用GEOS的级联合并 (union_all) 合成一个几何; 面较多时在进程池中做树形归约:
+先把每组按质心的网格顺序切成空间上紧凑的小块分别合并, 再把同组的部分结果每 REDUCE_FANIN 个一轮轮合并,
+每轮的任务分给所有核。可选地把数值属性按组求和 (如人口、GDP)
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.layer_stats import numeric_columns
+from src.vector_io import layer_to_geometries, split_geometries
+
+CHUNK_SIZE = 256  # 第一轮每个任务合并的面数
+REDUCE_FANIN = 8  # 之后每轮每个任务合并的部分结果数
+SORT_GRID = 1024  # 切块前按质心网格排序的分辨率
+PARALLEL_THRESHOLD = 200000  # 顶点数超过该值时默认启用多进程
+COUNT_COLUMN = 'count'
+
+logger = logging.getLogger(__name__)
+
+
+def _union_wkb(wkb):
+    """合并一组WKB几何 (在工作进程中执行), 返回WKB"""
+    return shapely.to_wkb(shapely.union_all(shapely.from_wkb(wkb)))
+
+
+def _spatial_order(geoms):
+    """按质心所在网格排序, 使同一块中的面在空间上相邻, 合并时公共边界能尽早消去"""
+    centers = shapely.centroid(geoms)
+    x, y = shapely.get_x(centers), shapely.get_y(centers)
+
+    def cell(values):
+        lo, hi = np.nanmin(values), np.nanmax(values)
+        span = hi - lo if hi > lo else 1.0
+        return np.minimum(((np.nan_to_num(values, nan=lo) - lo) / span * SORT_GRID).astype(np.int64), SORT_GRID - 1)
+    return np.lexsort((cell(y), cell(x)))
+
+
+def dissolve_geometries(geoms, groups, max_workers=None):
+    """按组合并几何, groups为每个几何的组号 (0开始的整数, 负数表示不参与), 返回每组一个几何的数组
+
+    无效的面先用 make_valid 修复。max_workers为None时顶点数超过 PARALLEL_THRESHOLD 才使用多进程。
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    groups = np.asarray(groups, dtype=np.int64)
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    keep = (groups >= 0) & ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    geoms, groups = geoms[keep], groups[keep]
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+    result = np.full(n_groups, None, dtype=object)
+    if len(geoms) == 0:
+        return result
+
+    if max_workers is None:
+        vertices = int(shapely.get_num_coordinates(geoms).sum())
+        max_workers = (os.cpu_count() or 1) if vertices >= PARALLEL_THRESHOLD else 1
+    members = pd.Series(np.arange(len(geoms))).groupby(groups).agg(list)
+    if max_workers <= 1 or len(geoms) <= CHUNK_SIZE:
+        for group, index in members.items():
+            result[group] = shapely.union_all(geoms[index])
+        return result
+
+    # 第一轮: 每组按空间顺序切块; 之后每轮把同组的部分结果每 REDUCE_FANIN 个合并, 直到每组只剩一个
+    partials = {}
+    for group, index in members.items():
+        index = np.asarray(index)
+        index = index[_spatial_order(geoms[index])]
+        partials[group] = [shapely.to_wkb(geoms[index[i:i + CHUNK_SIZE]])
+                           for i in range(0, len(index), CHUNK_SIZE)]
+    rounds = 0
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        while True:
+            tasks = []
+            for group, parts in partials.items():
+                if rounds == 0:
+                    tasks.extend((group, chunk) for chunk in parts)
+                elif len(parts) > 1:
+                    tasks.extend((group, np.array(parts[i:i + REDUCE_FANIN], dtype=object))
+                                 for i in range(0, len(parts), REDUCE_FANIN))
+            if not tasks:
+                break
+            merged = executor.map(_union_wkb, [chunk for _, chunk in tasks])
+            reduced = {group: [] for group, _ in tasks}
+            for (group, _), wkb in zip(tasks, merged):
+                reduced[group].append(wkb)
+            partials.update(reduced)
+            rounds += 1
+    for group, parts in partials.items():
+        result[group] = shapely.from_wkb(parts[0])
+    logger.debug(f"融合: {len(geoms)} 个面, {n_groups} 组, {rounds} 轮归约")
+    return result
+
+
+def _unique_column(name, taken):
+    """与已有列重名时依次加后缀 _1, _2, ..."""
+    candidate, suffix = name, 0
+    while candidate in taken:
+        suffix += 1
+        candidate = f"{name}_{suffix}"
+    return candidate
+
+
+def dissolve_layer(layer, column, sum_columns=None, max_workers=None):
+    """按属性列融合面图层, 返回面要素列表
+
+    每组的属性为分组值、面的个数 (count; 分组列或求和列已叫count时改为 count_1 等) 和 sum_columns 中
+    各数值列的和; sum_columns为True时对所有数值列求和。分组值缺失的面不参与融合。
+    """
+    if layer['type'] != 'polygons':
+        raise ValueError("融合需要面图层")
+    geoms, attrs = layer_to_geometries(layer)
+    if column not in attrs.columns:
+        raise ValueError(f"图层没有属性列: {column}")
+    codes, values = pd.factorize(attrs[column])
+    if sum_columns is True:
+        sum_columns = [col for col in numeric_columns(attrs) if col != column]
+    sum_columns = list(sum_columns or [])
+
+    dissolved = dissolve_geometries(geoms, codes, max_workers)
+    count_column = _unique_column(COUNT_COLUMN, {column, *sum_columns})
+    table = pd.DataFrame({column: values, count_column: np.bincount(codes[codes >= 0], minlength=len(values))})
+    for col in sum_columns:
+        numbers = pd.to_numeric(attrs[col], errors='coerce').to_numpy(dtype=np.float64)
+        used = (codes >= 0) & np.isfinite(numbers)
+        table[col] = np.bincount(codes[used], weights=numbers[used], minlength=len(values))
+    if column != 'name':
+        table.insert(0, 'name', [str(value) for value in values])
+    logger.info(f"按 {column} 融合: {len(geoms)} 个面 -> {len(values)} 组")
+    return split_geometries(dissolved, table)['polygons']
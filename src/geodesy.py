@@ -0,0 +1,21 @@
+"""
+球面几何的公用常量和函数
+缓冲区、测量、插值、核密度和地形分析共用的地球半径、度长和球面距离, 只依赖NumPy
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # 平均地球半径 (米)
+METERS_PER_DEGREE = EARTH_RADIUS * np.pi / 180  # 纬度1度 (及赤道处经度1度) 的长度
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """球面大圆距离 (米), 参数为度, 支持数组广播"""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def unit_vectors(lon, lat):
+    """经纬度 (度) 转换为单位球面上的三维向量"""
+    lon, lat = np.radians(np.asarray(lon, dtype=np.float64)), np.radians(np.asarray(lat, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
@@ -0,0 +1,310 @@
+"""
+GeoParquet 读写
+几何列使用WKB编码, 并附带bbox覆盖列 (GeoParquet 1.1 covering), 读取时按行组统计信息裁剪
+"""
+import json
+import logging
+
+import numpy as np
+import shapely
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.vector_io import split_geometries, merge_batches, layer_to_geometries
+
+GEOPARQUET_VERSION = '1.1.0'
+GEOMETRY_COLUMN = 'geometry'
+BBOX_COLUMN = 'bbox'
+DEFAULT_CRS = 'EPSG:4326'
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+# shapely类型编号 -> GeoParquet几何类型名称
+GEOMETRY_TYPE_NAMES = {
+    0: 'Point', 1: 'LineString', 3: 'Polygon',
+    4: 'MultiPoint', 5: 'MultiLineString', 6: 'MultiPolygon', 7: 'GeometryCollection'
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _crs_to_projjson(crs):
+    """坐标系转为PROJJSON; 未安装pyproj时返回None (按规范视为OGC:CRS84)"""
+    if crs is None:
+        return None
+    try:
+        from pyproj import CRS
+    except ImportError:
+        return None
+    return CRS.from_user_input(crs).to_json_dict()
+
+
+def _projjson_to_crs(projjson):
+    """PROJJSON转为坐标系字符串, 缺省为EPSG:4326"""
+    if projjson is None:
+        return DEFAULT_CRS
+    try:
+        from pyproj import CRS
+    except ImportError:
+        return DEFAULT_CRS
+    crs = CRS.from_json_dict(projjson)
+    authority = crs.to_authority()
+    return f"{authority[0]}:{authority[1]}" if authority else crs.to_wkt()
+
+
+def _morton_order(bounds):
+    """按bbox中心的Morton(Z序)编码排序, 使相邻行组在空间上紧凑, 提高裁剪效率"""
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+
+    def scale(values):
+        finite = np.isfinite(values)
+        if not finite.any():
+            return np.zeros(len(values), dtype=np.uint32)
+        lo, hi = values[finite].min(), values[finite].max()
+        span = hi - lo if hi > lo else 1.0
+        scaled = np.nan_to_num((values - lo) / span * 65535, nan=0.0)
+        return scaled.astype(np.uint32)
+
+    def spread(v):
+        # 在每一位之间插入0
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        v = (v | (v << 1)) & 0x55555555
+        return v
+
+    codes = spread(scale(cx)) | (spread(scale(cy)) << 1)
+    return np.argsort(codes, kind='stable')
+
+
+def attrs_to_arrow(attrs):
+    """属性表转Arrow表, 混合类型的列退化为字符串"""
+    arrays = []
+    for col in attrs.columns:
+        values = attrs[col]
+        try:
+            array = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array(values.astype(str), from_pandas=True)
+        if pa.types.is_null(array.type):
+            array = array.cast(pa.string())
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=[str(col) for col in attrs.columns])
+
+
+def _output_columns(attrs):
+    """几何列和bbox覆盖列的列名: 与属性列重名时加下划线前缀 (实际列名记录在geo元数据中)"""
+    taken = {str(col) for col in attrs.columns}
+
+    def unique(name):
+        while name in taken:
+            name = f"_{name}"
+        taken.add(name)
+        return name
+    return unique(GEOMETRY_COLUMN), unique(BBOX_COLUMN)
+
+
+def _batch_to_table(geoms, attrs, spatial_sort=True, geom_col=GEOMETRY_COLUMN, bbox_col=BBOX_COLUMN):
+    """几何数组和属性表转为带bbox覆盖列的Arrow表"""
+    bounds = shapely.bounds(geoms)
+    if spatial_sort and len(geoms) > 1:
+        order = _morton_order(bounds)
+        geoms = geoms[order]
+        bounds = bounds[order]
+        attrs = attrs.iloc[order]
+
+    table = attrs_to_arrow(attrs.reset_index(drop=True))
+    bbox = pa.StructArray.from_arrays(
+        [pa.array(bounds[:, i], from_pandas=True) for i in range(4)],
+        names=['xmin', 'ymin', 'xmax', 'ymax']
+    )
+    table = table.append_column(bbox_col, bbox)
+    table = table.append_column(geom_col, pa.array(shapely.to_wkb(geoms), type=pa.binary()))
+    return table
+
+
+def _geo_metadata(crs, geometry_types, bbox=None, geom_col=GEOMETRY_COLUMN, bbox_col=BBOX_COLUMN):
+    """构造GeoParquet 'geo' 元数据"""
+    column = {
+        'encoding': 'WKB',
+        'geometry_types': list(geometry_types),
+        'covering': {
+            'bbox': {
+                'xmin': [bbox_col, 'xmin'],
+                'ymin': [bbox_col, 'ymin'],
+                'xmax': [bbox_col, 'xmax'],
+                'ymax': [bbox_col, 'ymax'],
+            }
+        }
+    }
+    projjson = _crs_to_projjson(crs)
+    if projjson is not None:
+        column['crs'] = projjson
+    if bbox is not None:
+        column['bbox'] = [float(v) for v in bbox]
+    return {
+        'version': GEOPARQUET_VERSION,
+        'primary_column': geom_col,
+        'columns': {geom_col: column}
+    }
+
+
+def write_geoparquet_batches(path, batches, crs=DEFAULT_CRS, geometry_types=(), bbox=None,
+                             row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='zstd', spatial_sort=True):
+    """流式写入GeoParquet, batches为 (几何数组, 属性表) 的可迭代对象
+
+    适用于数据库导出等无法一次载入内存的场景; spatial_sort为True时每个批次内部按空间排序。
+    属性中已有 'geometry' 或 'bbox' 列时, 几何列和覆盖列按第一个批次的属性列改名。返回写入的要素数量。
+    """
+    writer = None
+    count = 0
+    try:
+        for geoms, attrs in batches:
+            if len(geoms) == 0:
+                continue
+            if writer is None:
+                geom_col, bbox_col = _output_columns(attrs)
+            table = _batch_to_table(geoms, attrs, spatial_sort, geom_col, bbox_col)
+            if writer is None:
+                geo = _geo_metadata(crs, geometry_types, bbox, geom_col, bbox_col)
+                metadata = {b'geo': json.dumps(geo).encode('utf-8')}
+                schema = table.schema.with_metadata(metadata)
+                writer = pq.ParquetWriter(path, schema, compression=compression)
+            writer.write_table(table.cast(writer.schema), row_group_size=row_group_size)
+            count += len(geoms)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def write_geoparquet(path, geoms, attrs, crs=DEFAULT_CRS, **kwargs):
+    """写入一组几何和属性到GeoParquet文件"""
+    type_ids = np.unique(shapely.get_type_id(geoms))
+    geometry_types = [GEOMETRY_TYPE_NAMES[t] for t in type_ids if t in GEOMETRY_TYPE_NAMES]
+    bounds = shapely.total_bounds(geoms)
+    bbox = None if np.isnan(bounds).any() else bounds
+    return write_geoparquet_batches(path, [(geoms, attrs)], crs, geometry_types, bbox, **kwargs)
+
+
+def write_layer_geoparquet(layer, path, **kwargs):
+    """将内存图层写入GeoParquet文件"""
+    geoms, attrs = layer_to_geometries(layer)
+    count = write_geoparquet(path, geoms, attrs, crs=layer.get('crs', DEFAULT_CRS), **kwargs)
+    logger.info(f"图层 {layer['name']} 已导出到 {path}, 共 {count} 个要素")
+    return count
+
+
+def read_geo_metadata(path):
+    """读取GeoParquet的 'geo' 元数据"""
+    metadata = pq.read_schema(path).metadata or {}
+    if b'geo' not in metadata:
+        raise ValueError(f"{path} 不是GeoParquet文件 (缺少geo元数据)")
+    return json.loads(metadata[b'geo'])
+
+
+def _prune_row_groups(parquet_file, covering, bbox):
+    """根据bbox覆盖列的行组统计信息, 跳过与查询范围不相交的行组"""
+    metadata = parquet_file.metadata
+    paths = {name: '.'.join(covering[name]) for name in ('xmin', 'ymin', 'xmax', 'ymax')}
+
+    selected = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        stats = {}
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            for name, path in paths.items():
+                if column.path_in_schema == path and column.statistics is not None \
+                        and column.statistics.has_min_max:
+                    stats[name] = (column.statistics.min, column.statistics.max)
+
+        if len(stats) == 4:
+            # 行组内最小的xmin大于查询的max_x等情况下, 整个行组可以跳过
+            if (stats['xmin'][0] > bbox[2] or stats['xmax'][1] < bbox[0] or
+                    stats['ymin'][0] > bbox[3] or stats['ymax'][1] < bbox[1]):
+                continue
+        selected.append(i)
+    return selected
+
+
+def _covering(geo):
+    """主几何列的bbox覆盖列定义 (GeoParquet 1.1 covering), 没有时返回None"""
+    return geo['columns'][geo['primary_column']].get('covering', {}).get('bbox')
+
+
+def iter_geoparquet_tables(path, bbox=None, columns=None):
+    """按行组读取GeoParquet, 返回 (坐标系, 几何列名, Arrow表) 的迭代器
+
+    文件以内存映射方式打开, 数值列转换到numpy/pandas时尽量零拷贝。
+    """
+    geo = read_geo_metadata(path)
+    geom_col = geo['primary_column']
+    column_meta = geo['columns'][geom_col]
+    covering = _covering(geo)
+    crs = _projjson_to_crs(column_meta.get('crs'))
+
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    if bbox is not None and covering is not None:
+        row_groups = _prune_row_groups(parquet_file, covering, bbox)
+        logger.info(f"{path}: bbox裁剪后读取 {len(row_groups)}/{parquet_file.num_row_groups} 个行组")
+    else:
+        row_groups = range(parquet_file.num_row_groups)
+
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns) + [geom_col]
+        if covering is not None and covering['xmin'][0] not in read_columns:
+            read_columns.append(covering['xmin'][0])
+
+    for i in row_groups:
+        table = parquet_file.read_row_group(i, columns=read_columns)
+
+        if bbox is not None:
+            if covering is not None:
+                struct = table.column(covering['xmin'][0])
+                field = lambda name: pc.struct_field(struct, covering[name][1])
+                mask = pc.and_(
+                    pc.and_(pc.less_equal(field('xmin'), bbox[2]), pc.greater_equal(field('xmax'), bbox[0])),
+                    pc.and_(pc.less_equal(field('ymin'), bbox[3]), pc.greater_equal(field('ymax'), bbox[1]))
+                )
+            else:
+                bounds = shapely.bounds(shapely.from_wkb(table.column(geom_col).to_numpy(zero_copy_only=False)))
+                mask = pa.array(
+                    (bounds[:, 0] <= bbox[2]) & (bounds[:, 2] >= bbox[0]) &
+                    (bounds[:, 1] <= bbox[3]) & (bounds[:, 3] >= bbox[1])
+                )
+            table = table.filter(mask)
+
+        if table.num_rows > 0:
+            yield crs, geom_col, table
+
+
+def iter_geoparquet_batches(path, bbox=None, columns=None):
+    """读取GeoParquet, 返回 (坐标系, 几何数组, 属性表) 的迭代器
+
+    元数据中声明的bbox覆盖列不作为属性返回; 没有覆盖列时同名的普通列 (如用户的 'bbox' 列) 保留。
+    """
+    covering = _covering(read_geo_metadata(path))
+    for crs, geom_col, table in iter_geoparquet_tables(path, bbox, columns):
+        geoms = shapely.from_wkb(table.column(geom_col).to_numpy(zero_copy_only=False))
+        drop = [geom_col]
+        if covering is not None and covering['xmin'][0] in table.column_names:
+            drop.append(covering['xmin'][0])
+        attrs = table.drop_columns(drop).to_pandas()
+        yield crs, geoms, attrs
+
+
+def read_geoparquet(path, bbox=None, columns=None):
+    """读取GeoParquet文件, 返回 {'crs', 'points', 'lines', 'polygons'}"""
+    def batches():
+        for crs, geoms, attrs in iter_geoparquet_batches(path, bbox, columns):
+            batch = split_geometries(geoms, attrs)
+            batch['crs'] = crs
+            yield batch
+
+    result = merge_batches(batches())
+    if result['crs'] is None:
+        result['crs'] = DEFAULT_CRS
+    return result
@@ -0,0 +1,304 @@
+"""
+反距离加权插值 (IDW)
+由点图层的属性值 (人口、GDP、高程等) 生成规则网格表面: 点建立KD树 (经纬度数据用单位球面向量, 弦长与球面距离单调),
+每个网格像元只用最近的k个点加权, 输出按块处理, 块数较多时在进程池中并行;
+网格分辨率按像元数上限和点数自动选择, 结果可写为GeoTIFF栅格图层或生成Plotly Surface
+"""
+import os
+import math
+import hashlib
+import logging
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+from src.geodesy import EARTH_RADIUS, unit_vectors
+from src.reprojection import DISPLAY_CRS, is_geographic
+from src.vector_io import layer_to_geometries
+
+DEFAULT_K = 12
+DEFAULT_POWER = 2.0
+TILE_SIZE = 256
+PARALLEL_THRESHOLD = 4000000  # 超过该像元数时默认启用多进程
+MAX_RASTER_CELLS = 4000000  # 栅格输出的默认像元数上限
+SURFACE_MAX_CELLS = 40000  # Plotly Surface 的像元数上限 (200 x 200)
+CELLS_PER_POINT = 400  # 点较少时网格像元数取点数的该倍数
+MIN_CELLS = 10000
+BOUNDS_PADDING = 0.02  # 网格范围在点的外包矩形外扩该比例
+NODATA = -9999.0
+MAX_CACHE_BYTES = 1024 ** 3  # 每个网格缓存目录的容量上限 (1GB), 超出时按最近使用时间淘汰
+
+logger = logging.getLogger(__name__)
+
+
+def _tree_coords(x, y, geographic):
+    return unit_vectors(x, y) if geographic else np.column_stack([x, y])
+
+
+def point_bounds(x, y, padding=BOUNDS_PADDING):
+    """点的外包矩形外扩padding比例, 返回 (xmin, ymin, xmax, ymax)"""
+    xmin, xmax, ymin, ymax = np.min(x), np.max(x), np.min(y), np.max(y)
+    pad_x = padding * max(xmax - xmin, 1e-6)
+    pad_y = padding * max(ymax - ymin, 1e-6)
+    return xmin - pad_x, ymin - pad_y, xmax + pad_x, ymax + pad_y
+
+
+def grid_shape(bounds, max_cells=MAX_RASTER_CELLS, n_points=None, geographic=True):
+    """自动选择网格 (行数, 列数): 像元数不超过max_cells, 点较少时按点数减少像元数;
+    像元在地面上近似为正方形 (经纬度范围按中间纬度的余弦修正经度方向)"""
+    xmin, ymin, xmax, ymax = bounds
+    width, height = max(xmax - xmin, 1e-12), max(ymax - ymin, 1e-12)
+    if geographic:
+        width *= max(math.cos(math.radians((ymin + ymax) / 2)), 0.01)
+    cells = max_cells if n_points is None else min(max_cells, max(MIN_CELLS, CELLS_PER_POINT * n_points))
+    size = math.sqrt(width * height / cells)
+    rows = int(min(max(round(height / size), 2), cells // 2))
+    cols = int(min(max(round(width / size), 2), cells // rows))
+    return rows, cols
+
+
+def grid_centers(bounds, shape):
+    """网格像元中心坐标 (第一行在北), 返回 (x, y) 一维数组"""
+    xmin, ymin, xmax, ymax = bounds
+    rows, cols = shape
+    dx, dy = (xmax - xmin) / cols, (ymax - ymin) / rows
+    return xmin + (np.arange(cols) + 0.5) * dx, ymax - (np.arange(rows) + 0.5) * dy
+
+
+def idw(tree, values, coords, k=DEFAULT_K, power=DEFAULT_POWER, max_distance=None, geographic=True):
+    """在coords处按最近的k个点做反距离加权, 返回插值数组
+
+    距离为米 (经纬度) 或坐标单位; max_distance以内没有点的位置为NaN。
+    与某个点重合的位置直接取该点的值 (多个重合点取平均)。
+    """
+    k = min(k, tree.n)
+    bound = np.inf
+    if max_distance is not None:
+        bound = 2 * math.sin(min(max_distance / EARTH_RADIUS, math.pi) / 2) if geographic else max_distance
+        bound = bound * (1 + 1e-12)
+    distances, indices = tree.query(coords, k=k, distance_upper_bound=bound)
+    distances, indices = distances.reshape(len(coords), k), indices.reshape(len(coords), k)
+    if geographic:
+        distances = 2 * EARTH_RADIUS * np.arcsin(np.minimum(distances / 2, 1))
+
+    found = indices < tree.n
+    # 缺失的邻点 (索引为n) 指向补在末尾的0
+    neighbour_values = np.append(values, 0.0)[indices]
+    exact = found & (distances <= 1e-9)
+    with np.errstate(divide='ignore'):
+        weights = np.where(found, 1.0 / distances ** power, 0.0)
+    weights = np.where(exact.any(axis=1, keepdims=True), exact, weights)
+    total = weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (weights * neighbour_values).sum(axis=1) / total
+    result[total == 0] = np.nan
+    return result
+
+
+def tile_slices(shape, tile_size=TILE_SIZE):
+    """划分输出块, 返回 [(row0, col0, rows, cols)]"""
+    rows, cols = shape
+    return [(row, col, min(tile_size, rows - row), min(tile_size, cols - col))
+            for row in range(0, rows, tile_size) for col in range(0, cols, tile_size)]
+
+
+_state = {}  # 工作进程中的KD树和插值参数
+
+
+def _init_worker(x, y, values, bounds, shape, options):
+    """在工作进程中重建KD树"""
+    geographic = options['geographic']
+    _state.update(tree=cKDTree(_tree_coords(x, y, geographic)), values=values, options=options,
+                  centers=grid_centers(bounds, shape))
+
+
+def _process_tile(tile):
+    """插值一个块 (在工作进程中执行), 返回 (块, 结果)"""
+    row, col, rows, cols = tile
+    xs, ys = _state['centers']
+    gx, gy = np.meshgrid(xs[col:col + cols], ys[row:row + rows])
+    options = _state['options']
+    coords = _tree_coords(gx.ravel(), gy.ravel(), options['geographic'])
+    result = idw(_state['tree'], _state['values'], coords, **options)
+    return tile, result.reshape(rows, cols)
+
+
+def idw_grid(x, y, values, bounds, shape, k=DEFAULT_K, power=DEFAULT_POWER, max_distance=None,
+             geographic=True, tile_size=TILE_SIZE, max_workers=None, progress=None):
+    """在bounds范围的规则网格 (shape为 (行数, 列数), 第一行在北) 上做IDW插值, 返回float64数组
+
+    坐标或值无效的点被忽略。max_workers为None时像元数超过 PARALLEL_THRESHOLD 才使用多进程;
+    progress(已完成块数, 总块数) 在每块完成后调用。
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(values)
+    x, y, values = x[valid], y[valid], values[valid]
+    grid = np.full(shape, np.nan)
+    if len(values) == 0:
+        return grid
+
+    options = {'k': k, 'power': power, 'max_distance': max_distance, 'geographic': geographic}
+    init_args = (x, y, values, bounds, shape, options)
+    tasks = tile_slices(shape, tile_size)
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if shape[0] * shape[1] >= PARALLEL_THRESHOLD else 1
+
+    def store(tile, result):
+        row, col, rows, cols = tile
+        grid[row:row + rows, col:col + cols] = result
+
+    if max_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=init_args) as executor:
+            tiles = executor.map(_process_tile, tasks, chunksize=max(1, len(tasks) // (8 * max_workers)))
+            for done, (tile, result) in enumerate(tiles, 1):
+                store(tile, result)
+                if progress:
+                    progress(done, len(tasks))
+    else:
+        _init_worker(*init_args)
+        try:
+            for done, task in enumerate(tasks, 1):
+                store(*_process_tile(task))
+                if progress:
+                    progress(done, len(tasks))
+        finally:
+            _state.clear()
+    logger.info(f"IDW插值完成: {len(values)} 个点, 网格 {shape[0]}x{shape[1]}, {len(tasks)} 个块")
+    return grid
+
+
+def interpolate_layer(layer, column, shape=None, bounds=None, max_cells=MAX_RASTER_CELLS, **options):
+    """对点图层的数值属性列做IDW插值, 返回 (网格, 范围)
+
+    bounds默认为点的外包矩形外扩2%, shape默认按 grid_shape 自动选择; options传给 idw_grid。
+    """
+    if layer['type'] != 'points':
+        raise ValueError("插值需要点图层")
+    geoms, attrs = layer_to_geometries(layer)
+    if column not in attrs.columns:
+        raise ValueError(f"图层没有属性列: {column}")
+    x, y = shapely.get_x(geoms), shapely.get_y(geoms)
+    values = pd.to_numeric(attrs[column], errors='coerce').to_numpy(dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(values)
+    if not valid.any():
+        raise ValueError(f"属性列 {column} 没有有效的数值")
+
+    geographic = is_geographic(layer.get('crs', DISPLAY_CRS))
+    if bounds is None:
+        bounds = point_bounds(x[valid], y[valid])
+    if shape is None:
+        shape = grid_shape(bounds, max_cells, int(valid.sum()), geographic)
+    options.setdefault('geographic', geographic)
+    return idw_grid(x, y, values, bounds, shape, **options), bounds
+
+
+def layer_digest(layer, column=None):
+    """点图层内容的摘要: 坐标系、各行坐标和参与计算的属性列, 与图层对象和会话无关"""
+    geoms, attrs = layer_to_geometries(layer)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(layer.get('crs', DISPLAY_CRS)).encode('utf-8'))
+    h.update(np.ascontiguousarray(shapely.get_x(geoms), dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(shapely.get_y(geoms), dtype=np.float64).tobytes())
+    if column is not None and column in attrs.columns:
+        h.update(pd.to_numeric(attrs[column], errors='coerce').to_numpy(dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def cached_grid_path(cache_dir, layer, product, **options):
+    """缓存目录中网格栅格的输出路径, 按图层内容 (layer_digest) 和参数区分
+
+    同样的点和属性值再次计算时 (包括重新导入或在其他会话中) 得到同一路径, 可直接复用文件;
+    options中的column为参与计算的属性列。
+    """
+    key = f"{layer_digest(layer, options.get('column'))}|{product}|{sorted(options.items())}"
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+    return Path(cache_dir) / f"{product}_{digest}.tif"
+
+
+def prune_grid_cache(cache_dir, max_bytes=MAX_CACHE_BYTES, keep=()):
+    """缓存目录中的栅格总大小超过max_bytes时, 从最久未使用 (修改时间最早) 的开始删除, keep中的路径保留
+
+    复用缓存文件时应更新其修改时间 (os.utime)。返回删除的文件数。
+    """
+    keep = {Path(p).resolve() for p in keep}
+    entries = []
+    for path in Path(cache_dir).glob('*.tif'):
+        if path.name.endswith('.part.tif'):
+            continue  # 正在写入的临时文件
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+
+    total, removed = 0, 0
+    for _, size, path in entries:
+        total += size
+        if total <= max_bytes or path.resolve() in keep:
+            continue
+        try:
+            path.unlink()
+            removed += 1
+        except OSError as e:
+            # Windows上仍被打开的文件删除失败, 留待下次
+            logger.warning(f"删除缓存栅格失败: {e}")
+    if removed:
+        logger.info(f"网格缓存超过容量上限, 已删除 {removed} 个文件: {cache_dir}")
+    return removed
+
+
+def write_grid_raster(path, grid, bounds, crs=DISPLAY_CRS):
+    """把网格写为分块压缩的GeoTIFF (附带概视), NaN写为nodata, 返回路径"""
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_bounds
+
+    from src.raster_layer import overview_factors
+
+    rows, cols = grid.shape
+    profile = {
+        'driver': 'GTiff', 'width': cols, 'height': rows, 'count': 1,
+        'crs': crs, 'transform': from_bounds(*bounds, cols, rows),
+        'dtype': 'float32', 'nodata': NODATA,
+        'tiled': True, 'blockxsize': TILE_SIZE, 'blockysize': TILE_SIZE,
+        'compress': 'deflate', 'BIGTIFF': 'IF_SAFER'
+    }
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(np.where(np.isnan(grid), NODATA, grid).astype(np.float32), 1)
+        if not np.isnan(grid).all():
+            # GDAL的统计量元数据, 复用缓存文件时不必重新读取整个网格
+            dst.update_tags(1, STATISTICS_MINIMUM=repr(float(np.nanmin(grid))),
+                            STATISTICS_MAXIMUM=repr(float(np.nanmax(grid))))
+        factors = overview_factors(cols, rows)
+        if factors:
+            dst.build_overviews(factors, Resampling.average)
+    logger.info(f"插值栅格已写入: {path}")
+    return path
+
+
+def grid_value_range(path):
+    """write_grid_raster 写入的 (最小值, 最大值), 文件没有统计量元数据时返回None"""
+    import rasterio
+
+    with rasterio.open(path) as ds:
+        tags = ds.tags(1)
+    if 'STATISTICS_MINIMUM' not in tags or 'STATISTICS_MAXIMUM' not in tags:
+        return None
+    return float(tags['STATISTICS_MINIMUM']), float(tags['STATISTICS_MAXIMUM'])
+
+
+def surface_trace(grid, bounds, name=None, colorscale='Viridis'):
+    """由网格生成 Plotly Surface (x/y为像元中心坐标, NaN处留空)"""
+    import plotly.graph_objects as go
+
+    xs, ys = grid_centers(bounds, grid.shape)
+    return go.Surface(x=xs, y=ys, z=grid, name=name, colorscale=colorscale,
+                      colorbar=dict(title=name) if name else None)
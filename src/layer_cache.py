@@ -0,0 +1,312 @@
+"""
+导入图层的磁盘缓存
+按文件内容寻址, 保存解析后的列式图层 (Arrow IPC + .npy坐标/偏移数组),
+再次导入同一文件时以内存映射方式读取, 多个窗口共享同一份页缓存
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+import shapely
+import pyarrow as pa
+
+from src.geoparquet_io import attrs_to_arrow
+from src.vector_io import split_geometries
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2GB
+INDEX_NAME = 'index.json'
+LOCK_NAME = 'index.lock'
+META_NAME = 'meta.json'
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path):
+    """计算文件内容摘要 (blake2b)"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"studygis-layer-cache-v{CACHE_FORMAT_VERSION}".encode('utf-8'))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_table(table, path):
+    """写入未压缩的Arrow IPC文件, 以便直接内存映射"""
+    with pa.OSFile(str(path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    """以内存映射方式读取Arrow IPC文件 (零拷贝)"""
+    return pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+
+
+def _directory_size(path):
+    return sum(p.stat().st_size for p in Path(path).rglob('*') if p.is_file())
+
+
+class LayerCache:
+    """内容寻址的图层缓存, 超过容量上限时按LRU淘汰"""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    # ---- 索引 ----
+
+    @contextmanager
+    def _index_lock(self):
+        """索引读-改-写的互斥锁: 线程锁 + 锁文件上的排他锁 (多个窗口/进程共享同一缓存目录)"""
+        with self._lock, open(self.cache_dir / LOCK_NAME, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load_index(self):
+        try:
+            with open(self.cache_dir / INDEX_NAME, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == CACHE_FORMAT_VERSION:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {'version': CACHE_FORMAT_VERSION, 'entries': {}, 'sources': {}}
+
+    def _save_index(self, index):
+        path = self.cache_dir / INDEX_NAME
+        tmp_path = path.with_name(f"{INDEX_NAME}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _lookup_digest(self, index, file_path, stat):
+        """按 路径+大小+修改时间 查找; 修改时间变化但大小相同时重新计算内容摘要"""
+        source = index['sources'].get(file_path)
+        if source and source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns:
+            return source['digest']
+        if source and source['size'] == stat.st_size:
+            digest = file_digest(file_path)
+            if digest in index['entries']:
+                return digest
+        return None
+
+    # ---- 读写 ----
+
+    def get(self, file_path):
+        """读取缓存, 未命中返回None; 结果格式与 vector_io.read_vector_file 相同"""
+        file_path = str(Path(file_path).resolve())
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        with self._index_lock():
+            index = self._load_index()
+            digest = self._lookup_digest(index, file_path, stat)
+            if digest is None or digest not in index['entries']:
+                return None
+            entry_dir = self.cache_dir / digest
+            if not (entry_dir / META_NAME).exists():
+                return None
+
+            index['entries'][digest]['last_access'] = time.time()
+            index['sources'][file_path] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest
+            }
+            self._save_index(index)
+
+        try:
+            result = self._read_entry(entry_dir)
+        except Exception as e:
+            logger.warning(f"读取图层缓存失败 {entry_dir}: {e}")
+            return None
+        logger.info(f"图层缓存命中: {file_path}")
+        return result
+
+    def put(self, file_path, result):
+        """写入缓存; result为 {'crs', 'points', 'lines', 'polygons'}"""
+        file_path = str(Path(file_path).resolve())
+        stat = os.stat(file_path)
+        digest = file_digest(file_path)
+        entry_dir = self.cache_dir / digest
+
+        if not (entry_dir / META_NAME).exists():
+            tmp_dir = self.cache_dir / f"{digest}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            tmp_dir.mkdir()
+            try:
+                self._write_entry(tmp_dir, result)
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # 其他窗口可能已经写入了同一份内容
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                if not (entry_dir / META_NAME).exists():
+                    raise
+
+        with self._index_lock():
+            index = self._load_index()
+            index['entries'][digest] = {
+                'size': _directory_size(entry_dir),
+                'last_access': time.time()
+            }
+            index['sources'][file_path] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest
+            }
+            self._evict(index, keep=digest)
+            self._save_index(index)
+
+    def _entry_dir(self, file_path):
+        """文件当前内容对应的缓存条目目录, 没有条目时返回None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        with self._index_lock():
+            index = self._load_index()
+            digest = self._lookup_digest(index, file_path, stat)
+        if digest is None or digest not in index['entries']:
+            return None
+        entry_dir = self.cache_dir / digest
+        return entry_dir if (entry_dir / META_NAME).exists() else None
+
+    def get_sidecar(self, file_path, name):
+        """与图层缓存条目一起保存的附加文件 (如计数金字塔) 的路径, 不存在时返回None"""
+        entry_dir = self._entry_dir(str(Path(file_path).resolve()))
+        if entry_dir is None or not (entry_dir / name).exists():
+            return None
+        return entry_dir / name
+
+    def put_sidecar(self, file_path, name, write):
+        """在图层缓存条目中写入附加文件, write(路径) 负责写入; 条目不存在时不写入, 返回是否写入"""
+        entry_dir = self._entry_dir(str(Path(file_path).resolve()))
+        if entry_dir is None:
+            return False
+        tmp_path = entry_dir / f"{name}.{os.getpid()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, entry_dir / name)
+        with self._index_lock():
+            index = self._load_index()
+            if entry_dir.name in index['entries']:
+                index['entries'][entry_dir.name]['size'] = _directory_size(entry_dir)
+                self._evict(index, keep=entry_dir.name)
+                self._save_index(index)
+        return True
+
+    def _write_entry(self, entry_dir, result):
+        """写入一个缓存条目: 点表为Arrow IPC, 线/面为坐标和偏移数组 + 属性表"""
+        meta = {'crs': result.get('crs'), 'layers': []}
+
+        points = result.get('points')
+        if points is not None and len(points) > 0:
+            _write_table(attrs_to_arrow(points.reset_index(drop=True)), entry_dir / 'points.arrow')
+            meta['layers'].append('points')
+
+        for key in ('lines', 'polygons'):
+            features = result.get(key) or []
+            if not features:
+                continue
+            geoms = shapely.from_geojson([json.dumps(feature['geometry']) for feature in features])
+            geom_type, coords, offsets = shapely.to_ragged_array(geoms)
+            np.save(entry_dir / f'{key}_coords.npy', coords)
+            for i, offset in enumerate(offsets):
+                np.save(entry_dir / f'{key}_offsets_{i}.npy', offset)
+            attrs = pd.DataFrame([feature.get('properties', {}) for feature in features])
+            _write_table(attrs_to_arrow(attrs), entry_dir / f'{key}_attrs.arrow')
+            meta['layers'].append(key)
+            meta[f'{key}_geometry_type'] = int(geom_type)
+            meta[f'{key}_offset_count'] = len(offsets)
+
+        with open(entry_dir / META_NAME, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def _read_entry(self, entry_dir):
+        """读取一个缓存条目, 数组均以内存映射方式打开"""
+        with open(entry_dir / META_NAME, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        result = {'crs': meta.get('crs'), 'points': None, 'lines': [], 'polygons': []}
+
+        if 'points' in meta['layers']:
+            result['points'] = _read_table(entry_dir / 'points.arrow').to_pandas(split_blocks=True)
+
+        for key in ('lines', 'polygons'):
+            if key not in meta['layers']:
+                continue
+            coords = np.load(entry_dir / f'{key}_coords.npy', mmap_mode='r')
+            offsets = tuple(
+                np.load(entry_dir / f'{key}_offsets_{i}.npy', mmap_mode='r')
+                for i in range(meta[f'{key}_offset_count'])
+            )
+            geoms = shapely.from_ragged_array(
+                shapely.GeometryType(meta[f'{key}_geometry_type']), coords, offsets
+            )
+            attrs = _read_table(entry_dir / f'{key}_attrs.arrow').to_pandas()
+            result[key] = split_geometries(geoms, attrs)[key]
+
+        return result
+
+    # ---- 容量管理 ----
+
+    def _evict(self, index, keep=None):
+        """按最近访问时间淘汰条目, 直到总大小不超过上限"""
+        entries = index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        for digest in sorted(entries, key=lambda d: entries[d]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            total -= entries[digest]['size']
+            self._remove_entry(index, digest)
+            logger.info(f"图层缓存淘汰: {digest}")
+
+    def _remove_entry(self, index, digest):
+        shutil.rmtree(self.cache_dir / digest, ignore_errors=True)
+        index['entries'].pop(digest, None)
+        index['sources'] = {
+            path: source for path, source in index['sources'].items()
+            if source['digest'] != digest
+        }
+
+    def total_size(self):
+        """缓存占用的总字节数"""
+        with self._index_lock():
+            return sum(entry['size'] for entry in self._load_index()['entries'].values())
+
+    def clear(self):
+        """清空缓存"""
+        with self._index_lock():
+            index = self._load_index()
+            for digest in list(index['entries']):
+                self._remove_entry(index, digest)
+            self._save_index(index)
@@ -0,0 +1,236 @@
+"""
+图层统计服务
+一次向量化计算图层所有数值列的统计量、分位数和直方图, 按图层版本缓存;
+追加行时用 Chan/Welford 合并公式增量更新, 切换图表时不重复计算
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (0.25, 0.5, 0.75)
+HISTOGRAM_BINS = 20
+MAX_CACHED_LAYERS = 32
+
+logger = logging.getLogger(__name__)
+
+
+def attribute_frame(data):
+    """图层数据 -> 属性DataFrame (点图层直接返回, 要素列表取properties)"""
+    if isinstance(data, pd.DataFrame):
+        return data
+    if isinstance(data, list):
+        return pd.DataFrame.from_records(feature.get('properties', {}) for feature in data)
+    return pd.DataFrame()
+
+
+def numeric_columns(frame):
+    """数值列 (不含布尔列)"""
+    return [col for col in frame.select_dtypes(include=[np.number]).columns
+            if frame[col].dtype.kind != 'b']
+
+
+def summarize_frame(frame, quantiles=QUANTILES, bins=HISTOGRAM_BINS):
+    """对所有数值列做一次向量化统计
+
+    返回 {'row_count', 'column_names', 'columns': {列名: 统计量字典}},
+    统计量字典包含 count/mean/m2/std/min/max/quantiles/histogram,
+    其中 m2 为离差平方和, 用于增量合并。
+    """
+    columns = numeric_columns(frame)
+    summary = {'row_count': len(frame), 'column_names': [str(c) for c in frame.columns], 'columns': {}}
+    if not columns or len(frame) == 0:
+        for col in columns:
+            summary['columns'][col] = _empty_column_stats(quantiles)
+        return summary
+
+    values = frame[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=0)
+    has_values = counts > 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sums = np.where(valid, values, 0.0).sum(axis=0)
+        means = np.where(has_values, sums / np.maximum(counts, 1), np.nan)
+        deviations = np.where(valid, values - means, 0.0)
+        m2 = (deviations * deviations).sum(axis=0)
+    mins = np.full(len(columns), np.nan)
+    maxs = np.full(len(columns), np.nan)
+    qs = np.full((len(quantiles), len(columns)), np.nan)
+    if has_values.any():
+        subset = values[:, has_values]
+        mins[has_values] = np.nanmin(subset, axis=0)
+        maxs[has_values] = np.nanmax(subset, axis=0)
+        qs[:, has_values] = np.nanquantile(subset, quantiles, axis=0)
+
+    for j, col in enumerate(columns):
+        stats = {
+            'count': int(counts[j]),
+            'mean': float(means[j]),
+            'm2': float(m2[j]),
+            'min': float(mins[j]),
+            'max': float(maxs[j]),
+            'quantiles': {q: float(qs[i, j]) for i, q in enumerate(quantiles)},
+            'histogram': None
+        }
+        if counts[j] > 0:
+            stats['histogram'] = np.histogram(values[valid[:, j], j], bins=bins)
+        stats['std'] = _std(stats)
+        summary['columns'][col] = stats
+    return summary
+
+
+def _empty_column_stats(quantiles):
+    return {'count': 0, 'mean': np.nan, 'm2': 0.0, 'std': np.nan, 'min': np.nan, 'max': np.nan,
+            'quantiles': {q: np.nan for q in quantiles}, 'histogram': None}
+
+
+def _std(stats):
+    """样本标准差 (ddof=1), 与 pandas.Series.std 一致"""
+    return float(np.sqrt(stats['m2'] / (stats['count'] - 1))) if stats['count'] > 1 else np.nan
+
+
+def _histogram_quantiles(histogram, quantiles):
+    """由直方图线性插值估计分位数"""
+    counts, edges = histogram
+    cumulative = np.concatenate([[0], np.cumsum(counts)])
+    targets = np.asarray(quantiles) * cumulative[-1]
+    return dict(zip(quantiles, np.interp(targets, cumulative, edges).astype(float)))
+
+
+def merge_column_stats(a, b, new_values, bins=HISTOGRAM_BINS):
+    """合并两部分数据的统计量 (Chan 并行算法)
+
+    均值/方差/极值的合并是精确的; 新数据落在原直方图范围内时直方图按原分箱累加,
+    否则仅用新数据无法重新分箱, 返回None由调用方全量重算; 分位数由合并后的直方图估计。
+    """
+    if b['count'] == 0:
+        return a
+    if a['count'] == 0:
+        return b
+
+    n = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+    merged = {
+        'count': n,
+        'mean': a['mean'] + delta * b['count'] / n,
+        'm2': a['m2'] + b['m2'] + delta * delta * a['count'] * b['count'] / n,
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max']),
+    }
+    merged['std'] = _std(merged)
+
+    counts, edges = a['histogram']
+    if b['min'] < edges[0] or b['max'] > edges[-1]:
+        return None
+    new_counts, _ = np.histogram(new_values, bins=edges)
+    merged['histogram'] = (counts + new_counts, edges)
+    merged['quantiles'] = _histogram_quantiles(merged['histogram'], list(a['quantiles']))
+    return merged
+
+
+class VersionedLayerCache:
+    """按图层版本缓存计算结果的LRU缓存, 统计、空间索引和计数金字塔等服务共用
+
+    缓存键为版本号 + 数据对象 + 行数: 替换数据或修改后递增版本都会使缓存失效;
+    最多保留 max_layers 个图层, 超出时丢弃最久未使用的。
+    """
+
+    def __init__(self, max_layers=MAX_CACHED_LAYERS):
+        self.max_layers = max_layers
+        self._cache = OrderedDict()  # id(layer) -> (layer, 缓存键, 结果)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(layer):
+        data = layer.get('data')
+        return (layer.get('version', 0), id(data), len(data) if hasattr(data, '__len__') else 0)
+
+    def _cached(self, layer):
+        """返回图层当前版本的缓存结果, 没有或已失效时返回None"""
+        with self._lock:
+            cached = self._cache.get(id(layer))
+            if cached and cached[0] is layer and cached[1] == self._cache_key(layer):
+                self._cache.move_to_end(id(layer))
+                return cached[2]
+        return None
+
+    def _store(self, layer, value):
+        with self._lock:
+            self._cache[id(layer)] = (layer, self._cache_key(layer), value)
+            self._cache.move_to_end(id(layer))
+            while len(self._cache) > self.max_layers:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, layer=None):
+        """清除缓存 (layer为None时清除全部)"""
+        with self._lock:
+            if layer is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(id(layer), None)
+
+
+class LayerStatsService(VersionedLayerCache):
+    """按图层版本缓存统计结果的服务"""
+
+    def get(self, layer):
+        """获取图层统计结果, 版本未变化时直接返回缓存"""
+        summary = self._cached(layer)
+        if summary is not None:
+            return summary
+
+        summary = summarize_frame(attribute_frame(layer.get('data')))
+        self._store(layer, summary)
+        logger.debug(f"计算图层统计: {layer.get('name')}")
+        return summary
+
+    def append_rows(self, layer, rows):
+        """向图层追加行 (DataFrame或要素列表) 并增量更新统计结果"""
+        data = layer['data']
+        previous = self._cached(layer)
+
+        if isinstance(data, pd.DataFrame):
+            layer['data'] = pd.concat([data, rows], ignore_index=True)
+        else:
+            layer['data'] = list(data) + list(rows)
+        layer['version'] = layer.get('version', 0) + 1
+
+        if previous is None:
+            return self.get(layer)
+
+        new_frame = attribute_frame(rows)
+        added = summarize_frame(new_frame)
+        column_names = previous['column_names'] + [
+            name for name in added['column_names'] if name not in previous['column_names']
+        ]
+        summary = {
+            'row_count': previous['row_count'] + len(new_frame),
+            'column_names': column_names,
+            'columns': {}
+        }
+        for col, stats in previous['columns'].items():
+            if col not in added['columns']:
+                # 新数据中该列缺失或不是数值列, 全量重算
+                return self._recompute(layer)
+            new_values = pd.to_numeric(new_frame[col], errors='coerce').dropna().to_numpy(dtype=np.float64)
+            merged = merge_column_stats(stats, added['columns'][col], new_values)
+            if merged is None:
+                return self._recompute(layer)
+            summary['columns'][col] = merged
+        if set(added['columns']) - set(previous['columns']):
+            return self._recompute(layer)
+
+        self._store(layer, summary)
+        return summary
+
+    def _recompute(self, layer):
+        summary = summarize_frame(attribute_frame(layer['data']))
+        self._store(layer, summary)
+        return summary
+
+
+# 全局共享的统计服务, 统计对话框和属性面板使用同一份缓存
+stats_service = LayerStatsService()
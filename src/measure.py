@@ -0,0 +1,270 @@
+"""
+测量: 椭球面上的长度、面积和点之间的距离矩阵
+整个图层一次性向量化计算: 长度把所有线段交给 pyproj.Geod 的数组接口, 面积在等积球面 (authalic) 上
+按大圆边的球面角盈余求和; 距离矩阵按行分块用矩阵乘法计算, 大矩阵可以逐块写入 .npy 文件, 也可以只保留每行最近的k个
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+
+from src.geodesy import EARTH_RADIUS, haversine, unit_vectors
+from src.reprojection import DISPLAY_CRS, crs_equal, transform_geometries
+from src.vector_io import layer_to_geometries
+
+GEOD = pyproj.Geod(ellps='WGS84')
+DISTANCE_METHODS = ('sphere', 'geodesic')
+BLOCK_ELEMENTS = 4000000  # 距离矩阵每块的元素数 (约32MB的float64)
+LENGTH_COLUMN = 'length_km'
+PERIMETER_COLUMN = 'perimeter_km'
+AREA_COLUMN = 'area_km2'
+
+logger = logging.getLogger(__name__)
+
+# WGS84椭球的等积纬度参数
+_E = np.sqrt(GEOD.es)
+
+
+def _authalic_q(sin_lat):
+    """等积纬度计算中的 q(φ)"""
+    e_sin = _E * sin_lat
+    return (1 - GEOD.es) * (sin_lat / (1 - e_sin ** 2) - np.log((1 - e_sin) / (1 + e_sin)) / (2 * _E))
+
+
+_Q_POLE = _authalic_q(1.0)
+AUTHALIC_RADIUS = GEOD.a * np.sqrt(_Q_POLE / 2)
+
+
+def authalic_latitude(lat):
+    """大地纬度 (度) 转换为等积纬度 (弧度), 等积球面上的面积与椭球面相同"""
+    return np.arcsin(np.clip(_authalic_q(np.sin(np.radians(lat))) / _Q_POLE, -1, 1))
+
+
+def _geographic(geoms, crs):
+    """转换到经纬度 (WGS84)"""
+    geoms = np.asarray(geoms, dtype=object)
+    if crs_equal(crs, DISPLAY_CRS):
+        return geoms
+    return transform_geometries(geoms, crs, DISPLAY_CRS)
+
+
+def _linear_parts(geoms):
+    """把几何拆成线和环, 返回 (线/环数组, 所属几何序号, 类型: 0线 1外环 2内环)"""
+    parts, owner = shapely.get_parts(geoms, return_index=True)
+    types = shapely.get_type_id(parts)
+    is_line = np.isin(types, (1, 2))  # 点没有长度
+    is_polygon = types == 3
+
+    rings, ring_part = shapely.get_rings(parts[is_polygon], return_index=True)
+    # 每个面的第一个环是外环
+    exterior = np.r_[True, ring_part[1:] != ring_part[:-1]] if len(rings) else np.array([], dtype=bool)
+    return (np.concatenate([parts[is_line], rings]),
+            np.concatenate([owner[is_line], owner[is_polygon][ring_part]]).astype(np.int64),
+            np.concatenate([np.zeros(is_line.sum(), dtype=np.int8), np.where(exterior, 1, 2).astype(np.int8)]))
+
+
+def _segments(parts):
+    """所有线/环的线段, 返回 (起点, 终点, 所属线/环序号)"""
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+    same = index[1:] == index[:-1]
+    return coords[:-1][same], coords[1:][same], index[:-1][same]
+
+
+def geodesic_lengths(geoms, crs=DISPLAY_CRS):
+    """几何在WGS84椭球面上的长度 (米); 面为所有环的周长, 点为0"""
+    geoms = _geographic(geoms, crs)
+    parts, owner, _ = _linear_parts(geoms)
+    start, end, part = _segments(parts)
+    distances = GEOD.inv(start[:, 0], start[:, 1], end[:, 0], end[:, 1])[2] if len(part) else np.array([])
+    return np.bincount(owner[part], weights=distances, minlength=len(geoms))
+
+
+def geodesic_areas(geoms, crs=DISPLAY_CRS):
+    """面在WGS84椭球面上的面积 (平方米), 内环面积扣除; 点和线为0
+
+    每条边看作等积球面上的大圆弧, 边与极点围成的球面角盈余为
+    E = 2·atan(tan(Δλ/2)·(tan(β1/2)+tan(β2/2)) / (1+tan(β1/2)·tan(β2/2))),
+    环内所有边求和即为环的面积 (除以半径平方)。
+    """
+    geoms = _geographic(geoms, crs)
+    parts, owner, kind = _linear_parts(geoms)
+    rings = kind > 0
+    parts, owner, hole = parts[rings], owner[rings], kind[rings] == 2
+    start, end, ring = _segments(parts)
+
+    lon1, lon2 = np.radians(start[:, 0]), np.radians(end[:, 0])
+    t1, t2 = np.tan(authalic_latitude(start[:, 1]) / 2), np.tan(authalic_latitude(end[:, 1]) / 2)
+    # 经度差归一化到 (-π, π], 跨越180度经线的边也正确
+    dlon = np.remainder(lon2 - lon1 + np.pi, 2 * np.pi) - np.pi
+    excess = 2 * np.arctan2(np.tan(dlon / 2) * (t1 + t2), 1 + t1 * t2)
+
+    ring_area = np.abs(np.bincount(ring, weights=excess, minlength=len(parts))) * AUTHALIC_RADIUS ** 2
+    # 环绕一周超过半个球面时取较小的一侧
+    sphere = 4 * np.pi * AUTHALIC_RADIUS ** 2
+    ring_area = np.minimum(ring_area, sphere - ring_area)
+    return np.bincount(owner, weights=np.where(hole, -ring_area, ring_area), minlength=len(geoms))
+
+
+def layer_points(layer):
+    """图层要素的经纬度 (WGS84), 线/面取面上一点, 返回 (经度数组, 纬度数组)"""
+    geoms, _ = layer_to_geometries(layer)
+    if not (shapely.get_type_id(geoms) == 0).all():
+        geoms = shapely.point_on_surface(geoms)
+    geoms = _geographic(geoms, layer.get('crs', DISPLAY_CRS))
+    return shapely.get_x(geoms), shapely.get_y(geoms)
+
+
+def _block_rows(columns):
+    return max(1, BLOCK_ELEMENTS // max(columns, 1))
+
+
+def _dot_blocks(a, b, block_rows):
+    """按行分块计算单位向量点积 (矩阵乘法), 点积越大距离越近"""
+    u, v = unit_vectors(*a), unit_vectors(*b).T
+    for start in range(0, len(u), block_rows):
+        yield start, u[start:start + block_rows] @ v
+
+
+def _chord_to_distance(dot):
+    """单位向量点积转换为大圆距离 (米), 就地计算以减少临时数组"""
+    np.multiply(dot, -2, out=dot)
+    np.add(dot, 2, out=dot)
+    np.maximum(dot, 0, out=dot)
+    np.sqrt(dot, out=dot)
+    np.multiply(dot, 0.5, out=dot)
+    np.minimum(dot, 1, out=dot)
+    np.arcsin(dot, out=dot)
+    np.multiply(dot, 2 * EARTH_RADIUS, out=dot)
+    return dot
+
+
+def iter_distance_blocks(a, b, method='sphere', block_rows=None):
+    """按行分块计算点集a到点集b的距离 (米), 逐块产生 (起始行, 距离块)
+
+    a, b 为 (经度数组, 纬度数组)。sphere为球面大圆距离, 由单位向量的矩阵乘法得到弦长再换算,
+    重合点附近的绝对误差在0.1米以内; geodesic为WGS84椭球面上的测地线距离, 由pyproj逐块计算,
+    较慢但更精确。
+    """
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"不支持的距离计算方式: {method}")
+    m = len(b[0])
+    block_rows = block_rows or _block_rows(m)
+    if method == 'sphere':
+        for start, dot in _dot_blocks(a, b, block_rows):
+            yield start, _chord_to_distance(dot)
+        return
+
+    lon1, lat1 = (np.asarray(v, dtype=np.float64) for v in a)
+    lon2, lat2 = (np.asarray(v, dtype=np.float64) for v in b)
+    for start in range(0, len(lon1), block_rows):
+        rows = len(lon1[start:start + block_rows])
+        yield start, GEOD.inv(np.repeat(lon1[start:start + rows], m), np.repeat(lat1[start:start + rows], m),
+                              np.tile(lon2, rows), np.tile(lat2, rows))[2].reshape(rows, m)
+
+
+def distance_matrix(a, b, method='sphere', path=None, block_rows=None):
+    """点集a到点集b的 N×M 距离矩阵 (米)
+
+    path给出时逐块写入 .npy 文件 (内存映射), 矩阵不需要整个放进内存, 返回内存映射数组。
+    """
+    shape = (len(a[0]), len(b[0]))
+    if path is not None:
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=shape)
+    else:
+        out = np.empty(shape)
+    for start, block in iter_distance_blocks(a, b, method, block_rows):
+        out[start:start + len(block)] = block
+    if path is not None:
+        out.flush()
+        logger.info(f"距离矩阵已写入: {path} ({shape[0]}×{shape[1]})")
+    return out
+
+
+def nearest_k(a, b, k=1, method='sphere', exclude_self=False, block_rows=None):
+    """a中每个点在b中最近的k个点, 返回 (序号 N×k, 距离 N×k), 每行按距离升序
+
+    分块计算时每块只保留前k个, 内存只与块大小有关。球面距离直接按点积排名, 只对选中的k个
+    用haversine计算精确距离。exclude_self为真时a和b是同一点集, 跳过每个点自身。
+    b的点数不足k个时多出的位置序号为-1、距离为inf。
+    """
+    n, m = len(a[0]), len(b[0])
+    indices = np.full((n, k), -1, dtype=np.int64)
+    distances = np.full((n, k), np.inf)
+    kk = min(k, m - 1 if exclude_self else m)
+    if n == 0 or kk <= 0:
+        return indices, distances
+
+    block_rows = block_rows or _block_rows(m)
+    if method == 'sphere':
+        # 点积取负, 与距离同序
+        blocks = ((start, np.negative(dot, out=dot)) for start, dot in _dot_blocks(a, b, block_rows))
+    else:
+        blocks = iter_distance_blocks(a, b, method, block_rows)
+    lon1, lat1 = (np.asarray(v, dtype=np.float64) for v in a)
+    lon2, lat2 = (np.asarray(v, dtype=np.float64) for v in b)
+    for start, block in blocks:
+        rows = np.arange(len(block))
+        if exclude_self:
+            block[rows, start + rows] = np.inf
+        part = np.argpartition(block, kk - 1, axis=1)[:, :kk] if kk < m else \
+            np.broadcast_to(np.arange(m), (len(block), m))
+        if method == 'sphere':
+            part_distances = haversine(lon1[start + rows, None], lat1[start + rows, None], lon2[part], lat2[part])
+        else:
+            part_distances = np.take_along_axis(block, part, axis=1)
+        order = np.argsort(part_distances, axis=1, kind='stable')
+        indices[start:start + len(block), :kk] = np.take_along_axis(part, order, axis=1)
+        distances[start:start + len(block), :kk] = np.take_along_axis(part_distances, order, axis=1)
+    return indices, distances
+
+
+def measure_layer(layer):
+    """计算线/面图层每个要素的椭球面长度、周长和面积, 写入属性列, 返回测量表
+
+    线写入 length_km, 面写入 area_km2 和 perimeter_km。图层的 version 加1, 以便缓存失效。
+    """
+    if layer['type'] not in ('lines', 'polygons'):
+        raise ValueError("只有线图层和面图层可以测量长度和面积")
+    geoms, _ = layer_to_geometries(layer)
+    crs = layer.get('crs', DISPLAY_CRS)
+    lengths = geodesic_lengths(geoms, crs) / 1e3
+    if layer['type'] == 'lines':
+        table = pd.DataFrame({LENGTH_COLUMN: lengths})
+    else:
+        table = pd.DataFrame({AREA_COLUMN: geodesic_areas(geoms, crs) / 1e6, PERIMETER_COLUMN: lengths})
+
+    valid = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    for feature, row, ok in zip(layer['data'], table.itertuples(index=False), valid):
+        properties = feature.setdefault('properties', {})
+        for column, value in zip(table.columns, row):
+            properties[column] = round(float(value), 3) if ok else None
+    layer['version'] = layer.get('version', 0) + 1
+    return table
+
+
+def nearest_table(left_layer, right_layer, k=1, method='sphere', label='name'):
+    """左图层每个要素在右图层中最近的k个要素, 返回长表 (可导出为CSV)
+
+    每行为一对要素: 左右序号、名次、距离 (公里), 两个图层有label列时附带名称。
+    左右是同一个图层时跳过要素自身。
+    """
+    same = left_layer is right_layer
+    indices, distances = nearest_k(layer_points(left_layer), layer_points(right_layer), k, method,
+                                   exclude_self=same)
+    n = len(indices)
+    table = pd.DataFrame({
+        'left_index': np.repeat(np.arange(n), k),
+        'rank': np.tile(np.arange(1, k + 1), n),
+        'right_index': indices.ravel(),
+        'distance_km': distances.ravel() / 1e3,
+    })
+    table = table[table['right_index'] >= 0].reset_index(drop=True)
+
+    for side, layer in (('left', left_layer), ('right', right_layer)):
+        _, attrs = layer_to_geometries(layer)
+        if label in attrs.columns:
+            table.insert(len(table.columns) - 1, f"{side}_{label}",
+                         attrs[label].to_numpy()[table[f"{side}_index"].to_numpy()])
+    return table
@@ -0,0 +1,138 @@
+"""
+常驻的Plotly图表页面
+页面和本地plotly.js只加载一次, 之后每个图表只通过 runJavaScript 推送图形JSON,
+由 Plotly.react 增量更新; 数值数组以二进制 (base64 typed array) 编码传输,
+布局模板只在变化时发送一次
+"""
+import os
+import re
+import logging
+from pathlib import Path
+
+import plotly
+import plotly.io as pio
+from PyQt5.QtCore import QUrl
+from plotly.offline import get_plotlyjs_version
+
+HOST_PAGE_NAME = 'plotly_host.html'
+DEFAULT_CONFIG = {'displayModeBar': True, 'responsive': True}
+
+logger = logging.getLogger(__name__)
+
+HOST_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="{plotly_js}"></script>
+<style>
+    html, body, #chart {{ width: 100%; height: 100%; margin: 0; padding: 0; overflow: hidden; }}
+</style>
+</head>
+<body>
+<div id="chart"></div>
+<script>
+    var currentTemplate = null;
+    function setTemplate(template) {{
+        currentTemplate = template;
+    }}
+    function renderFigure(figure) {{
+        var layout = figure.layout || {{}};
+        if (!layout.template && currentTemplate) {{
+            layout.template = currentTemplate;
+        }}
+        layout.autosize = true;
+        return Plotly.react('chart', figure.data || [], layout, figure.config || {{}});
+    }}
+    function clearFigure() {{
+        Plotly.purge('chart');
+    }}
+</script>
+</body>
+</html>
+"""
+
+
+def plotly_js_url():
+    """plotly.js地址: 优先使用plotly包中自带的本地文件, 找不到时使用CDN"""
+    local_js = Path(plotly.__file__).parent / 'package_data' / 'plotly.min.js'
+    if local_js.exists():
+        return local_js.resolve().as_uri()
+    logger.warning("未找到本地plotly.min.js, 使用CDN")
+    return f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+
+
+def write_host_page(directory):
+    """在目录中写入宿主页面, 返回页面路径"""
+    path = Path(directory) / HOST_PAGE_NAME
+    path.write_text(HOST_PAGE_TEMPLATE.format(plotly_js=plotly_js_url()), encoding='utf-8')
+    return path
+
+
+def figure_payload(fig, config=None):
+    """把图形序列化为 (图形JSON, 模板JSON)
+
+    plotly.py 会把numpy数组编码为 {dtype, bdata} 的二进制形式, 大轨迹只传输紧凑的base64数据;
+    布局模板 (约几百KB) 单独返回, 由宿主页面缓存, 不随每个图表重复发送。
+    """
+    figure = fig.to_plotly_json()
+    template = figure['layout'].pop('template', None)
+    if config:
+        figure['config'] = config
+    payload = pio.to_json(figure, validate=False)
+    template_json = pio.to_json(template, validate=False, remove_uids=False) if template else None
+    return payload, template_json
+
+
+def _js_safe(payload):
+    """整理JSON以作为JavaScript代码执行"""
+    # plotly为嵌入HTML把 '/' 转义为 \u002f, base64数据中大量出现, 通过runJavaScript传输时不需要
+    payload = re.sub(r'(?<!\\)\\u002f', '/', payload)
+    # U+2028/2029 在旧版JavaScript字符串中非法
+    return payload.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def figure_script(fig, config=None, template=True):
+    """生成渲染图形的JavaScript调用; template为False时不包含布局模板"""
+    payload, template_json = figure_payload(fig, config)
+    script = f"renderFigure({_js_safe(payload)});"
+    if template and template_json:
+        script = f"setTemplate({_js_safe(template_json)});" + script
+    return script
+
+
+class PlotlyHost:
+    """管理一个QWebEngineView中的常驻Plotly页面"""
+
+    def __init__(self, web_view, directory):
+        self.web_view = web_view
+        self.page_path = write_host_page(directory)
+        self.ready = False
+        self._pending = None
+        self._template = None  # 页面中已缓存的模板JSON
+        self.web_view.loadFinished.connect(self._on_load_finished)
+        self.web_view.setUrl(QUrl.fromLocalFile(os.fspath(self.page_path)))
+
+    def _on_load_finished(self, ok):
+        self.ready = ok
+        if not ok:
+            logger.error(f"Plotly宿主页面加载失败: {self.page_path}")
+            return
+        if self._pending is not None:
+            script, self._pending = self._pending, None
+            self.web_view.page().runJavaScript(script)
+
+    def show(self, fig, config=None):
+        """显示图形; 页面尚未加载完成时在加载后显示最后一个图形"""
+        payload, template_json = figure_payload(fig, DEFAULT_CONFIG if config is None else config)
+        script = f"renderFigure({_js_safe(payload)});"
+        if template_json and template_json != self._template:
+            script = f"setTemplate({_js_safe(template_json)});" + script
+            self._template = template_json
+        if self.ready:
+            self.web_view.page().runJavaScript(script)
+        else:
+            self._pending = script
+
+    def clear(self):
+        if self.ready:
+            self.web_view.page().runJavaScript("clearFigure();")
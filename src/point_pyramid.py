@@ -0,0 +1,255 @@
+"""
+点图层的多分辨率计数金字塔
+按Web墨卡托瓦片 (四叉树) 划分, 最细一级的瓦片用Morton编码 (行列位交错) 作为键, 一次 np.unique 得到各瓦片的
+点数和数值列之和; 上一级的键为下一级右移两位, 排好序的键相邻即可用 reduceat 逐级汇总, 只处理瓦片而不再处理点。
+追加点时只为新点建立金字塔再与原金字塔逐级合并。地图渲染和范围统计按瓦片回答, 耗时与瓦片数而不是点数有关
+"""
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.layer_stats import VersionedLayerCache, attribute_frame, numeric_columns, stats_service
+
+MAX_ZOOM = 16  # 最细一级 (赤道处瓦片约600米)
+MAX_LATITUDE = 85.0511287798  # Web墨卡托的纬度范围
+RENDER_MAX_TILES = 2000  # 地图渲染时最多显示的瓦片数
+PYRAMID_FILE = 'pyramid.npz'
+
+logger = logging.getLogger(__name__)
+
+
+def tile_xy(lon, lat, zoom):
+    """经纬度 -> 瓦片行列号 (y向南增大), 超出墨卡托范围的纬度归入边缘瓦片"""
+    n = 1 << zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def tile_bounds(x, y, zoom):
+    """瓦片的经纬度范围, 返回 (西, 南, 东, 北) 数组"""
+    n = float(1 << zoom)
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+
+    def latitude(row):
+        return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * row / n))))
+    return x / n * 360.0 - 180.0, latitude(y + 1), (x + 1) / n * 360.0 - 180.0, latitude(y)
+
+
+def _spread_bits(v):
+    """把32位整数的各位隔位展开 (Morton编码)"""
+    v = v & 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    return (v | (v << 1)) & 0x5555555555555555
+
+
+def _compact_bits(v):
+    v = v & 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    return (v | (v >> 16)) & 0xFFFFFFFF
+
+
+def tile_keys(x, y):
+    """瓦片行列号 -> Morton键 (父瓦片的键为子瓦片的键右移两位)"""
+    return _spread_bits(np.asarray(x, dtype=np.int64)) | (_spread_bits(np.asarray(y, dtype=np.int64)) << 1)
+
+
+def key_xy(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    return _compact_bits(keys), _compact_bits(keys >> 1)
+
+
+def _reduce_sorted(keys, counts, sums):
+    """合并已排序键中相同的瓦片"""
+    if len(keys) == 0:
+        return keys, counts, sums
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.add.reduceat(counts, starts), np.add.reduceat(sums, starts, axis=0)
+
+
+def _ranges(starts, stops):
+    """把多个 [start, stop) 区间展开为一个索引数组"""
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.array([], dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total, dtype=np.int64) + offsets
+
+
+class PointPyramid:
+    """每一级瓦片的 (键, 点数, 数值列之和); 键按升序排列, 数值列中的缺失值不计入和"""
+
+    def __init__(self, columns, levels, row_count=0, max_zoom=MAX_ZOOM):
+        self.columns = list(columns)
+        self.levels = levels  # levels[z] = (键, 点数, 和 (瓦片数 x 列数))
+        self.row_count = row_count  # 建立金字塔的行数 (包括坐标无效的行)
+        self.max_zoom = max_zoom
+
+    @classmethod
+    def build(cls, lon, lat, values=None, columns=(), max_zoom=MAX_ZOOM):
+        """一次向量化建立金字塔; values为 (点数 x 列数) 数组"""
+        lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        values = np.zeros((len(lon), 0)) if values is None else np.asarray(values, dtype=np.float64)
+        row_count = len(lon)
+        valid = np.isfinite(lon) & np.isfinite(lat)
+        lon, lat, values = lon[valid], lat[valid], np.nan_to_num(values[valid], nan=0.0)
+
+        keys, inverse = np.unique(tile_keys(*tile_xy(lon, lat, max_zoom)), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys)).astype(np.int64)
+        sums = np.zeros((len(keys), values.shape[1]))
+        for j in range(values.shape[1]):
+            sums[:, j] = np.bincount(inverse, weights=values[:, j], minlength=len(keys))
+
+        levels = [None] * (max_zoom + 1)
+        levels[max_zoom] = (keys, counts, sums)
+        for zoom in range(max_zoom - 1, -1, -1):
+            child_keys, child_counts, child_sums = levels[zoom + 1]
+            levels[zoom] = _reduce_sorted(child_keys >> 2, child_counts, child_sums)
+        logger.debug(f"建立计数金字塔: {len(lon)} 个点, {len(keys)} 个最细瓦片")
+        return cls(columns, levels, row_count, max_zoom)
+
+    @classmethod
+    def from_frame(cls, frame, columns=None, max_zoom=MAX_ZOOM):
+        """由点表建立金字塔, columns默认为所有数值列 (不含经纬度)"""
+        if columns is None:
+            columns = [col for col in numeric_columns(frame) if col not in ('longitude', 'latitude')]
+        values = np.column_stack([pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=np.float64)
+                                  for col in columns]) if columns else None
+        lon = pd.to_numeric(frame['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+        lat = pd.to_numeric(frame['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+        return cls.build(lon, lat, values, columns, max_zoom)
+
+    @property
+    def point_count(self):
+        return int(self.levels[0][1].sum()) if len(self.levels[0][1]) else 0
+
+    def append_frame(self, frame):
+        """追加点表中的点: 为新点建立金字塔后逐级合并, 不重新处理已有的点"""
+        added = PointPyramid.from_frame(frame, self.columns, self.max_zoom)
+        for zoom in range(self.max_zoom + 1):
+            keys = np.concatenate([self.levels[zoom][0], added.levels[zoom][0]])
+            order = np.argsort(keys, kind='stable')
+            counts = np.concatenate([self.levels[zoom][1], added.levels[zoom][1]])[order]
+            sums = np.concatenate([self.levels[zoom][2], added.levels[zoom][2]])[order]
+            self.levels[zoom] = _reduce_sorted(keys[order], counts, sums)
+        self.row_count += added.row_count
+        return self
+
+    def tiles(self, zoom, bbox=None):
+        """某一级的非空瓦片, 返回DataFrame (x, y, 中心经纬度, 点数, 各列之和); bbox为 (西, 南, 东, 北)"""
+        keys, counts, sums = self.levels[zoom]
+        x, y = key_xy(keys)
+        west, south, east, north = tile_bounds(x, y, zoom)
+        keep = np.ones(len(keys), dtype=bool)
+        if bbox is not None:
+            keep = (east > bbox[0]) & (west < bbox[2]) & (north > bbox[1]) & (south < bbox[3])
+        table = pd.DataFrame({
+            'x': x[keep], 'y': y[keep],
+            'longitude': ((west + east) / 2)[keep], 'latitude': ((south + north) / 2)[keep],
+            'count': counts[keep]
+        })
+        for j, col in enumerate(self.columns):
+            table[f"{col}_sum"] = sums[keep, j]
+        return table
+
+    def choose_zoom(self, max_tiles=RENDER_MAX_TILES):
+        """非空瓦片数不超过max_tiles的最细一级"""
+        for zoom in range(self.max_zoom, -1, -1):
+            if len(self.levels[zoom][0]) <= max_tiles:
+                return zoom
+        return 0
+
+    def bbox_summary(self, bbox):
+        """范围内的点数和各列之和, 返回 {'count', 'sums': {列: 和}}
+
+        从第0级向下遍历四叉树: 完全在范围内的瓦片直接计入, 只与范围部分相交的瓦片继续细分,
+        最细一级部分相交的瓦片按中心是否在范围内计入 (误差不超过一个最细瓦片)。
+        """
+        west, south, east, north = bbox
+        count, sums = 0, np.zeros(len(self.columns))
+        index = np.arange(len(self.levels[0][0]))
+        for zoom in range(self.max_zoom + 1):
+            keys, counts, level_sums = self.levels[zoom]
+            if len(index) == 0:
+                break
+            tile_west, tile_south, tile_east, tile_north = tile_bounds(*key_xy(keys[index]), zoom)
+            inside = (tile_west >= west) & (tile_east <= east) & (tile_south >= south) & (tile_north <= north)
+            overlap = (tile_east > west) & (tile_west < east) & (tile_north > south) & (tile_south < north)
+            partial = overlap & ~inside
+            if zoom == self.max_zoom:
+                center_x, center_y = (tile_west + tile_east) / 2, (tile_south + tile_north) / 2
+                inside |= partial & (center_x >= west) & (center_x <= east) & \
+                    (center_y >= south) & (center_y <= north)
+            count += int(counts[index[inside]].sum())
+            sums += level_sums[index[inside]].sum(axis=0)
+            if zoom == self.max_zoom:
+                break
+            parents = keys[index[partial]] << 2
+            children = self.levels[zoom + 1][0]
+            index = _ranges(np.searchsorted(children, parents), np.searchsorted(children, parents + 4))
+        return {'count': count, 'sums': dict(zip(self.columns, sums.tolist()))}
+
+    def save(self, path):
+        """保存为 .npz (每一级三个数组)"""
+        arrays = {'meta': np.array(json.dumps({'columns': self.columns, 'row_count': self.row_count,
+                                               'max_zoom': self.max_zoom}, ensure_ascii=False))}
+        for zoom, (keys, counts, sums) in enumerate(self.levels):
+            arrays[f'keys_{zoom}'], arrays[f'counts_{zoom}'], arrays[f'sums_{zoom}'] = keys, counts, sums
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            levels = [(arrays[f'keys_{zoom}'], arrays[f'counts_{zoom}'], arrays[f'sums_{zoom}'])
+                      for zoom in range(meta['max_zoom'] + 1)]
+        return cls(meta['columns'], levels, meta['row_count'], meta['max_zoom'])
+
+
+class PyramidService(VersionedLayerCache):
+    """按图层版本缓存点图层的计数金字塔, 追加行时增量更新"""
+
+    def get(self, layer):
+        """获取点图层的金字塔, 版本未变化时直接返回缓存"""
+        pyramid = self._cached(layer)
+        if pyramid is None:
+            if layer.get('type') != 'points' or not isinstance(layer.get('data'), pd.DataFrame):
+                raise ValueError("计数金字塔需要点表图层")
+            pyramid = PointPyramid.from_frame(layer['data'])
+            self._store(layer, pyramid)
+            logger.debug(f"建立图层计数金字塔: {layer.get('name')}")
+        return pyramid
+
+    def attach(self, layer, pyramid):
+        """使用已有的金字塔 (如从磁盘缓存读取), 行数与图层不一致时不使用, 返回是否使用"""
+        if pyramid.row_count != len(layer['data']):
+            return False
+        self._store(layer, pyramid)
+        return True
+
+    def append_rows(self, layer, rows):
+        """向点图层追加行 (同时增量更新统计结果) 并增量更新金字塔"""
+        previous = self._cached(layer)
+        stats_service.append_rows(layer, rows)
+        rows = attribute_frame(rows)
+        if previous is None or not set(previous.columns) <= set(rows.columns):
+            # 新数据缺少已汇总的列时全量重建
+            return self.get(layer)
+        pyramid = previous.append_frame(rows)
+        self._store(layer, pyramid)
+        return pyramid
+
+
+# 全局共享的金字塔服务, 地图渲染和范围统计使用同一份缓存
+pyramid_service = PyramidService()
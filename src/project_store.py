@@ -0,0 +1,277 @@
+"""
+项目文件存储
+项目为一个目录: project.json 清单 + layers/ 下每个图层一个文件 (矢量为GeoParquet, TIN为.npz,
+分析生成的栅格为GeoTIFF副本; 导入的栅格只在清单中记录源文件路径)
+打开项目时只读取清单, 图层数据在首次访问时才加载; 保存时只重写发生变化的图层
+"""
+import os
+import json
+import uuid
+import shutil
+import logging
+from pathlib import Path
+from datetime import datetime
+
+import pandas as pd
+import shapely
+
+from src.geoparquet_io import write_geoparquet, read_geoparquet, DEFAULT_CRS
+from src.vector_io import layer_to_geometries
+
+PROJECT_FORMAT = 'studygis-project'
+PROJECT_FORMAT_VERSION = 2  # 2: 增加 tin 和 raster 图层
+PROJECT_SUFFIX = '.sgproj'
+MANIFEST_NAME = 'project.json'
+LAYER_DIR = 'layers'
+
+# 可以保存到项目中的图层类型
+STORABLE_LAYER_TYPES = ('points', 'lines', 'polygons', 'tin', 'raster')
+LAYER_FILE_SUFFIXES = {'tin': '.npz', 'raster': '.tif'}  # 其他类型为 .parquet
+
+logger = logging.getLogger(__name__)
+
+
+class LazyLayer(dict):
+    """延迟加载的图层
+
+    行为与普通图层字典一致, 但 'data' 在首次通过 layer['data'] 或 layer.get('data')
+    访问时才从项目文件中读取。修改图层数据的代码应递增 layer['version'],
+    保存项目时据此判断是否需要重写该图层。
+    """
+
+    def __init__(self, path, options=None, **fields):
+        super().__init__(**fields)
+        self.path = Path(path)
+        self.options = options or {}  # 读取数据时的选项 (栅格的着色和概视缓存目录)
+        self.saved_version = fields.get('version', 0)
+
+    @property
+    def loaded(self):
+        return dict.__contains__(self, 'data')
+
+    def load(self):
+        """读取图层数据"""
+        if not self.loaded:
+            logger.info(f"加载图层 {self.get('name')}: {self.path}")
+            dict.__setitem__(self, 'data', _read_layer_data(self.path, dict.__getitem__(self, 'type'),
+                                                             crs=dict.get(self, 'crs'), **self.options))
+        return dict.__getitem__(self, 'data')
+
+    def __getitem__(self, key):
+        if key == 'data':
+            return self.load()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == 'data':
+            return self.load()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return key == 'data' or dict.__contains__(self, key)
+
+
+def _read_layer_data(path, layer_type, crs=None, cmap=None, value_range=None, cache_dir=None):
+    """读取图层文件, 返回与内存图层一致的结构 (栅格打开后注册瓦片源)"""
+    if layer_type == 'tin':
+        from src.tin import TIN
+        return TIN.load(path, crs=crs)
+    if layer_type == 'raster':
+        from src.raster_layer import RASTER_CMAP, RasterSource, register_source
+        source = RasterSource(path, cache_dir=cache_dir, cmap=cmap or RASTER_CMAP, value_range=value_range)
+        register_source(source)
+        return source
+    result = read_geoparquet(path)
+    if layer_type == 'points':
+        if result['points'] is None:
+            return pd.DataFrame(columns=['longitude', 'latitude'])
+        return result['points']
+    return result[layer_type]
+
+
+def _atomic_write_json(path, data):
+    """先写临时文件再替换, 避免保存中断时损坏清单"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _write_layer_file(layer, path):
+    """写入单个图层文件, 返回清单中记录的统计信息"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    if layer['type'] == 'tin':
+        tin = layer['data']
+        tin.save(tmp_path)
+        os.replace(tmp_path, path)
+        return {'feature_count': len(tin), 'bbox': [float(v) for v in tin.bounds()]}
+    if layer['type'] == 'raster':
+        shutil.copy2(layer['data'].path, tmp_path)
+        os.replace(tmp_path, path)
+        return _raster_stats(layer['data'])
+
+    geoms, attrs = layer_to_geometries(layer)
+    # 保持原有行顺序, 不做空间排序
+    count = write_geoparquet(tmp_path, geoms, attrs, crs=layer.get('crs', DEFAULT_CRS), spatial_sort=False)
+    os.replace(tmp_path, path)
+
+    bounds = shapely.total_bounds(geoms)
+    bbox = None if pd.isna(bounds).any() else [float(v) for v in bounds]
+    return {'feature_count': count, 'bbox': bbox}
+
+
+def _raster_stats(source):
+    """栅格在清单中记录的统计信息和着色参数"""
+    return {'feature_count': None, 'bbox': [float(v) for v in source.bounds], 'cmap': source.cmap,
+            'value_range': list(source.value_range[0]) if source.count == 1 else None}
+
+
+def is_project_manifest(path):
+    """判断文件是否为项目清单"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(manifest, dict) and manifest.get('format') == PROJECT_FORMAT
+
+
+def read_manifest(project_dir):
+    """读取项目清单"""
+    with open(Path(project_dir) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != PROJECT_FORMAT:
+        raise ValueError(f"{project_dir} 不是StudyGIS项目")
+    if manifest.get('format_version', 1) > PROJECT_FORMAT_VERSION:
+        raise ValueError(f"项目格式版本过新: {manifest['format_version']}")
+    return manifest
+
+
+def save_project(project_dir, layers, name=None, app_version=None):
+    """增量保存项目, 只重写新增或版本变化的图层
+
+    分析生成的栅格 (图层的 'generated' 为True, 文件在缓存目录中) 复制到项目中,
+    导入的栅格只记录源文件的绝对路径。
+    返回 {'written': 重写的图层数, 'reused': 复用的图层数, 'skipped': 不支持保存的图层名称列表}
+    """
+    project_dir = Path(project_dir)
+    layer_dir = project_dir / LAYER_DIR
+    layer_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest_path = project_dir / MANIFEST_NAME
+    old_manifest = read_manifest(project_dir) if manifest_path.exists() else {}
+    old_entries = {entry['id']: entry for entry in old_manifest.get('layers', [])}
+
+    entries = []
+    skipped = []
+    written = reused = 0
+    for layer in layers:
+        layer_type = layer.get('type')
+        if layer_type not in STORABLE_LAYER_TYPES:
+            logger.warning(f"图层 {layer.get('name')} 的类型 {layer_type} 暂不支持保存, 已跳过")
+            skipped.append(layer.get('name'))
+            continue
+
+        layer_id = dict.setdefault(layer, 'layer_id', uuid.uuid4().hex)
+        version = dict.get(layer, 'version', 0)
+        generated = dict.get(layer, 'generated', False)
+        file_name = f"{layer_id}{LAYER_FILE_SUFFIXES.get(layer_type, '.parquet')}"
+        target = layer_dir / file_name
+        old_entry = old_entries.get(layer_id)
+        lazy_unchanged = (isinstance(layer, LazyLayer) and not layer.loaded
+                          and layer.saved_version == version)
+        stat_keys = ('feature_count', 'bbox') + (('cmap', 'value_range') if layer_type == 'raster' else ())
+
+        if layer_type == 'raster' and not generated:
+            # 导入的栅格不复制, 只记录源文件
+            source = layer.path if lazy_unchanged else Path(layer['data'].path)
+            stats = ({key: dict.get(layer, key) for key in stat_keys} if lazy_unchanged
+                     else _raster_stats(layer['data']))
+            stats['source'] = str(source.resolve())
+            reused += 1
+        elif old_entry and old_entry.get('version') == version and target.exists():
+            # 图层数据未变化, 只更新名称/可见性等元数据
+            stats = {key: old_entry.get(key) for key in stat_keys}
+            reused += 1
+        elif lazy_unchanged:
+            # 另存为: 尚未加载的图层直接复制文件
+            if layer.path.resolve() != target.resolve():
+                shutil.copy2(layer.path, target)
+            stats = {key: dict.get(layer, key) for key in stat_keys}
+            reused += 1
+        else:
+            stats = _write_layer_file(layer, target)
+            written += 1
+
+        entry = {
+            'id': layer_id,
+            'name': layer['name'],
+            'type': layer_type,
+            'visible': layer.get('visible', True),
+            'crs': layer.get('crs', DEFAULT_CRS),
+            'source_crs': layer.get('source_crs', layer.get('crs', DEFAULT_CRS)),
+            'file': None if 'source' in stats else f"{LAYER_DIR}/{file_name}",
+            'version': version,
+            **stats
+        }
+        if layer_type == 'raster':
+            entry['generated'] = generated
+        entries.append(entry)
+
+    now = datetime.now().isoformat()
+    manifest = {
+        'format': PROJECT_FORMAT,
+        'format_version': PROJECT_FORMAT_VERSION,
+        'name': name or old_manifest.get('name') or project_dir.stem,
+        'created_time': old_manifest.get('created_time', now),
+        'saved_time': now,
+        'version': app_version,
+        'layers': entries
+    }
+    _atomic_write_json(manifest_path, manifest)
+
+    # 清理已移除图层的文件
+    referenced = {Path(entry['file']).name for entry in entries if entry['file']}
+    for suffix in {'.parquet', *LAYER_FILE_SUFFIXES.values()}:
+        for path in layer_dir.glob(f'*{suffix}'):
+            if path.name not in referenced:
+                path.unlink()
+
+    logger.info(f"项目已保存到 {project_dir}: 重写 {written} 个图层, 复用 {reused} 个图层")
+    return {'written': written, 'reused': reused, 'skipped': skipped}
+
+
+def open_project(project_dir, raster_cache_dir=None):
+    """打开项目, 只读取清单并返回 (清单, 延迟加载的图层列表)
+
+    raster_cache_dir 为导入的栅格生成概视时使用的缓存目录。
+    """
+    project_dir = Path(project_dir)
+    if project_dir.is_file():
+        project_dir = project_dir.parent
+    manifest = read_manifest(project_dir)
+
+    layers = []
+    for entry in manifest.get('layers', []):
+        fields = {}
+        options = None
+        if entry['type'] == 'raster':
+            fields = {'generated': entry.get('generated', False), 'cmap': entry.get('cmap'),
+                      'value_range': entry.get('value_range')}
+            options = {'cmap': entry.get('cmap'), 'value_range': entry.get('value_range'),
+                       'cache_dir': raster_cache_dir}
+        layers.append(LazyLayer(
+            entry.get('source') or project_dir / entry['file'],
+            options,
+            name=entry['name'],
+            type=entry['type'],
+            visible=entry.get('visible', True),
+            crs=entry.get('crs', DEFAULT_CRS),
+            source_crs=entry.get('source_crs', entry.get('crs', DEFAULT_CRS)),
+            layer_id=entry['id'],
+            version=entry.get('version', 0),
+            feature_count=entry.get('feature_count'),
+            bbox=entry.get('bbox'),
+            **fields
+        ))
+    return manifest, layers
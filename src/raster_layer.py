@@ -0,0 +1,457 @@
+"""
+栅格图层 (GeoTIFF/DEM)
+按地图瓦片只读取视口需要的窗口 (rasterio窗口读取), 缩小显示时从概视金字塔读取;
+没有概视的栅格在缓存目录中通过VRT生成外部概视 (.ovr), 不修改原始文件。
+渲染后的PNG瓦片按瓦片LRU缓存, 由自定义URL scheme提供给地图页面
+"""
+import io
+import math
+import uuid
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds as transform_from_bounds
+from rasterio.warp import reproject, transform_bounds
+from rasterio.windows import Window, from_bounds as window_from_bounds
+from matplotlib import colormaps
+from PIL import Image
+
+# 尝试导入Qt WebEngine的URL scheme接口 (可选, 只有瓦片服务需要)
+try:
+    from PyQt5.QtCore import QBuffer, QIODevice, pyqtSignal
+    from PyQt5.QtWebEngineCore import (QWebEngineUrlRequestJob, QWebEngineUrlScheme,
+                                       QWebEngineUrlSchemeHandler)
+    from PyQt5.QtWebEngineWidgets import QWebEngineProfile
+    TILE_SCHEME_AVAILABLE = True
+except ImportError:
+    TILE_SCHEME_AVAILABLE = False
+
+RASTER_EXTENSIONS = ('.tif', '.tiff', '.img', '.jp2', '.vrt')
+TILE_SIZE = 256
+TILE_CRS = 'EPSG:3857'
+TILE_SCHEME = b'studygis'
+MAX_CACHED_TILES = 1024
+TILE_WORKERS = 4
+SYNC_OVERVIEW_PIXELS = 64 * 1024 * 1024  # 小于该像元数的栅格打开时同步生成概视, 否则在后台生成
+MAX_DECIMATION = 4  # 一个瓦片最多读取 (TILE_SIZE*MAX_DECIMATION)^2 个源像元
+SAMPLE_GRID = 16  # 估计显示范围时的采样窗口数 (每个方向)
+SAMPLE_SIZE = 64
+RASTER_CMAP = 'terrain'
+
+logger = logging.getLogger(__name__)
+
+# 后台生成概视的线程 (同一时间只生成一个, 避免磁盘争用)
+_overview_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def mercator_tile_bounds(z, x, y):
+    """XYZ瓦片在Web墨卡托坐标系中的范围 (west, south, east, north)"""
+    half = 20037508.342789244
+    size = 2 * half / (1 << z)
+    west = -half + x * size
+    north = half - y * size
+    return west, north - size, west + size, north
+
+
+def overview_factors(width, height, tile_size=TILE_SIZE):
+    """概视倍数: 2, 4, 8 ... 直到最长边不超过一个瓦片"""
+    factors = []
+    factor = 2
+    while max(width, height) / factor >= tile_size / 2:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+class RasterSource:
+    """一个栅格文件的读取和瓦片渲染
+
+    每个线程持有自己的数据集句柄 (rasterio数据集不是线程安全的)。
+    overview_path 为带概视的数据集 (原文件自带概视时即原文件, 否则为缓存目录中的VRT)。
+    value_range 为单波段着色的 (最小值, 最大值), 不指定时按采样的2%~98%分位数。
+    """
+
+    def __init__(self, path, cache_dir=None, cmap=RASTER_CMAP, value_range=None):
+        self.path = str(Path(path).resolve())
+        self.key = uuid.uuid4().hex
+        self.cmap = cmap
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        with rasterio.open(self.path) as ds:
+            if ds.crs is None:
+                raise ValueError("栅格缺少坐标系信息")
+            self.crs = ds.crs
+            self.width, self.height = ds.width, ds.height
+            self.count = ds.count
+            self.dtype = ds.dtypes[0]
+            self.nodata = ds.nodata
+            self.bounds = tuple(ds.bounds)
+            self.res = ds.res
+            self.factors = ds.overviews(1)
+
+        self.overview_path = self.path if self.factors else None
+        self.overview_future = None
+        if not self.factors and cache_dir is not None:
+            self._prepare_overviews(Path(cache_dir))
+        self.value_range = [tuple(value_range)] if value_range else self._sample_range()
+
+    # ---- 概视 ----
+
+    def _overview_vrt(self, cache_dir):
+        """缓存目录中的VRT路径, 按源文件路径、大小和修改时间区分"""
+        stat = Path(self.path).stat()
+        digest = hashlib.blake2b(f"{self.path}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8'),
+                                 digest_size=16).hexdigest()
+        return cache_dir / f"{digest}.vrt"
+
+    def _prepare_overviews(self, cache_dir):
+        vrt = self._overview_vrt(cache_dir)
+        if vrt.exists() and Path(f"{vrt}.ovr").exists():
+            self._use_overviews(vrt)
+            return
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        if self.width * self.height <= SYNC_OVERVIEW_PIXELS:
+            self._build_overviews(vrt)
+        else:
+            logger.info(f"后台生成概视: {self.path}")
+            self.overview_future = _overview_executor.submit(self._build_overviews, vrt)
+
+    def _build_overviews(self, vrt):
+        """生成外部概视: VRT以更新模式打开时, GDAL把概视写入 .vrt.ovr"""
+        factors = overview_factors(self.width, self.height)
+        if not factors:
+            return
+        try:
+            rasterio.shutil.copy(self.path, vrt, driver='VRT')
+            resampling = Resampling.nearest if self.count >= 3 else Resampling.average
+            with rasterio.open(vrt, 'r+') as ds:
+                ds.build_overviews(factors, resampling)
+        except Exception as e:
+            logger.error(f"生成概视失败: {e}")
+            return
+        self._use_overviews(vrt)
+        logger.info(f"概视已生成: {self.path} {factors}")
+
+    def _use_overviews(self, vrt):
+        with rasterio.open(vrt) as ds:
+            factors = ds.overviews(1)
+        with self._lock:
+            self.overview_path = str(vrt)
+            self.factors = factors
+        tile_cache.invalidate(self.key)
+
+    # ---- 读取 ----
+
+    def _dataset(self, level=None):
+        """当前线程的数据集句柄; level为概视序号, None表示原始分辨率"""
+        path = self.path if level is None else self.overview_path
+        handles = getattr(self._local, 'handles', None)
+        if handles is None:
+            handles = self._local.handles = {}
+        key = (path, level)
+        if key not in handles:
+            kwargs = {} if level is None else {'overview_level': level}
+            handles[key] = rasterio.open(path, **kwargs)
+        return handles[key]
+
+    def _choose_level(self, decimation):
+        """按需要的抽稀倍数选择概视: 返回不超过该倍数的最粗概视序号, None表示原始分辨率"""
+        with self._lock:
+            factors = list(self.factors)
+        level = None
+        for i, factor in enumerate(factors):
+            if factor <= decimation:
+                level = i
+        return level
+
+    def _bands(self):
+        return [1, 2, 3] if self.count >= 3 else [1]
+
+    def _sample_range(self):
+        """从均匀分布的小窗口采样估计显示范围 (2%~98%分位), 不读取整个栅格"""
+        ds = self._dataset()
+        rows = np.linspace(0, max(self.height - SAMPLE_SIZE, 0), SAMPLE_GRID).astype(int)
+        cols = np.linspace(0, max(self.width - SAMPLE_SIZE, 0), SAMPLE_GRID).astype(int)
+        samples = []
+        for row in np.unique(rows):
+            for col in np.unique(cols):
+                window = Window(col, row, min(SAMPLE_SIZE, self.width), min(SAMPLE_SIZE, self.height))
+                samples.append(self._valid(ds.read(self._bands(), window=window)).reshape(len(self._bands()), -1))
+        values = np.concatenate(samples, axis=1)
+        if not np.isfinite(values).any():
+            return [(0.0, 1.0)] * values.shape[0]
+        low, high = np.nanpercentile(values, [2, 98], axis=1)
+        return [(float(lo), float(hi) if hi > lo else float(lo) + 1.0) for lo, hi in zip(low, high)]
+
+    def _valid(self, data):
+        """转为float32并把nodata置为NaN"""
+        data = data.astype(np.float32)
+        if self.nodata is not None:
+            data[data == self.nodata] = np.nan
+        return data
+
+    def read_window(self, bounds, shape, dst_crs=TILE_CRS):
+        """把源坐标系中的窗口重投影到 dst_crs 的 bounds/shape 网格上, 返回 (波段, 行, 列) float32
+
+        只读取覆盖目标范围的窗口, 并按抽稀倍数选择概视。范围与栅格不相交或
+        概视尚未生成、需要读取的像元过多时返回None。
+        """
+        height, width = shape
+        src_bounds = transform_bounds(dst_crs, self.crs, *bounds, densify_pts=21)
+        west = max(src_bounds[0], self.bounds[0])
+        south = max(src_bounds[1], self.bounds[1])
+        east = min(src_bounds[2], self.bounds[2])
+        north = min(src_bounds[3], self.bounds[3])
+        if west >= east or south >= north:
+            return None
+
+        decimation = max((src_bounds[2] - src_bounds[0]) / width / self.res[0],
+                         (src_bounds[3] - src_bounds[1]) / height / self.res[1])
+        ds = self._dataset(self._choose_level(decimation))
+
+        window = window_from_bounds(west, south, east, north, transform=ds.transform)
+        col0 = max(int(math.floor(window.col_off)) - 1, 0)
+        row0 = max(int(math.floor(window.row_off)) - 1, 0)
+        col1 = min(int(math.ceil(window.col_off + window.width)) + 1, ds.width)
+        row1 = min(int(math.ceil(window.row_off + window.height)) + 1, ds.height)
+        if col1 <= col0 or row1 <= row0:
+            return None
+        if (col1 - col0) * (row1 - row0) > (max(width, height) * MAX_DECIMATION) ** 2:
+            # 概视尚未生成, 直接读取的像元过多
+            return None
+        window = Window(col0, row0, col1 - col0, row1 - row0)
+        source = self._valid(ds.read(self._bands(), window=window))
+
+        destination = np.full((source.shape[0], height, width), np.nan, dtype=np.float32)
+        reproject(
+            source, destination,
+            src_transform=ds.window_transform(window), src_crs=self.crs, src_nodata=np.nan,
+            dst_transform=transform_from_bounds(*bounds, width, height), dst_crs=dst_crs, dst_nodata=np.nan,
+            resampling=Resampling.bilinear
+        )
+        return destination
+
+    def read_grid(self, max_pixels=4000000):
+        """读取整个栅格的单波段网格 (自动选择概视, 像元数不超过max_pixels)
+
+        返回 (z, x, y): z的行按y升序排列, x/y为像元中心坐标 (源坐标系)。
+        """
+        decimation = math.sqrt(self.width * self.height / max_pixels)
+        ds = self._dataset(self._choose_level(decimation))
+        step = max(1, int(math.ceil(math.sqrt(ds.width * ds.height / max_pixels))))
+        out_shape = (int(math.ceil(ds.height / step)), int(math.ceil(ds.width / step)))
+        z = self._valid(ds.read(1, out_shape=out_shape, resampling=Resampling.average))
+        west, south, east, north = self.bounds
+        dx = (east - west) / out_shape[1]
+        dy = (north - south) / out_shape[0]
+        x = west + dx * (np.arange(out_shape[1]) + 0.5)
+        y = north - dy * (np.arange(out_shape[0]) + 0.5)
+        return z[::-1].astype(np.float64), x, y[::-1]
+
+    # ---- 渲染 ----
+
+    def colorize(self, data):
+        """(波段, 行, 列) -> RGBA uint8; 单波段按高程着色, 多波段按RGB拉伸"""
+        valid = np.isfinite(data).all(axis=0)
+        rgba = np.zeros(data.shape[1:] + (4,), dtype=np.uint8)
+        if data.shape[0] == 1:
+            low, high = self.value_range[0]
+            normed = np.clip((data[0] - low) / (high - low), 0, 1)
+            lut = (colormaps[self.cmap](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+            rgba[valid] = lut[(np.nan_to_num(normed[valid]) * 255).astype(np.uint8)]
+        else:
+            for band, (low, high) in enumerate(self.value_range):
+                scaled = np.clip((data[band] - low) / (high - low) * 255, 0, 255)
+                rgba[..., band][valid] = np.nan_to_num(scaled[valid]).astype(np.uint8)
+        rgba[..., 3] = np.where(valid, 255, 0)
+        return rgba
+
+    def render_tile(self, z, x, y):
+        """渲染一个XYZ瓦片为PNG字节串, 不相交或暂时无法读取时返回None"""
+        data = self.read_window(mercator_tile_bounds(z, x, y), (TILE_SIZE, TILE_SIZE))
+        if data is None:
+            return None
+        return encode_png(self.colorize(data))
+
+    def wgs84_bounds(self):
+        """经纬度范围 (west, south, east, north)"""
+        return transform_bounds(self.crs, 'EPSG:4326', *self.bounds, densify_pts=21)
+
+    def describe(self):
+        return (f"栅格: {self.width} x {self.height}, {self.count} 个波段, {self.dtype}\n"
+                f"分辨率: {self.res[0]:.6g} x {self.res[1]:.6g}\n"
+                f"概视: {self.factors if self.factors else '生成中'}")
+
+    def close(self):
+        """关闭当前线程的数据集句柄"""
+        for handle in getattr(self._local, 'handles', {}).values():
+            handle.close()
+        self._local.handles = {}
+
+
+def encode_png(rgba):
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+class TileCache:
+    """渲染后瓦片的LRU缓存, 键为 (栅格键, z, x, y)"""
+
+    def __init__(self, max_tiles=MAX_CACHED_TILES):
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile):
+        with self._lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+    def invalidate(self, source_key=None):
+        """清除某个栅格 (None时全部) 的瓦片"""
+        with self._lock:
+            if source_key is None:
+                self._tiles.clear()
+            else:
+                for key in [k for k in self._tiles if k[0] == source_key]:
+                    del self._tiles[key]
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+tile_cache = TileCache()
+_sources = {}  # 栅格键 -> RasterSource, 供瓦片服务查找
+
+
+def register_source(source):
+    _sources[source.key] = source
+    return source.key
+
+
+def unregister_source(source):
+    _sources.pop(source.key, None)
+    tile_cache.invalidate(source.key)
+
+
+def get_tile(source_key, z, x, y):
+    """获取瓦片PNG (优先缓存); 栅格不存在时返回None
+
+    不相交或概视尚未生成时返回透明瓦片且不缓存, 以便概视生成后重新渲染。
+    """
+    key = (source_key, z, x, y)
+    tile = tile_cache.get(key)
+    if tile is not None:
+        return tile
+    source = _sources.get(source_key)
+    if source is None:
+        return None
+    tile = source.render_tile(z, x, y)
+    if tile is None:
+        return EMPTY_TILE
+    tile_cache.put(key, tile)
+    return tile
+
+
+def tile_url(source):
+    """Leaflet瓦片地址模板"""
+    return f"{TILE_SCHEME.decode()}://tiles/{source.key}/{{z}}/{{x}}/{{y}}.png"
+
+
+def parse_tile_path(path):
+    """'/<栅格键>/<z>/<x>/<y>.png' -> (栅格键, z, x, y), 格式错误时返回None"""
+    parts = path.strip('/').split('/')
+    if len(parts) != 4 or not parts[3].endswith('.png'):
+        return None
+    try:
+        return parts[0], int(parts[1]), int(parts[2]), int(parts[3][:-4])
+    except ValueError:
+        return None
+
+
+if TILE_SCHEME_AVAILABLE:
+    class TileSchemeHandler(QWebEngineUrlSchemeHandler):
+        """studygis://tiles/... 瓦片请求处理: 在线程池中渲染, 回到主线程应答"""
+
+        tile_ready = pyqtSignal(object, object)
+
+        def __init__(self, parent=None):
+            super().__init__(parent)
+            self._executor = ThreadPoolExecutor(max_workers=TILE_WORKERS)
+            self.tile_ready.connect(self._reply)
+
+        def requestStarted(self, job):
+            request = parse_tile_path(job.requestUrl().path())
+            if request is None:
+                job.fail(QWebEngineUrlRequestJob.UrlInvalid)
+                return
+            cached = tile_cache.get(request)
+            if cached is not None:
+                self._reply(job, cached)
+                return
+            self._executor.submit(self._render, job, request)
+
+        def _render(self, job, request):
+            try:
+                tile = get_tile(*request)
+            except Exception as e:
+                logger.error(f"渲染瓦片失败 {request}: {e}")
+                tile = None
+            self.tile_ready.emit(job, tile)
+
+        def _reply(self, job, tile):
+            try:
+                if tile is None:
+                    job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+                    return
+                buffer = QBuffer(job)
+                buffer.setData(tile)
+                buffer.open(QIODevice.ReadOnly)
+                job.reply(b'image/png', buffer)
+            except RuntimeError:
+                pass  # 请求已被取消, 对应的job已销毁
+
+_handler = None
+
+
+def register_tile_scheme():
+    """注册瓦片URL scheme (必须在创建QApplication之前调用)"""
+    if not TILE_SCHEME_AVAILABLE:
+        return
+    scheme = QWebEngineUrlScheme(TILE_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme | QWebEngineUrlScheme.LocalScheme |
+                    QWebEngineUrlScheme.LocalAccessAllowed | QWebEngineUrlScheme.CorsEnabled)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+def install_tile_handler():
+    """在默认WebEngine配置中安装瓦片处理器 (重复调用无副作用)"""
+    global _handler
+    if not TILE_SCHEME_AVAILABLE or _handler is not None:
+        return _handler
+    _handler = TileSchemeHandler()
+    QWebEngineProfile.defaultProfile().installUrlSchemeHandler(TILE_SCHEME, _handler)
+    return _handler
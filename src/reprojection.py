@@ -0,0 +1,215 @@
+"""
+坐标系转换
+对整个坐标数组批量调用缓存的 pyproj.Transformer, 大图层分块并可选多进程并行
+"""
+import os
+import logging
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import CRS, Transformer
+
+from src.vector_io import layer_to_geometries, split_geometries
+
+DISPLAY_CRS = 'EPSG:4326'
+DEFAULT_CHUNK_SIZE = 1000000
+PARALLEL_THRESHOLD = 5000000  # 超过该顶点数时默认启用多进程
+
+# 常用坐标系 (显示名称 -> 坐标系代码)
+COMMON_CRS = {
+    'WGS 84 经纬度 (EPSG:4326)': 'EPSG:4326',
+    'CGCS2000 经纬度 (EPSG:4490)': 'EPSG:4490',
+    'Web墨卡托 (EPSG:3857)': 'EPSG:3857',
+}
+# CGCS2000 高斯-克吕格 3度带 (带号前缀), 第25~45带
+for _zone in range(25, 46):
+    COMMON_CRS[f'CGCS2000 高斯-克吕格 3度带 第{_zone}带 (EPSG:{4513 + _zone - 25})'] = f'EPSG:{4513 + _zone - 25}'
+# CGCS2000 高斯-克吕格 6度带 (带号前缀), 第13~23带
+for _zone in range(13, 24):
+    COMMON_CRS[f'CGCS2000 高斯-克吕格 6度带 第{_zone}带 (EPSG:{4491 + _zone - 13})'] = f'EPSG:{4491 + _zone - 13}'
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=64)
+def get_crs(crs):
+    """解析坐标系 (带缓存)"""
+    return CRS.from_user_input(crs)
+
+
+@lru_cache(maxsize=64)
+def get_transformer(src_crs, dst_crs):
+    """获取坐标转换器 (带缓存), 统一使用 经度/x 在前 的轴顺序"""
+    return Transformer.from_crs(get_crs(src_crs), get_crs(dst_crs), always_xy=True)
+
+
+def crs_equal(a, b):
+    """判断两个坐标系是否等价 (忽略轴顺序)"""
+    if a is None or b is None:
+        return a is b
+    if a == b:
+        return True
+    return get_crs(a).equals(get_crs(b), ignore_axis_order=True)
+
+
+def epsg_code(crs):
+    """坐标系对应的EPSG代码 (PostGIS的SRID), 没有EPSG代码时抛出ValueError
+
+    与EPSG:4326仅轴顺序不同的坐标系 (如GeoParquet默认的OGC:CRS84) 返回4326。
+    """
+    if crs_equal(crs, DISPLAY_CRS):
+        return 4326
+    code = get_crs(crs).to_epsg()
+    if code is None:
+        raise ValueError(f"坐标系 {crs} 没有对应的EPSG代码, 无法写入PostGIS")
+    return code
+
+
+def guess_crs(x, y):
+    """根据坐标范围猜测坐标系, 无法判断时返回None"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return None
+    x, y = x[finite], y[finite]
+
+    if (np.abs(x) <= 180).all() and (np.abs(y) <= 90).all():
+        return DISPLAY_CRS
+
+    # 带号前缀的高斯-克吕格坐标: 东坐标为8位数, 前两位为带号
+    if (x >= 1e7).all() and (x < 1e8).all():
+        zones = np.unique((x // 1e6).astype(int))
+        if len(zones) == 1:
+            zone = int(zones[0])
+            if 25 <= zone <= 45:
+                return f'EPSG:{4513 + zone - 25}'
+            if 13 <= zone <= 23:
+                return f'EPSG:{4491 + zone - 13}'
+
+    # 中国范围内的Web墨卡托坐标
+    if (x > 8e6).all() and (x < 1.6e7).all() and (y > 1e6).all() and (y < 8e6).all():
+        return 'EPSG:3857'
+
+    return None
+
+
+def local_metric_crs(x, y):
+    """以数据范围中心为原点的方位等距投影 (单位米), 用于经纬度数据的距离计算
+
+    到中心的距离和方位无变形, 中心1000km内其余方向的长度误差小于1%。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    lon = (np.min(x[finite]) + np.max(x[finite])) / 2 if finite.any() else 0.0
+    lat = (np.min(y[finite]) + np.max(y[finite])) / 2 if finite.any() else 0.0
+    return f'+proj=aeqd +lat_0={lat:.6f} +lon_0={lon:.6f} +datum=WGS84 +units=m +no_defs'
+
+
+def is_geographic(crs):
+    """坐标系是否为经纬度坐标系"""
+    return get_crs(crs or DISPLAY_CRS).is_geographic
+
+
+def _transform_chunk(args):
+    """在子进程中转换一个坐标块"""
+    src_crs, dst_crs, x, y = args
+    get_transformer(src_crs, dst_crs).transform(x, y, inplace=True)
+    return x, y
+
+
+def transform_coords(x, y, src_crs, dst_crs=DISPLAY_CRS, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None):
+    """批量转换坐标数组, 返回新的 (x, y) 数组, 不修改输入
+
+    max_workers为None时, 顶点数超过 PARALLEL_THRESHOLD 才使用多进程。
+    """
+    x = np.array(x, dtype=np.float64)
+    y = np.array(y, dtype=np.float64)
+    if crs_equal(src_crs, dst_crs) or len(x) == 0:
+        return x, y
+
+    n = len(x)
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if n >= PARALLEL_THRESHOLD else 1
+
+    starts = range(0, n, chunk_size)
+    if max_workers > 1 and n > chunk_size:
+        tasks = ((src_crs, dst_crs, x[i:i + chunk_size], y[i:i + chunk_size]) for i in starts)
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            for i, (cx, cy) in zip(starts, executor.map(_transform_chunk, tasks)):
+                x[i:i + chunk_size] = cx
+                y[i:i + chunk_size] = cy
+    else:
+        transformer = get_transformer(src_crs, dst_crs)
+        for i in starts:
+            # 一维切片是连续内存, 可以原地转换
+            transformer.transform(x[i:i + chunk_size], y[i:i + chunk_size], inplace=True)
+
+    return x, y
+
+
+def transform_geometries(geoms, src_crs, dst_crs=DISPLAY_CRS, **kwargs):
+    """转换几何数组, 所有顶点作为一个坐标数组一次性转换"""
+    if crs_equal(src_crs, dst_crs):
+        return geoms
+
+    def transform(coords):
+        x, y = transform_coords(coords[:, 0], coords[:, 1], src_crs, dst_crs, **kwargs)
+        return np.column_stack([x, y])
+
+    return shapely.transform(geoms, transform)
+
+
+def reproject_result(result, dst_crs=DISPLAY_CRS, src_crs=None, **kwargs):
+    """转换读取结果 {'crs', 'points', 'lines', 'polygons'} 的坐标系
+
+    src_crs为None时使用 result['crs']; 返回新的结果字典, 其中记录了 'source_crs'。
+    """
+    src_crs = src_crs or result.get('crs') or DISPLAY_CRS
+    reprojected = dict(result, crs=dst_crs, source_crs=src_crs)
+    if crs_equal(src_crs, dst_crs):
+        return reprojected
+
+    points = result.get('points')
+    if points is not None and len(points) > 0:
+        points = points.copy()
+        points['longitude'], points['latitude'] = transform_coords(
+            pd.to_numeric(points['longitude'], errors='coerce'),
+            pd.to_numeric(points['latitude'], errors='coerce'),
+            src_crs, dst_crs, **kwargs
+        )
+        reprojected['points'] = points
+
+    for key in ('lines', 'polygons'):
+        features = result.get(key) or []
+        if features:
+            geoms, attrs = layer_to_geometries({'data': features})
+            geoms = transform_geometries(geoms, src_crs, dst_crs, **kwargs)
+            reprojected[key] = split_geometries(geoms, attrs)[key]
+
+    logger.info(f"坐标转换完成: {src_crs} -> {dst_crs}")
+    return reprojected
+
+
+def reproject_layer(layer, dst_crs=DISPLAY_CRS, **kwargs):
+    """转换内存图层的坐标系 (原地修改), 并记录原始坐标系"""
+    src_crs = layer.get('crs', DISPLAY_CRS)
+    if crs_equal(src_crs, dst_crs):
+        return layer
+
+    key = layer['type']
+    result = {'crs': src_crs, 'points': None, 'lines': [], 'polygons': []}
+    result[key] = layer['data']
+    reprojected = reproject_result(result, dst_crs, **kwargs)
+
+    layer['data'] = reprojected[key]
+    layer['crs'] = dst_crs
+    layer.setdefault('source_crs', src_crs)
+    layer['version'] = layer.get('version', 0) + 1
+    return layer
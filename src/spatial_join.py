@@ -0,0 +1,266 @@
+"""
+图层间的空间连接 (例如为每个城市点标注所在省份)
+右图层建立 STRtree 索引过滤候选, 再用GEOS预处理几何精确判断; 左图层分块, 大图层多进程并行。
+点与面的包含/相交连接先在规则格网上分类: 不与任何面边界相交的格子整体位于一个面内 (或所有面外),
+其中的点直接查表得到结果, 只有落在边界格子中的少量点需要精确判断
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.reprojection import (DISPLAY_CRS, crs_equal, is_geographic, local_metric_crs, transform_coords,
+                              transform_geometries)
+from src.vector_io import layer_to_geometries, split_geometries
+
+# 格网预分类需要栅格化 (可选, 需要rasterio)
+try:
+    from rasterio import features
+    from rasterio.transform import from_bounds
+    from src.zonal import overlap_groups
+    RASTERIZE_AVAILABLE = True
+except ImportError:
+    RASTERIZE_AVAILABLE = False
+
+PREDICATES = ('contains', 'intersects', 'within_distance', 'nearest')
+PREDICATE_NAMES = {
+    'contains': '包含 (右图层包含左图层要素)',
+    'intersects': '相交',
+    'within_distance': '距离范围内',
+    'nearest': '最近要素'
+}
+CHUNK_SIZE = 500000
+GRID_SIZE = 4096  # 格网预分类的最大边长 (格子数)
+GRID_MIN_POINTS = 100000  # 点数少于该值时直接精确判断
+PARALLEL_THRESHOLD = 2000000  # 超过该要素数时默认启用多进程
+DISTANCE_COLUMN = 'distance'
+
+logger = logging.getLogger(__name__)
+
+_state = {}  # 工作进程中的右图层几何和索引
+
+
+def _init_worker(wkb):
+    """在工作进程中重建右图层的几何和 STRtree"""
+    geoms = shapely.from_wkb(wkb)
+    _state.update(geoms=geoms, tree=shapely.STRtree(geoms))
+
+
+def _left_geometries(payload):
+    """分块数据 -> 几何数组: ('points', x, y) 或 ('wkb', wkb数组)"""
+    if payload[0] == 'points':
+        return shapely.points(payload[1], payload[2])
+    return shapely.from_wkb(payload[1])
+
+
+def _query_chunk(args):
+    """对一个左图层分块查询 (在工作进程中执行), 返回 (左序号, 右序号, 距离或None)"""
+    payload, predicate, distance = args
+    geoms = _left_geometries(payload)
+    tree = _state['tree']
+    if predicate == 'nearest':
+        (left, right), dist = tree.query_nearest(geoms, max_distance=distance, return_distance=True)
+        return left, right, dist
+    if predicate == 'within_distance':
+        left, right = tree.query(geoms, predicate='dwithin', distance=distance)
+        return left, right, shapely.distance(geoms[left], _state['geoms'][right])
+    # 包含: 右图层要素包含左图层要素, 即左 within 右
+    left, right = tree.query(geoms, predicate='within' if predicate == 'contains' else 'intersects')
+    return left, right, None
+
+
+def _payloads(left, chunk_size):
+    """把左图层 (几何数组或点坐标 (x, y)) 切分为可传给子进程的分块"""
+    if isinstance(left, tuple):
+        x, y = left
+        for start in range(0, len(x), chunk_size):
+            yield start, ('points', x[start:start + chunk_size], y[start:start + chunk_size])
+    else:
+        for start in range(0, len(left), chunk_size):
+            yield start, ('wkb', shapely.to_wkb(left[start:start + chunk_size]))
+
+
+def _run_queries(left, right_geoms, predicate, distance, chunk_size, max_workers):
+    """分块 (可选多进程) 查询, 合并为全局序号"""
+    n = len(left[0]) if isinstance(left, tuple) else len(left)
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if n >= PARALLEL_THRESHOLD else 1
+    chunks = list(_payloads(left, chunk_size))
+    tasks = [(payload, predicate, distance) for _, payload in chunks]
+
+    if max_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(shapely.to_wkb(right_geoms),)) as executor:
+            results = list(executor.map(_query_chunk, tasks))
+    else:
+        _state.update(geoms=right_geoms, tree=shapely.STRtree(right_geoms))
+        try:
+            results = [_query_chunk(task) for task in tasks]
+        finally:
+            _state.clear()
+
+    lefts = [left_idx + start for (start, _), (left_idx, _, _) in zip(chunks, results)]
+    rights = [right_idx for _, right_idx, _ in results]
+    distances = None if predicate in ('contains', 'intersects') else [d for _, _, d in results]
+    return _concat(lefts, np.int64), _concat(rights, np.int64), (None if distances is None else _concat(distances, float))
+
+
+def _concat(parts, dtype):
+    return np.concatenate(parts).astype(dtype) if parts else np.array([], dtype=dtype)
+
+
+def grid_classify(x, y, polygons, grid_size=GRID_SIZE):
+    """在规则格网上对点做面包含预分类
+
+    返回 (点序号, 面序号, 需要精确判断的点序号)。边界格子 (与任何面的边界接触, 再外扩一格) 中的点
+    归入需要精确判断; 其余格子的中心落在哪个面内, 格子就整体在该面内, 其中的点直接得到结果。
+    面之间有重叠时分组栅格化, 一个点可能得到多个面。
+    """
+    xmin, ymin, xmax, ymax = shapely.total_bounds(polygons)
+    span = max(xmax - xmin, ymax - ymin)
+    width = max(1, int(np.ceil(grid_size * (xmax - xmin) / span)))
+    height = max(1, int(np.ceil(grid_size * (ymax - ymin) / span)))
+    transform = from_bounds(xmin, ymin, xmax, ymax, width, height)
+
+    # 所有边界接触的格子, 外扩一格以抵消栅格化的舍入
+    boundary = features.rasterize(((line, 1) for line in shapely.boundary(polygons)),
+                                  out_shape=(height, width), transform=transform, all_touched=True,
+                                  dtype='uint8').astype(bool)
+    dilated = boundary.copy()
+    dilated[1:] |= boundary[:-1]
+    dilated[:-1] |= boundary[1:]
+    dilated[:, 1:] |= boundary[:, :-1]
+    dilated[:, :-1] |= boundary[:, 1:]
+    dilated[1:, 1:] |= boundary[:-1, :-1]
+    dilated[:-1, :-1] |= boundary[1:, 1:]
+    dilated[1:, :-1] |= boundary[:-1, 1:]
+    dilated[:-1, 1:] |= boundary[1:, :-1]
+
+    # 范围外的点不在任何面内; 恰好在范围边上的点落入边界格子
+    inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    index = np.flatnonzero(inside)
+    col = np.clip(np.floor((x[index] - xmin) / (xmax - xmin or 1) * width), 0, width - 1).astype(np.int64)
+    row = np.clip(np.floor((ymax - y[index]) / (ymax - ymin or 1) * height), 0, height - 1).astype(np.int64)
+    cells = row * width + col
+    on_boundary = dilated.ravel()[cells]
+    exact = index[on_boundary]
+    index, cells = index[~on_boundary], cells[~on_boundary]
+
+    groups = overlap_groups(polygons)
+    lefts, rights = [], []
+    for group in np.unique(groups):
+        members = np.flatnonzero(groups == group)
+        labels = features.rasterize(zip(polygons[members], (members + 1).tolist()),
+                                    out_shape=(height, width), transform=transform, fill=0, dtype='int32').ravel()
+        label = labels[cells]
+        hit = label > 0
+        lefts.append(index[hit])
+        rights.append(label[hit] - 1)
+    return _concat(lefts, np.int64), _concat(rights, np.int64), exact
+
+
+def join_indices(left, right_geoms, predicate='intersects', distance=None, chunk_size=CHUNK_SIZE,
+                 max_workers=None, use_grid=True):
+    """计算空间连接的匹配对, 返回按左序号排序的 (左序号, 右序号, 距离或None)
+
+    left为几何数组, 或点坐标元组 (x, y) (不需要为大量点创建几何对象)。
+    predicate: contains (右包含左) / intersects / within_distance (距离不超过distance) /
+    nearest (最近的右要素, distance为最大搜索距离, 可为None)。距离单位与坐标单位相同。
+    点与面的 contains/intersects 连接在rasterio可用时先做格网预分类。
+    """
+    if predicate not in PREDICATES:
+        raise ValueError(f"未知的空间关系: {predicate}")
+    if predicate == 'within_distance' and distance is None:
+        raise ValueError("距离范围查询需要指定距离")
+    right_geoms = np.asarray(right_geoms, dtype=object)
+    empty = np.array([], dtype=np.int64)
+    n = len(left[0]) if isinstance(left, tuple) else len(left)
+    if n == 0 or len(right_geoms) == 0:
+        return empty, empty, None if predicate in ('contains', 'intersects') else np.array([])
+
+    if isinstance(left, tuple):
+        left = (np.asarray(left[0], dtype=np.float64), np.asarray(left[1], dtype=np.float64))
+    polygonal = np.isin(shapely.get_type_id(right_geoms), (3, 6)).all()
+    if (use_grid and RASTERIZE_AVAILABLE and isinstance(left, tuple) and polygonal
+            and predicate in ('contains', 'intersects') and n >= GRID_MIN_POINTS):
+        grid_left, grid_right, exact = grid_classify(left[0], left[1], right_geoms)
+        exact_left, exact_right, _ = _run_queries((left[0][exact], left[1][exact]), right_geoms, predicate,
+                                                  distance, chunk_size, max_workers)
+        left_idx = np.concatenate([grid_left, exact[exact_left]])
+        right_idx = np.concatenate([grid_right, exact_right])
+        logger.info(f"格网预分类: {n - len(exact)} 个点直接确定, {len(exact)} 个点精确判断")
+        distances = None
+    else:
+        left_idx, right_idx, distances = _run_queries(left, right_geoms, predicate, distance, chunk_size, max_workers)
+
+    order = np.lexsort((right_idx, left_idx))
+    return left_idx[order], right_idx[order], None if distances is None else distances[order]
+
+
+def spatial_join(left_layer, right_layer, predicate='intersects', distance=None, how='left',
+                 rsuffix='_right', **kwargs):
+    """两个内存图层的空间连接, 返回左图层类型的新数据 (点为DataFrame, 线/面为GeoJSON要素列表)
+
+    每个匹配对一行 (一个点落在多个重叠面内时复制为多行), 附加右图层的属性列 (与左图层重名的列加
+    rsuffix后缀); how='left' 时保留没有匹配的左要素 (右图层属性为空), 'inner' 时只保留匹配的。
+    within_distance/nearest 的距离单位为米: 经纬度坐标系的图层在以数据为中心的等距投影中计算,
+    结果附加 distance 列。右图层坐标系与左图层不同时先转换。kwargs传给 join_indices。
+    """
+    left_crs = left_layer.get('crs', DISPLAY_CRS)
+    right_crs = right_layer.get('crs', DISPLAY_CRS)
+    right_geoms, right_attrs = layer_to_geometries(right_layer)
+    if not crs_equal(left_crs, right_crs):
+        right_geoms = transform_geometries(right_geoms, right_crs, left_crs)
+
+    data = left_layer['data']
+    if isinstance(data, pd.DataFrame):
+        left = (pd.to_numeric(data['longitude'], errors='coerce').to_numpy(dtype=np.float64),
+                pd.to_numeric(data['latitude'], errors='coerce').to_numpy(dtype=np.float64))
+        left_attrs = data.reset_index(drop=True)
+        n = len(data)
+    else:
+        left_geoms, left_attrs = layer_to_geometries(left_layer)
+        left = left_geoms
+        n = len(left_geoms)
+
+    if predicate in ('within_distance', 'nearest') and is_geographic(left_crs):
+        # 经纬度的距离没有统一的长度单位, 转换到以数据为中心的等距投影 (米)
+        bounds = shapely.total_bounds(right_geoms)
+        if isinstance(left, tuple):
+            xs, ys = np.concatenate([left[0], bounds[::2]]), np.concatenate([left[1], bounds[1::2]])
+        else:
+            left_bounds = shapely.total_bounds(left)
+            xs, ys = np.r_[left_bounds[::2], bounds[::2]], np.r_[left_bounds[1::2], bounds[1::2]]
+        metric = local_metric_crs(xs, ys)
+        right_geoms = transform_geometries(right_geoms, left_crs, metric)
+        left = transform_coords(*left, left_crs, metric) if isinstance(left, tuple) \
+            else transform_geometries(left, left_crs, metric)
+
+    left_idx, right_idx, distances = join_indices(left, right_geoms, predicate, distance, **kwargs)
+    if how == 'left':
+        unmatched = np.setdiff1d(np.arange(n), left_idx, assume_unique=False)
+        order = np.argsort(np.concatenate([left_idx, unmatched]), kind='stable')
+        left_idx = np.concatenate([left_idx, unmatched])[order]
+        right_idx = np.concatenate([right_idx, np.full(len(unmatched), -1)])[order]
+        if distances is not None:
+            distances = np.concatenate([distances, np.full(len(unmatched), np.nan)])[order]
+    elif how != 'inner':
+        raise ValueError(f"未知的连接方式: {how}")
+
+    right_attrs = right_attrs.reset_index(drop=True)
+    right_attrs = right_attrs.rename(columns={col: f"{col}{rsuffix}" for col in right_attrs.columns
+                                              if col in left_attrs.columns})
+    joined = pd.concat([left_attrs.iloc[left_idx].reset_index(drop=True),
+                        right_attrs.reindex(right_idx).reset_index(drop=True)], axis=1)
+    if distances is not None:
+        joined[DISTANCE_COLUMN] = distances
+
+    logger.info(f"空间连接完成: {n} 个要素, {int((right_idx >= 0).sum())} 个匹配")
+    if isinstance(data, pd.DataFrame):
+        return joined
+    return split_geometries(left_geoms[left_idx], joined)[left_layer['type']]
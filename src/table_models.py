@@ -0,0 +1,320 @@
+"""
+属性表数据模型
+基于 QAbstractTableModel 直接读取图层的列数据, 只格式化可见单元格;
+排序和过滤通过向量化的行索引置换实现, 不复制底层数据
+"""
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant, pyqtSignal
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_MAX_PAGES = 20  # 内存中最多保留的页数
+
+logger = logging.getLogger(__name__)
+
+
+def features_to_frame(features):
+    """GeoJSON要素列表 -> 属性DataFrame"""
+    return pd.DataFrame.from_records(feature.get('properties', {}) for feature in features)
+
+
+def format_value(value):
+    """单元格显示文本"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.6g}"
+    return str(value)
+
+
+class DataFrameTableModel(QAbstractTableModel):
+    """只读的DataFrame表格模型
+
+    self._rows 为当前可见行在原始数据中的位置 (排序/过滤后的置换),
+    data() 只在视图请求时格式化单元格。
+    """
+
+    def __init__(self, data=None, parent=None):
+        super().__init__(parent)
+        self._frame = pd.DataFrame()
+        self._columns = []
+        self._rows = np.arange(0)
+        self._strings = {}
+        self._sort = None
+        self._filter = None
+        if data is not None:
+            self.set_data(data)
+
+    # ---- 数据源 ----
+
+    def set_data(self, data):
+        """设置数据源: DataFrame 或 GeoJSON要素列表"""
+        if isinstance(data, pd.DataFrame):
+            frame = data
+        elif isinstance(data, list):
+            frame = features_to_frame(data)
+        else:
+            frame = pd.DataFrame()
+
+        self.beginResetModel()
+        self._frame = frame
+        # 按列缓存numpy数组, 单元格访问为O(1)
+        self._columns = [frame.iloc[:, j].to_numpy() for j in range(frame.shape[1])]
+        self._rows = np.arange(len(frame))
+        self._strings = {}
+        self._sort = None
+        self._filter = None
+        self.endResetModel()
+
+    def frame(self):
+        return self._frame
+
+    def row_positions(self):
+        """当前可见行在原始数据中的位置"""
+        return self._rows
+
+    # ---- Qt接口 ----
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return format_value(self._columns[index.column()][self._rows[index.row()]])
+        if role == Qt.TextAlignmentRole:
+            if self._frame.dtypes.iloc[index.column()].kind in 'iuf':
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+        return QVariant()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+        if orientation == Qt.Horizontal:
+            return str(self._frame.columns[section])
+        return str(self._rows[section] + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """按列排序: 对可见行做一次向量化argsort"""
+        if column < 0 or column >= len(self._columns):
+            return
+        self.layoutAboutToBeChanged.emit()
+        self._sort = (column, order)
+        self._rows = self._rows[self._argsort(column, self._rows, order)]
+        self.layoutChanged.emit()
+
+    # ---- 排序和过滤 ----
+
+    def _argsort(self, column, rows, order):
+        """返回使 rows 按指定列有序的置换, 缺失值排在最后"""
+        keys = pd.Series(self._columns[column][rows])
+        ascending = order == Qt.AscendingOrder
+        try:
+            sorted_keys = keys.sort_values(kind='mergesort', ascending=ascending, na_position='last')
+        except TypeError:
+            # 混合类型的列按文本排序
+            sorted_keys = keys.astype(str).sort_values(kind='mergesort', ascending=ascending)
+        return sorted_keys.index.to_numpy()
+
+    def _string_column(self, column):
+        """列的文本形式 (首次过滤时计算并缓存)"""
+        if column not in self._strings:
+            self._strings[column] = self._frame.iloc[:, column].astype(str).str.lower().to_numpy()
+        return self._strings[column]
+
+    def set_filter(self, text, column=None):
+        """按文本过滤行 (不区分大小写), column为None时匹配任意列"""
+        text = (text or '').strip().lower()
+        self.beginResetModel()
+        self._filter = (text, column) if text else None
+
+        if not text:
+            rows = np.arange(len(self._frame))
+        else:
+            columns = range(len(self._columns)) if column is None else [column]
+            mask = np.zeros(len(self._frame), dtype=bool)
+            for j in columns:
+                mask |= pd.Series(self._string_column(j)).str.contains(text, regex=False).to_numpy()
+            rows = np.flatnonzero(mask)
+
+        if self._sort is not None:
+            rows = rows[self._argsort(self._sort[0], rows, self._sort[1])]
+        self._rows = rows
+        self.endResetModel()
+
+
+class PagedTableModel(QAbstractTableModel):
+    """增量加载的分页表格模型 (用于数据库查询结果)
+
+    fetch_page(after_key) 返回键值大于 after_key 的下一页 DataFrame (按 key_column 升序)。
+    视图滚动到末尾时通过 canFetchMore/fetchMore 追加一页, 并在后台线程预取再下一页;
+    内存中只保留最近访问的 max_pages 页, 被淘汰的页在重新可见时按记录的起始键在后台线程重新查询,
+    查询完成后回到主线程缓存并发出 dataChanged。
+    """
+
+    page_ready = pyqtSignal(int, object)
+
+    def __init__(self, fetch_page, key_column='id', page_size=DEFAULT_PAGE_SIZE,
+                 max_pages=DEFAULT_MAX_PAGES, parent=None):
+        super().__init__(parent)
+        self._fetch_page = fetch_page
+        self._key_column = key_column
+        self._page_size = page_size
+        self._max_pages = max(2, max_pages)
+        self._pages = OrderedDict()  # 页号 -> 列数组列表, 按最近访问排序
+        self._page_keys = [None]  # 第i页的起始键 (上一页的最后一个键)
+        self._columns = []
+        self._row_count = 0
+        self._exhausted = False
+        self._prefetch = None
+        self._pending = set()  # 正在后台重新查询的页号
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.page_ready.connect(self._on_page_ready)
+        self.error = None
+
+    # ---- 分页 ----
+
+    def _store_page(self, page, frame):
+        """缓存一页数据, 超出窗口时淘汰最久未访问的页"""
+        self._pages[page] = [frame.iloc[:, j].to_numpy() for j in range(frame.shape[1])]
+        self._pages.move_to_end(page)
+        while len(self._pages) > self._max_pages:
+            evicted, _ = self._pages.popitem(last=False)
+            logger.debug(f"淘汰第 {evicted} 页")
+
+    def _page(self, page):
+        """获取一页的列数组, 不在窗口中时重新查询"""
+        if page in self._pages:
+            self._pages.move_to_end(page)
+        else:
+            self._store_page(page, self._fetch_page(self._page_keys[page]))
+        return self._pages[page]
+
+    def _request_page(self, page):
+        """在后台线程重新查询被淘汰的页 (同一页只提交一次)"""
+        if page in self._pending:
+            return
+        try:
+            self._executor.submit(self._load_page, page, self._page_keys[page])
+        except RuntimeError:
+            return  # 模型已关闭
+        self._pending.add(page)
+
+    def _load_page(self, page, after_key):
+        """后台线程: 查询一页并通过信号交回主线程"""
+        try:
+            frame = self._fetch_page(after_key)
+        except Exception as e:
+            logger.error(f"重新查询第 {page} 页失败: {e}")
+            self.error = e
+            frame = None
+        self.page_ready.emit(page, frame)
+
+    def _on_page_ready(self, page, frame):
+        """主线程: 缓存重新查询到的页并刷新对应的行"""
+        self._pending.discard(page)
+        if frame is None:
+            return
+        self._store_page(page, frame)
+        first = page * self._page_size
+        last = min(first + len(frame), self._row_count) - 1
+        if last >= first and self._columns:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, len(self._columns) - 1))
+
+    def _next_frame(self):
+        """取下一页: 优先使用后台预取的结果"""
+        after_key = self._page_keys[-1]
+        if self._prefetch is not None and self._prefetch[0] == after_key:
+            future = self._prefetch[1]
+            self._prefetch = None
+            return future.result()
+        return self._fetch_page(after_key)
+
+    def loaded_pages(self):
+        """当前保留在内存中的页号"""
+        return list(self._pages)
+
+    def page_frame(self, page=0):
+        """返回一页数据的DataFrame"""
+        return pd.DataFrame(dict(zip(self._columns, self._page(page))), columns=self._columns)
+
+    # ---- Qt接口 ----
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        try:
+            frame = self._next_frame()
+        except Exception as e:
+            logger.error(f"分页查询失败: {e}")
+            self.error = e
+            self._exhausted = True
+            return
+
+        if not self._columns:
+            self.beginResetModel()
+            self._columns = [str(c) for c in frame.columns]
+            self.endResetModel()
+
+        count = len(frame)
+        if count < self._page_size:
+            self._exhausted = True
+        if count == 0:
+            return
+
+        page = len(self._page_keys) - 1
+        self.beginInsertRows(QModelIndex(), self._row_count, self._row_count + count - 1)
+        self._store_page(page, frame)
+        self._row_count += count
+        self.endInsertRows()
+
+        if not self._exhausted:
+            next_key = frame[self._key_column].iloc[-1]
+            self._page_keys.append(next_key)
+            # 后台预取下一页
+            self._prefetch = (next_key, self._executor.submit(self._fetch_page, next_key))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            page, offset = divmod(index.row(), self._page_size)
+            if page not in self._pages:
+                # 被淘汰的页在后台重新查询, 到达前先显示为空
+                self._request_page(page)
+                return QVariant()
+            self._pages.move_to_end(page)
+            column = self._pages[page][index.column()]
+            if offset >= len(column):
+                return QVariant()
+            return format_value(column[offset])
+        return QVariant()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+        if orientation == Qt.Horizontal:
+            return self._columns[section]
+        return str(section + 1)
+
+    def close(self):
+        """停止后台预取"""
+        self._prefetch = None
+        self._executor.shutdown(wait=False)
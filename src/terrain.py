@@ -0,0 +1,212 @@
+"""
+地形分析: 山体阴影、坡度、坡向
+DEM按块读取 (每块四周多读一行/列作为邻域), 用NumPy向量化的Horn 3x3模板计算,
+多个块在进程池中并行处理, 结果按窗口写入分块压缩的GeoTIFF, 内存占用与DEM大小无关
+"""
+import os
+import math
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from src.geodesy import METERS_PER_DEGREE
+from src.raster_layer import overview_factors
+
+PRODUCTS = ('hillshade', 'slope', 'aspect')
+PRODUCT_NAMES = {'hillshade': '山体阴影', 'slope': '坡度', 'aspect': '坡向'}
+PRODUCT_CMAPS = {'hillshade': 'gray', 'slope': 'YlOrRd', 'aspect': 'twilight'}
+PRODUCT_RANGES = {'hillshade': (0.0, 255.0), 'aspect': (0.0, 360.0)}  # 坡度按采样范围显示
+BLOCK_SIZE = 1024
+PARALLEL_THRESHOLD = 4000000  # 超过该像元数时默认启用多进程
+NODATA = -9999.0
+
+logger = logging.getLogger(__name__)
+
+
+def horn_gradient(block, xres, yres):
+    """Horn方法计算梯度; block四周各带一个像元的邻域, 返回内部的 (dz/dx, dz/dy)
+
+    dz/dx 向东为正, dz/dy 向南为正 (行号增加方向); xres可以是每行一个值的列向量 (地理坐标系)。
+    """
+    a, b, c = block[:-2, :-2], block[:-2, 1:-1], block[:-2, 2:]
+    d, f = block[1:-1, :-2], block[1:-1, 2:]
+    g, h, i = block[2:, :-2], block[2:, 1:-1], block[2:, 2:]
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * xres)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * yres)
+    return dzdx, dzdy
+
+
+def slope(dzdx, dzdy, z_factor=1.0):
+    """坡度 (度)"""
+    return np.degrees(np.arctan(z_factor * np.hypot(dzdx, dzdy)))
+
+
+def aspect(dzdx, dzdy):
+    """坡向 (度, 正北为0顺时针), 平地为-1"""
+    with np.errstate(invalid='ignore'):
+        # atan2(向北的升高, 向东的升高) 给出上坡方向, 坡向为其反方向 (下坡方向)
+        result = (np.degrees(np.arctan2(-dzdx, dzdy)) + 360.0) % 360.0
+    result[(dzdx == 0) & (dzdy == 0)] = -1.0
+    return result
+
+
+def hillshade(dzdx, dzdy, azimuth=315.0, altitude=45.0, z_factor=1.0):
+    """山体阴影 (0~255), 光源方位角/高度角为度"""
+    zenith = math.radians(90.0 - altitude)
+    sun = math.radians(azimuth)
+    slope_rad = np.arctan(z_factor * np.hypot(dzdx, dzdy))
+    # 下坡方向的方位角 (正北为0顺时针)
+    aspect_rad = np.arctan2(-dzdx, dzdy)
+    shade = (math.cos(zenith) * np.cos(slope_rad) +
+             math.sin(zenith) * np.sin(slope_rad) * np.cos(sun - aspect_rad))
+    return np.clip(255.0 * shade, 0, 255)
+
+
+def compute_product(block, xres, yres, product, z_factor=1.0, azimuth=315.0, altitude=45.0):
+    """对带邻域的块计算地形产品, NaN传播为NaN"""
+    dzdx, dzdy = horn_gradient(block, xres, yres)
+    if product == 'slope':
+        return slope(dzdx, dzdy, z_factor)
+    if product == 'aspect':
+        return aspect(dzdx, dzdy)
+    if product == 'hillshade':
+        return hillshade(dzdx, dzdy, azimuth, altitude, z_factor)
+    raise ValueError(f"未知的地形产品: {product}")
+
+
+def block_windows(width, height, block_size=BLOCK_SIZE):
+    """按行优先划分的块窗口"""
+    return [Window(col, row, min(block_size, width - col), min(block_size, height - row))
+            for row in range(0, height, block_size) for col in range(0, width, block_size)]
+
+
+def read_with_halo(ds, window):
+    """读取窗口及四周一个像元的邻域; 栅格边界处复制边缘值, nodata转为NaN"""
+    col0 = max(window.col_off - 1, 0)
+    row0 = max(window.row_off - 1, 0)
+    col1 = min(window.col_off + window.width + 1, ds.width)
+    row1 = min(window.row_off + window.height + 1, ds.height)
+    data = ds.read(1, window=Window(col0, row0, col1 - col0, row1 - row0)).astype(np.float64)
+    if ds.nodata is not None:
+        data[data == ds.nodata] = np.nan
+    pad = ((window.row_off - row0 == 0) * 1, (row1 - window.row_off - window.height == 0) * 1)
+    pad_cols = ((window.col_off - col0 == 0) * 1, (col1 - window.col_off - window.width == 0) * 1)
+    return np.pad(data, (pad, pad_cols), mode='edge')
+
+
+def cell_size(ds, window):
+    """窗口内每行的像元大小 (米): 地理坐标系按纬度换算经度方向的长度"""
+    xres, yres = ds.res
+    if not ds.crs or not ds.crs.is_geographic:
+        return xres, yres
+    rows = window.row_off + np.arange(window.height) + 0.5
+    lat = ds.transform.f + rows * ds.transform.e
+    xres_m = xres * METERS_PER_DEGREE * np.cos(np.radians(lat))[:, None]
+    return np.maximum(xres_m, 1e-6), yres * METERS_PER_DEGREE
+
+
+_datasets = {}  # 工作进程中复用的数据集句柄
+
+
+def _process_block(args):
+    """处理一个块 (在工作进程中执行)"""
+    path, window, product, options = args
+    ds = _datasets.get(path)
+    if ds is None:
+        ds = _datasets[path] = rasterio.open(path)
+    window = Window(*window)
+    xres, yres = cell_size(ds, window)
+    result = compute_product(read_with_halo(ds, window), xres, yres, product, **options)
+    return window, result
+
+
+def output_profile(src, product):
+    """分块压缩的GeoTIFF输出参数"""
+    return {
+        'driver': 'GTiff', 'width': src.width, 'height': src.height, 'count': 1,
+        'crs': src.crs, 'transform': src.transform,
+        'dtype': 'uint8' if product == 'hillshade' else 'float32',
+        'nodata': 0 if product == 'hillshade' else NODATA,
+        'tiled': True, 'blockxsize': 256, 'blockysize': 256,
+        'compress': 'deflate', 'BIGTIFF': 'IF_SAFER'
+    }
+
+
+def terrain_analysis(dem_path, out_path, product='hillshade', block_size=BLOCK_SIZE,
+                     max_workers=None, progress=None, **options):
+    """计算地形产品并写入GeoTIFF (附带概视), 返回输出路径
+
+    任何时刻最多有 2*max_workers 个块在处理或等待写入, 内存占用与DEM大小无关。
+    max_workers为None时像元数超过 PARALLEL_THRESHOLD 才使用多进程;
+    progress(已完成块数, 总块数) 在每块写入后调用。options传给 compute_product。
+    """
+    if product not in PRODUCTS:
+        raise ValueError(f"未知的地形产品: {product}")
+    dem_path = str(dem_path)
+    with rasterio.open(dem_path) as src:
+        profile = output_profile(src, product)
+        windows = block_windows(src.width, src.height, block_size)
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if profile['width'] * profile['height'] >= PARALLEL_THRESHOLD else 1
+
+    tasks = ((dem_path, (w.col_off, w.row_off, w.width, w.height), product, options) for w in windows)
+    with rasterio.open(out_path, 'w', **profile) as dst:
+        def write(window, result):
+            nodata = np.isnan(result)
+            if product == 'hillshade':
+                # 0为nodata, 完全阴影的像元记为1
+                result = np.maximum(np.rint(result), 1).astype(np.uint8)
+            else:
+                result = result.astype(np.float32)
+            result[nodata] = profile['nodata']
+            dst.write(result, 1, window=window)
+
+        done = 0
+        if max_workers > 1 and len(windows) > 1:
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                pending = deque()
+                for task in tasks:
+                    pending.append(executor.submit(_process_block, task))
+                    if len(pending) >= 2 * max_workers:
+                        write(*pending.popleft().result())
+                        done += 1
+                        if progress:
+                            progress(done, len(windows))
+                while pending:
+                    write(*pending.popleft().result())
+                    done += 1
+                    if progress:
+                        progress(done, len(windows))
+        else:
+            for task in tasks:
+                write(*_process_block(task))
+                done += 1
+                if progress:
+                    progress(done, len(windows))
+
+        factors = overview_factors(profile['width'], profile['height'])
+        if factors:
+            dst.build_overviews(factors, Resampling.average)
+    ds = _datasets.pop(dem_path, None)
+    if ds is not None:
+        ds.close()
+
+    logger.info(f"地形分析完成: {PRODUCT_NAMES[product]} -> {out_path}")
+    return out_path
+
+
+def cached_output_path(cache_dir, dem_path, product, **options):
+    """缓存目录中的输出路径, 按源文件路径、大小、修改时间和参数区分"""
+    stat = Path(dem_path).stat()
+    key = f"{Path(dem_path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{product}|{sorted(options.items())}"
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+    return Path(cache_dir) / f"{Path(dem_path).stem}_{product}_{digest}.tif"
@@ -0,0 +1,230 @@
+"""
+不规则三角网 (TIN)
+使用 scipy.spatial.Delaunay 对带高程的点图层做三角剖分, 三角形以紧凑的int32索引数组保存;
+新增少量点时只重新剖分受影响的局部区域 (Bowyer-Watson空腔), 不重建整个三角网
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import Delaunay, cKDTree
+
+# 识别高程列时使用的列名 (按优先级)
+ELEVATION_COLUMNS = ('elevation', 'elev', 'z', 'height', 'altitude', 'dem', '高程', '海拔')
+REBUILD_RATIO = 0.1  # 新增点数超过现有点数的该比例时直接全量重建
+SORT_GRID = 1024  # 剖分前按网格排序的分辨率
+
+logger = logging.getLogger(__name__)
+
+
+def find_elevation_column(frame):
+    """查找高程列, 找不到时返回None"""
+    columns = {str(col).lower(): col for col in frame.columns}
+    for name in ELEVATION_COLUMNS:
+        if name in columns and pd.api.types.is_numeric_dtype(frame[columns[name]]):
+            return columns[name]
+    return None
+
+
+def _spatial_order(x, y):
+    """按网格行列排序, 使相邻点在内存中也相邻, 剖分速度提高约四分之一"""
+    def cell(values):
+        lo, hi = values.min(), values.max()
+        span = hi - lo if hi > lo else 1.0
+        return np.minimum(((values - lo) / span * SORT_GRID).astype(np.int64), SORT_GRID - 1)
+    return np.lexsort((cell(y), cell(x)))
+
+
+def _circumcircles(points, triangles):
+    """三角形外接圆的圆心和半径平方"""
+    a = points[triangles[:, 0]]
+    b = points[triangles[:, 1]] - a
+    c = points[triangles[:, 2]] - a
+    d = 2 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    b2 = (b * b).sum(axis=1)
+    c2 = (c * c).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ux = (c[:, 1] * b2 - b[:, 1] * c2) / d
+        uy = (b[:, 0] * c2 - c[:, 0] * b2) / d
+    centers = a + np.column_stack([ux, uy])
+    return centers, ux * ux + uy * uy
+
+
+class TIN:
+    """不规则三角网
+
+    points: (n, 2) float64 平面坐标; z: (n,) float64 高程;
+    triangles: (m, 3) int32 顶点索引 (逆时针); source_index: 顶点对应的原始行号。
+    """
+
+    def __init__(self, x, y, z, crs=None):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+        index = np.flatnonzero(valid)
+        if len(index) < 3:
+            raise ValueError("至少需要3个有效的三维点才能构建TIN")
+
+        order = index[_spatial_order(x[index], y[index])]
+        self.points = np.column_stack([x[order], y[order]])
+        self.z = z[order]
+        self.source_index = order
+        self.crs = crs
+        self.triangles = np.empty((0, 3), dtype=np.int32)
+        self._circles = None
+        self._hull = None
+        self._triangulate()
+
+    def __len__(self):
+        return len(self.triangles)
+
+    @property
+    def vertex_count(self):
+        return len(self.points)
+
+    # ---- 剖分 ----
+
+    def _triangulate(self):
+        """全量剖分"""
+        delaunay = Delaunay(self.points)
+        self.triangles = delaunay.simplices.astype(np.int32)
+        self._hull = shapely.MultiPoint(self.points[np.unique(delaunay.convex_hull)]).convex_hull
+        self._circles = None
+        logger.info(f"TIN剖分完成: {self.vertex_count} 个顶点, {len(self.triangles)} 个三角形")
+
+    def _conflicts(self, new_points):
+        """外接圆包含任一新点的三角形 (布尔掩码)"""
+        if self._circles is None:
+            centers, radius2 = _circumcircles(self.points, self.triangles)
+            radius2 = np.where(np.isfinite(radius2), radius2, np.inf)
+            # 大多数三角形半径较小, 用KD树按上限半径检索; 少数大半径三角形 (凸包边缘) 单独逐一检查
+            cap = np.sqrt(np.quantile(radius2, 0.999)) if len(radius2) else 0.0
+            large = np.flatnonzero(radius2 > cap * cap)
+            self._circles = (centers, radius2, cap, large, cKDTree(centers))
+        centers, radius2, cap, large, tree = self._circles
+
+        mask = np.zeros(len(self.triangles), dtype=bool)
+        for point, candidates in zip(new_points, tree.query_ball_point(new_points, cap)):
+            if candidates:
+                candidates = np.asarray(candidates)
+                d2 = ((centers[candidates] - point) ** 2).sum(axis=1)
+                mask[candidates[d2 < radius2[candidates]]] = True
+        if len(large):
+            d2 = ((centers[large][:, None, :] - new_points[None, :, :]) ** 2).sum(axis=2)
+            mask[large[(d2 < radius2[large][:, None]).any(axis=1)]] = True
+        return mask
+
+    def add_points(self, x, y, z):
+        """插入新点并局部更新三角网
+
+        删除外接圆包含新点的三角形 (空腔), 对空腔顶点和新点做局部剖分, 保留落在空腔内的三角形。
+        新点位于现有凸包之外或数量较多时全量重建。
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+        x, y, z = x[valid], y[valid], z[valid]
+        if len(x) == 0:
+            return 0
+
+        start = self.vertex_count
+        new_points = np.column_stack([x, y])
+        self.points = np.vstack([self.points, new_points])
+        self.z = np.concatenate([self.z, z])
+        self.source_index = np.concatenate([self.source_index, np.full(len(x), -1)])
+
+        inside = shapely.contains_xy(self._hull, x, y) | shapely.intersects_xy(self._hull.boundary, x, y)
+        if len(x) > REBUILD_RATIO * start or not inside.all():
+            self._triangulate()
+            return len(x)
+
+        conflict = self._conflicts(new_points)
+        cavity = self.triangles[conflict]
+        local_vertices = np.concatenate([np.unique(cavity), np.arange(start, self.vertex_count)])
+        local = Delaunay(self.points[local_vertices])
+        local_triangles = local_vertices[local.simplices]
+
+        # 只保留重心落在空腔 (被删除三角形的并集) 内的局部三角形
+        centroids = self.points[local_triangles].mean(axis=1)
+        keep = self._inside_triangles(centroids, cavity)
+        self.triangles = np.vstack([self.triangles[~conflict], local_triangles[keep].astype(np.int32)])
+        self._circles = None
+        logger.info(f"TIN插入 {len(x)} 个点, 局部重建 {int(conflict.sum())} -> {int(keep.sum())} 个三角形")
+        return len(x)
+
+    def _inside_triangles(self, points, triangles, chunk_size=2048):
+        """判断点是否落在任一给定三角形内 (重心坐标判断)"""
+        a = self.points[triangles[:, 0]]
+        v0 = self.points[triangles[:, 1]] - a
+        v1 = self.points[triangles[:, 2]] - a
+        det = v0[:, 0] * v1[:, 1] - v0[:, 1] * v1[:, 0]
+        inside = np.zeros(len(points), dtype=bool)
+        eps = 1e-12
+        for i in range(0, len(points), chunk_size):
+            p = points[i:i + chunk_size, None, :] - a[None, :, :]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                u = (p[..., 0] * v1[:, 1] - p[..., 1] * v1[:, 0]) / det
+                v = (v0[:, 0] * p[..., 1] - v0[:, 1] * p[..., 0]) / det
+            inside[i:i + chunk_size] = ((u >= -eps) & (v >= -eps) & (u + v <= 1 + eps)).any(axis=1)
+        return inside
+
+    # ---- 存储 ----
+
+    def save(self, path):
+        """保存为 .npz (顶点、高程、三角形和原始行号)"""
+        with open(path, 'wb') as f:
+            np.savez(f, points=self.points, z=self.z, triangles=self.triangles, source_index=self.source_index)
+
+    @classmethod
+    def load(cls, path, crs=None):
+        """读取 save 保存的三角网, 不重新剖分"""
+        tin = cls.__new__(cls)
+        with np.load(path) as arrays:
+            tin.points = arrays['points']
+            tin.z = arrays['z']
+            tin.triangles = arrays['triangles'].astype(np.int32)
+            tin.source_index = arrays['source_index']
+        tin.crs = crs
+        tin._circles = None
+        tin._hull = shapely.MultiPoint(tin.points[np.unique(tin.triangles)]).convex_hull
+        return tin
+
+    # ---- 输出 ----
+
+    def bounds(self):
+        """(xmin, ymin, xmax, ymax)"""
+        return (*self.points.min(axis=0), *self.points.max(axis=0))
+
+    def to_mesh3d(self, z_column='高程', colorscale='Earth', **kwargs):
+        """转换为Plotly Mesh3d轨迹 (numpy数组直接以二进制传输)"""
+        import plotly.graph_objects as go
+        return go.Mesh3d(
+            x=self.points[:, 0], y=self.points[:, 1], z=self.z,
+            i=self.triangles[:, 0], j=self.triangles[:, 1], k=self.triangles[:, 2],
+            intensity=self.z, colorscale=colorscale,
+            colorbar=dict(title=z_column), flatshading=False,
+            **kwargs
+        )
+
+
+def tin_from_frame(frame, z_column=None, x_column='longitude', y_column='latitude', crs=None):
+    """由点表构建TIN; z_column为None时自动识别高程列"""
+    z_column = z_column or find_elevation_column(frame)
+    if z_column is None:
+        raise ValueError("未找到高程列")
+    return TIN(
+        pd.to_numeric(frame[x_column], errors='coerce').to_numpy(dtype=np.float64),
+        pd.to_numeric(frame[y_column], errors='coerce').to_numpy(dtype=np.float64),
+        pd.to_numeric(frame[z_column], errors='coerce').to_numpy(dtype=np.float64),
+        crs=crs
+    )
+
+
+def tin_from_layer(layer, z_column=None):
+    """由点图层构建TIN"""
+    if layer.get('type') != 'points':
+        raise ValueError("只能由点图层构建TIN")
+    return tin_from_frame(layer['data'], z_column, crs=layer.get('crs'))
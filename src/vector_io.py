@@ -0,0 +1,292 @@
+"""
+Shapefile / GeoPackage 流式读取
+按批次读取要素, 支持bbox过滤和列裁剪下推, 多文件并行导入
+"""
+import os
+import json
+import sqlite3
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# 尝试导入几何库 (必需)
+try:
+    import shapely
+    SHAPELY_AVAILABLE = True
+except ImportError:
+    SHAPELY_AVAILABLE = False
+
+# 尝试导入pyogrio (优先, 基于Arrow的批量读取)
+try:
+    from pyogrio.raw import open_arrow
+    import pyarrow  # noqa: F401  open_arrow(use_pyarrow=True) 需要
+    PYOGRIO_AVAILABLE = True
+except ImportError:
+    PYOGRIO_AVAILABLE = False
+
+# 尝试导入fiona (备选, 逐要素读取)
+try:
+    import fiona
+    FIONA_AVAILABLE = True
+except ImportError:
+    FIONA_AVAILABLE = False
+
+if not SHAPELY_AVAILABLE:
+    VECTOR_BACKEND = None
+elif PYOGRIO_AVAILABLE:
+    VECTOR_BACKEND = 'pyogrio'
+elif FIONA_AVAILABLE:
+    VECTOR_BACKEND = 'fiona'
+else:
+    VECTOR_BACKEND = None
+
+SUPPORTED_VECTOR_EXTENSIONS = ('.shp', '.gpkg')
+DEFAULT_BATCH_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def list_layers(path):
+    """列出数据源中的图层名称 (GeoPackage可能包含多个图层)"""
+    if VECTOR_BACKEND == 'pyogrio':
+        import pyogrio
+        return [str(name) for name in pyogrio.list_layers(path)[:, 0]]
+    if VECTOR_BACKEND == 'fiona':
+        return list(fiona.listlayers(path))
+    raise RuntimeError("未安装pyogrio或fiona, 无法读取矢量数据")
+
+
+def source_info(path, layer=None):
+    """读取数据源的坐标系和属性列名 (不读取要素), 返回 (crs, 列名列表)"""
+    if VECTOR_BACKEND == 'pyogrio':
+        import pyogrio
+        info = pyogrio.read_info(path, layer=layer)
+        return info['crs'], [str(name) for name in info['fields']]
+    if VECTOR_BACKEND == 'fiona':
+        with fiona.open(path, layer=layer) as src:
+            crs = src.crs.to_string() if src.crs else None
+            return crs, list(src.schema['properties'])
+    raise RuntimeError("未安装pyogrio或fiona, 无法读取矢量数据")
+
+
+def has_spatial_index(path, layer=None):
+    """检查数据源是否带有空间索引 (.qix/.sbn 或 GeoPackage R-tree)"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix == '.shp':
+        # .shx 为记录偏移索引, OGR按其随机访问记录; .qix/.sbn 为空间索引
+        return any(path.with_suffix(ext).exists() for ext in ('.qix', '.sbn', '.QIX', '.SBN'))
+
+    if suffix == '.gpkg':
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                sql = ("SELECT table_name FROM gpkg_extensions "
+                       "WHERE extension_name = 'gpkg_rtree_index'")
+                tables = {row[0] for row in conn.execute(sql)}
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+        return bool(tables) if layer is None else layer in tables
+
+    return False
+
+
+def split_geometries(geoms, attrs):
+    """将几何数组和属性表拆分为点表、线要素和面要素
+
+    多部件几何被拆成单部件, 以便沿用现有的 LineString/Polygon 显示逻辑。
+    """
+    result = {'points': None, 'lines': [], 'polygons': []}
+
+    valid = ~shapely.is_missing(geoms)
+    if not valid.all():
+        geoms = geoms[valid]
+        attrs = attrs.loc[valid].reset_index(drop=True)
+    if len(geoms) == 0:
+        return result
+
+    parts, index = shapely.get_parts(geoms, return_index=True)
+    type_ids = shapely.get_type_id(parts)
+
+    # 点: 直接向量化提取坐标
+    point_mask = type_ids == 0
+    if point_mask.any():
+        df = attrs.iloc[index[point_mask]].reset_index(drop=True)
+        df.insert(0, 'longitude', shapely.get_x(parts[point_mask]))
+        df.insert(1, 'latitude', shapely.get_y(parts[point_mask]))
+        result['points'] = df
+
+    # 线和面: 转为GeoJSON要素, 与 add_line_features / add_polygon_features 的格式一致
+    for key, type_id in (('lines', 1), ('polygons', 3)):
+        mask = type_ids == type_id
+        if not mask.any():
+            continue
+        geometries = shapely.to_geojson(parts[mask])
+        records = attrs.iloc[index[mask]].to_dict('records')
+        result[key] = [
+            {
+                'type': 'Feature',
+                'properties': {k: _to_builtin(v) for k, v in props.items()},
+                'geometry': json.loads(geometry)
+            }
+            for props, geometry in zip(records, geometries)
+        ]
+
+    return result
+
+
+def layer_to_geometries(layer):
+    """将内存图层转换为 (几何数组, 属性表), 是 split_geometries 的逆过程"""
+    data = layer['data']
+
+    if isinstance(data, pd.DataFrame):
+        geoms = shapely.points(
+            pd.to_numeric(data['longitude'], errors='coerce').to_numpy(dtype=float),
+            pd.to_numeric(data['latitude'], errors='coerce').to_numpy(dtype=float)
+        )
+        attrs = data.drop(columns=['longitude', 'latitude']).reset_index(drop=True)
+        return geoms, attrs
+
+    # GeoJSON要素列表
+    geoms = shapely.from_geojson([json.dumps(feature.get('geometry')) for feature in data])
+    attrs = pd.DataFrame([feature.get('properties', {}) for feature in data])
+    return geoms, attrs
+
+
+def _to_builtin(value):
+    """把numpy标量转换为Python内置类型, 便于JSON序列化"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+
+def _iter_pyogrio(path, layer, bbox, columns, batch_size):
+    """pyogrio后端: 以Arrow批次流式读取"""
+    with open_arrow(path, layer=layer, columns=columns, bbox=bbox,
+                    batch_size=batch_size, use_pyarrow=True) as source:
+        meta, reader = source
+        geom_col = meta['geometry_name'] or 'wkb_geometry'
+        for batch in reader:
+            geoms = shapely.from_wkb(batch.column(geom_col).to_numpy(zero_copy_only=False))
+            attrs = batch.drop_columns([geom_col]).to_pandas()
+            yield meta['crs'], geoms, attrs
+
+
+def _iter_fiona(path, layer, bbox, columns, batch_size):
+    """fiona后端: 逐要素读取后按批次聚合"""
+    open_kwargs = {'layer': layer} if layer is not None else {}
+    if columns is not None:
+        open_kwargs['include_fields'] = list(columns)
+
+    with fiona.open(path, **open_kwargs) as src:
+        crs = src.crs.to_string() if src.crs else None
+        features = src.filter(bbox=tuple(bbox)) if bbox is not None else iter(src)
+
+        geoms, props = [], []
+        for feature in features:
+            geometry = feature['geometry']
+            geoms.append(shapely.geometry.shape(geometry) if geometry else None)
+            props.append(dict(feature['properties']))
+            if len(geoms) >= batch_size:
+                yield crs, np.array(geoms, dtype=object), pd.DataFrame(props)
+                geoms, props = [], []
+        if geoms:
+            yield crs, np.array(geoms, dtype=object), pd.DataFrame(props)
+
+
+def _source_bbox(path, layer, bbox, bbox_crs):
+    """把bbox从 bbox_crs 转换到数据源的坐标系 (取转换后边界的外包矩形)"""
+    from src.reprojection import crs_equal, get_transformer
+
+    crs = source_info(path, layer)[0]
+    if crs is None or crs_equal(crs, bbox_crs):
+        return tuple(bbox)
+    return get_transformer(bbox_crs, crs).transform_bounds(*bbox, densify_pts=21)
+
+
+def iter_feature_batches(path, layer=None, bbox=None, columns=None, batch_size=DEFAULT_BATCH_SIZE,
+                         bbox_crs=None):
+    """流式读取矢量数据, 每个批次返回 {'crs', 'points', 'lines', 'polygons'}
+
+    bbox为 (min_x, min_y, max_x, max_y), bbox_crs为None时使用数据源自身的坐标系,
+    否则先从 bbox_crs 转换 (如按当前地图范围读取时传入 'EPSG:4326');
+    OGR在设置空间过滤时会自动使用 .qix/.sbn 或 GeoPackage R-tree 索引。
+    columns为需要读取的属性列, None表示全部读取。
+    """
+    if VECTOR_BACKEND is None:
+        raise RuntimeError("未安装pyogrio或fiona, 无法读取矢量数据")
+
+    if bbox is not None and bbox_crs is not None:
+        bbox = _source_bbox(path, layer, bbox, bbox_crs)
+    if bbox is not None and not has_spatial_index(path, layer):
+        logger.info(f"{path} 没有空间索引, bbox过滤将顺序扫描")
+
+    reader = _iter_pyogrio if VECTOR_BACKEND == 'pyogrio' else _iter_fiona
+    for crs, geoms, attrs in reader(path, layer, bbox, columns, batch_size):
+        batch = split_geometries(geoms, attrs)
+        batch['crs'] = crs
+        yield batch
+
+
+def merge_batches(batches):
+    """合并多个批次为一个结果 {'crs', 'points', 'lines', 'polygons'}"""
+    point_frames = []
+    lines = []
+    polygons = []
+    crs = None
+
+    for batch in batches:
+        crs = batch['crs']
+        if batch['points'] is not None:
+            point_frames.append(batch['points'])
+        lines.extend(batch['lines'])
+        polygons.extend(batch['polygons'])
+
+    points = pd.concat(point_frames, ignore_index=True) if point_frames else None
+    return {'crs': crs, 'points': points, 'lines': lines, 'polygons': polygons}
+
+
+def read_vector_file(path, layer=None, bbox=None, columns=None, batch_size=DEFAULT_BATCH_SIZE, bbox_crs=None):
+    """读取单个矢量文件并合并所有批次"""
+    result = merge_batches(iter_feature_batches(path, layer, bbox, columns, batch_size, bbox_crs))
+    logger.info(
+        f"读取 {path}: 点 {0 if result['points'] is None else len(result['points'])} 个, "
+        f"线 {len(result['lines'])} 个, 面 {len(result['polygons'])} 个"
+    )
+    return result
+
+
+def read_vector_files(paths, bbox=None, columns=None, batch_size=DEFAULT_BATCH_SIZE, max_workers=None,
+                      bbox_crs=None):
+    """并行读取多个矢量文件, 返回 {路径: 读取结果}
+
+    GDAL读取时会释放GIL, 线程池即可并行解码多个文件。
+    给出 bbox_crs 时bbox按各文件的坐标系分别转换。
+    读取失败的文件对应的值为异常对象。
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+
+    max_workers = max_workers or min(len(paths), os.cpu_count() or 1)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            path: executor.submit(read_vector_file, path, None, bbox, columns, batch_size, bbox_crs)
+            for path in paths
+        }
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                logger.error(f"读取矢量文件失败 {path}: {e}")
+                results[path] = e
+    return results
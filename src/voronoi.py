@@ -0,0 +1,157 @@
+"""
+泰森多边形 (Voronoi)
+用 scipy.spatial.Delaunay 剖分 (O(n log n)), 每个点的泰森多边形由其相邻三角形的外接圆圆心按角度排序组成,
+整个图层一次性向量化构造; 四周加远处的辅助点使所有单元都闭合。结果裁剪到边界面图层,
+只有与边界相交的单元才做求交, 并且只与单元外包矩形内的那部分边界求交
+"""
+import logging
+
+import numpy as np
+import shapely
+from scipy.spatial import Delaunay
+
+from src.reprojection import DISPLAY_CRS, crs_equal, is_geographic, local_metric_crs, transform_geometries
+from src.vector_io import layer_to_geometries, split_geometries
+
+FRAME_FACTOR = 10.0  # 辅助点到数据中心的距离 (数据范围的倍数), 保证其单元不影响裁剪范围内的结果
+BBOX_PADDING = 0.05  # 没有边界图层时裁剪到点外包矩形外扩该比例的范围
+SEGMENT_DEGREES = 0.05  # 边界投影前加密顶点
+SORT_GRID = 1024  # 剖分前按网格排序的分辨率 (与TIN相同)
+
+logger = logging.getLogger(__name__)
+
+
+def _circumcenters(points, simplices):
+    """三角形外接圆圆心"""
+    a, b, c = points[simplices[:, 0]], points[simplices[:, 1]], points[simplices[:, 2]]
+    ab, ac = b - a, c - a
+    d = 2 * (ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+    ab2, ac2 = (ab ** 2).sum(axis=1), (ac ** 2).sum(axis=1)
+    ux = (ac[:, 1] * ab2 - ab[:, 1] * ac2) / d
+    uy = (ab[:, 0] * ac2 - ac[:, 0] * ab2) / d
+    return a + np.column_stack([ux, uy])
+
+
+def voronoi_cells(x, y, extent=None):
+    """计算每个点的泰森多边形, 返回与输入等长的几何数组 (坐标无效的点为None)
+
+    extent为 (xmin, ymin, xmax, ymax), 辅助点放在 extent 和点范围之外足够远处,
+    保证该范围内的单元与无界的泰森图一致。重复的点共用同一个单元。
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    cells = np.full(len(x), None, dtype=object)
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(valid) == 0:
+        return cells
+    unique, inverse = np.unique(np.column_stack([x[valid], y[valid]]), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    # 按网格排序, 相邻点在内存中也相邻, 剖分更快
+    lo, span = unique.min(axis=0), np.maximum(np.ptp(unique, axis=0), 1e-12)
+    cell = np.minimum(((unique - lo) / span * SORT_GRID).astype(np.int64), SORT_GRID - 1)
+    grid_order = np.argsort(cell[:, 0] * SORT_GRID + cell[:, 1], kind='stable')
+    unique = unique[grid_order]
+    inverse = np.argsort(grid_order)[inverse]
+
+    xmin, ymin = unique.min(axis=0)
+    xmax, ymax = unique.max(axis=0)
+    if extent is not None:
+        xmin, ymin = min(xmin, extent[0]), min(ymin, extent[1])
+        xmax, ymax = max(xmax, extent[2]), max(ymax, extent[3])
+    center = np.array([(xmin + xmax) / 2, (ymin + ymax) / 2])
+    span = max(xmax - xmin, ymax - ymin, 1e-9)
+    frame = center + FRAME_FACTOR * span * np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])
+    # 以中心为原点剖分, 减小大坐标值 (如投影坐标) 的舍入误差
+    points = np.vstack([unique, frame]) - center
+
+    tri = Delaunay(points)
+    centers = _circumcenters(points, tri.simplices)
+
+    # 每个 (三角形, 顶点) 对贡献一个单元顶点, 按点分组后按角度排序
+    owner = tri.simplices.ravel()
+    vertex = np.repeat(np.arange(len(centers)), 3)
+    keep = owner < len(unique)
+    owner, vertex = owner[keep], vertex[keep]
+    offset = centers[vertex] - points[owner]
+    # 排序键: 点序号 + 角度归一化到 [0, 1), 一次argsort代替lexsort
+    angle = (np.arctan2(offset[:, 1], offset[:, 0]) + np.pi) / (2 * np.pi + 1e-9)
+    order = np.argsort(owner + angle)
+    rings = shapely.linearrings(centers[vertex[order]] + center, indices=owner[order])
+    polygons = shapely.polygons(rings)
+
+    unique_cells = np.full(len(unique), None, dtype=object)
+    unique_cells[np.unique(owner)] = polygons
+    cells[valid] = unique_cells[inverse]
+    logger.debug(f"泰森多边形: {len(valid)} 个点, {len(unique)} 个不同位置, {len(tri.simplices)} 个三角形")
+    return cells
+
+
+def clip_cells(cells, boundary):
+    """把单元裁剪到边界几何: 完全在边界内的单元原样保留, 其余与单元外包矩形内的边界部分求交"""
+    cells = np.asarray(cells, dtype=object)
+    result = np.full(len(cells), None, dtype=object)
+    present = np.flatnonzero(~shapely.is_missing(cells))
+    shapely.prepare(boundary)
+    inside = shapely.contains_properly(boundary, cells[present])
+    result[present[inside]] = cells[present[inside]]
+
+    crossing = present[~inside]
+    crossing = crossing[shapely.intersects(boundary, cells[crossing])]
+    if len(crossing):
+        clipped = shapely.intersection(cells[crossing], boundary)
+        # 只保留面部分 (与边界只有线、点接触的部分没有面积)
+        parts, index = shapely.get_parts(clipped, return_index=True)
+        polygonal = shapely.get_type_id(parts) == 3
+        parts, index = parts[polygonal], index[polygonal]
+        has_area, counts = np.unique(index, return_counts=True)
+        merged = shapely.multipolygons(parts, indices=index)[has_area]
+        merged[counts == 1] = parts[np.isin(index, has_area[counts == 1])]
+        result[crossing[has_area]] = merged
+    logger.debug(f"裁剪泰森多边形: {len(present)} 个单元, {len(crossing)} 个与边界相交")
+    return result
+
+
+def voronoi_layer(layer, boundary_layer=None):
+    """为点图层生成泰森多边形, 返回面要素列表 (每个单元带对应点的属性)
+
+    boundary_layer为面图层时单元裁剪到其所有面的并集 (如省界), 否则裁剪到点的外包矩形外扩5%。
+    经纬度图层在以数据为中心的等距投影中计算, 单元边界为按实际距离的等分线。
+    """
+    if layer['type'] != 'points':
+        raise ValueError("泰森多边形需要点图层")
+    geoms, attrs = layer_to_geometries(layer)
+    crs = layer.get('crs', DISPLAY_CRS)
+    x, y = shapely.get_x(geoms), shapely.get_y(geoms)
+
+    boundary = None
+    if boundary_layer is not None:
+        boundary_geoms, _ = layer_to_geometries(boundary_layer)
+        boundary_geoms = boundary_geoms[~shapely.is_missing(boundary_geoms)]
+        boundary_crs = boundary_layer.get('crs', DISPLAY_CRS)
+        if is_geographic(boundary_crs):
+            boundary_geoms = shapely.segmentize(boundary_geoms, SEGMENT_DEGREES)
+        if not crs_equal(boundary_crs, crs):
+            boundary_geoms = transform_geometries(boundary_geoms, boundary_crs, crs)
+        boundary = shapely.union_all(boundary_geoms)
+        if shapely.is_empty(boundary):
+            raise ValueError("边界图层没有有效的面")
+
+    metric = None
+    if is_geographic(crs):
+        finite = np.isfinite(x) & np.isfinite(y)
+        metric = local_metric_crs(x[finite], y[finite])
+        projected = transform_geometries(geoms, crs, metric)
+        x, y = shapely.get_x(projected), shapely.get_y(projected)
+        if boundary is not None:
+            boundary = transform_geometries(np.array([boundary]), crs, metric)[0]
+
+    if boundary is None:
+        finite = np.isfinite(x) & np.isfinite(y)
+        xmin, xmax, ymin, ymax = x[finite].min(), x[finite].max(), y[finite].min(), y[finite].max()
+        pad = BBOX_PADDING * max(xmax - xmin, ymax - ymin, 1.0)
+        boundary = shapely.box(xmin - pad, ymin - pad, xmax + pad, ymax + pad)
+
+    cells = clip_cells(voronoi_cells(x, y, shapely.bounds(boundary)), boundary)
+    if metric is not None:
+        present = ~shapely.is_missing(cells)
+        cells[present] = transform_geometries(cells[present], metric, crs)
+    return split_geometries(cells, attrs)['polygons']
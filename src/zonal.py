@@ -0,0 +1,239 @@
+"""
+分区统计: 按面图层统计栅格值 (均值/最小值/最大值等)
+栅格按块读取, 每块只栅格化与之相交的面 (先裁剪到块范围), 再用 bincount 和 reduceat 向量化聚合;
+多个块在进程池中并行处理, 各块的结果按分区合并, 内存占用与栅格大小无关
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+import rasterio
+from rasterio import features
+from rasterio.windows import Window, transform as window_transform
+
+from src.reprojection import DISPLAY_CRS, transform_geometries
+from src.vector_io import layer_to_geometries
+
+ZONAL_STATS = ('count', 'mean', 'min', 'max', 'std', 'sum')
+TILE_SIZE = 1024
+PARALLEL_THRESHOLD = 4000000  # 超过该像元数时默认启用多进程
+
+logger = logging.getLogger(__name__)
+
+
+def overlap_groups(geoms):
+    """把面分组, 同组内的面内部互不重叠, 每组可以一次栅格化到同一个分区数组
+
+    相邻面只共享边界时视为不重叠; 通常 (如省界) 只有一组。返回每个面的组号。
+    """
+    tree = shapely.STRtree(geoms)
+    left, right = tree.query(geoms, predicate='intersects')
+    pairs = left < right
+    left, right = left[pairs], right[pairs]
+    overlapping = ~shapely.touches(geoms[left], geoms[right])
+    left, right = left[overlapping], right[overlapping]
+
+    groups = np.zeros(len(geoms), dtype=np.int32)
+    if len(left) == 0:
+        return groups
+    # 贪心着色: 按编号顺序, 取与已分组的重叠面都不同的最小组号
+    neighbours = pd.Series(np.concatenate([left, right])).groupby(np.concatenate([right, left])).agg(list)
+    for i, others in neighbours.items():
+        used = {groups[j] for j in others if j < i}
+        group = 0
+        while group in used:
+            group += 1
+        groups[i] = group
+    return groups
+
+
+def tile_windows(width, height, tile_size=TILE_SIZE, bounds=None):
+    """划分块窗口; bounds为 (col0, row0, col1, row1) 时只覆盖该像元范围"""
+    col0, row0, col1, row1 = bounds or (0, 0, width, height)
+    col0, row0 = max(int(col0), 0), max(int(row0), 0)
+    col1, row1 = min(int(np.ceil(col1)), width), min(int(np.ceil(row1)), height)
+    return [Window(col, row, min(tile_size, col1 - col), min(tile_size, row1 - row))
+            for row in range(row0, row1, tile_size) for col in range(col0, col1, tile_size)]
+
+
+def reduce_tile(zones, values):
+    """按分区聚合一个块的像元值, 返回 (分区, 个数, 均值, 离差平方和, 最小值, 最大值)"""
+    ids, inverse, counts = np.unique(zones, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(ids))
+    means = sums / counts
+    m2 = np.bincount(inverse, weights=(values - means[inverse]) ** 2, minlength=len(ids))
+    order = np.argsort(inverse, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ordered = values[order]
+    return ids, counts, means, m2, np.minimum.reduceat(ordered, starts), np.maximum.reduceat(ordered, starts)
+
+
+_state = {}  # 工作进程中的栅格句柄和面数据
+
+
+def _init_worker(path, overview_level, band, wkb, zones, groups, all_touched):
+    """在工作进程中打开栅格并重建面的几何和空间索引"""
+    if _state.get('dataset') is not None:
+        _state['dataset'].close()
+    geoms = shapely.from_wkb(wkb)
+    kwargs = {} if overview_level is None else {'overview_level': overview_level}
+    _state.update(dataset=rasterio.open(path, **kwargs), band=band, geoms=geoms,
+                  tree=shapely.STRtree(geoms), zones=zones, groups=groups, all_touched=all_touched)
+
+
+def _process_tile(window):
+    """统计一个块 (在工作进程中执行), 块内没有有效像元时返回None"""
+    ds = _state['dataset']
+    window = Window(*window)
+    transform = window_transform(window, ds.transform)
+    left, top = transform * (0, 0)
+    right, bottom = transform * (window.width, window.height)
+    box = shapely.box(min(left, right), min(top, bottom), max(left, right), max(top, bottom))
+    candidates = _state['tree'].query(box, predicate='intersects')
+    if len(candidates) == 0:
+        return None
+
+    data = ds.read(_state['band'], window=window, masked=True)
+    valid = ~np.ma.getmaskarray(data)
+    data = np.ma.getdata(data).astype(np.float64)
+    valid &= np.isfinite(data)
+
+    # 只栅格化裁剪到块范围 (外扩一个像元) 的部分, 大面的顶点不会在每个块中重复处理
+    pad_x, pad_y = abs(transform.a), abs(transform.e)
+    clipped = shapely.clip_by_rect(_state['geoms'][candidates], box.bounds[0] - pad_x, box.bounds[1] - pad_y,
+                                   box.bounds[2] + pad_x, box.bounds[3] + pad_y)
+    zone_parts, value_parts = [], []
+    for group in np.unique(_state['groups'][candidates]):
+        members = candidates[_state['groups'][candidates] == group]
+        shapes = [(geom, int(index) + 1) for geom, index in
+                  zip(clipped[_state['groups'][candidates] == group], members) if not geom.is_empty]
+        if not shapes:
+            continue
+        burned = features.rasterize(shapes, out_shape=data.shape, transform=transform, fill=0,
+                                    all_touched=_state['all_touched'], dtype='int32')
+        hit = valid & (burned > 0)
+        zone_parts.append(_state['zones'][burned[hit] - 1])
+        value_parts.append(data[hit])
+    if not zone_parts or not sum(len(part) for part in zone_parts):
+        return None
+    return reduce_tile(np.concatenate(zone_parts), np.concatenate(value_parts))
+
+
+def choose_overview_level(path, max_pixels):
+    """选择像元数不超过max_pixels的最精细概视, 返回概视序号, None表示原始分辨率"""
+    with rasterio.open(path) as ds:
+        pixels = ds.width * ds.height
+        factors = ds.overviews(1)
+    if max_pixels is None or pixels <= max_pixels:
+        return None
+    for level, factor in enumerate(factors):
+        if pixels / factor ** 2 <= max_pixels:
+            return level
+    return len(factors) - 1 if factors else None
+
+
+def zonal_statistics(raster_path, geoms, zones=None, crs=DISPLAY_CRS, band=1, overview_level=None,
+                     tile_size=TILE_SIZE, max_workers=None, all_touched=False):
+    """按面统计栅格值, 返回以分区号为索引的DataFrame (列为 ZONAL_STATS)
+
+    geoms为面的几何数组 (坐标系crs, 与栅格不同时自动转换); zones为每个面的分区号 (0开始的整数),
+    同一分区的多个面合并统计, 默认每个面一个分区。像元中心落在面内即计入 (all_touched为True时
+    计入所有接触的像元); 面互相重叠时重叠部分分别计入各自的分区。
+    overview_level 指定时在该级概视上统计 (大范围时以分辨率换速度)。
+    max_workers为None时像元数超过 PARALLEL_THRESHOLD 才使用多进程。
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    zones = np.arange(len(geoms)) if zones is None else np.asarray(zones, dtype=np.int64)
+    n_zones = int(zones.max()) + 1 if len(zones) else 0
+    result = {'count': np.zeros(n_zones, dtype=np.int64), 'mean': np.zeros(n_zones), 'm2': np.zeros(n_zones),
+              'min': np.full(n_zones, np.nan), 'max': np.full(n_zones, np.nan)}
+
+    keep = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    with rasterio.open(raster_path, **({} if overview_level is None else {'overview_level': overview_level})) as ds:
+        if ds.crs is not None:
+            geoms = transform_geometries(geoms, crs, ds.crs.to_string())
+        geoms, zones = shapely.make_valid(geoms[keep]), zones[keep]
+        width, height, inverse = ds.width, ds.height, ~ds.transform
+    if len(geoms) > 0:
+        xmin, ymin, xmax, ymax = shapely.total_bounds(geoms)
+        cols, rows = zip(*(inverse * (x, y) for x in (xmin, xmax) for y in (ymin, ymax)))
+        windows = tile_windows(width, height, tile_size, (min(cols), min(rows), max(cols), max(rows)))
+    else:
+        windows = []
+
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if sum(w.width * w.height for w in windows) >= PARALLEL_THRESHOLD else 1
+    init_args = (str(raster_path), overview_level, band, shapely.to_wkb(geoms), zones,
+                 overlap_groups(geoms) if len(geoms) else zones, all_touched)
+    tasks = [(w.col_off, w.row_off, w.width, w.height) for w in windows]
+    if max_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=init_args) as executor:
+            tiles = executor.map(_process_tile, tasks, chunksize=max(1, len(tasks) // (8 * max_workers)))
+            for tile in tiles:
+                _merge(result, tile)
+    else:
+        _init_worker(*init_args)
+        try:
+            for task in tasks:
+                _merge(result, _process_tile(task))
+        finally:
+            _state.pop('dataset').close()
+
+    table = pd.DataFrame(result)
+    empty = table['count'] == 0
+    table.loc[empty, 'mean'] = np.nan
+    table['sum'] = np.where(empty, np.nan, table['mean'] * table['count'])
+    table['std'] = np.sqrt(table['m2'] / table['count'].where(~empty))
+    logger.info(f"分区统计完成: {n_zones} 个分区, {len(tasks)} 个块")
+    return table[list(ZONAL_STATS)]
+
+
+def _merge(result, tile):
+    """把一个块的统计合并到总结果 (Chan并行方差合并公式); 同一块内的分区号互不相同"""
+    if tile is None:
+        return
+    ids, counts, means, m2, mins, maxs = tile
+    n_a, mean_a = result['count'][ids], result['mean'][ids]
+    total = n_a + counts
+    delta = means - mean_a
+    result['mean'][ids] = mean_a + delta * counts / total
+    result['m2'][ids] += m2 + delta ** 2 * n_a * counts / total
+    result['count'][ids] = total
+    result['min'][ids] = np.fmin(result['min'][ids], mins)
+    result['max'][ids] = np.fmax(result['max'][ids], maxs)
+
+
+def zonal_layer(layer, raster_path, prefix, by=None, stats=ZONAL_STATS, **kwargs):
+    """对面图层做分区统计, 结果写入每个要素的属性列 '{prefix}_{统计量}', 返回统计表
+
+    by为属性列名时按该列的取值分区 (例如多部件的省份被拆成多个要素时按名称合并), 该列为空的要素不参与合并,
+    各自单独统计 (统计表中索引为None); by为None时每个要素单独统计。图层的 version 加1, 以便缓存失效。
+    """
+    geoms, attrs = layer_to_geometries(layer)
+    if by is not None and by in attrs.columns:
+        codes, keys = pd.factorize(attrs[by])
+        missing = codes < 0
+        codes[missing] = len(keys) + np.arange(missing.sum())
+        keys = pd.Index(list(keys) + [None] * int(missing.sum()), dtype=object)
+    else:
+        codes, keys = np.arange(len(geoms)), pd.RangeIndex(len(geoms))
+    table = zonal_statistics(raster_path, geoms, codes, crs=layer.get('crs', DISPLAY_CRS), **kwargs)
+    table = table[list(stats)]
+
+    values = table.to_numpy()[codes]
+    columns = [f"{prefix}_{stat}" for stat in stats]
+    for feature, row in zip(layer['data'], values):
+        properties = feature.setdefault('properties', {})
+        for column, stat, value in zip(columns, stats, row):
+            if stat == 'count':
+                properties[column] = int(value)
+            else:
+                properties[column] = float(value) if np.isfinite(value) else None
+    layer['version'] = layer.get('version', 0) + 1
+    table.index = keys
+    return table
@@ -0,0 +1,109 @@
+"""
+测试缓冲区生成和距离查询
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+import shapely
+from src.buffer import HIGHLIGHT_COLOR, buffer_geometries, buffer_layer, highlight_data, query_within_distance
+from src.geodesy import haversine
+from src.reprojection import local_metric_crs, transform_geometries
+
+
+def _cities(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'name': [f'城市{i}' for i in range(n)],
+                         'longitude': rng.uniform(100, 125, n), 'latitude': rng.uniform(20, 45, n)})
+
+
+def test_haversine_and_buffer():
+    """测试球面距离, 以及不同纬度的点缓冲区半径都为指定的米数 (椭球面距离)"""
+    assert abs(haversine(116.4074, 39.9042, 121.4737, 31.2304) - 1067e3) < 3e3
+    geod = __import__('pyproj').Geod(ellps='WGS84')
+
+    points = shapely.points([[116.0, 40.0], [100.0, 20.0], [125.0, 50.0]])
+    buffers = buffer_geometries(points, 10000)
+    for point, buffer in zip(points, buffers):
+        ring = shapely.get_coordinates(buffer.exterior)
+        radius = geod.inv(np.full(len(ring), point.x), np.full(len(ring), point.y), ring[:, 0], ring[:, 1])[2]
+        assert np.allclose(radius, 10000, rtol=1e-4)
+        assert len(ring) == 16 * 4 + 1
+
+    layer = {'type': 'lines', 'crs': 'EPSG:4326', 'data': [
+        {'type': 'Feature', 'properties': {'name': '河'}, 'geometry': {'type': 'LineString',
+                                                                     'coordinates': [[110, 30], [111, 30.5]]}}]}
+    features = buffer_layer(layer, 5000)
+    assert features[0]['geometry']['type'] == 'Polygon' and features[0]['properties'] == {'name': '河'}
+    print("✅ 缓冲区生成正常")
+
+
+def test_point_query_matches_haversine():
+    """测试点图层按选中点查询与逐点球面距离结果一致"""
+    cities = _cities()
+    layer = {'name': '城市', 'type': 'points', 'crs': 'EPSG:4326', 'data': cities}
+    selection = shapely.points([[113.0, 30.0], [120.0, 40.0]])
+    positions, distances = query_within_distance(layer, selection, 150000)
+
+    all_distances = np.minimum(
+        haversine(113.0, 30.0, cities['longitude'], cities['latitude']),
+        haversine(120.0, 40.0, cities['longitude'], cities['latitude'])
+    )
+    expected = np.flatnonzero(all_distances <= 150000)
+    assert np.array_equal(positions, expected)
+    assert np.allclose(distances, all_distances[expected])
+    print("✅ 点查询与球面距离一致")
+
+
+def test_extended_geometries():
+    """测试面作为选区、线作为候选时与精确距离计算一致"""
+    cities = _cities(5000, seed=1)
+    province = shapely.Polygon([(110, 30), (114, 29), (115, 33), (111, 34)])
+    layer = {'name': '城市', 'type': 'points', 'crs': 'EPSG:4326', 'data': cities}
+    positions, distances = query_within_distance(layer, [province], 50000)
+
+    metric = local_metric_crs([110, 115], [29, 34])
+    points = transform_geometries(shapely.points(cities[['longitude', 'latitude']].to_numpy()), 'EPSG:4326', metric)
+    dense = shapely.segmentize(np.array([province]), 0.05)
+    exact = shapely.distance(transform_geometries(dense, 'EPSG:4326', metric)[0], points)
+    assert np.array_equal(positions, np.flatnonzero(exact <= 50000))
+    assert (distances[shapely.contains_xy(province, cities['longitude'].to_numpy()[positions],
+                                          cities['latitude'].to_numpy()[positions])] == 0).all()
+
+    rivers = {'name': '河流', 'type': 'lines', 'crs': 'EPSG:4326', 'data': [
+        {'type': 'Feature', 'properties': {'name': name},
+         'geometry': {'type': 'LineString', 'coordinates': coords}}
+        for name, coords in [('近', [[116.2, 39.0], [116.2, 41.0]]), ('远', [[118.0, 39.0], [118.0, 41.0]])]
+    ]}
+    positions, distances = query_within_distance(rivers, shapely.points([[116.0, 40.0]]), 30000)
+    # 纬度40度处经度0.2度约17km
+    assert list(positions) == [0] and abs(distances[0] - 17060) < 100
+    print("✅ 线/面距离查询正常")
+
+
+def test_projected_layer_and_highlight():
+    """测试投影坐标系图层直接按坐标单位查询, 以及高亮图层数据"""
+    points = pd.DataFrame({'name': ['a', 'b', 'c'], 'longitude': [500000.0, 500900.0, 503000.0],
+                           'latitude': [4000000.0, 4000000.0, 4000000.0]})
+    layer = {'name': '点', 'type': 'points', 'crs': 'EPSG:32650', 'data': points}
+    positions, distances = query_within_distance(layer, shapely.points([[500000.0, 4000000.0]]), 1000,
+                                                 selection_crs='EPSG:32650')
+    assert list(positions) == [0, 1] and np.allclose(distances, [0, 900])
+
+    subset = highlight_data(layer, positions, distances)
+    assert list(subset['name']) == ['a', 'b'] and (subset['color'] == HIGHLIGHT_COLOR).all()
+    assert 'color' not in points.columns
+
+    features = [{'type': 'Feature', 'properties': {'name': 'x'}, 'geometry': None}]
+    highlighted = highlight_data({'data': features}, [0], [5.0])
+    assert highlighted[0]['properties'] == {'name': 'x', 'color': HIGHLIGHT_COLOR, 'distance': 5.0}
+    assert features[0]['properties'] == {'name': 'x'}
+    print("✅ 投影坐标查询和高亮数据正常")
+
+
+if __name__ == '__main__':
+    test_haversine_and_buffer()
+    test_point_query_matches_haversine()
+    test_extended_geometries()
+    test_projected_layer_and_highlight()
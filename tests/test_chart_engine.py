@@ -0,0 +1,53 @@
+"""
+测试图表引擎的密度聚合和图表元素复用
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from src import chart_engine
+from src.chart_engine import ChartEngine, density_grid
+
+
+def test_density_grid():
+    """测试分箱计数与numpy.histogram2d一致"""
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(size=100000), rng.normal(size=100000)
+    x[0] = np.nan
+    counts, extent = density_grid(x, y, shape=(50, 40))
+    assert counts.shape == (40, 50)
+    assert counts.sum() == 99999
+
+    expected, _, _ = np.histogram2d(y[1:], x[1:], bins=(40, 50),
+                                    range=[extent[2:], extent[:2]])
+    assert np.abs(counts - expected).sum() <= 2 * (40 + 50)  # 只允许边界像元的舍入差异
+    print("✅ 密度分箱正常")
+
+
+def test_artist_reuse():
+    """测试切换图表时复用图表元素"""
+    engine = ChartEngine(Figure())
+    engine.histogram(np.arange(10), np.linspace(0, 1, 11), 'x')
+    bars = engine._bars
+    engine.pie([1, 2], ['a', 'b'])
+    engine.histogram(np.arange(10)[::-1], np.linspace(0, 2, 11), 'x')
+    assert engine._bars is bars
+    assert engine._pie == []
+    assert bars[0].get_height() == 9
+
+    n = chart_engine.DENSITY_THRESHOLD + 1
+    engine.scatter(np.random.rand(n), np.random.rand(n))
+    image = engine._image
+    engine.scatter(np.random.rand(10), np.random.rand(10))
+    assert not image.get_visible() and engine._colorbar is None
+    engine.scatter(np.random.rand(n), np.random.rand(n))
+    assert engine._image is image and image.get_visible()
+    print("✅ 图表元素复用正常")
+
+
+if __name__ == '__main__':
+    test_density_grid()
+    test_artist_reuse()
@@ -0,0 +1,97 @@
+"""
+测试格网和TIN等高线生成
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+import shapely
+from src.contour import MAX_LEVELS, chaikin, contour_levels, contour_tin, grid_contours, tin_contours
+from src.tin import TIN
+
+
+def _surface():
+    x = np.linspace(0, 10, 201)
+    y = np.linspace(0, 8, 161)
+    xx, yy = np.meshgrid(x, y)
+    return x, y, np.sin(xx) * np.cos(yy) + 0.1 * xx + 0.013  # 避免格点恰好落在级别上
+
+
+def test_grid_contours():
+    """测试Marching Squares结果与contourpy一致, 分块结果与整体结果一致"""
+    contourpy = __import__('contourpy')
+    x, y, z = _surface()
+    z[50:55, 50:55] = np.nan
+    levels = contour_levels(np.nanmin(z), np.nanmax(z), 0.25)
+    lines = grid_contours(z, x, y, levels)
+
+    generator = contourpy.contour_generator(*np.meshgrid(x, y), np.ma.masked_invalid(z), corner_mask=False)
+    for level, geometry in zip(levels, lines):
+        expected = [line for line in generator.lines(level) if len(line) > 1]
+        assert np.isclose(shapely.length(geometry), sum(shapely.length(shapely.linestrings(line)) for line in expected))
+
+    tiled = grid_contours(z, x, y, levels, tile_rows=16)
+    assert all(shapely.equals(a, b) for a, b in zip(lines, tiled))
+    print("✅ 格网等高线正常")
+
+
+def test_tin_contours():
+    """测试平面TIN的等高线为精确的直线, 且每个级别连接为一条线"""
+    rng = np.random.default_rng(0)
+    px, py = rng.random(5000), rng.random(5000)
+    tin = TIN(px, py, px + 2 * py)
+    levels = np.array([0.5, 1.0, 1.5, 2.0])
+    for level, geometry in zip(levels, tin_contours(tin, levels)):
+        assert geometry.geom_type == 'LineString'
+        coords = shapely.get_coordinates(geometry)
+        assert np.allclose(coords[:, 0] + 2 * coords[:, 1], level)
+    print("✅ TIN等高线正常")
+
+
+def test_contour_features():
+    """测试输出线图层要素、平滑和抽稀"""
+    rng = np.random.default_rng(1)
+    px, py = rng.random(3000) * 4 - 2, rng.random(3000) * 4 - 2
+    tin = TIN(px, py, np.exp(-(px ** 2 + py ** 2)))
+    features = contour_tin(tin, interval=0.2)
+    assert [f['properties']['elevation'] for f in features] == [0.2, 0.4, 0.6000000000000001, 0.8]
+    assert all(f['geometry']['type'] == 'LineString' and f['properties']['color'].startswith('#')
+               for f in features)
+
+    smoothed = contour_tin(tin, interval=0.2, smooth=2)
+    simplified = contour_tin(tin, interval=0.2, simplify=0.05)
+    for plain, smooth, simple in zip(features, smoothed, simplified):
+        n = len(plain['geometry']['coordinates'])
+        assert len(smooth['geometry']['coordinates']) > n > len(simple['geometry']['coordinates'])
+    print("✅ 等高线要素输出正常")
+
+
+def test_chaikin():
+    """测试平滑保留开放折线端点和闭合环"""
+    line = np.array([[0, 0], [1, 1], [2, 0]], dtype=float)
+    smoothed = chaikin(line, 1)
+    assert np.array_equal(smoothed[0], line[0]) and np.array_equal(smoothed[-1], line[-1])
+    ring = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]], dtype=float)
+    smoothed = chaikin(ring, 2)
+    assert np.array_equal(smoothed[0], smoothed[-1]) and len(smoothed) == 17
+    print("✅ 平滑正常")
+
+
+def test_level_limit():
+    """测试等高距过小时拒绝生成, 级别数恰好等于上限时正常"""
+    assert len(contour_levels(0.5, 500.5, 1.0)) == MAX_LEVELS
+    try:
+        contour_levels(0, 8848, 0.001)
+    except ValueError as e:
+        assert '8848001' in str(e)
+    else:
+        raise AssertionError("级别数超过上限时应当报错")
+    print("✅ 等高线级别数上限正常")
+
+
+if __name__ == '__main__':
+    test_grid_contours()
+    test_tin_contours()
+    test_contour_features()
+    test_chaikin()
+    test_level_limit()
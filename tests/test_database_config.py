@@ -0,0 +1,328 @@
+"""
+测试数据库管理器中不需要真实数据库的逻辑 (会话和查询由替身对象代替)
+"""
+import sys
+import tempfile
+from pathlib import Path
+sys.path.append('.')
+
+import re
+from contextlib import nullcontext
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from rasterio.transform import from_origin
+from src import database_config
+from src.database_config import KNN_PAGE_SIZE, DatabaseManager
+from src.geoparquet_io import write_layer_geoparquet
+from src.layer_stats import summarize_frame
+from src.table_models import PagedTableModel
+
+
+class FakeSession:
+    """记录执行的SQL和参数的会话替身"""
+
+    def __init__(self):
+        self.statements = []
+        self.committed = self.rolled_back = False
+
+    def execute(self, statement, params=None):
+        self.statements.append((str(statement), params))
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+def width_bucket(values, lo, hi, bins):
+    """PostgreSQL width_bucket: 小于下界为0号桶, 大于等于上界为 bins+1 号桶"""
+    buckets = np.floor((values - lo) / (hi - lo) * bins).astype(np.int64) + 1
+    return np.where(values < lo, 0, np.where(values >= hi, bins + 1, buckets))
+
+
+def stats_manager(table):
+    """统计查询由一张DataFrame模拟的管理器: 按SQL的类型在pandas中计算聚合结果"""
+    numeric = [col for col in table.columns if col != 'id' and table[col].dtype.kind in 'if']
+    queries = []
+
+    def execute_query(query, params=None):
+        queries.append(query)
+        params = params or {}
+        if 'AS row_count' in query:
+            row = {'row_count': len(table)}
+            for i, col in enumerate(numeric):
+                values = table[col].dropna().to_numpy(dtype=float)
+                empty = len(values) == 0
+                row.update({
+                    f'c{i}_count': len(values),
+                    f'c{i}_min': None if empty else values.min(),
+                    f'c{i}_max': None if empty else values.max(),
+                    f'c{i}_avg': None if empty else values.mean(),
+                    f'c{i}_std': values.std(ddof=1) if len(values) > 1 else None,
+                    f'c{i}_var': values.var(ddof=1) if len(values) > 1 else None,
+                    f'c{i}_q': None if empty else list(np.quantile(values, [0.25, 0.5, 0.75]))
+                })
+            return [row]
+        if 'width_bucket' in query:
+            col = re.search(r'width_bucket\("(\w+)"', query).group(1)
+            buckets = width_bucket(table[col].dropna().to_numpy(dtype=float), params['lo'], params['hi'],
+                                   params['bins'])
+            values, counts = np.unique(buckets, return_counts=True)
+            return [{'bucket': int(b), 'count': int(c)} for b, c in zip(values, counts)]
+        col = re.search(r'SELECT "(\w+)" AS value', query).group(1)
+        counts = table[col].value_counts(dropna=False).head(params['top_n'])
+        return [{'value': None if pd.isna(v) else v, 'count': int(c)} for v, c in counts.items()]
+
+    manager = DatabaseManager()
+    manager.execute_query = execute_query
+    manager.get_table_columns = lambda table_name: list(table.columns)
+    manager.get_numeric_columns = lambda table_name: numeric
+    manager.queries = queries
+    return manager
+
+
+class FakeEngine:
+    """connect() 返回空上下文的引擎替身, 配合替换的 pd.read_sql_query 使用"""
+
+    def __init__(self):
+        self.connections = 0
+
+    def connect(self):
+        self.connections += 1
+        return nullcontext()
+
+
+def nearest_manager(n=23):
+    """最近邻查询由按距离排好序的n行表模拟的管理器, 记录每次查询的SQL和参数"""
+    table = pd.DataFrame({'id': np.arange(n) + 100, 'name': [f'p{i}' for i in range(n)],
+                          'distance_m': np.arange(n) * 10.0})
+    manager = DatabaseManager()
+    manager.engine = FakeEngine()
+    manager.queries = []
+
+    def read_sql_query(query, conn, params=None):
+        manager.queries.append((str(query), params))
+        return table.iloc[params['offset']:params['offset'] + params['limit']].reset_index(drop=True)
+    return manager, read_sql_query
+
+
+def fake_manager(columns=('name', 'population')):
+    manager = DatabaseManager()
+    manager.session = FakeSession()
+    manager.get_session = lambda: manager.session
+    manager.get_table_columns = lambda table: ['id', 'geom', *columns]
+    return manager
+
+
+def test_geoparquet_import_srid():
+    """测试GeoParquet导入按坐标系的EPSG代码写SRID, 没有EPSG代码时报错而不是按4326写入"""
+    frame = pd.DataFrame({'name': ['a', 'b'], 'longitude': [500000.0, 600000.0],
+                          'latitude': [4000000.0, 4100000.0], 'population': [1, 2]})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'utm.parquet'
+        write_layer_geoparquet({'name': 'utm', 'type': 'points', 'data': frame,
+                                'crs': '+proj=utm +zone=50 +datum=WGS84'}, path)
+        manager = fake_manager()
+        assert manager.import_geoparquet_to_postgis(path) and manager.session.committed
+        sql, rows = manager.session.statements[0]
+        assert 'ST_Transform(ST_GeomFromWKB(:geom_wkb, 32650), 4326)' in sql and len(rows) == 2
+
+        path = Path(tmp) / 'albers.parquet'
+        write_layer_geoparquet({'name': 'albers', 'type': 'points', 'data': frame, 'crs': 'ESRI:102003'}, path)
+        manager = fake_manager()
+        try:
+            manager.import_geoparquet_to_postgis(path)
+        except ValueError as e:
+            assert 'EPSG' in str(e)
+        else:
+            raise AssertionError("没有EPSG代码的坐标系应当报错")
+        assert manager.session.rolled_back and not manager.session.statements
+    print("✅ GeoParquet导入的SRID正确")
+
+
+def test_query_all_pages():
+    """测试按主键逐页读取完整结果: 每页从上一页最后的id之后开始, 不足一页时停止"""
+    table = pd.DataFrame({'id': np.arange(1, 1236) * 2, 'name': [f'p{i}' for i in range(1235)]})
+    calls = []
+
+    def query_page(table_name, after_id=None, page_size=500, bbox=None):
+        calls.append(after_id)
+        rows = table if after_id is None else table[table['id'] > after_id]
+        return rows.head(page_size).reset_index(drop=True)
+
+    manager = DatabaseManager()
+    manager.query_page = query_page
+    result = manager.query_all('point_features', page_size=500)
+    assert result['id'].tolist() == table['id'].tolist()
+    assert calls == [None, 1000, 2000]
+
+    table = table.head(1000)
+    calls.clear()
+    assert len(manager.query_all('point_features', page_size=500)) == 1000 and calls == [None, 1000, 2000]
+    table = table.head(0)
+    assert manager.query_all('point_features').empty
+    print("✅ 逐页读取完整结果正常")
+
+
+def test_query_nearest():
+    """测试最近邻分页: LIMIT/OFFSET按k截断, 名次跨页连续, 按球面距离和id排序, 取完k个后不再查询"""
+    manager, read_sql_query = nearest_manager()
+    with mock.patch.object(database_config.pd, 'read_sql_query', side_effect=read_sql_query):
+        pages = [manager.query_nearest('point_features', 116.4, 39.9, k=23, after_rank=after, page_size=10)
+                 for after in (None, 10, 20)]
+        assert [(p['limit'], p['offset']) for _, p in manager.queries] == [(10, 0), (10, 10), (3, 20)]
+        assert [page['knn_rank'].tolist() for page in pages] == [list(range(1, 11)), list(range(11, 21)),
+                                                                 [21, 22, 23]]
+        assert pages[1]['id'].tolist() == list(range(110, 120))
+
+        for after in (23, 30):
+            empty = manager.query_nearest('point_features', 116.4, 39.9, k=23, after_rank=after, page_size=10)
+            assert empty.empty and list(empty.columns) == ['knn_rank', 'distance_m']
+        assert len(manager.queries) == 3
+
+        short = manager.query_nearest('point_features', 116.4, 39.9, k=12, after_rank=10, page_size=10)
+        assert short['knn_rank'].tolist() == [11, 12] and manager.queries[-1][1]['limit'] == 2
+        assert 'max_degrees' not in manager.queries[-1][1] and 'ST_DWithin' not in manager.queries[-1][0]
+        # 按球面距离排序 (名次与distance_m一致), 距离相同时按id
+        order_by = ' '.join(manager.queries[-1][0].split()).split('ORDER BY ')[1]
+        assert order_by.startswith('geom::geography <-> ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography, id ')
+    print("✅ 最近邻分页正常")
+
+
+def test_nearest_max_degrees():
+    """测试距离预筛选的度数范围覆盖max_distance: 经度方向按范围内最高纬度放大, 不超过360度"""
+    manager, read_sql_query = nearest_manager()
+    with mock.patch.object(database_config.pd, 'read_sql_query', side_effect=read_sql_query):
+        for lat in (0.0, 39.9, -60.0, 75.0):
+            manager.query_nearest('point_features', 116.4, lat, k=5, max_distance=100000)
+            sql, params = manager.queries[-1]
+            assert 'ST_DWithin(geom, ST_SetSRID' in sql and params['max_distance'] == 100000
+            # 范围边缘 (纬度离赤道较远的一侧) 向东100公里的经度差, 以及向北100公里的纬度差
+            edge = np.radians(abs(lat) + np.degrees(100000 / 6371008.8))
+            assert params['max_degrees'] >= 100000 / (6371008.8 * np.cos(edge)) * 180 / np.pi
+            assert params['max_degrees'] >= np.degrees(100000 / 6371008.8)
+
+        manager.query_nearest('point_features', 0.0, 88.5, k=5, max_distance=5000000)
+        assert manager.queries[-1][1]['max_degrees'] == 360.0
+    print("✅ 距离预筛选范围正确")
+
+
+def test_nearest_paged_model():
+    """测试点选查询的分页模型 (key_column='knn_rank') 逐页加载到k个要素为止"""
+    k = KNN_PAGE_SIZE + 25
+    manager, read_sql_query = nearest_manager(200)
+    with mock.patch.object(database_config.pd, 'read_sql_query', side_effect=read_sql_query):
+        model = PagedTableModel(lambda after_rank: manager.query_nearest('point_features', 116.4, 39.9, k,
+                                                                         None, after_rank),
+                                key_column='knn_rank', page_size=KNN_PAGE_SIZE)
+        model.fetchMore()
+        assert model.rowCount() == KNN_PAGE_SIZE and model.canFetchMore()
+        model.fetchMore()
+        assert model.rowCount() == k and not model.canFetchMore() and model.error is None
+        assert model.page_frame(1)['knn_rank'].tolist() == list(range(KNN_PAGE_SIZE + 1, k + 1))
+        model.close()
+    assert [p['offset'] for _, p in manager.queries] == [0, KNN_PAGE_SIZE]
+    print("✅ 点选查询分页模型正常")
+
+
+def test_table_statistics():
+    """测试数据库统计结果的结构和数值与内存统计 (summarize_frame) 一致"""
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame({
+        'id': np.arange(1, 1001),
+        'population': rng.integers(0, 10000, 1000).astype(float),
+        'gdp': rng.normal(100, 20, 1000),
+        'empty': np.full(1000, np.nan),
+        'type': rng.choice(['城市', '乡镇', None], 1000),
+        'name': [f'p{i}' for i in range(1000)]
+    })
+    table.loc[::7, 'population'] = np.nan
+    manager = stats_manager(table)
+    stats = manager.get_table_statistics('point_features', group_columns=('type', 'province'), top_n=2)
+    expected = summarize_frame(table.drop(columns=['id']))
+
+    assert set(stats) == {'row_count', 'column_names', 'columns', 'groups'}
+    assert stats['row_count'] == 1000 and stats['column_names'] == list(table.columns)
+    assert set(stats['columns']) == {'population', 'gdp', 'empty'}
+    for col in ('population', 'gdp'):
+        actual, wanted = stats['columns'][col], expected['columns'][col]
+        assert set(actual) == set(wanted) and actual['count'] == wanted['count']
+        for key in ('mean', 'std', 'm2', 'min', 'max'):
+            assert np.isclose(actual[key], wanted[key]), (col, key)
+        assert all(np.isclose(actual['quantiles'][q], wanted['quantiles'][q]) for q in (0.25, 0.5, 0.75))
+        assert np.array_equal(actual['histogram'][0], wanted['histogram'][0])
+        assert np.allclose(actual['histogram'][1], wanted['histogram'][1])
+    empty = stats['columns']['empty']
+    assert empty['count'] == 0 and empty['histogram'] is None and np.isnan(empty['mean'])
+    assert sum('width_bucket' in query for query in manager.queries) == 2
+
+    groups = stats['groups']
+    assert list(groups) == ['type'] and len(groups['type']) == 2
+    assert groups['type'].to_dict() == table['type'].fillna('(空)').value_counts().head(2).to_dict()
+    print("✅ 数据库统计结果与内存统计一致")
+
+
+def test_histogram_bucket_clamping():
+    """测试width_bucket的0号桶和 bins+1 号桶分别并入第一个和最后一个桶"""
+    table = pd.DataFrame({'value': np.arange(11, dtype=float)})
+    manager = stats_manager(table)
+    counts, edges = manager._table_histogram('t', 'value', 2.0, 8.0, 3)
+    assert counts.tolist() == [4, 2, 5] and edges.tolist() == [2.0, 4.0, 6.0, 8.0]
+
+    counts, edges = manager._table_histogram('t', 'value', 0.0, 10.0, 5)
+    assert counts.tolist() == np.histogram(table['value'], bins=5)[0].tolist()
+
+    counts, edges = stats_manager(pd.DataFrame({'value': [3.0, 3.0]}))._table_histogram('t', 'value', 3.0, 3.0, 4)
+    assert counts.tolist() == [0, 0, 2, 0] and edges[0] == 2.5 and edges[-1] == 3.5
+    print("✅ 直方图端点桶合并正确")
+
+
+def test_zonal_column_prefix():
+    """测试分区统计结果列名前缀: 汉字、数字和下划线可用, 含引号等字符时在访问数据库前报错"""
+    rows = pd.DataFrame({'id': [3, 5], 'geom_wkb': shapely.to_wkb([shapely.box(110.1, 34.1, 110.5, 34.5),
+                                                                   shapely.box(110.5, 34.5, 110.9, 34.9)])})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'dem.tif'
+        with rasterio.open(path, 'w', driver='GTiff', width=100, height=100, count=1, dtype='float64',
+                           crs='EPSG:4326', transform=from_origin(110, 35, 0.01, 0.01)) as ds:
+            ds.write(np.arange(10000, dtype=float).reshape(100, 100), 1)
+
+        manager = fake_manager()
+        manager.engine = FakeEngine()
+        with mock.patch.object(database_config.pd, 'read_sql_query', return_value=rows):
+            assert manager.write_zonal_statistics('polygon_features', path, '高程_2', stats=['count', 'mean']) == 2
+        statements = [sql for sql, _ in manager.session.statements]
+        assert 'ADD COLUMN IF NOT EXISTS "高程_2_count" bigint' in statements[0]
+        assert '"高程_2_mean" double precision' in statements[1]
+        assert [record['id'] for record in manager.session.statements[2][1]] == [3, 5]
+
+        for prefix in ('a" = 0; DROP TABLE polygon_features; --', 'elev-1', 'a b', ''):
+            manager = fake_manager()
+            manager.engine = FakeEngine()
+            try:
+                manager.write_zonal_statistics('polygon_features', path, prefix)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"非法前缀应当报错: {prefix!r}")
+            assert manager.engine.connections == 0 and not manager.session.statements
+    print("✅ 分区统计列名前缀校验正常")
+
+
+if __name__ == '__main__':
+    test_geoparquet_import_srid()
+    test_query_all_pages()
+    test_query_nearest()
+    test_nearest_max_degrees()
+    test_nearest_paged_model()
+    test_table_statistics()
+    test_histogram_bucket_clamping()
+    test_zonal_column_prefix()
@@ -0,0 +1,70 @@
+"""
+测试点密度聚合: 核密度的总量和峰值、六边形分箱的归属和权重
+"""
+import sys
+sys.path.append('.')
+
+import math
+
+import numpy as np
+import pandas as pd
+import shapely
+from src.density import (COUNT_COLUMN, DENSITY_COLUMN, bin_counts, density_layer, hex_bin, hexbin_layer,
+                         kernel_density)
+
+
+def test_kernel_density_mass_and_peak():
+    """测试密度乘像元面积的总和等于权重和, 单个点的峰值符合高斯核"""
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(0, 5000, 20000), rng.normal(0, 3000, 20000)
+    weights = rng.random(20000) * 10
+    grid, bounds, _ = kernel_density(x, y, weights, bandwidth=1000, geographic=False, max_cells=250000)
+    cell_km2 = (bounds[2] - bounds[0]) / grid.shape[1] * (bounds[3] - bounds[1]) / grid.shape[0] / 1e6
+    assert np.isclose(grid.sum() * cell_km2, weights.sum(), rtol=1e-3)
+
+    bounds = (-5000, -5000, 5000, 5000)
+    single, _, _ = kernel_density([0.0], [0.0], bandwidth=1000, bounds=bounds, shape=(100, 100), geographic=False)
+    assert np.isclose(single.max(), 1e6 / (2 * math.pi * 1000 ** 2), rtol=0.05)
+    assert np.unravel_index(single.argmax(), single.shape) in [(49, 49), (49, 50), (50, 49), (50, 50)]
+
+    counts = bin_counts(np.array([0.5, 9.5, 9.5, 20.0]), np.array([9.5, 0.5, 0.5, 0.0]), (0, 0, 10, 10), (10, 10))
+    assert counts[0, 0] == 1 and counts[9, 9] == 2 and counts.sum() == 3
+    print("✅ 核密度总量和峰值正确")
+
+
+def test_hex_bin_membership():
+    """测试每个点落在最近中心的六边形内, 个数和权重按六边形汇总正确, 六边形互不重叠"""
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(-50000, 50000, 5000), rng.uniform(-30000, 30000, 5000)
+    weights = rng.random(5000)
+    hexagons, counts, sums = hex_bin(x, y, 4000, weights, geographic=False)
+    assert counts.sum() == 5000 and np.isclose(sums.sum(), weights.sum())
+    assert np.allclose(shapely.area(hexagons), 1.5 * math.sqrt(3) * 4000 ** 2)
+
+    # 六边形网格即六边形中心的泰森图: 每个点归属最近的中心
+    centers = shapely.centroid(hexagons)
+    distances = np.hypot(x[:, None] - shapely.get_x(centers), y[:, None] - shapely.get_y(centers))
+    assert np.array_equal(np.bincount(distances.argmin(axis=1), minlength=len(hexagons)), counts)
+    assert shapely.contains(hexagons[distances.argmin(axis=1)], shapely.points(x, y)).all()
+    assert np.isclose(shapely.union_all(hexagons).area, shapely.area(hexagons).sum())
+    print("✅ 六边形分箱正确")
+
+
+def test_layers_with_weights():
+    """测试城市图层按人口加权的密度栅格和六边形要素"""
+    cities = pd.read_csv('sample_data/cities_extended.csv')
+    layer = {'type': 'points', 'crs': 'EPSG:4326', 'data': cities}
+    grid, bounds, bandwidth = density_layer(layer, 'population', max_cells=40000)
+    assert grid.size <= 40000 and bandwidth > 0 and np.isnan(grid).any() and np.nanmax(grid) > 0
+
+    features = hexbin_layer(layer, 200000, 'population')
+    assert sum(f['properties'][COUNT_COLUMN] for f in features) == len(cities)
+    assert np.isclose(sum(f['properties']['population_sum'] for f in features), cities['population'].sum())
+    assert all(f['properties']['color'].startswith('#') and f['properties'][DENSITY_COLUMN] > 0 for f in features)
+    print("✅ 加权密度图层正常")
+
+
+if __name__ == '__main__':
+    test_kernel_density_mass_and_peak()
+    test_hex_bin_membership()
+    test_layers_with_weights()
@@ -0,0 +1,75 @@
+"""
+测试按属性融合面图层: 并行树形归约与直接合并一致、属性求和
+"""
+import sys
+sys.path.append('.')
+
+import json
+
+import numpy as np
+import shapely
+from src.dissolve import COUNT_COLUMN, dissolve_geometries, dissolve_layer
+
+
+def test_parallel_matches_serial():
+    """测试多进程树形归约与单进程合并的结果相同, 相邻方格的公共边被消去"""
+    x, y = np.meshgrid(np.arange(60), np.arange(50))
+    boxes = shapely.box(x.ravel(), y.ravel(), x.ravel() + 1, y.ravel() + 1)
+    groups = (y.ravel() // 10) * 2 + (x.ravel() >= 30)
+    groups[7] = -1
+    serial = dissolve_geometries(boxes, groups, max_workers=1)
+    parallel = dissolve_geometries(boxes, groups, max_workers=2)
+
+    assert len(parallel) == 10
+    assert all(shapely.equals(a, b) for a, b in zip(serial, parallel))
+    assert np.allclose(shapely.area(parallel), [299] + [300] * 9)
+    assert parallel[1].geom_type == 'Polygon' and parallel[1].length == 80
+    print("✅ 并行融合与直接合并一致")
+
+
+def test_dissolve_provinces():
+    """测试省界按类型融合, 人口和GDP按组求和"""
+    with open('sample_data/provinces.geojson', encoding='utf-8') as f:
+        features = json.load(f)['features']
+    layer = {'type': 'polygons', 'crs': 'EPSG:4326', 'data': features}
+    result = dissolve_layer(layer, 'type', ['population', 'gdp'])
+
+    types = {feature['properties']['type'] for feature in features}
+    assert {feature['properties']['type'] for feature in result} == types
+    for value in types:
+        members = [feature for feature in features if feature['properties']['type'] == value]
+        parts = [feature for feature in result if feature['properties']['type'] == value]
+        properties = parts[0]['properties']
+        assert properties[COUNT_COLUMN] == len(members) and properties['name'] == value
+        assert properties['population'] == sum(m['properties']['population'] for m in members)
+        assert np.isclose(properties['gdp'], sum(m['properties']['gdp'] for m in members))
+        expected = shapely.union_all([shapely.geometry.shape(m['geometry']) for m in members])
+        dissolved = shapely.union_all([shapely.geometry.shape(p['geometry']) for p in parts])
+        assert np.isclose(dissolved.area, expected.area)
+
+    summed = dissolve_layer(layer, 'type', True)
+    assert 'area' in summed[0]['properties']
+    print("✅ 省界按属性融合正常")
+
+
+def test_count_column_clash():
+    """测试分组列或求和列叫count时, 面的个数写入 count_1, 不覆盖原有的列"""
+    boxes = [shapely.box(i, 0, i + 1, 1) for i in range(6)]
+    features = [{'type': 'Feature', 'geometry': shapely.geometry.mapping(box),
+                 'properties': {'count': i // 3, 'count_1': 10, 'value': i}} for i, box in enumerate(boxes)]
+    layer = {'type': 'polygons', 'crs': 'EPSG:4326', 'data': features}
+
+    result = dissolve_layer(layer, 'count', ['value'])
+    assert sorted((f['properties']['count'], f['properties']['count_1'], f['properties']['value'])
+                  for f in result) == [(0, 3, 3), (1, 3, 12)]
+
+    result = dissolve_layer(layer, 'value', ['count', 'count_1'])
+    assert all(f['properties']['count_2'] == 1 and f['properties']['count_1'] == 10 for f in result)
+    assert sum(f['properties']['count'] for f in result) == 3 and len(result) == 6
+    print("✅ count列重名时改名正常")
+
+
+if __name__ == '__main__':
+    test_parallel_matches_serial()
+    test_dissolve_provinces()
+    test_count_column_clash()
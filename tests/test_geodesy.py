@@ -0,0 +1,35 @@
+"""
+测试球面几何的公用函数: 大圆距离和单位球面向量
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+from src.geodesy import EARTH_RADIUS, METERS_PER_DEGREE, haversine, unit_vectors
+
+
+def test_haversine():
+    """测试大圆距离: 已知城市间距离、1度纬度长度和数组广播"""
+    assert abs(haversine(116.4074, 39.9042, 121.4737, 31.2304) - 1067e3) < 3e3
+    assert abs(haversine(0, 10, 0, 11) - METERS_PER_DEGREE) < 1e-6
+    distances = haversine(np.array([[0.0], [90.0]]), 0.0, np.array([0.0, 180.0]), 0.0)
+    assert distances.shape == (2, 2)
+    assert np.allclose(distances, [[0, np.pi * EARTH_RADIUS], [np.pi / 2 * EARTH_RADIUS] * 2])
+    print("✅ 大圆距离正确")
+
+
+def test_unit_vectors():
+    """测试单位向量的弦长与大圆距离一致"""
+    rng = np.random.default_rng(0)
+    lon, lat = rng.uniform(-180, 180, (2, 100)), rng.uniform(-90, 90, (2, 100))
+    a, b = unit_vectors(lon[0], lat[0]), unit_vectors(lon[1], lat[1])
+    assert a.shape == (100, 3) and np.allclose(np.linalg.norm(a, axis=1), 1)
+    chord = np.linalg.norm(a - b, axis=1)
+    arc = 2 * EARTH_RADIUS * np.arcsin(chord / 2)
+    assert np.allclose(arc, haversine(lon[0], lat[0], lon[1], lat[1]), rtol=1e-9, atol=1e-6)
+    print("✅ 单位球面向量正确")
+
+
+if __name__ == '__main__':
+    test_haversine()
+    test_unit_vectors()
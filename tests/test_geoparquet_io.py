@@ -0,0 +1,119 @@
+"""
+测试GeoParquet读写
+"""
+import sys
+import json
+import tempfile
+from pathlib import Path
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+from src.geoparquet_io import write_layer_geoparquet, read_geoparquet, read_geo_metadata
+
+
+def test_points_roundtrip_with_bbox():
+    """测试点图层往返和bbox裁剪"""
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame({
+        'name': [f'点{i}' for i in range(n)],
+        'longitude': rng.uniform(73, 135, n),
+        'latitude': rng.uniform(18, 54, n),
+        'population': rng.integers(0, 1000000, n)
+    })
+    layer = {'name': '测试点', 'data': df, 'type': 'points'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'points.parquet'
+        write_layer_geoparquet(layer, path, row_group_size=500)
+
+        geo = read_geo_metadata(path)
+        assert geo['columns']['geometry']['encoding'] == 'WKB'
+        assert geo['columns']['geometry']['geometry_types'] == ['Point']
+
+        result = read_geoparquet(path)
+        assert len(result['points']) == n
+        assert set(result['points']['name']) == set(df['name'])
+
+        bbox = (100, 30, 110, 40)
+        result = read_geoparquet(path, bbox=bbox)
+        expected = df['longitude'].between(100, 110) & df['latitude'].between(30, 40)
+        assert len(result['points']) == expected.sum()
+        print(f"✅ bbox查询返回 {len(result['points'])} 个点")
+
+
+def test_polygons_roundtrip():
+    """测试面要素往返"""
+    with open('sample_data/provinces_simple.geojson', 'r', encoding='utf-8') as f:
+        features = json.load(f)['features']
+    layer = {'name': '省份', 'data': features, 'type': 'polygons'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'provinces.parquet'
+        write_layer_geoparquet(layer, path, spatial_sort=False)
+        result = read_geoparquet(path)
+
+    assert len(result['polygons']) == len(features)
+    assert result['polygons'][0]['properties']['name'] == features[0]['properties']['name']
+    print(f"✅ 面要素往返成功: {len(features)} 个")
+
+
+def test_covering_column_name():
+    """测试只丢弃元数据声明的覆盖列: 覆盖列不叫'bbox'时丢弃它, 用户的'bbox'列保留"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import shapely
+
+    geoms = shapely.points([110.0, 120.0], [30.0, 40.0])
+    bounds = shapely.bounds(geoms)
+    cover = pa.StructArray.from_arrays([pa.array(bounds[:, i]) for i in range(4)],
+                                       names=['xmin', 'ymin', 'xmax', 'ymax'])
+    user_bbox = pa.array(['A区', 'B区'])
+    wkb = pa.array(shapely.to_wkb(geoms), type=pa.binary())
+    column = {'encoding': 'WKB', 'geometry_types': ['Point']}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        covered = dict(column, covering={'bbox': {name: ['geom_bbox', name] for name in cover.type.names}})
+        table = pa.table({'bbox': user_bbox, 'geom_bbox': cover, 'geometry': wkb})
+        table = table.replace_schema_metadata({'geo': json.dumps(
+            {'version': '1.1.0', 'primary_column': 'geometry', 'columns': {'geometry': covered}})})
+        pq.write_table(table, Path(tmp) / 'covered.parquet')
+        points = read_geoparquet(Path(tmp) / 'covered.parquet', bbox=(115, 35, 125, 45))['points']
+        assert list(points.columns) == ['longitude', 'latitude', 'bbox'] and points['bbox'].tolist() == ['B区']
+
+        table = pa.table({'bbox': user_bbox, 'geometry': wkb}).replace_schema_metadata({'geo': json.dumps(
+            {'version': '1.0.0', 'primary_column': 'geometry', 'columns': {'geometry': column}})})
+        pq.write_table(table, Path(tmp) / 'plain.parquet')
+        points = read_geoparquet(Path(tmp) / 'plain.parquet')['points']
+        assert points['bbox'].tolist() == ['A区', 'B区']
+    print("✅ 覆盖列按元数据识别")
+
+
+def test_reserved_attribute_names():
+    """测试属性中有 'geometry' 和 'bbox' 列时改用其他列名写几何和覆盖列, 属性原样读回"""
+    features = [{'type': 'Feature',
+                 'geometry': {'type': 'Polygon', 'coordinates': [[[x, 30], [x + 1, 30], [x + 1, 31], [x, 30]]]},
+                 'properties': {'name': f'区{x}', 'geometry': '三角形', 'bbox': f'格{x}', '_geometry': x}}
+                for x in range(100, 110)]
+    layer = {'name': '保留列名', 'data': features, 'type': 'polygons'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'reserved.parquet'
+        write_layer_geoparquet(layer, path)
+        geo = read_geo_metadata(path)
+        assert geo['primary_column'] == '__geometry'
+        assert geo['columns']['__geometry']['covering']['bbox']['xmin'] == ['_bbox', 'xmin']
+
+        polygons = read_geoparquet(path)['polygons']
+        assert [f['properties'] for f in polygons] == [f['properties'] for f in features]
+        polygons = read_geoparquet(path, bbox=(104.5, 29, 105.5, 32))['polygons']
+        assert sorted(f['properties']['bbox'] for f in polygons) == ['格104', '格105']
+    print("✅ 与几何列同名的属性正常往返")
+
+
+if __name__ == '__main__':
+    test_points_roundtrip_with_bbox()
+    test_polygons_roundtrip()
+    test_covering_column_name()
+    test_reserved_attribute_names()
@@ -0,0 +1,59 @@
+"""
+测试地图点选查询: identify_at 用分页模型 (key_column='knn_rank') 从数据库逐页加载最近的k个要素
+"""
+import os
+import sys
+from contextlib import nullcontext
+from unittest import mock
+sys.path.append('.')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+from StudyGIS_demo import Enhanced3DMainWindow
+from src import database_config
+from src.database_config import KNN_PAGE_SIZE, DatabaseManager
+
+
+class FakeEngine:
+    def connect(self):
+        return nullcontext()
+
+
+def test_identify_two_pages():
+    """测试点选结果第一页立即加载, 滚动到末尾时加载第二页, 名次连续且不超过k"""
+    table = pd.DataFrame({'id': np.arange(500), 'distance_m': np.arange(500) * 5.0})
+    offsets = []
+
+    def read_sql_query(query, conn, params=None):
+        offsets.append(params['offset'])
+        return table.iloc[params['offset']:params['offset'] + params['limit']].reset_index(drop=True)
+
+    manager = DatabaseManager()
+    manager.engine = FakeEngine()
+    with mock.patch.object(Enhanced3DMainWindow, 'init_database'):
+        window = Enhanced3DMainWindow()
+    window.db_manager = manager
+    k = KNN_PAGE_SIZE + 10
+    window.identify_options = {'table': 'point_features', 'k': k, 'max_distance': None}
+
+    with mock.patch.object(database_config.pd, 'read_sql_query', side_effect=read_sql_query):
+        window.identify_at(116.4, 39.9)
+        model = window.identify_dialog.model
+        assert model.rowCount() == KNN_PAGE_SIZE and model.canFetchMore()
+        assert model.page_frame(0)['knn_rank'].tolist() == list(range(1, KNN_PAGE_SIZE + 1))
+        model.fetchMore()
+    assert model.rowCount() == k and not model.canFetchMore()
+    assert model.page_frame(1)['knn_rank'].tolist() == list(range(KNN_PAGE_SIZE + 1, k + 1))
+    assert offsets == [0, KNN_PAGE_SIZE]
+    assert f"最近的 {k} 个要素" in window.identify_dialog.info_label.text()
+    window.identify_dialog.close()
+    print("✅ 点选查询分两页加载正常")
+
+
+if __name__ == '__main__':
+    test_identify_two_pages()
@@ -0,0 +1,138 @@
+"""
+测试反距离加权插值: 与逐点暴力计算一致、分块/并行结果相同、自动分辨率和栅格输出
+"""
+import sys
+sys.path.append('.')
+
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import rasterio
+from src.geodesy import haversine
+from src.interpolation import (cached_grid_path, grid_centers, grid_shape, grid_value_range, idw_grid,
+                               interpolate_layer, prune_grid_cache, surface_trace, write_grid_raster)
+
+
+def _brute_force(x, y, values, gx, gy, k, power, geographic):
+    """逐像元计算到所有点的距离, 取最近k个加权"""
+    if geographic:
+        distances = haversine(gx[:, None], gy[:, None], x, y)
+    else:
+        distances = np.hypot(gx[:, None] - x, gy[:, None] - y)
+    nearest = np.argsort(distances, axis=1)[:, :k]
+    d = np.take_along_axis(distances, nearest, axis=1)
+    weights = 1.0 / d ** power
+    return (weights * values[nearest]).sum(axis=1) / weights.sum(axis=1)
+
+
+def test_matches_brute_force():
+    """测试经纬度和平面坐标的结果与暴力计算一致, 与点重合的像元取点的值"""
+    rng = np.random.default_rng(0)
+    x, y, values = rng.uniform(100, 120, 300), rng.uniform(20, 40, 300), rng.random(300) * 100
+    bounds, shape = (100, 20, 120, 40), (37, 53)
+    xs, ys = grid_centers(bounds, shape)
+    gx, gy = (v.ravel() for v in np.meshgrid(xs, ys))
+    for geographic in (True, False):
+        grid = idw_grid(x, y, values, bounds, shape, k=8, power=2, geographic=geographic)
+        expected = _brute_force(x, y, values, gx, gy, 8, 2, geographic)
+        assert np.allclose(grid.ravel(), expected, rtol=1e-9)
+
+    x[0], y[0] = xs[5], ys[3]
+    grid = idw_grid(x, y, values, bounds, shape, k=8)
+    assert grid[3, 5] == values[0]
+    print("✅ IDW插值与暴力计算一致")
+
+
+def test_tiles_parallel_and_max_distance():
+    """测试分块、多进程结果与单块相同, 超出最大距离的像元为NaN"""
+    rng = np.random.default_rng(1)
+    x, y, values = rng.uniform(0, 1000, 200), rng.uniform(0, 1000, 200), rng.random(200)
+    values[5] = np.nan
+    bounds, shape = (0, 0, 1000, 1000), (130, 170)
+    whole = idw_grid(x, y, values, bounds, shape, geographic=False, tile_size=1000)
+    tiled = idw_grid(x, y, values, bounds, shape, geographic=False, tile_size=32, max_workers=2)
+    assert np.array_equal(whole, tiled) and np.isfinite(whole).all()
+
+    sparse = idw_grid([100.0], [100.0], [1.0], bounds, shape, max_distance=200, geographic=False)
+    assert np.nanmax(sparse) == 1.0 and np.isnan(sparse[0, -1])
+    print("✅ 分块并行和最大距离正常")
+
+
+def test_layer_raster_and_surface():
+    """测试城市图层按人口插值: 自动分辨率、GeoTIFF输出和Plotly Surface"""
+    cities = pd.read_csv('sample_data/cities_extended.csv')
+    column = 'population'
+    layer = {'type': 'points', 'crs': 'EPSG:4326', 'data': cities}
+    grid, bounds = interpolate_layer(layer, column, max_cells=20000)
+    assert grid.size <= 20000 and np.isfinite(grid).all()
+    assert np.nanmin(grid) >= cities[column].min() and np.nanmax(grid) <= cities[column].max()
+
+    rows, cols = grid_shape((100, 20, 120, 40), 10000, geographic=True)
+    assert rows * cols <= 10000 and cols < rows
+
+    path = Path(tempfile.mkdtemp()) / 'idw.tif'
+    write_grid_raster(path, grid, bounds)
+    with rasterio.open(path) as ds:
+        assert (ds.height, ds.width) == grid.shape and ds.crs.to_epsg() == 4326
+        assert np.allclose(ds.read(1), grid, rtol=1e-6)
+    assert grid_value_range(path) == (float(grid.min()), float(grid.max()))
+
+    trace = surface_trace(grid, bounds, column)
+    assert trace.type == 'surface' and np.asarray(trace.z).shape == grid.shape
+    print("✅ 图层插值、栅格输出和Surface正常")
+
+
+def test_cached_grid_path():
+    """测试缓存路径按图层内容和参数区分: 同样的数据 (不同的图层对象) 得到同一路径"""
+    cities = pd.read_csv('sample_data/cities_extended.csv')
+    layer = {'type': 'points', 'data': cities}
+    path = cached_grid_path('cache', layer, 'idw', column='population', k=12)
+    assert path == cached_grid_path('cache', layer, 'idw', k=12, column='population')
+    assert path.parent == Path('cache') and path.name.startswith('idw_') and path.suffix == '.tif'
+
+    # 重新导入 (新的图层对象和版本号) 时复用同一文件
+    other = {'type': 'points', 'data': cities.copy(), 'version': 3}
+    assert cached_grid_path('cache', other, 'idw', column='population', k=12) == path
+    assert cached_grid_path('cache', layer, 'idw', column='population', k=8) != path
+    assert cached_grid_path('cache', layer, 'kde', column='population', k=12) != path
+    other['data'] = cities.head(10)
+    assert cached_grid_path('cache', other, 'idw', column='population', k=12) != path
+    changed = cities.copy()
+    changed.loc[0, 'population'] += 1
+    other['data'] = changed
+    assert cached_grid_path('cache', other, 'idw', column='population', k=12) != path
+    # 未参与计算的列不影响路径
+    changed = cities.copy()
+    changed['extra'] = 1
+    other['data'] = changed
+    assert cached_grid_path('cache', other, 'idw', column='population', k=12) == path
+    print("✅ 插值缓存路径正确")
+
+
+def test_prune_grid_cache():
+    """测试缓存目录超过容量上限时按修改时间删除最旧的文件, 保留正在使用的文件"""
+    cache_dir = Path(tempfile.mkdtemp())
+    paths = []
+    for i in range(4):
+        path = cache_dir / f"idw_{i}.tif"
+        path.write_bytes(b'0' * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(path)
+    (cache_dir / 'idw_4.part.tif').write_bytes(b'0' * 1000)
+
+    assert prune_grid_cache(cache_dir, max_bytes=400) == 0
+    assert prune_grid_cache(cache_dir, max_bytes=250, keep=[paths[0]]) == 1
+    assert [path.exists() for path in paths] == [True, False, True, True]
+    assert (cache_dir / 'idw_4.part.tif').exists()
+    print("✅ 网格缓存容量上限正常")
+
+
+if __name__ == '__main__':
+    test_matches_brute_force()
+    test_tiles_parallel_and_max_distance()
+    test_layer_raster_and_surface()
+    test_cached_grid_path()
+    test_prune_grid_cache()
@@ -0,0 +1,118 @@
+"""
+测试图层磁盘缓存
+"""
+import sys
+import json
+import tempfile
+from pathlib import Path
+sys.path.append('.')
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from src.layer_cache import LayerCache
+
+
+def test_cache_roundtrip():
+    """测试缓存命中和文件修改后失效"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        csv_file = tmp / 'cities.csv'
+        df = pd.DataFrame({'name': ['北京', '上海'], 'longitude': [116.4, 121.5], 'latitude': [39.9, 31.2]})
+        df.to_csv(csv_file, index=False)
+
+        cache = LayerCache(tmp / 'cache')
+        assert cache.get(csv_file) is None
+
+        cache.put(csv_file, {'crs': 'EPSG:4326', 'points': df, 'lines': [], 'polygons': []})
+        result = cache.get(csv_file)
+        assert list(result['points']['name']) == ['北京', '上海']
+
+        # 内容变化后缓存失效
+        df.assign(latitude=[40.0, 31.0]).to_csv(csv_file, index=False)
+        assert cache.get(csv_file) is None
+    print("✅ 点图层缓存正常")
+
+
+def test_cache_lines_and_eviction():
+    """测试线要素缓存和LRU淘汰"""
+    with open('sample_data/rivers_simple.geojson', 'r', encoding='utf-8') as f:
+        features = json.load(f)['features']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        files = []
+        for i in range(2):
+            path = tmp / f'rivers_{i}.geojson'
+            path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features[i:]}), encoding='utf-8')
+            files.append(path)
+
+        cache = LayerCache(tmp / 'cache', max_bytes=1)
+        cache.put(files[0], {'crs': 'EPSG:4326', 'points': None, 'lines': features, 'polygons': []})
+        result = cache.get(files[0])
+        assert len(result['lines']) == len(features)
+        assert result['lines'][0]['geometry']['coordinates'][0] == features[0]['geometry']['coordinates'][0]
+
+        # 容量上限很小, 写入新条目后旧条目被淘汰
+        cache.put(files[1], {'crs': 'EPSG:4326', 'points': None, 'lines': features[1:], 'polygons': []})
+        assert cache.get(files[0]) is None
+        assert cache.get(files[1]) is not None
+    print("✅ 线要素缓存和LRU淘汰正常")
+
+
+def test_cache_sidecar():
+    """测试附加文件随缓存条目保存, 文件内容变化后不再返回"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        csv_file = tmp / 'cities.csv'
+        df = pd.DataFrame({'name': ['北京'], 'longitude': [116.4], 'latitude': [39.9]})
+        df.to_csv(csv_file, index=False)
+
+        cache = LayerCache(tmp / 'cache')
+        assert not cache.put_sidecar(csv_file, 'extra.bin', lambda path: path.write_bytes(b'1'))
+        cache.put(csv_file, {'crs': 'EPSG:4326', 'points': df, 'lines': [], 'polygons': []})
+        assert cache.get_sidecar(csv_file, 'extra.bin') is None
+        assert cache.put_sidecar(csv_file, 'extra.bin', lambda path: path.write_bytes(b'1'))
+        assert cache.get_sidecar(csv_file, 'extra.bin').read_bytes() == b'1'
+
+        df.assign(latitude=[40.0]).to_csv(csv_file, index=False)
+        assert cache.get_sidecar(csv_file, 'extra.bin') is None
+    print("✅ 缓存附加文件正常")
+
+
+def _put_files(cache_dir, paths):
+    """在子进程中把一组CSV写入同一个缓存目录"""
+    cache = LayerCache(cache_dir)
+    for path in paths:
+        cache.put(path, {'crs': 'EPSG:4326', 'points': pd.read_csv(path), 'lines': [], 'polygons': []})
+        cache.get(path)
+    return len(paths)
+
+
+def test_cache_shared_by_processes():
+    """测试多个进程同时写同一个缓存目录时索引不丢失条目"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        paths = []
+        for i in range(40):
+            path = tmp / f'points_{i}.csv'
+            pd.DataFrame({'id': [i], 'longitude': [100.0 + i], 'latitude': [30.0]}).to_csv(path, index=False)
+            paths.append(str(path))
+
+        groups = [paths[i::4] for i in range(4)]
+        with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('spawn')) as executor:
+            assert sum(executor.map(_put_files, [tmp / 'cache'] * 4, groups)) == 40
+
+        index = json.loads((tmp / 'cache' / 'index.json').read_text(encoding='utf-8'))
+        assert len(index['entries']) == 40 and len(index['sources']) == 40
+        cache = LayerCache(tmp / 'cache')
+        assert all(cache.get(path)['points']['id'][0] == i for i, path in enumerate(paths))
+    print("✅ 多进程共享缓存索引正常")
+
+
+if __name__ == '__main__':
+    test_cache_roundtrip()
+    test_cache_lines_and_eviction()
+    test_cache_sidecar()
+    test_cache_shared_by_processes()
@@ -0,0 +1,93 @@
+"""
+测试图层统计服务的缓存和增量更新
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+from src.layer_stats import LayerStatsService, VersionedLayerCache, summarize_frame
+
+
+def make_layer(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'name': [f'p{i}' for i in range(n)],
+        'value': rng.normal(10, 3, n),
+        'count': rng.integers(0, 100, n)
+    })
+    return {'name': '测试', 'data': data, 'type': 'points', 'visible': True}
+
+
+def test_summary_matches_pandas():
+    """测试向量化统计结果与pandas逐列计算一致"""
+    layer = make_layer()
+    layer['data'].loc[3, 'value'] = np.nan
+    stats = summarize_frame(layer['data'])
+    for col in ['value', 'count']:
+        series = layer['data'][col]
+        assert stats['columns'][col]['count'] == series.count()
+        assert np.isclose(stats['columns'][col]['mean'], series.mean())
+        assert np.isclose(stats['columns'][col]['std'], series.std())
+        assert np.isclose(stats['columns'][col]['quantiles'][0.5], series.median())
+    assert 'name' not in stats['columns']
+    print("✅ 统计结果正确")
+
+
+def test_cache_by_version():
+    """测试版本不变时返回缓存, 版本变化后重新计算"""
+    service = LayerStatsService()
+    layer = make_layer()
+    first = service.get(layer)
+    assert service.get(layer) is first
+
+    layer['data'] = layer['data'].head(10)
+    layer['version'] = 1
+    assert service.get(layer)['row_count'] == 10
+    print("✅ 按版本缓存正常")
+
+
+def test_append_rows():
+    """测试追加行时增量合并的结果与全量计算一致"""
+    service = LayerStatsService()
+    layer = make_layer(1000)
+    service.get(layer)
+
+    extra = make_layer(200, seed=1)['data']
+    extra['value'] = extra['value'].clip(layer['data']['value'].min(), layer['data']['value'].max())
+    merged = service.append_rows(layer, extra)
+    full = summarize_frame(layer['data'])
+
+    assert merged['row_count'] == 1200
+    assert layer['version'] == 1
+    for col in ['value', 'count']:
+        assert np.isclose(merged['columns'][col]['mean'], full['columns'][col]['mean'])
+        assert np.isclose(merged['columns'][col]['std'], full['columns'][col]['std'])
+        assert merged['columns'][col]['histogram'][0].sum() == full['columns'][col]['count']
+    assert service.get(layer) is merged
+    print("✅ 增量更新正常")
+
+
+def test_lru_eviction():
+    """测试超过 max_layers 时丢弃最久未使用的图层, 替换数据对象也使缓存失效"""
+    cache = VersionedLayerCache(max_layers=2)
+    layers = [make_layer(10, seed=i) for i in range(3)]
+    cache._store(layers[0], 'a')
+    cache._store(layers[1], 'b')
+    assert cache._cached(layers[0]) == 'a'
+    cache._store(layers[2], 'c')
+    assert cache._cached(layers[1]) is None
+    assert cache._cached(layers[0]) == 'a' and cache._cached(layers[2]) == 'c'
+
+    layers[0]['data'] = layers[0]['data'].copy()
+    assert cache._cached(layers[0]) is None
+    cache.invalidate()
+    assert cache._cached(layers[2]) is None
+    print("✅ LRU淘汰正常")
+
+
+if __name__ == '__main__':
+    test_summary_matches_pandas()
+    test_cache_by_version()
+    test_append_rows()
+    test_lru_eviction()
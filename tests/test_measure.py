@@ -0,0 +1,120 @@
+"""
+测试测量: 椭球面长度和面积、分块距离矩阵和最近k个要素
+"""
+import sys
+sys.path.append('.')
+
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+from src.geodesy import haversine
+from src.measure import (AREA_COLUMN, LENGTH_COLUMN, PERIMETER_COLUMN, distance_matrix, geodesic_areas,
+                         geodesic_lengths, measure_layer, nearest_k, nearest_table)
+
+GEOD = pyproj.Geod(ellps='WGS84')
+
+
+def _points(n, seed):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(100, 125, n), rng.uniform(20, 45, n)
+
+
+def test_lengths_and_areas():
+    """测试长度和面积与pyproj逐个几何计算一致, 包括内环、多部件和投影坐标系"""
+    with open('sample_data/provinces.geojson', encoding='utf-8') as f:
+        provinces = shapely.from_geojson([json.dumps(feature['geometry']) for feature in json.load(f)['features']])
+    # 内环与外环同向, 面积计算不应依赖环的方向 (pyproj按方向计符号, 对比时先调整方向)
+    holed = shapely.Polygon(shapely.box(100, 30, 110, 40).segmentize(0.5).exterior.coords,
+                            [shapely.box(102, 32, 104, 34).exterior.coords])
+    multi = shapely.MultiPolygon([shapely.box(120, 20, 121, 21), shapely.box(122, 22, 123, 23)])
+    geoms = np.concatenate([provinces, [holed, multi]])
+
+    expected = [GEOD.geometry_area_perimeter(shapely.geometry.polygon.orient(geom) if geom.geom_type == 'Polygon'
+                                             else geom)[0] for geom in geoms]
+    assert np.allclose(geodesic_areas(geoms), np.abs(expected), rtol=1e-5)
+    # 周长包括内环 (与shapely的length一致)
+    assert np.allclose(geodesic_lengths(geoms), [GEOD.geometry_length(geom.boundary) for geom in geoms], rtol=1e-9)
+
+    lines = shapely.linestrings([[[116, 40], [121, 31], [113, 23]]])
+    mixed = np.array([lines[0], shapely.Point(116, 40), None])
+    assert np.isclose(geodesic_lengths(mixed)[0], GEOD.geometry_length(lines[0]))
+    assert list(geodesic_lengths(mixed)[1:]) == [0, 0] and list(geodesic_areas(mixed)) == [0, 0, 0]
+
+    to_utm = pyproj.Transformer.from_crs('EPSG:4326', 'EPSG:32650', always_xy=True)
+    projected = shapely.transform(holed, lambda c: np.column_stack(to_utm.transform(c[:, 0], c[:, 1])))
+    assert np.isclose(geodesic_areas([projected], crs='EPSG:32650')[0], geodesic_areas([holed])[0], rtol=1e-3)
+    print("✅ 长度和面积计算正确")
+
+
+def test_distance_matrix_blocks():
+    """测试分块距离矩阵与直接计算一致, 以及写入 .npy 文件"""
+    a, b = _points(500, 0), _points(700, 1)
+    expected = haversine(a[0][:, None], a[1][:, None], b[0], b[1])
+    matrix = distance_matrix(a, b, block_rows=64)
+    assert matrix.shape == (500, 700) and np.allclose(matrix, expected, rtol=0, atol=0.1)
+
+    path = Path(tempfile.mkdtemp()) / 'distances.npy'
+    distance_matrix(a, b, path=path, block_rows=100)
+    assert np.allclose(np.load(path), matrix)
+
+    geodesic = distance_matrix((a[0][:20], a[1][:20]), b, method='geodesic')
+    assert np.allclose(geodesic, expected[:20], rtol=0.005)
+    print("✅ 距离矩阵分块计算正确")
+
+
+def test_nearest_k():
+    """测试每行最近的k个与完整矩阵排序一致, 排除自身和点数不足k个"""
+    a, b = _points(800, 2), _points(3000, 3)
+    full = haversine(a[0][:, None], a[1][:, None], b[0], b[1])
+    indices, distances = nearest_k(a, b, k=4, block_rows=100)
+    assert np.array_equal(indices, np.argsort(full, axis=1)[:, :4])
+    assert np.allclose(distances, np.sort(full, axis=1)[:, :4])
+
+    geodesic = nearest_k(a, b, k=4, method='geodesic', block_rows=100)[0]
+    assert (geodesic[:, 0] == indices[:, 0]).mean() > 0.98
+
+    self_indices, _ = nearest_k(a, a, k=2, exclude_self=True)
+    assert (self_indices != np.arange(800)[:, None]).all()
+
+    few, few_distances = nearest_k(a, (b[0][:2], b[1][:2]), k=3)
+    assert (few[:, 2] == -1).all() and np.isinf(few_distances[:, 2]).all()
+    print("✅ 最近k个要素正确")
+
+
+def test_layer_columns_and_table():
+    """测试测量结果写入图层属性列, 以及最近要素表"""
+    with open('sample_data/rivers.geojson', encoding='utf-8') as f:
+        rivers = {'name': '河流', 'type': 'lines', 'crs': 'EPSG:4326', 'data': json.load(f)['features']}
+    table = measure_layer(rivers)
+    assert list(table.columns) == [LENGTH_COLUMN] and rivers['version'] == 1
+    geoms = [shapely.geometry.shape(feature['geometry']) for feature in rivers['data']]
+    assert np.isclose(rivers['data'][0]['properties'][LENGTH_COLUMN], GEOD.geometry_length(geoms[0]) / 1e3,
+                      atol=1e-3)
+
+    square = shapely.box(110, 30, 111, 31)
+    provinces = {'type': 'polygons', 'data': [{'type': 'Feature', 'properties': {'name': '方块'},
+                                               'geometry': shapely.geometry.mapping(square)}]}
+    measure_layer(provinces)
+    properties = provinces['data'][0]['properties']
+    assert np.isclose(properties[AREA_COLUMN], abs(GEOD.geometry_area_perimeter(square)[0]) / 1e6, atol=1e-3)
+    assert PERIMETER_COLUMN in properties
+
+    cities = {'type': 'points', 'data': pd.read_csv('sample_data/cities_extended.csv')}
+    nearest = nearest_table(cities, cities, k=2)
+    assert len(nearest) == 2 * len(cities['data'])
+    beijing = nearest[nearest['left_name'] == '北京']
+    assert list(beijing['rank']) == [1, 2] and beijing['right_name'].iloc[0] == '天津'
+    assert abs(beijing['distance_km'].iloc[0] - 111) < 2
+    print("✅ 图层测量和最近要素表正常")
+
+
+if __name__ == '__main__':
+    test_lengths_and_areas()
+    test_distance_matrix_blocks()
+    test_nearest_k()
+    test_layer_columns_and_table()
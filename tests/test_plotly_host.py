@@ -0,0 +1,44 @@
+"""
+测试Plotly宿主页面和图形脚本生成
+"""
+import sys
+import json
+import tempfile
+sys.path.append('.')
+
+import numpy as np
+import plotly.graph_objects as go
+from src.plotly_host import write_host_page, figure_script
+
+
+def test_host_page():
+    """测试宿主页面引用本地plotly.js"""
+    with tempfile.TemporaryDirectory() as tmp:
+        page = write_host_page(tmp).read_text(encoding='utf-8')
+    assert 'function renderFigure' in page
+    assert 'Plotly.react' in page
+    assert 'plotly.min.js' in page
+    print("✅ 宿主页面正常")
+
+
+def test_figure_script():
+    """测试大数组以二进制编码传输"""
+    x = np.random.rand(100000)
+    fig = go.Figure(go.Scatter3d(x=x, y=x, z=x, mode='markers'))
+    script = figure_script(fig, {'responsive': True}, template=False)
+    assert script.startswith('renderFigure(') and script.endswith(');')
+
+    payload = json.loads(script[len('renderFigure('):-2])
+    assert payload['config'] == {'responsive': True}
+    assert 'bdata' in payload['data'][0]['x']
+    assert 'template' not in payload['layout']
+    # base64编码约为每个float64 10.7个字符, 远小于文本形式
+    assert len(script) < 100000 * 3 * 12
+
+    assert figure_script(fig).startswith('setTemplate(')
+    print("✅ 图形脚本正常")
+
+
+if __name__ == '__main__':
+    test_host_page()
+    test_figure_script()
@@ -0,0 +1,94 @@
+"""
+测试点图层计数金字塔: 逐级汇总、范围统计、增量追加和保存读取
+"""
+import sys
+sys.path.append('.')
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from src.layer_stats import stats_service
+from src.point_pyramid import PointPyramid, PyramidService, key_xy, tile_bounds, tile_keys, tile_xy
+
+
+def make_frame(n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'longitude': rng.uniform(100, 125, n), 'latitude': rng.uniform(20, 45, n),
+        'population': rng.integers(0, 1000, n).astype(float), 'name': [f'p{i}' for i in range(n)]
+    })
+
+
+def test_levels_match_points():
+    """测试每一级的点数和列之和与直接按瓦片分组一致, Morton键可以还原行列号"""
+    frame = make_frame(20000, 0)
+    frame.loc[3, 'population'] = np.nan
+    frame.loc[5, 'longitude'] = np.nan
+    pyramid = PointPyramid.from_frame(frame)
+    assert pyramid.columns == ['population'] and pyramid.row_count == 20000 and pyramid.point_count == 19999
+
+    valid = frame.dropna(subset=['longitude'])
+    for zoom in (0, 5, 11, 16):
+        x, y = tile_xy(valid['longitude'], valid['latitude'], zoom)
+        expected = valid.groupby([x, y])['population'].agg(['size', 'sum'])
+        tiles = pyramid.tiles(zoom).set_index(['x', 'y'])
+        assert len(tiles) == len(expected)
+        assert np.array_equal(tiles.loc[expected.index, 'count'].to_numpy(), expected['size'].to_numpy())
+        assert np.allclose(tiles.loc[expected.index, 'population_sum'].to_numpy(), expected['sum'].to_numpy())
+
+    x, y = np.array([0, 5, 65535]), np.array([7, 0, 65535])
+    assert all(np.array_equal(a, b) for a, b in zip(key_xy(tile_keys(x, y)), (x, y)))
+    zoom = pyramid.choose_zoom(100)
+    assert len(pyramid.levels[zoom][0]) <= 100 < len(pyramid.levels[zoom + 1][0])
+    print("✅ 金字塔逐级汇总正确")
+
+
+def test_bbox_summary():
+    """测试范围统计与按最细瓦片中心判断的暴力计算一致, 且接近按点判断的结果"""
+    frame = make_frame(50000, 1)
+    pyramid = PointPyramid.from_frame(frame)
+    x, y = tile_xy(frame['longitude'], frame['latitude'], 16)
+    west, south, east, north = tile_bounds(x, y, 16)
+    center_x, center_y = (west + east) / 2, (south + north) / 2
+    for bbox in [(110.3, 25.7, 118.9, 33.1), (90, 0, 130, 50), (124.99, 44.99, 126, 46), (0, 0, 1, 1)]:
+        summary = pyramid.bbox_summary(bbox)
+        inside = (center_x >= bbox[0]) & (center_x <= bbox[2]) & (center_y >= bbox[1]) & (center_y <= bbox[3])
+        assert summary['count'] == inside.sum()
+        assert np.isclose(summary['sums']['population'], frame['population'][inside].sum())
+        exact = frame['longitude'].between(bbox[0], bbox[2]) & frame['latitude'].between(bbox[1], bbox[3])
+        assert abs(summary['count'] - exact.sum()) <= max(10, exact.sum() * 0.01)
+    print("✅ 范围统计正确")
+
+
+def test_append_and_persist():
+    """测试追加点与整体重建一致, 服务同时更新统计结果, 保存后读取一致"""
+    first, second = make_frame(5000, 2), make_frame(3000, 3)
+    layer = {'name': '测试', 'type': 'points', 'data': first}
+    service = PyramidService()
+    service.get(layer)
+    stats_service.get(layer)
+    pyramid = service.append_rows(layer, second)
+    assert len(layer['data']) == 8000 and stats_service.get(layer)['row_count'] == 8000
+    assert service.get(layer) is pyramid
+
+    rebuilt = PointPyramid.from_frame(pd.concat([first, second], ignore_index=True))
+    for zoom in (0, 8, 16):
+        assert all(np.array_equal(a, b) for a, b in zip(pyramid.levels[zoom][:2], rebuilt.levels[zoom][:2]))
+        assert np.allclose(pyramid.levels[zoom][2], rebuilt.levels[zoom][2])
+
+    path = Path(tempfile.mkdtemp()) / 'pyramid.npz'
+    pyramid.save(path)
+    loaded = PointPyramid.load(path)
+    assert loaded.columns == pyramid.columns and loaded.row_count == 8000
+    assert loaded.bbox_summary((105, 25, 115, 35)) == pyramid.bbox_summary((105, 25, 115, 35))
+    other = {'name': '其他', 'type': 'points', 'data': first}
+    assert not service.attach(other, loaded) and service.attach(layer, loaded)
+    print("✅ 增量追加和保存读取正常")
+
+
+if __name__ == '__main__':
+    test_levels_match_points()
+    test_bbox_summary()
+    test_append_and_persist()
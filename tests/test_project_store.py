@@ -0,0 +1,120 @@
+"""
+测试项目文件的延迟加载和增量保存
+"""
+import sys
+import json
+import tempfile
+from pathlib import Path
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+from src import project_store
+from src.raster_layer import RasterSource
+from src.tin import TIN
+
+
+def make_layers():
+    """构造一个点图层和一个线图层"""
+    points = pd.DataFrame({
+        'name': ['北京', '上海'],
+        'longitude': [116.4074, 121.4737],
+        'latitude': [39.9042, 31.2304],
+        'population': [21540000, 24280000]
+    })
+    with open('sample_data/rivers_simple.geojson', 'r', encoding='utf-8') as f:
+        lines = json.load(f)['features']
+    return [
+        {'name': '城市', 'data': points, 'type': 'points', 'visible': True},
+        {'name': '河流', 'data': lines, 'type': 'lines', 'visible': False}
+    ]
+
+
+def test_incremental_save():
+    """测试只重写发生变化的图层"""
+    layers = make_layers()
+    with tempfile.TemporaryDirectory() as tmp:
+        project_dir = Path(tmp) / 'demo.sgproj'
+
+        assert project_store.save_project(project_dir, layers) == {'written': 2, 'reused': 0, 'skipped': []}
+        assert project_store.save_project(project_dir, layers) == {'written': 0, 'reused': 2, 'skipped': []}
+
+        layers[0]['version'] = 1
+        assert project_store.save_project(project_dir, layers) == {'written': 1, 'reused': 1, 'skipped': []}
+
+        # 移除图层后, 对应文件被清理
+        project_store.save_project(project_dir, layers[:1])
+        assert len(list((project_dir / project_store.LAYER_DIR).glob('*.parquet'))) == 1
+    print("✅ 增量保存正常")
+
+
+def test_lazy_open():
+    """测试打开项目时不读取图层数据"""
+    layers = make_layers()
+    with tempfile.TemporaryDirectory() as tmp:
+        project_dir = Path(tmp) / 'demo.sgproj'
+        project_store.save_project(project_dir, layers)
+
+        manifest, opened = project_store.open_project(project_dir / project_store.MANIFEST_NAME)
+        assert [layer['name'] for layer in opened] == ['城市', '河流']
+        assert not any(layer.loaded for layer in opened)
+        assert opened[1]['visible'] is False
+
+        points = opened[0]['data']
+        assert opened[0].loaded
+        assert list(points['name']) == ['北京', '上海']
+        assert len(opened[1]['data']) == len(layers[1]['data'])
+    print("✅ 延迟加载正常")
+
+
+def write_raster(path):
+    with rasterio.open(path, 'w', driver='GTiff', width=20, height=10, count=1, dtype='float32',
+                       crs='EPSG:4326', transform=from_origin(110, 35, 0.1, 0.1)) as ds:
+        ds.write(np.arange(200, dtype='float32').reshape(10, 20), 1)
+
+
+def test_tin_and_raster_layers():
+    """测试TIN和栅格图层随项目保存: 生成的栅格复制到项目中, 导入的栅格记录源路径, 不支持的图层报告给调用者"""
+    rng = np.random.default_rng(0)
+    tin = TIN(rng.uniform(0, 10, 200), rng.uniform(0, 10, 200), rng.uniform(0, 100, 200), crs='EPSG:4326')
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_raster(tmp / 'dem.tif')
+        write_raster(tmp / 'idw.tif')
+        layers = [
+            {'name': '三角网', 'data': tin, 'type': 'tin', 'visible': True, 'crs': 'EPSG:4326'},
+            {'name': 'DEM', 'data': RasterSource(tmp / 'dem.tif'), 'type': 'raster', 'visible': True},
+            {'name': '插值', 'data': RasterSource(tmp / 'idw.tif', cmap='viridis', value_range=(0, 50)),
+             'type': 'raster', 'visible': True, 'generated': True},
+            {'name': '图表', 'data': None, 'type': 'chart'}
+        ]
+        project_dir = tmp / 'demo.sgproj'
+        stats = project_store.save_project(project_dir, layers)
+        assert stats == {'written': 2, 'reused': 1, 'skipped': ['图表']}
+        (tmp / 'idw.tif').unlink()
+
+        manifest, opened = project_store.open_project(project_dir)
+        assert [layer['type'] for layer in opened] == ['tin', 'raster', 'raster']
+        loaded = opened[0]['data']
+        assert np.array_equal(loaded.triangles, tin.triangles) and np.array_equal(loaded.z, tin.z)
+        loaded.add_points([5.0], [5.0], [50.0])
+        assert loaded.vertex_count == 201
+
+        assert opened[1]['data'].path == str((tmp / 'dem.tif').resolve())
+        generated = opened[2]['data']
+        assert Path(generated.path).parent == project_dir / project_store.LAYER_DIR
+        assert generated.cmap == 'viridis' and generated.value_range == [(0, 50)]
+
+        other = tmp / 'copy.sgproj'
+        assert project_store.save_project(other, opened[1:]) == {'written': 1, 'reused': 1, 'skipped': []}
+        files = sorted(path.suffix for path in (other / project_store.LAYER_DIR).iterdir())
+        assert files == ['.tif']
+    print("✅ TIN和栅格图层保存正常")
+
+
+if __name__ == '__main__':
+    test_incremental_save()
+    test_lazy_open()
+    test_tin_and_raster_layers()
@@ -0,0 +1,126 @@
+"""
+测试栅格图层的概视生成、窗口读取和瓦片缓存
+"""
+import sys
+sys.path.append('.')
+
+import io
+import math
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from PIL import Image
+from src import raster_layer
+from src.raster_layer import (EMPTY_TILE, RasterSource, TileCache, get_tile, parse_tile_path,
+                              register_source, tile_cache)
+
+
+def _write_dem(path, width=1200, height=1000):
+    rows, cols = np.mgrid[0:height, 0:width]
+    z = (np.sin(cols / 100) * np.cos(rows / 100) * 300 + 500).astype('float32')
+    z[:10, :10] = -9999
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1, dtype='float32',
+                       crs='EPSG:4326', transform=from_origin(110, 35, 0.001, 0.001), nodata=-9999,
+                       tiled=True, blockxsize=256, blockysize=256) as ds:
+        ds.write(z, 1)
+    return z
+
+
+def _tile_for(lon, lat, z):
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return z, x, y
+
+
+def test_overviews_in_cache_dir():
+    """测试概视生成在缓存目录中, 不修改原始文件"""
+    tmp = Path(tempfile.mkdtemp())
+    _write_dem(tmp / 'dem.tif')
+    source = RasterSource(tmp / 'dem.tif', cache_dir=tmp / 'cache')
+    assert source.factors == [2, 4, 8]
+    assert source.overview_path.startswith(str(tmp / 'cache'))
+    assert list((tmp / 'cache').glob('*.vrt.ovr'))
+    with rasterio.open(tmp / 'dem.tif') as ds:
+        assert ds.overviews(1) == []
+
+    # 再次打开直接使用已有概视
+    again = RasterSource(tmp / 'dem.tif', cache_dir=tmp / 'cache')
+    assert again.overview_path == source.overview_path
+    low, high = source.value_range[0]
+    assert 150 < low < high < 850
+    print("✅ 概视生成正常")
+
+
+def test_tiles():
+    """测试瓦片渲染、透明区域和缓存"""
+    tmp = Path(tempfile.mkdtemp())
+    _write_dem(tmp / 'dem.tif')
+    source = RasterSource(tmp / 'dem.tif', cache_dir=tmp / 'cache')
+    register_source(source)
+
+    tile = _tile_for(110.6, 34.5, 10)
+    png = get_tile(source.key, *tile)
+    image = np.array(Image.open(io.BytesIO(png)))
+    assert image.shape == (256, 256, 4)
+    assert (image[..., 3] == 255).mean() > 0.9
+    assert tile_cache.get((source.key,) + tile) is png
+
+    # 缩小到全国范围时从概视读取, 不相交的瓦片为透明瓦片
+    assert get_tile(source.key, *_tile_for(110.6, 34.5, 4)) != EMPTY_TILE
+    assert get_tile(source.key, *_tile_for(0, 0, 10)) == EMPTY_TILE
+    assert get_tile('missing', 1, 0, 0) is None
+    print("✅ 瓦片渲染正常")
+
+
+def test_no_overviews_limits_reads():
+    """测试没有概视时不为缩小显示读取整个栅格"""
+    tmp = Path(tempfile.mkdtemp())
+    _write_dem(tmp / 'dem.tif')
+    source = RasterSource(tmp / 'dem.tif')
+    assert source.factors == []
+    assert source.render_tile(*_tile_for(110.6, 34.5, 4)) is None
+    assert source.render_tile(*_tile_for(110.6, 34.5, 12)) is not None
+    print("✅ 无概视时的读取限制正常")
+
+
+def test_read_grid():
+    """测试按概视读取整个网格, 行按y升序排列"""
+    tmp = Path(tempfile.mkdtemp())
+    z = _write_dem(tmp / 'dem.tif')
+    source = RasterSource(tmp / 'dem.tif', cache_dir=tmp / 'cache')
+    grid, x, y = source.read_grid(max_pixels=100000)
+    assert grid.size <= 100000
+    assert np.all(np.diff(y) > 0) and np.all(np.diff(x) > 0)
+    assert np.isnan(grid[-1, 0])  # nodata角位于北侧
+    full, _, _ = source.read_grid()
+    assert np.allclose(full[::-1][20:], z[20:], atol=1e-3)
+    print("✅ 网格读取正常")
+
+
+def test_tile_cache_and_paths():
+    """测试瓦片LRU淘汰和URL解析"""
+    cache = TileCache(max_tiles=2)
+    cache.put(('a', 1, 0, 0), b'1')
+    cache.put(('a', 1, 0, 1), b'2')
+    cache.get(('a', 1, 0, 0))
+    cache.put(('b', 1, 1, 1), b'3')
+    assert cache.get(('a', 1, 0, 1)) is None and len(cache) == 2
+    cache.invalidate('a')
+    assert len(cache) == 1
+
+    assert parse_tile_path('/abc/3/4/5.png') == ('abc', 3, 4, 5)
+    assert parse_tile_path('/abc/3/4.png') is None
+    assert raster_layer.tile_url(type('S', (), {'key': 'k'})()) == 'studygis://tiles/k/{z}/{x}/{y}.png'
+    print("✅ 瓦片缓存正常")
+
+
+if __name__ == '__main__':
+    test_overviews_in_cache_dir()
+    test_tiles()
+    test_no_overviews_limits_reads()
+    test_read_grid()
+    test_tile_cache_and_paths()
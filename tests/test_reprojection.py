@@ -0,0 +1,55 @@
+"""
+测试坐标转换
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+from src.reprojection import epsg_code, transform_coords, guess_crs, reproject_result
+
+
+def test_transform_roundtrip():
+    """测试Web墨卡托往返转换 (分块)"""
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(73, 135, 10000)
+    lat = rng.uniform(18, 54, 10000)
+
+    x, y = transform_coords(lon, lat, 'EPSG:4326', 'EPSG:3857', chunk_size=3000)
+    assert guess_crs(x, y) == 'EPSG:3857'
+
+    lon2, lat2 = transform_coords(x, y, 'EPSG:3857', 'EPSG:4326', chunk_size=3000)
+    assert np.allclose(lon, lon2) and np.allclose(lat, lat2)
+    print("✅ 坐标往返转换正常")
+
+
+def test_reproject_gauss_kruger_points():
+    """测试CGCS2000高斯-克吕格坐标转经纬度"""
+    # 北京附近, 3度带第39带
+    points = pd.DataFrame({'name': ['北京'], 'longitude': [39447000.0], 'latitude': [4419000.0]})
+    assert guess_crs(points['longitude'], points['latitude']) == 'EPSG:4527'
+
+    result = reproject_result({'crs': 'EPSG:4527', 'points': points, 'lines': [], 'polygons': []})
+    assert result['source_crs'] == 'EPSG:4527'
+    assert abs(result['points']['longitude'][0] - 116.4) < 0.1
+    assert abs(result['points']['latitude'][0] - 39.9) < 0.1
+    print("✅ 高斯-克吕格坐标转换正常")
+
+
+def test_epsg_code():
+    """测试坐标系转为EPSG代码: CRS84按4326, 没有EPSG代码时报错"""
+    assert epsg_code('OGC:CRS84') == 4326 and epsg_code('EPSG:4527') == 4527
+    assert epsg_code('+proj=utm +zone=50 +datum=WGS84') == 32650
+    try:
+        epsg_code('ESRI:102003')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("没有EPSG代码的坐标系应当报错")
+    print("✅ EPSG代码解析正常")
+
+
+if __name__ == '__main__':
+    test_transform_roundtrip()
+    test_reproject_gauss_kruger_points()
+    test_epsg_code()
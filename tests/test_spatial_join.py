@@ -0,0 +1,105 @@
+"""
+测试图层空间连接: 格网预分类、各种空间关系和图层输出
+"""
+import sys
+sys.path.append('.')
+
+import json
+
+import numpy as np
+import pandas as pd
+import shapely
+from src.spatial_join import grid_classify, join_indices, spatial_join
+
+
+def _polygons(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    seeds = rng.random((n, 2)) * 10 + [110, 30]
+    polygons = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(seeds)))
+    polygons = shapely.intersection(polygons, shapely.box(110, 30, 120, 40))
+    # 加一个与其他面重叠的面
+    return np.append(polygons, shapely.box(112, 32, 113.5, 33.5))
+
+
+def test_grid_matches_exact():
+    """测试格网预分类与逐点精确判断结果一致, 包括边界上的点和重叠面"""
+    polygons = _polygons()
+    rng = np.random.default_rng(1)
+    x, y = rng.random(300000) * 11 + 109.5, rng.random(300000) * 11 + 29.5
+    # 面的顶点恰好在边界上
+    vertices = shapely.get_coordinates(polygons[:20])
+    x, y = np.concatenate([x, vertices[:, 0]]), np.concatenate([y, vertices[:, 1]])
+
+    _, _, exact = grid_classify(x, y, polygons, grid_size=256)
+    assert 0 < len(exact) < len(x) // 2
+    for predicate in ('contains', 'intersects'):
+        fast = join_indices((x, y), polygons, predicate, chunk_size=100000)
+        plain = join_indices((x, y), polygons, predicate, use_grid=False)
+        assert np.array_equal(fast[0], plain[0]) and np.array_equal(fast[1], plain[1])
+    # 重叠区域的点同时属于两个面
+    left, right, _ = join_indices((np.array([112.7]), np.array([32.7])), polygons, 'contains')
+    assert len(left) == 2 and right[-1] == len(polygons) - 1
+    print("✅ 格网预分类结果正确")
+
+
+def test_distance_predicates():
+    """测试距离范围和最近要素, 经纬度图层的距离单位为米"""
+    cities = pd.DataFrame({'name': ['甲', '乙'], 'longitude': [116.0, 100.0], 'latitude': [40.0, 30.0]})
+    stations = pd.DataFrame({'station': ['近', '远'], 'longitude': [116.01, 117.0], 'latitude': [40.0, 40.0]})
+    left = {'data': cities, 'type': 'points', 'crs': 'EPSG:4326'}
+    right = {'data': stations, 'type': 'points', 'crs': 'EPSG:4326'}
+
+    nearest = spatial_join(left, right, 'nearest')
+    assert list(nearest['station']) == ['近', '近']
+    # 纬度40度处经度0.01度约852m
+    assert abs(nearest['distance'][0] - 852) < 5
+
+    within = spatial_join(left, right, 'within_distance', distance=1000, how='inner')
+    assert list(within['name']) == ['甲'] and list(within['station']) == ['近']
+    within = spatial_join(left, right, 'within_distance', distance=100000)
+    assert list(within['station'].fillna('')) == ['近', '远', ''] and np.isnan(within['distance'][2])
+
+    limited = spatial_join(left, right, 'nearest', distance=1000, how='inner')
+    assert list(limited['name']) == ['甲']
+    print("✅ 距离关系正常")
+
+
+def test_points_in_provinces():
+    """测试城市点标注所在省份, 重名列加后缀"""
+    cities = pd.read_csv('sample_data/cities_extended.csv')
+    with open('sample_data/provinces.geojson', encoding='utf-8') as f:
+        provinces = json.load(f)['features']
+    left = {'data': cities, 'type': 'points', 'crs': 'EPSG:4326'}
+    right = {'data': provinces, 'type': 'polygons', 'crs': 'EPSG:4326'}
+
+    joined = spatial_join(left, right, 'contains')
+    assert len(joined) >= len(cities)
+    assert 'name_right' in joined.columns and 'population_right' in joined.columns
+    beijing = joined[joined['name'] == '北京']
+    assert beijing['name_right'].iloc[0] == '北京市'
+    inner = spatial_join(left, right, 'contains', how='inner')
+    assert inner['name_right'].notna().all()
+    print("✅ 城市与省份连接正常")
+
+
+def test_polygon_left_layer():
+    """测试线/面作为左图层时输出GeoJSON要素"""
+    polygons = _polygons(20)
+    left = {'type': 'polygons', 'crs': 'EPSG:4326',
+            'data': [{'type': 'Feature', 'properties': {'id': 0},
+                      'geometry': shapely.geometry.mapping(shapely.box(111, 31, 111.2, 31.2))}]}
+    right = {'type': 'polygons', 'crs': 'EPSG:4326',
+             'data': [{'type': 'Feature', 'properties': {'id': i}, 'geometry': shapely.geometry.mapping(p)}
+                      for i, p in enumerate(polygons)]}
+    features = spatial_join(left, right, 'intersects')
+    expected = np.flatnonzero(shapely.intersects(polygons, shapely.box(111, 31, 111.2, 31.2)))
+    assert [f['properties']['id_right'] for f in features] == list(expected)
+    assert all(f['geometry']['type'] == 'Polygon' for f in features)
+    print("✅ 面图层连接正常")
+
+
+if __name__ == '__main__':
+    test_grid_matches_exact()
+    test_distance_predicates()
+    test_points_in_provinces()
+    test_polygon_left_layer()
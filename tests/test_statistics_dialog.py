@@ -0,0 +1,74 @@
+"""
+测试统计对话框的数据源切换: 内存图层 <-> 数据库 (SQL聚合)
+"""
+import os
+import sys
+sys.path.append('.')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+from StudyGIS_demo import StatisticsDialog
+from src.layer_stats import summarize_frame
+
+
+class FakeDatabase:
+    """按表名返回固定统计结果, 并记录查询次数的数据库替身"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_table_statistics(self, table_name):
+        self.calls.append(table_name)
+        frame = pd.DataFrame({'population': np.arange(10.0) * (len(self.calls) + 1),
+                              'type': ['城市', '乡镇'] * 5})
+        stats = summarize_frame(frame)
+        stats['groups'] = {'type': frame['type'].value_counts()}
+        return stats
+
+
+def test_source_switch():
+    """测试切换数据源时图层列表和统计来源随之切换, 数据库统计按表缓存"""
+    layer = {'name': '城市', 'type': 'points', 'visible': True, 'version': 0,
+             'data': pd.DataFrame({'name': ['北京', '上海'], 'longitude': [116.4, 121.5],
+                                   'latitude': [39.9, 31.2], 'population': [2154.0, 2428.0]})}
+    database = FakeDatabase()
+    dialog = StatisticsDialog([layer], db_manager=database)
+
+    assert not dialog.is_database_mode() and database.calls == []
+    assert [dialog.layer_combo.itemText(i) for i in range(dialog.layer_combo.count())] == ['城市']
+    assert dialog.current_stats['row_count'] == 2
+
+    dialog.source_combo.setCurrentIndex(1)
+    assert dialog.is_database_mode()
+    assert [dialog.layer_combo.itemText(i) for i in range(dialog.layer_combo.count())] == \
+        StatisticsDialog.DATABASE_TABLES
+    assert database.calls == ['point_features'] and dialog.current_stats['row_count'] == 10
+    assert '按type分组' in dialog.stats_text.toPlainText()
+
+    dialog.chart_combo.setCurrentText("直方图")
+    dialog.layer_combo.setCurrentText('polygon_features')
+    dialog.layer_combo.setCurrentText('point_features')
+    assert database.calls == ['point_features', 'polygon_features']
+
+    dialog.source_combo.setCurrentIndex(0)
+    assert [dialog.layer_combo.itemText(i) for i in range(dialog.layer_combo.count())] == ['城市']
+    assert dialog.current_stats['row_count'] == 2 and '按type分组' not in dialog.stats_text.toPlainText()
+    print("✅ 统计数据源切换正常")
+
+
+def test_database_only():
+    """测试没有内存图层时默认使用数据库统计"""
+    database = FakeDatabase()
+    dialog = StatisticsDialog([], db_manager=database)
+    assert dialog.is_database_mode() and database.calls == ['point_features']
+    print("✅ 无内存图层时默认数据库统计")
+
+
+if __name__ == '__main__':
+    test_source_switch()
+    test_database_only()
@@ -0,0 +1,105 @@
+"""
+测试属性表模型的排序和过滤
+"""
+import os
+import sys
+import json
+import time
+sys.path.append('.')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import Qt, QVariant
+from PyQt5.QtWidgets import QApplication
+from src.table_models import DataFrameTableModel, PagedTableModel
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+
+def make_model():
+    data = pd.DataFrame({
+        'name': ['北京', '上海', '广州', '深圳'],
+        'population': [21540000, 24280000, np.nan, 17560000],
+        'province': ['北京', '上海', '广东', '广东']
+    })
+    return DataFrameTableModel(data)
+
+
+def cell(model, row, column):
+    return model.data(model.index(row, column), Qt.DisplayRole)
+
+
+def test_sort():
+    """测试排序只改变行置换, 缺失值排在最后"""
+    model = make_model()
+    assert model.rowCount() == 4 and model.columnCount() == 3
+
+    model.sort(1, Qt.DescendingOrder)
+    assert [cell(model, i, 0) for i in range(4)] == ['上海', '北京', '深圳', '广州']
+    assert cell(model, 3, 1) == ''
+    assert list(model.row_positions()) == [1, 0, 3, 2]
+    print("✅ 排序正常")
+
+
+def test_filter():
+    """测试过滤并保持当前排序"""
+    model = make_model()
+    model.sort(0, Qt.AscendingOrder)
+    model.set_filter('广东')
+    assert model.rowCount() == 2
+    assert sorted(cell(model, i, 0) for i in range(2)) == ['广州', '深圳']
+
+    model.set_filter('')
+    assert model.rowCount() == 4
+    print("✅ 过滤正常")
+
+
+def test_features():
+    """测试GeoJSON要素列表的属性"""
+    with open('sample_data/rivers_simple.geojson', 'r', encoding='utf-8') as f:
+        features = json.load(f)['features']
+    model = DataFrameTableModel(features)
+    assert model.rowCount() == len(features)
+    assert model.columnCount() > 0
+    print("✅ 要素属性表正常")
+
+
+
+def test_paged_model():
+    """测试分页模型按键值增量加载, 并只保留有限的页"""
+    table = pd.DataFrame({'id': np.arange(1, 1001), 'value': np.arange(1000) * 2})
+    queries = []
+
+    def fetch_page(after_id):
+        queries.append(after_id)
+        rows = table if after_id is None else table[table['id'] > after_id]
+        return rows.head(100)
+
+    model = PagedTableModel(fetch_page, page_size=100, max_pages=3)
+    while model.canFetchMore():
+        model.fetchMore()
+    assert model.rowCount() == 1000
+    assert len(model.loaded_pages()) == 3
+
+    # 已淘汰的页在后台按起始键重新查询, 到达前显示为空, 到达后发出 dataChanged
+    changed = []
+    model.dataChanged.connect(lambda first, last: changed.append((first.row(), last.row())))
+    assert isinstance(cell(model, 5, 1), QVariant) and isinstance(cell(model, 6, 1), QVariant)
+    deadline = time.time() + 5
+    while not changed and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    assert changed == [(0, 99)]
+    assert queries.count(None) == 2
+    assert cell(model, 5, 1) == '10'
+    assert cell(model, 999, 0) == '1000'
+    model.close()
+    print("✅ 分页加载正常")
+
+
+if __name__ == '__main__':
+    test_sort()
+    test_filter()
+    test_features()
+    test_paged_model()
@@ -0,0 +1,114 @@
+"""
+测试分块地形分析: 坡度、坡向、山体阴影
+"""
+import sys
+sys.path.append('.')
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from src.geodesy import METERS_PER_DEGREE
+from src.terrain import (NODATA, aspect, cached_output_path, compute_product, horn_gradient,
+                         slope, terrain_analysis)
+
+
+def _write_dem(path, z, crs='EPSG:32649', res=30.0, nodata=None):
+    with rasterio.open(path, 'w', driver='GTiff', width=z.shape[1], height=z.shape[0], count=1,
+                       dtype='float32', crs=crs, transform=from_origin(500000, 4000000, res, res),
+                       nodata=nodata) as ds:
+        ds.write(z.astype('float32'), 1)
+
+
+def _hills(height=700, width=900):
+    rows, cols = np.mgrid[0:height, 0:width]
+    return np.sin(cols / 60) * np.cos(rows / 45) * 200 + rows * 0.5 + 1000
+
+
+def test_stencils():
+    """测试倾斜平面的坡度和坡向与解析值一致"""
+    rows, cols = np.mgrid[0:20, 0:30].astype(float)
+    # 向东每像元下降3m (像元10m): 坡度 atan(0.3), 坡向朝东 (90度)
+    plane = 100 - 3 * cols
+    dzdx, dzdy = horn_gradient(plane, 10.0, 10.0)
+    assert np.allclose(slope(dzdx, dzdy), np.degrees(np.arctan(0.3)))
+    assert np.allclose(aspect(dzdx, dzdy), 90.0)
+    # 向北升高 (行号越大越靠南, 高程越低) 时坡向朝南
+    dzdx, dzdy = horn_gradient(100 - 2 * rows, 10.0, 10.0)
+    assert np.allclose(aspect(dzdx, dzdy), 180.0)
+
+    flat = np.full((5, 5), 50.0)
+    assert np.all(aspect(*horn_gradient(flat, 1.0, 1.0)) == -1)
+    # 平地的山体阴影为 255*cos(天顶角)
+    assert np.allclose(compute_product(flat, 1.0, 1.0, 'hillshade'), 255 * np.cos(np.radians(45)))
+    print("✅ 地形模板计算正常")
+
+
+def test_blocks_match_single_pass():
+    """测试小块串行、多进程与整体一次计算的结果一致"""
+    tmp = Path(tempfile.mkdtemp())
+    z = _hills()
+    _write_dem(tmp / 'dem.tif', z)
+    padded = np.pad(z.astype('float32').astype(float), 1, mode='edge')
+    for product in ('slope', 'aspect', 'hillshade'):
+        whole = compute_product(padded, 30.0, 30.0, product)
+        terrain_analysis(tmp / 'dem.tif', tmp / f'{product}_1.tif', product, block_size=128, max_workers=1)
+        terrain_analysis(tmp / 'dem.tif', tmp / f'{product}_2.tif', product, block_size=200, max_workers=2)
+        with rasterio.open(tmp / f'{product}_1.tif') as a, rasterio.open(tmp / f'{product}_2.tif') as b:
+            serial, parallel = a.read(1), b.read(1)
+            assert a.profile['tiled'] and a.overviews(1)
+        assert np.array_equal(serial, parallel)
+        if product == 'hillshade':
+            assert np.abs(serial.astype(int) - np.maximum(np.rint(whole), 1)).max() == 0
+        else:
+            assert np.allclose(serial, whole, atol=1e-3)
+    print("✅ 分块结果与整体结果一致")
+
+
+def test_nodata_and_progress():
+    """测试nodata区域传播到结果, 进度回调覆盖所有块"""
+    tmp = Path(tempfile.mkdtemp())
+    z = _hills(300, 300)
+    z[100:110, 100:110] = -32768
+    _write_dem(tmp / 'dem.tif', z, nodata=-32768)
+    calls = []
+    terrain_analysis(tmp / 'dem.tif', tmp / 'slope.tif', 'slope', block_size=100,
+                     progress=lambda done, total: calls.append((done, total)))
+    assert calls[-1] == (9, 9)
+    with rasterio.open(tmp / 'slope.tif') as ds:
+        result = ds.read(1)
+        assert ds.nodata == NODATA
+    # nodata像元及其邻域都无效
+    assert np.all(result[99:111, 99:111] == NODATA)
+    assert result[97, 97] != NODATA and result[120, 120] != NODATA
+    print("✅ nodata处理正常")
+
+
+def test_geographic_cell_size():
+    """测试地理坐标系下按纬度换算像元大小"""
+    tmp = Path(tempfile.mkdtemp())
+    rows, cols = np.mgrid[0:50, 0:50]
+    # 经度方向每0.001度升高1m, 纬度60度处0.001度约55.6m
+    z = cols * 1.0
+    with rasterio.open(tmp / 'dem.tif', 'w', driver='GTiff', width=50, height=50, count=1, dtype='float32',
+                       crs='EPSG:4326', transform=from_origin(110, 60.025, 0.001, 0.001)) as ds:
+        ds.write(z.astype('float32'), 1)
+    terrain_analysis(tmp / 'dem.tif', tmp / 'slope.tif', 'slope')
+    with rasterio.open(tmp / 'slope.tif') as ds:
+        result = ds.read(1)
+    expected = np.degrees(np.arctan(1 / (0.001 * METERS_PER_DEGREE * np.cos(np.radians(60)))))
+    assert np.allclose(result[25, 1:-1], expected, rtol=1e-3)
+
+    key = cached_output_path(tmp, tmp / 'dem.tif', 'hillshade', azimuth=300)
+    assert key != cached_output_path(tmp, tmp / 'dem.tif', 'hillshade')
+    assert key.parent == tmp and key.suffix == '.tif'
+    print("✅ 地理坐标系像元大小正常")
+
+
+if __name__ == '__main__':
+    test_stencils()
+    test_blocks_match_single_pass()
+    test_nodata_and_progress()
+    test_geographic_cell_size()
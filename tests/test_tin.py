@@ -0,0 +1,91 @@
+"""
+测试TIN三角剖分、增量插入和高程列识别
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import Delaunay
+from src.tin import TIN, find_elevation_column, tin_from_frame, tin_from_layer
+
+
+def _triangle_set(triangles):
+    return set(map(tuple, np.sort(triangles, axis=1)))
+
+
+def test_build():
+    """测试全量剖分与scipy结果一致, 并跳过无效点"""
+    rng = np.random.default_rng(0)
+    x, y = rng.random(1000), rng.random(1000)
+    z = np.sin(x * 6) + y
+    z[0] = np.nan
+    tin = TIN(x, y, z)
+    assert tin.vertex_count == 999
+    assert tin.triangles.dtype == np.int32
+    assert len(tin) == len(Delaunay(tin.points).simplices)
+    assert np.allclose(tin.z, z[tin.source_index])
+    print("✅ TIN剖分正常")
+
+
+def test_incremental_insert():
+    """测试局部插入后的三角网与全量重建一致"""
+    rng = np.random.default_rng(1)
+    x, y = rng.random(2000), rng.random(2000)
+    tin = TIN(x, y, x + y)
+    triangles_before = len(tin)
+
+    nx, ny = rng.random(50) * 0.8 + 0.1, rng.random(50) * 0.8 + 0.1
+    assert tin.add_points(nx, ny, nx + ny) == 50
+    assert len(tin) == triangles_before + 2 * 50  # 内部点每个增加两个三角形
+    assert _triangle_set(tin.triangles) == _triangle_set(Delaunay(tin.points).simplices)
+    assert (tin.source_index[-50:] == -1).all()
+    print("✅ TIN增量插入正常")
+
+
+def test_insert_outside_hull():
+    """测试凸包外的点触发全量重建"""
+    tin = TIN([0, 1, 0, 1], [0, 0, 1, 1], [0, 1, 2, 3])
+    tin.add_points([2.0], [2.0], [5.0])
+    assert tin.vertex_count == 5
+    assert tin.bounds() == (0.0, 0.0, 2.0, 2.0)
+    assert _triangle_set(tin.triangles) == _triangle_set(Delaunay(tin.points).simplices)
+    print("✅ 凸包外插入正常")
+
+
+def test_elevation_column():
+    """测试高程列识别和由图层构建TIN"""
+    frame = pd.DataFrame({
+        'longitude': [119.0, 119.1, 119.0, 119.1],
+        'latitude': [31.0, 31.0, 31.1, 31.1],
+        'name': list('abcd'),
+        'Elevation': [10.0, 20.0, 30.0, 40.0]
+    })
+    assert find_elevation_column(frame) == 'Elevation'
+    assert find_elevation_column(frame[['longitude', 'latitude', 'name']]) is None
+
+    tin = tin_from_layer({'name': 't', 'type': 'points', 'data': frame, 'crs': 'EPSG:4326'})
+    assert len(tin) == 2 and tin.crs == 'EPSG:4326'
+    try:
+        tin_from_frame(frame[['longitude', 'latitude', 'name']])
+        assert False, "缺少高程列时应报错"
+    except ValueError:
+        pass
+    print("✅ 高程列识别正常")
+
+
+def test_mesh3d():
+    """测试Mesh3d轨迹使用三角形索引"""
+    tin = TIN([0, 1, 0, 1], [0, 0, 1, 1], [0, 1, 2, 3])
+    mesh = tin.to_mesh3d()
+    assert len(mesh.i) == len(tin)
+    assert list(mesh.z) == list(tin.z)
+    print("✅ Mesh3d转换正常")
+
+
+if __name__ == '__main__':
+    test_build()
+    test_incremental_insert()
+    test_insert_outside_hull()
+    test_elevation_column()
+    test_mesh3d()
@@ -0,0 +1,94 @@
+"""
+测试Shapefile/GeoPackage流式读取: bbox和列裁剪下推、多部件拆分、多文件读取的单文件错误
+"""
+import sys
+import tempfile
+from pathlib import Path
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyogrio.raw import write
+from src.vector_io import read_vector_file, read_vector_files, source_info, split_geometries
+
+
+def write_points(path, crs='EPSG:4326'):
+    """写入10x10的格网点GeoPackage, 属性列 a, b; 坐标为经纬度 100..109, 20..29 (按crs转换)"""
+    x, y = np.meshgrid(np.arange(100, 110, dtype=float), np.arange(20, 30, dtype=float))
+    x, y = x.ravel(), y.ravel()
+    if crs != 'EPSG:4326':
+        from src.reprojection import get_transformer
+        x, y = get_transformer('EPSG:4326', crs).transform(x, y)
+    geoms = shapely.to_wkb(shapely.points(x, y))
+    a, b = np.arange(100), np.arange(100) * 10.0
+    write(str(path), geoms, [a, b], ['a', 'b'], geometry_type='Point', crs=crs, driver='GPKG')
+
+
+def test_bbox_and_column_pushdown():
+    """测试bbox只读出范围内的要素, columns只读出指定列, bbox_crs按文件坐标系转换"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'points.gpkg'
+        write_points(path)
+        assert source_info(path) == ('EPSG:4326', ['a', 'b'])
+
+        result = read_vector_file(path, bbox=(102.5, 22.5, 104.5, 25.5), columns=['a'])
+        points = result['points']
+        assert len(points) == 2 * 3
+        assert points['longitude'].between(102.5, 104.5).all() and points['latitude'].between(22.5, 25.5).all()
+        assert list(points.columns) == ['longitude', 'latitude', 'a']
+        assert sorted(points['a']) == [33, 34, 43, 44, 53, 54]
+
+        assert list(read_vector_file(path)['points'].columns) == ['longitude', 'latitude', 'a', 'b']
+
+        mercator = Path(tmp) / 'mercator.gpkg'
+        write_points(mercator, 'EPSG:3857')
+        result = read_vector_file(mercator, bbox=(102.5, 22.5, 104.5, 25.5), bbox_crs='EPSG:4326')
+        assert result['crs'] == 'EPSG:3857' and sorted(result['points']['a']) == [33, 34, 43, 44, 53, 54]
+    print("✅ bbox和列裁剪下推正常")
+
+
+def test_split_multipart():
+    """测试多部件几何拆成单部件并复制属性, 缺失几何被丢弃"""
+    geoms = np.array([
+        shapely.MultiPolygon([shapely.box(0, 0, 1, 1), shapely.box(2, 2, 3, 3)]),
+        shapely.MultiPoint([(5, 6), (7, 8)]),
+        None,
+        shapely.MultiLineString([[(0, 0), (1, 1)], [(2, 2), (3, 3)], [(4, 4), (5, 5)]]),
+        shapely.Point(9, 10),
+    ], dtype=object)
+    attrs = pd.DataFrame({'name': ['面', '多点', '空', '线', '点'], 'value': np.arange(5)})
+    result = split_geometries(geoms, attrs)
+
+    assert len(result['polygons']) == 2 and len(result['lines']) == 3
+    assert all(f['geometry']['type'] == 'Polygon' and f['properties'] == {'name': '面', 'value': 0}
+               for f in result['polygons'])
+    assert all(f['geometry']['type'] == 'LineString' and f['properties']['name'] == '线'
+               for f in result['lines'])
+    points = result['points']
+    assert points['name'].tolist() == ['多点', '多点', '点']
+    assert points['longitude'].tolist() == [5, 7, 9] and points['latitude'].tolist() == [6, 8, 10]
+    assert isinstance(result['polygons'][0]['properties']['value'], int)
+    print("✅ 多部件几何拆分正常")
+
+
+def test_read_files_error_per_file():
+    """测试多文件读取时, 读取失败的文件对应异常对象, 不影响其他文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        good = Path(tmp) / 'good.gpkg'
+        write_points(good)
+        bad = Path(tmp) / 'bad.gpkg'
+        bad.write_text('not a geopackage')
+        missing = Path(tmp) / 'missing.shp'
+        results = read_vector_files([good, bad, missing], bbox=(100, 20, 101, 21), max_workers=2)
+
+        assert list(results) == [good, bad, missing]
+        assert len(results[good]['points']) == 4
+        assert isinstance(results[bad], Exception) and isinstance(results[missing], Exception)
+    print("✅ 单个文件读取失败不影响其他文件")
+
+
+if __name__ == '__main__':
+    test_bbox_and_column_pushdown()
+    test_split_multipart()
+    test_read_files_error_per_file()
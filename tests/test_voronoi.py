@@ -0,0 +1,73 @@
+"""
+测试泰森多边形: 与GEOS结果一致、重复点、边界裁剪和图层属性
+"""
+import sys
+sys.path.append('.')
+
+import json
+
+import numpy as np
+import pandas as pd
+import shapely
+from src.voronoi import clip_cells, voronoi_cells, voronoi_layer
+
+
+def test_cells_match_geos():
+    """测试单元与GEOS的泰森图一致, 每个点落在自己的单元内, 重复点共用单元"""
+    rng = np.random.default_rng(0)
+    x, y = rng.random(3000) * 10, rng.random(3000) * 10
+    x[7], y[7] = x[3], y[3]
+    box = shapely.box(0, 0, 10, 10)
+    cells = clip_cells(voronoi_cells(x, y, (0, 0, 10, 10)), box)
+
+    assert shapely.contains(cells, shapely.points(x, y)).all()
+    assert cells[7] is cells[3]
+    assert abs(shapely.area(shapely.union_all(cells)) - 100) < 1e-9
+
+    reference = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(np.column_stack([x, y])),
+                                                           extend_to=box))
+    reference = shapely.intersection(reference, box)
+    assert np.allclose(np.sort(np.delete(shapely.area(cells), 7)), np.sort(shapely.area(reference)))
+    print("✅ 泰森多边形与GEOS一致")
+
+
+def test_clip_to_concave_boundary():
+    """测试裁剪到凹多边形边界: 边界外的点没有单元, 被凹口切开的单元为多部件"""
+    boundary = shapely.Polygon([(0, 0), (10, 0), (10, 10), (6, 10), (6, 2), (4, 2), (4, 10), (0, 10)])
+    x = np.array([5.0, 2.0, 8.0, 5.0, 20.0])
+    y = np.array([1.0, 5.0, 5.0, 9.0, 20.0])
+    cells = clip_cells(voronoi_cells(x, y, shapely.bounds(boundary)), boundary)
+
+    assert cells[4] is None
+    assert cells[3].geom_type == 'MultiPolygon'
+    assert abs(shapely.area(cells[:4]).sum() - boundary.area) < 1e-9
+    assert shapely.covers(boundary, shapely.union_all(cells[:4]).buffer(-1e-9))
+    print("✅ 边界裁剪正常")
+
+
+def test_layer_with_provinces():
+    """测试城市点图层按省界生成泰森多边形, 单元带城市属性"""
+    cities = pd.read_csv('sample_data/cities_extended.csv')
+    with open('sample_data/provinces.geojson', encoding='utf-8') as f:
+        provinces = {'type': 'polygons', 'crs': 'EPSG:4326', 'data': json.load(f)['features']}
+    layer = {'type': 'points', 'crs': 'EPSG:4326', 'data': cities}
+    features = voronoi_layer(layer, provinces)
+
+    assert features and all(f['geometry']['type'] == 'Polygon' for f in features)
+    assert set(features[0]['properties']) == set(cities.columns) - {'longitude', 'latitude'}
+    beijing = [shapely.geometry.shape(f['geometry']) for f in features if f['properties']['name'] == '北京']
+    assert any(cell.contains(shapely.Point(116.4074, 39.9042)) for cell in beijing)
+
+    boundary = shapely.union_all([shapely.geometry.shape(f['geometry']) for f in provinces['data']])
+    total = sum(shapely.geometry.shape(f['geometry']).area for f in features)
+    assert abs(total - boundary.area) / boundary.area < 0.01
+
+    unclipped = voronoi_layer(layer)
+    assert len(unclipped) == len(cities)
+    print("✅ 省界裁剪的泰森多边形图层正常")
+
+
+if __name__ == '__main__':
+    test_cells_match_geos()
+    test_clip_to_concave_boundary()
+    test_layer_with_provinces()
@@ -0,0 +1,138 @@
+"""
+测试分区统计: 分块栅格化聚合、重叠面、多进程和图层属性回写
+"""
+import sys
+sys.path.append('.')
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import shapely
+from rasterio import features
+from rasterio.transform import from_origin
+from src.zonal import choose_overview_level, overlap_groups, zonal_layer, zonal_statistics
+
+TRANSFORM = from_origin(110, 35, 0.01, 0.01)
+
+
+def _write_raster(path, width=500, height=400, nodata=-9999):
+    rng = np.random.default_rng(0)
+    z = rng.random((height, width)) * 1000
+    z[:20, :20] = nodata
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1, dtype='float64',
+                       crs='EPSG:4326', transform=TRANSFORM, nodata=nodata) as ds:
+        ds.write(z, 1)
+    return z
+
+
+def _expected(z, geom, nodata=-9999):
+    mask = features.geometry_mask([geom], z.shape, TRANSFORM, invert=True) & (z != nodata)
+    values = z[mask]
+    return len(values), values.mean(), values.min(), values.max(), values.std()
+
+
+def _polygons():
+    return np.array([
+        shapely.box(109.5, 33.5, 112.0, 34.9),  # 超出栅格范围, 包含nodata角
+        # 顶点避开像元中心恰好落在边上的情况 (此时栅格化结果与裁剪方式有关)
+        shapely.Polygon([(112.0013, 31.5007), (114.5031, 32.0011), (113.0007, 34.5023)]),
+        shapely.box(112.5, 33.0, 113.5, 34.0),  # 与三角形重叠
+        shapely.box(120, 20, 121, 21),  # 不相交
+    ])
+
+
+def test_matches_masks():
+    """测试分块统计与逐面掩膜计算一致, 重叠部分分别计入两个面"""
+    tmp = Path(tempfile.mkdtemp())
+    z = _write_raster(tmp / 'dem.tif')
+    geoms = _polygons()
+    assert list(overlap_groups(geoms)) == [0, 0, 1, 0]
+
+    table = zonal_statistics(tmp / 'dem.tif', geoms, tile_size=64, max_workers=1)
+    for i, geom in enumerate(geoms[:3]):
+        count, mean, low, high, std = _expected(z, geom)
+        row = table.loc[i]
+        assert row['count'] == count
+        assert np.allclose([row['mean'], row['min'], row['max'], row['std']], [mean, low, high, std])
+        assert np.isclose(row['sum'], mean * count)
+    assert table.loc[3, 'count'] == 0 and np.isnan(table.loc[3, 'mean'])
+
+    parallel = zonal_statistics(tmp / 'dem.tif', geoms, tile_size=100, max_workers=2)
+    assert np.allclose(table.to_numpy(), parallel.to_numpy(), equal_nan=True)
+    print("✅ 分区统计与掩膜计算一致")
+
+
+def test_zones_and_reprojection():
+    """测试多个面合并为一个分区, 以及面与栅格坐标系不同"""
+    tmp = Path(tempfile.mkdtemp())
+    z = _write_raster(tmp / 'dem.tif')
+    geoms = _polygons()[:2]
+    merged = zonal_statistics(tmp / 'dem.tif', geoms, zones=[0, 0], max_workers=1)
+    union_count, union_mean = _expected(z, shapely.union_all(geoms))[:2]
+    assert len(merged) == 1 and merged.loc[0, 'count'] == union_count
+    assert np.isclose(merged.loc[0, 'mean'], union_mean)
+
+    pyproj = __import__('pyproj')
+    to_mercator = pyproj.Transformer.from_crs('EPSG:4326', 'EPSG:3857', always_xy=True)
+    projected = shapely.transform(shapely.segmentize(geoms, 0.01),
+                                  lambda c: np.column_stack(to_mercator.transform(c[:, 0], c[:, 1])))
+    table = zonal_statistics(tmp / 'dem.tif', projected, crs='EPSG:3857', max_workers=1)
+    plain = zonal_statistics(tmp / 'dem.tif', geoms, max_workers=1)
+    assert np.allclose(table['count'], plain['count'], rtol=0.01)
+    print("✅ 分区合并和坐标转换正常")
+
+
+def test_layer_columns():
+    """测试统计结果写回面图层属性: 默认每个要素单独统计, 按名称合并多部件要素, 名称为空的要素不合并"""
+    tmp = Path(tempfile.mkdtemp())
+    _write_raster(tmp / 'dem.tif')
+    geoms = _polygons()
+    layer = {
+        'type': 'polygons', 'crs': 'EPSG:4326',
+        'data': [{'type': 'Feature', 'properties': {'name': name},
+                  'geometry': shapely.geometry.mapping(geom)}
+                 for name, geom in zip(['甲', '乙', '乙', '丙'], geoms)]
+    }
+    table = zonal_layer(layer, tmp / 'dem.tif', '高程', by='name', stats=('count', 'mean'), max_workers=1)
+    assert list(table.index) == ['甲', '乙', '丙']
+    props = [feature['properties'] for feature in layer['data']]
+    assert props[1]['高程_mean'] == props[2]['高程_mean'] == table.loc['乙', 'mean']
+    assert props[3] == {'name': '丙', '高程_count': 0, '高程_mean': None}
+    assert layer['version'] == 1
+
+    # 默认每个要素单独统计
+    table = zonal_layer(layer, tmp / 'dem.tif', '单独', stats=('count',), max_workers=1)
+    assert list(table.index) == [0, 1, 2, 3] and layer['version'] == 2
+    assert props[1]['单独_count'] + props[2]['单独_count'] == props[1]['高程_count']
+
+    # 合并列为空的要素不合并成一组 (也不当作字符串 'None'), 各自单独统计
+    props[0]['name'] = props[1]['name'] = None
+    table = zonal_layer(layer, tmp / 'dem.tif', '空值', by='name', stats=('count',), max_workers=1)
+    assert list(table.index) == ['乙', '丙', None, None]
+    assert props[0]['空值_count'] == props[0]['单独_count'] and props[1]['空值_count'] == props[1]['单独_count']
+    assert props[2]['空值_count'] == props[2]['单独_count']
+    print("✅ 图层属性回写正常")
+
+
+def test_overview_level():
+    """测试按像元预算选择概视"""
+    tmp = Path(tempfile.mkdtemp())
+    _write_raster(tmp / 'dem.tif')
+    with rasterio.open(tmp / 'dem.tif', 'r+') as ds:
+        ds.build_overviews([2, 4, 8])
+    assert choose_overview_level(tmp / 'dem.tif', None) is None
+    assert choose_overview_level(tmp / 'dem.tif', 200000) is None
+    assert choose_overview_level(tmp / 'dem.tif', 20000) == 1
+    coarse = zonal_statistics(tmp / 'dem.tif', _polygons()[:1], overview_level=1, max_workers=1)
+    full = zonal_statistics(tmp / 'dem.tif', _polygons()[:1], max_workers=1)
+    assert abs(coarse.loc[0, 'count'] * 16 - full.loc[0, 'count']) < 0.05 * full.loc[0, 'count']
+    print("✅ 概视选择正常")
+
+
+if __name__ == '__main__':
+    test_matches_masks()
+    test_zones_and_reprojection()
+    test_layer_columns()
+    test_overview_level()